@@ -0,0 +1,291 @@
+"""
+REST API студии (FastAPI), параллельно с Gradio UI.
+
+    POST /api/jobs                      — задача транскрибации: multipart (file) или JSON {"path": ...};
+                                          429 — очередь транскрибации заполнена;
+                                          profile — профиль декодирования (fast / balanced / accurate)
+    GET  /api/jobs                      — список задач
+    GET  /api/jobs/{id}                 — статус задачи (в очереди — позиция и expected_start_in, сек)
+    GET  /api/jobs/{id}/segments        — сегменты потоком (SSE; ?format=ndjson — chunked NDJSON)
+    GET  /api/search?q=&page=&page_size= — поиск по чанкам
+    GET  /api/transcripts/{file_id}?offset=&length= — фрагмент транскрипта
+    GET  /api/traces/{id}?format=chrome — трасса этапов задачи (trace_id — в статусе задачи)
+    GET  /api/stats                     — статистика БД (+ RTF по профилям, отчёт обслуживания БД)
+    /api/cluster/...                    — аренды удалённых воркеров (cluster.enabled, см. app.coordinator)
+
+Вся работа с БД/диском/моделью уходит в пул потоков, event loop не блокируется.
+Запуск без UI: python -m app.api
+"""
+from __future__ import annotations
+import json
+import logging
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.config import DECODING_PROFILES, get_config
+from app.coordinator import LeaseLost
+from app.jobs import JobManager
+from app.lanes import QueueFull, get_lanes
+
+log = logging.getLogger("whisper_rag_studio")
+
+
+def _resolve_allowed(path: str, roots) -> Path:
+    p = Path(path).expanduser().resolve()
+    for root in roots:
+        r = Path(root).expanduser().resolve()
+        if p == r or r in p.parents:
+            return p
+    raise HTTPException(403, f"path is outside allowed roots: {path}")
+
+
+def _discard_upload(dest: Path):
+    """Загрузка отклонённой задачи (400, 429, ошибка приёма) — файл и его каталог"""
+    try:
+        dest.unlink(missing_ok=True)
+        dest.parent.rmdir()
+    except OSError as e:
+        log.warning("API: не удалось удалить загрузку %s: %s", dest, e)
+
+
+def create_app(studio, jobs: Optional[JobManager] = None) -> FastAPI:
+    cfg = get_config().api
+    jobs = jobs or JobManager(studio)
+    app = FastAPI(title="Whisper RAG Studio API")
+    app.state.studio = studio
+    app.state.jobs = jobs
+
+    def _job_or_404(job_id: str):
+        job = jobs.get(job_id)
+        if job is None:
+            raise HTTPException(404, "job not found")
+        return job
+
+    # ---------------- jobs ----------------
+    @app.post("/api/jobs", status_code=202)
+    async def submit_job(request: Request):
+        ctype = request.headers.get("content-type", "")
+        upload_span = None
+        uploaded: Optional[Path] = None  # сохранённая загрузка: при отказе удаляется
+        try:
+            if ctype.startswith("multipart/form-data"):
+                t0 = time.time()
+                form = await request.form()
+                upload = form.get("file")
+                if upload is None or not hasattr(upload, "filename"):
+                    raise HTTPException(400, "multipart field 'file' is required")
+                upload_dir = Path(cfg.upload_dir)
+                dest = upload_dir / uuid.uuid4().hex[:8] / Path(upload.filename or "upload.bin").name
+                uploaded = dest
+
+                def _save():
+                    dest.parent.mkdir(parents=True, exist_ok=True)
+                    with open(dest, "wb") as out:
+                        shutil.copyfileobj(upload.file, out, length=1024 * 1024)
+
+                await run_in_threadpool(_save)
+                await upload.close()
+                upload_span = (t0, time.time(), dest.stat().st_size)  # приём + сохранение → этап трассы
+                path, model_name, collection = dest, form.get("model_name"), form.get("collection")
+                profile = form.get("profile")
+            else:
+                try:
+                    body = await request.json()
+                except Exception:
+                    raise HTTPException(400, "expected multipart/form-data or JSON body")
+                if not body.get("path"):
+                    raise HTTPException(400, "field 'path' is required")
+                path = _resolve_allowed(body["path"], cfg.allowed_roots)
+                if not path.is_file():
+                    raise HTTPException(404, f"file not found: {path}")
+                model_name, collection = body.get("model_name"), body.get("collection")
+                profile = body.get("profile")
+            profiles = {**DECODING_PROFILES, **(get_config().transcriber.profiles or {})}
+            if profile and profile not in profiles:
+                raise HTTPException(400, f"unknown profile '{profile}' (available: {', '.join(profiles)})")
+
+            try:
+                # probe длительности (ffprobe) — в пуле потоков
+                job = await run_in_threadpool(
+                    jobs.submit, str(path), model_name=model_name or None, collection=collection or None,
+                    session=request.headers.get("x-session-id"), upload=upload_span, profile=profile or None)
+            except QueueFull as e:
+                raise HTTPException(429, str(e), headers={"Retry-After": "30"})
+        except BaseException:
+            if uploaded is not None:
+                _discard_upload(uploaded)  # и при отмене запроса: await здесь нельзя
+            raise
+        return job.to_dict()
+
+    @app.get("/api/jobs")
+    async def list_jobs(limit: int = Query(100, ge=1, le=1000)):
+        return [j.to_dict() for j in jobs.list()[:limit]]
+
+    @app.get("/api/jobs/{job_id}")
+    async def job_status(job_id: str):
+        return _job_or_404(job_id).to_dict()
+
+    @app.get("/api/jobs/{job_id}/segments")
+    async def job_segments(job_id: str, request: Request,
+                           start: int = Query(0, ge=0), format: str = Query("sse")):
+        job = _job_or_404(job_id)
+        # SSE-переподключение: продолжаем с Last-Event-ID
+        last_id = request.headers.get("last-event-id")
+        if last_id and last_id.isdigit():
+            start = int(last_id) + 1
+        ndjson = format == "ndjson"
+
+        async def stream():
+            idx = start
+            while True:
+                segs, done = await run_in_threadpool(job.wait_segments, idx, 15.0)
+                for seg in segs:
+                    data = json.dumps(seg, ensure_ascii=False)
+                    yield (data + "\n") if ndjson else f"id: {seg['index']}\nevent: segment\ndata: {data}\n\n"
+                    idx = seg["index"] + 1
+                if done and not segs:
+                    final = json.dumps(job.to_dict(), ensure_ascii=False)
+                    yield (final + "\n") if ndjson else f"event: done\ndata: {final}\n\n"
+                    return
+                if not segs and not ndjson:
+                    yield ": keep-alive\n\n"
+                if await request.is_disconnected():
+                    return
+
+        media = "application/x-ndjson" if ndjson else "text/event-stream"
+        return StreamingResponse(stream(), media_type=media,
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    # ---------------- search / transcripts / stats ----------------
+    @app.get("/api/search")
+    async def search(q: str = Query(..., min_length=1),
+                     page: int = Query(1, ge=1),
+                     page_size: int = Query(20, ge=1, le=200)):
+        try:
+            items, total = await run_in_threadpool(
+                studio.db.search_chunks, q, page_size, (page - 1) * page_size)
+        except Exception as e:  # синтаксис FTS5 MATCH
+            raise HTTPException(400, f"bad query: {e}")
+        return {"query": q, "page": page, "page_size": page_size, "total": total, "items": items}
+
+    @app.get("/api/transcripts/{file_id}")
+    async def transcript_range(file_id: int,
+                               offset: int = Query(0, ge=0),
+                               length: int = Query(65536, ge=1, le=16 * 1024 * 1024)):
+        res = await run_in_threadpool(studio.files.read_transcript_range, file_id, offset, length)
+        if res is None:
+            raise HTTPException(404, "transcript not found")
+        return res
+
+    @app.get("/api/traces/{trace_id}")
+    async def trace(trace_id: int, format: str = Query("json", pattern="^(json|chrome)$")):
+        from app.tracing import chrome_trace
+        rec = await run_in_threadpool(studio.db.get_trace, trace_id)
+        if rec is None:
+            raise HTTPException(404, "trace not found")
+        return chrome_trace([rec]) if format == "chrome" else rec
+
+    @app.get("/api/stats")
+    async def stats():
+        s = await run_in_threadpool(studio.db.get_stats)
+        s["heavy_lane"] = get_lanes().heavy.stats()
+        s["decode_profiles"] = await run_in_threadpool(studio.db.get_profile_rtf_stats)
+        s["maintenance"] = studio.ctx.maintenance.last_report
+        return s
+
+    # ---------------- удалённые воркеры ----------------
+    coordinator = jobs.coordinator
+    if coordinator is not None:
+        async def _cluster(request: Request, call, *args):
+            """Проверка X-Cluster-Token и вызов координатора в пуле потоков; 410 — аренды нет"""
+            if not coordinator.authorized(request.headers.get("x-cluster-token")):
+                raise HTTPException(401, "bad cluster token")
+            try:
+                return await run_in_threadpool(call, *args)
+            except LeaseLost:
+                raise HTTPException(410, "lease expired or unknown")
+
+        async def _body(request: Request) -> dict:
+            try:
+                return await request.json() or {}
+            except Exception:
+                raise HTTPException(400, "expected JSON body")
+
+        @app.post("/api/cluster/lease")
+        async def cluster_lease(request: Request):
+            body = await _body(request)
+            address = request.client.host if request.client else None
+            worker = str(body.get("worker") or address or "worker")
+            wait = min(max(float(body.get("wait") or 0), 0.0), 60.0)
+            task = await _cluster(request, coordinator.lease, worker, wait, address)
+            return task if task is not None else Response(status_code=204)
+
+        @app.get("/api/cluster/leases/{lease_id}/media")
+        async def cluster_media(lease_id: str, request: Request):
+            path = await _cluster(request, coordinator.media_path, lease_id)
+            return FileResponse(path, media_type="application/octet-stream", filename=path.name)
+
+        @app.post("/api/cluster/leases/{lease_id}/heartbeat")
+        async def cluster_heartbeat(lease_id: str, request: Request):
+            body = await _body(request)
+            return await _cluster(request, coordinator.heartbeat, lease_id, body.get("progress"),
+                                  str(body.get("desc") or ""))
+
+        @app.post("/api/cluster/leases/{lease_id}/segments")
+        async def cluster_segments(lease_id: str, request: Request):
+            body = await _body(request)
+            accepted = await _cluster(request, coordinator.add_segments, lease_id, body.get("segments") or [])
+            return {"accepted": accepted}
+
+        @app.post("/api/cluster/leases/{lease_id}/complete")
+        async def cluster_complete(lease_id: str, request: Request):
+            body = await _body(request)
+            await _cluster(request, coordinator.complete, lease_id, body.get("meta") or {})
+            return {"ok": True}
+
+        @app.post("/api/cluster/leases/{lease_id}/fail")
+        async def cluster_fail(lease_id: str, request: Request):
+            body = await _body(request)
+            await _cluster(request, coordinator.fail, lease_id, str(body.get("error") or "unknown error"),
+                           bool(body.get("retry", True)))
+            return {"ok": True}
+
+        @app.get("/api/cluster")
+        async def cluster_status(request: Request):
+            return await _cluster(request, coordinator.stats)
+
+    return app
+
+
+def start_api_server(studio, jobs: Optional[JobManager] = None) -> threading.Thread:
+    """Запустить API в фоновом потоке (uvicorn со своим event loop)"""
+    import uvicorn
+
+    cfg = get_config().api
+    app = create_app(studio, jobs)
+    server = uvicorn.Server(uvicorn.Config(app, host=cfg.host, port=cfg.port, log_level="warning"))
+    th = threading.Thread(target=server.run, name="rest-api", daemon=True)
+    th.start()
+    print(f"🌐 REST API: http://{cfg.host}:{cfg.port}/docs")
+    return th
+
+
+def main():
+    import uvicorn
+    from app.studio import WhisperRAGStudio
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    cfg = get_config().api
+    uvicorn.run(create_app(WhisperRAGStudio()), host=cfg.host, port=cfg.port)
+
+
+if __name__ == "__main__":
+    main()
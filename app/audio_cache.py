@@ -0,0 +1,161 @@
+"""
+Дисковый кэш декодированного аудио.
+
+Повторная транскрибация того же файла (другая модель, новые настройки, повтор после ошибки)
+не гоняет ffmpeg заново: PCM 16 кГц моно int16 лежит в cache_dir/<sha256>.pcm и открывается
+через memmap — без чтения в память. Бюджет размера — max_size_mb, вытесняются записи,
+к которым дольше всего не обращались (mtime обновляется при каждом попадании).
+
+    audio = load_audio("lecture.mp4", file_hash)   # np.float32 [-1, 1] для Whisper
+
+WAV (PCM, float, G.711) в кэш не попадает: он и так читается без декодера (app.media.load_wav).
+"""
+from __future__ import annotations
+import logging
+import os
+import subprocess
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from app.config import get_config
+from app.media import SAMPLE_RATE, content_hash
+
+log = logging.getLogger("whisper_rag_studio")
+
+READ_BLOCK = 1024 * 1024
+
+
+class AudioCache:
+    def __init__(self, config=None):
+        cfg = config or get_config().audio_cache
+        self.cache_dir = Path(cfg.cache_dir)
+        self.max_bytes = int(cfg.max_size_mb) * 1024 * 1024
+        self._lock = threading.Lock()
+
+    def path_for(self, file_hash: str) -> Path:
+        return self.cache_dir / f"{file_hash}.pcm"
+
+    def get(self, file_hash: str):
+        """np.memmap int16 или None, если записи нет"""
+        import numpy as np
+
+        p = self.path_for(file_hash)
+        try:
+            os.utime(p)  # отметка для LRU
+        except FileNotFoundError:
+            return None
+        if p.stat().st_size == 0:
+            return np.zeros(0, dtype=np.int16)
+        return np.memmap(p, dtype=np.int16, mode="r")
+
+    def put(self, file_hash: str, src: Union[str, Path]):
+        """Декодировать src в кэш (потоком из ffmpeg, без буфера на весь файл) → memmap"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_dir / f".{file_hash}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp, "wb") as out:
+                try:
+                    _decode_pcm16_to(src, out)
+                except FileNotFoundError:  # нет ffmpeg
+                    out.write(_decode_pcm16_pyav(src))
+            os.replace(tmp, self.path_for(file_hash))
+        finally:
+            tmp.unlink(missing_ok=True)
+        pcm = self.get(file_hash)
+        self.evict(keep=self.path_for(file_hash))
+        return pcm
+
+    def load(self, path: Union[str, Path], file_hash: Optional[str] = None):
+        """PCM int16 файла: из кэша или декодированием с записью в кэш"""
+        file_hash = file_hash or content_hash(path)
+        pcm = self.get(file_hash)
+        if pcm is None:
+            log.info("AUDIO CACHE miss %s → декодирование", Path(path).name)
+            pcm = self.put(file_hash, path)
+        return pcm
+
+    def evict(self, keep: Optional[Path] = None):
+        """Удалять самые давние записи (кроме keep), пока кэш не уложится в бюджет"""
+        with self._lock:
+            entries = []
+            for p in self.cache_dir.glob("*.pcm"):
+                try:
+                    st = p.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, p))
+            total = sum(size for _, size, _ in entries)
+            for _, size, p in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if p == keep:
+                    continue
+                try:
+                    p.unlink()
+                    total -= size
+                except OSError:  # Windows: файл ещё открыт через memmap
+                    continue
+
+    def stats(self) -> Dict[str, int]:
+        files = list(self.cache_dir.glob("*.pcm")) if self.cache_dir.exists() else []
+        return {"entries": len(files), "bytes": sum(p.stat().st_size for p in files),
+                "max_bytes": self.max_bytes}
+
+
+def _decode_pcm16_to(src: Union[str, Path], out, sampling_rate: int = SAMPLE_RATE):
+    """ffmpeg → s16le моно в файловый объект блоками"""
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", str(src), "-vn",
+        "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(sampling_rate), "-",
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # stderr читаем в отдельном потоке, иначе ffmpeg может встать на заполненном пайпе
+    err = []
+    t = threading.Thread(target=lambda: err.append(proc.stderr.read()), daemon=True)
+    t.start()
+    while True:
+        block = proc.stdout.read(READ_BLOCK)
+        if not block:
+            break
+        out.write(block)
+    proc.wait()
+    t.join()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg: {(err[0] if err else b'').decode(errors='ignore')[-500:]}")
+
+
+def _decode_pcm16_pyav(src: Union[str, Path], sampling_rate: int = SAMPLE_RATE) -> bytes:
+    import numpy as np
+    from faster_whisper.audio import decode_audio as fw_decode_audio
+
+    audio = fw_decode_audio(str(src), sampling_rate=sampling_rate)
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+
+
+_cache: Optional[AudioCache] = None
+
+
+def get_audio_cache() -> AudioCache:
+    global _cache
+    if _cache is None:
+        _cache = AudioCache()
+    return _cache
+
+
+def load_audio(path: Union[str, Path], file_hash: Optional[str] = None, offset: float = 0.0):
+    """Аудио для Whisper (np.float32, 16 кГц моно) начиная с offset сек — через кэш, если он включён"""
+    import numpy as np
+    from app.media import decode_audio, load_wav
+
+    # WAV читается напрямую (memmap + NumPy) — ни ffmpeg, ни копии в кэш
+    audio = load_wav(path, offset)
+    if audio is not None:
+        return audio
+    start = int(max(0.0, offset) * SAMPLE_RATE)
+    if not get_config().audio_cache.enabled:
+        return decode_audio(path)[start:]
+    pcm = get_audio_cache().load(path, file_hash)[start:]  # срез memmap — без чтения пропущенного
+    # единственная копия — int16 → float32 одной операцией прямо из memmap
+    return np.multiply(pcm, np.float32(1.0 / 32768.0), dtype=np.float32)
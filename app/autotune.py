@@ -0,0 +1,265 @@
+"""
+Подбор параметров CPU-инференса (faster-whisper / CTranslate2).
+
+Перебирает compute_type (int8, int8_float32, float32) × потоки × воркеры на коротком
+калибровочном клипе, сравнивает скорость (секунд аудио в секунду) и текст с эталоном float32.
+Лучшая годная комбинация пишется в конфиг (transcriber.cpu_compute_type / cpu_threads /
+num_workers) и применяется при загрузке модели.
+
+    python -m app.autotune --clip sample.wav --seconds 30
+    python -m app.autotune --dry-run          # только отчёт, конфиг не менять
+
+Здесь же — раскладка воркеров по ядрам/NUMA-узлам (pin_worker) для сервера инференса.
+"""
+from __future__ import annotations
+import difflib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import replace
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from app.config import get_config, update_config
+
+log = logging.getLogger("whisper_rag_studio")
+
+COMPUTE_TYPES = ("float32", "int8_float32", "int8")  # float32 первым — он же эталон текста
+REPORT_FILE = "./data/autotune.json"
+MIN_SIMILARITY = 0.85  # доля совпадающих слов с эталоном float32, ниже — комбинация негодна
+
+
+# ---------------------------------------------------------------------------
+# Топология CPU
+# ---------------------------------------------------------------------------
+def _parse_cpulist(text: str) -> Set[int]:
+    cpus: Set[int] = set()
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        lo, _, hi = part.partition("-")
+        cpus.update(range(int(lo), int(hi or lo) + 1))
+    return cpus
+
+
+def allowed_cpus() -> Set[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return set(os.sched_getaffinity(0))
+    return set(range(os.cpu_count() or 1))
+
+
+def numa_nodes() -> List[Set[int]]:
+    """Доступные ядра по NUMA-узлам (без sysfs — один узел)"""
+    allowed = allowed_cpus()
+    nodes = []
+    for p in sorted(Path("/sys/devices/system/node").glob("node[0-9]*/cpulist")):
+        try:
+            cpus = _parse_cpulist(p.read_text()) & allowed
+        except (OSError, ValueError):
+            continue
+        if cpus:
+            nodes.append(cpus)
+    return nodes or [allowed]
+
+
+def worker_cpus(slot: int, n_slots: int) -> Set[int]:
+    """Ядра для воркера slot из n_slots: воркеры по узлам по кругу, внутри узла — поровну"""
+    nodes = numa_nodes()
+    node_idx = slot % len(nodes)
+    cpus = sorted(nodes[node_idx])
+    peers = [s for s in range(n_slots) if s % len(nodes) == node_idx]
+    k, n = peers.index(slot), len(peers)
+    if n >= len(cpus):  # воркеров больше, чем ядер на узле — делят узел целиком
+        return set(cpus)
+    size = len(cpus) // n
+    return set(cpus[k * size:(k + 1) * size if k < n - 1 else len(cpus)])
+
+
+def pin_worker(slot: int, n_slots: int) -> Optional[Set[int]]:
+    """Закрепить текущий процесс за его долей ядер (только Linux)"""
+    if not hasattr(os, "sched_setaffinity"):
+        return None
+    cpus = worker_cpus(slot, n_slots)
+    try:
+        os.sched_setaffinity(0, cpus)
+    except OSError as e:
+        log.warning("affinity для воркера %d не установлена: %s", slot, e)
+        return None
+    log.info("INFERENCE worker %d → CPU %s", slot, ",".join(map(str, sorted(cpus))))
+    return cpus
+
+
+# ---------------------------------------------------------------------------
+# Бенчмарк
+# ---------------------------------------------------------------------------
+def calibration_clip(path: Optional[str] = None, seconds: float = 30.0):
+    """Первые seconds аудио из path (по умолчанию — последний обработанный файл в БД)"""
+    from app.audio_cache import load_audio
+    from app.media import SAMPLE_RATE
+
+    if not path:
+        from app.database import Database
+        get_config().ensure_dirs()
+        db = Database()
+        try:
+            for batch in db.iter_files():
+                for f in batch:
+                    if f["status"] == "completed" and Path(f["filepath"]).is_file():
+                        path = f["filepath"]
+        finally:
+            db.close()
+    if not path:
+        raise SystemExit("❌ Нет калибровочного клипа: укажите --clip <файл с речью>")
+    audio = load_audio(path)
+    return audio[:int(seconds * SAMPLE_RATE)].copy(), path
+
+
+def _similarity(a: str, b: str) -> float:
+    wa, wb = a.lower().split(), b.lower().split()
+    if not wa or not wb:
+        return 0.0  # SequenceMatcher([], []) дал бы 1.0 — пустой прогон не «совпадает»
+    return difflib.SequenceMatcher(None, wa, wb).ratio()
+
+
+def _default_threads(n_cpus: int) -> List[int]:
+    opts, t = [], 1
+    while t < n_cpus:
+        opts.append(t)
+        t *= 2
+    return sorted(set(opts + [n_cpus]))
+
+
+def _run_parallel(model, audio, workers: int):
+    """workers одновременных распознаваний → (тексты, секунды); ошибка любого потока пробрасывается"""
+    texts: List[str] = [""] * workers
+    errors: List[Optional[BaseException]] = [None] * workers
+
+    def run(i):
+        try:
+            texts[i], _ = model.transcribe_audio(audio)
+        except BaseException as e:  # иначе поток молча оставит пустой текст
+            errors[i] = e
+
+    t0 = time.perf_counter()
+    pool = [threading.Thread(target=run, args=(i,)) for i in range(workers)]
+    for th in pool:
+        th.start()
+    for th in pool:
+        th.join()
+    wall = time.perf_counter() - t0
+    failed = next((e for e in errors if e is not None), None)
+    if failed is not None:
+        raise failed
+    if not all(t.strip() for t in texts):
+        raise RuntimeError("пустой текст распознавания — сравнивать с эталоном нечего")
+    return texts, wall
+
+
+def benchmark(audio, compute_types=COMPUTE_TYPES, threads: Optional[List[int]] = None,
+              workers: Optional[List[int]] = None) -> List[Dict]:
+    """Прогнать все комбинации; результат — список dict (с throughput, similarity, ok)"""
+    import ctranslate2
+    from app.media import SAMPLE_RATE
+    from transcriber import Transcriber
+
+    base = replace(get_config().transcriber, device="cpu", use_faster_whisper=True)
+    n_cpus = len(allowed_cpus())
+    threads = threads or _default_threads(n_cpus)
+    workers = workers or [w for w in (1, 2, 4) if w == 1 or n_cpus >= 2 * w]
+    supported = set(ctranslate2.get_supported_compute_types("cpu"))
+    clip_sec = len(audio) / SAMPLE_RATE
+    reference: Optional[str] = None
+    results: List[Dict] = []
+
+    for ct in compute_types:
+        for w in workers:
+            for t in threads:
+                res = {"compute_type": ct, "cpu_threads": t, "num_workers": w, "ok": False}
+                results.append(res)
+                if ct not in supported:
+                    res["error"] = "не поддерживается на этом CPU"
+                    continue
+                if t * w > n_cpus:
+                    res["error"] = f"потоков {t}×{w} больше ядер ({n_cpus})"
+                    continue
+                try:
+                    tr = Transcriber(replace(base, cpu_compute_type=ct, cpu_threads=t, num_workers=w),
+                                     mode="local")
+                    tr.transcribe_audio(audio[:SAMPLE_RATE * 5])  # прогрев
+                    texts, wall = _run_parallel(tr, audio, w)
+                    del tr
+                except Exception as e:
+                    res["error"] = f"{type(e).__name__}: {e}"
+                    continue
+                if reference is None:
+                    reference = texts[0]  # первый успешный непустой прогон (обычно float32)
+                res.update(
+                    wall_seconds=round(wall, 3),
+                    throughput=round(w * clip_sec / wall, 3),  # секунд аудио в секунду
+                    similarity=round(min(_similarity(reference, text) for text in texts), 3),
+                )
+                res["ok"] = res["similarity"] >= MIN_SIMILARITY
+                log.info("AUTOTUNE %s", res)
+    return results
+
+
+def best_of(results: List[Dict]) -> Optional[Dict]:
+    viable = [r for r in results if r["ok"]]
+    return max(viable, key=lambda r: r["throughput"]) if viable else None
+
+
+def apply(best: Dict):
+    """Записать комбинацию в конфиг; воркеров модели без параллельных задач не бывает"""
+    cfg = get_config()
+    update_config(**{
+        "transcriber.cpu_compute_type": best["compute_type"],
+        "transcriber.cpu_threads": best["cpu_threads"],
+        "transcriber.num_workers": best["num_workers"],
+        "lanes.heavy_concurrency": max(cfg.lanes.heavy_concurrency, best["num_workers"]),
+    })
+
+
+def main():
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Подбор compute_type / потоков / воркеров для CPU")
+    parser.add_argument("--clip", help="калибровочный файл с речью (по умолчанию — из БД)")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--compute-types", default=",".join(COMPUTE_TYPES))
+    parser.add_argument("--threads", help="например 2,4,8 (по умолчанию степени двойки до числа ядер)")
+    parser.add_argument("--workers", help="например 1,2")
+    parser.add_argument("--dry-run", action="store_true", help="не записывать результат в конфиг")
+    args = parser.parse_args()
+
+    def ints(s):
+        return [int(x) for x in s.split(",")] if s else None
+
+    audio, path = calibration_clip(args.clip, args.seconds)
+    print(f"🎧 Калибровка: {path} ({len(audio) / 16000:.1f} сек), ядер: {len(allowed_cpus())}, "
+          f"NUMA-узлов: {len(numa_nodes())}")
+    results = benchmark(audio, [c.strip() for c in args.compute_types.split(",")],
+                        ints(args.threads), ints(args.workers))
+    best = best_of(results)
+
+    os.makedirs(Path(REPORT_FILE).parent, exist_ok=True)
+    with open(REPORT_FILE, "w", encoding="utf-8") as f:
+        json.dump({"clip": path, "results": results, "best": best}, f, ensure_ascii=False, indent=2)
+
+    for r in sorted(results, key=lambda r: -(r.get("throughput") or 0)):
+        mark = "✅" if r["ok"] else "✗"
+        print(f"{mark} {r['compute_type']:>13} threads={r['cpu_threads']:<3} workers={r['num_workers']} "
+              f"{r.get('throughput', '-')}x  sim={r.get('similarity', '-')}  {r.get('error', '')}")
+    if best is None:
+        raise SystemExit("❌ Ни одна комбинация не прошла")
+    print(f"\n🏆 {best['compute_type']}, потоков {best['cpu_threads']}, воркеров {best['num_workers']} "
+          f"→ {best['throughput']}x реального времени")
+    if not args.dry_run:
+        apply(best)
+        print(f"💾 Записано в {get_config().config_file}")
+
+
+if __name__ == "__main__":
+    main()
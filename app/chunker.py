@@ -1,9 +1,16 @@
 """
 Нарезка текста на чанки для RAG
 """
-from typing import List
+import re
+from typing import Iterable, Iterator, List, Tuple
 from app.config import get_config
 
+_SENTENCE_END = re.compile(r"[!?.] ")
+
+
+def _sentences(text: str) -> List[str]:
+    return text.replace('! ', '!|').replace('? ', '?|').replace('. ', '.|').split('|')
+
 
 class TextChunker:
     def __init__(self, config=None):
@@ -50,19 +57,7 @@ class TextChunker:
                 chunks.extend(self._split_large_paragraph(para))
                 continue
             
-            # Если добавление параграфа превысит размер
-            if current_size + para_size > self.chunk_size and current_chunk:
-                # Сохраняем текущий чанк
-                chunks.append(self.separator.join(current_chunk))
-                
-                # Создаем перекрытие (overlap)
-                overlap_text = self._create_overlap(current_chunk)
-                current_chunk = [overlap_text, para] if overlap_text else [para]
-                current_size = len(overlap_text) + para_size if overlap_text else para_size
-            else:
-                # Добавляем к текущему чанку
-                current_chunk.append(para)
-                current_size += para_size + len(self.separator)
+            current_chunk, current_size = self._pack_paragraph(para, (current_chunk, current_size), chunks)
         
         # Добавляем последний чанк
         if current_chunk:
@@ -70,15 +65,55 @@ class TextChunker:
         
         return chunks
     
+    def iter_chunks(self, pieces: Iterable[str]) -> Iterator[str]:
+        """
+        То же, что chunk_text, но текст приходит частями (сегменты распознавания, блоки
+        хранилища), а чанки отдаются по мере готовности: в памяти — текущий чанк, начало
+        абзаца (не длиннее chunk_size) и недописанное предложение, а не весь текст
+        """
+        stream = _ChunkStream(self)
+        for piece in pieces:
+            yield from stream.feed(piece)
+        yield from stream.close()
+    
+    def _pack_paragraph(self, para: str, state: Tuple[List[str], int],
+                        chunks: List[str]) -> Tuple[List[str], int]:
+        """Абзац не больше chunk_size → готовый чанк в chunks; state — (текущий чанк, его размер)"""
+        current_chunk, current_size = state
+        para_size = len(para)
+        
+        # Если добавление параграфа превысит размер
+        if current_size + para_size > self.chunk_size and current_chunk:
+            # Сохраняем текущий чанк
+            chunks.append(self.separator.join(current_chunk))
+            
+            # Создаем перекрытие (overlap)
+            overlap_text = self._create_overlap(current_chunk)
+            current_chunk = [overlap_text, para] if overlap_text else [para]
+            current_size = len(overlap_text) + para_size if overlap_text else para_size
+        else:
+            # Добавляем к текущему чанку
+            current_chunk.append(para)
+            current_size += para_size + len(self.separator)
+        
+        return current_chunk, current_size
+    
     def _split_large_paragraph(self, paragraph: str) -> List[str]:
         """Разбивка большого параграфа на куски по предложениям"""
         # Простая разбивка по предложениям
-        sentences = paragraph.replace('! ', '!|').replace('? ', '?|').replace('. ', '.|').split('|')
+        sentences = _sentences(paragraph)
         
         chunks = []
-        current = []
-        current_size = 0
+        state = self._pack_sentences(sentences, ([], 0), chunks)
+        if state[0]:
+            chunks.append(' '.join(state[0]))
         
+        return chunks
+    
+    def _pack_sentences(self, sentences: Iterable[str], state: Tuple[List[str], int],
+                        chunks: List[str]) -> Tuple[List[str], int]:
+        """Предложения → готовые чанки в chunks; state — (текущий чанк, его размер) до и после"""
+        current, current_size = state
         for sentence in sentences:
             sentence = sentence.strip()
             if not sentence:
@@ -99,10 +134,7 @@ class TextChunker:
                 current.append(sentence)
                 current_size += sent_size
         
-        if current:
-            chunks.append(' '.join(current))
-        
-        return chunks
+        return current, current_size
     
     def _create_overlap(self, chunks: List[str]) -> str:
         """Создание текста перекрытия из последних частей чанка"""
@@ -123,6 +155,71 @@ class TextChunker:
         return self.separator.join(overlap_parts) if overlap_parts else ""
 
 
+class _ChunkStream:
+    """Состояние TextChunker.iter_chunks: нарезка та же, что у chunk_text на склеенном тексте"""
+    
+    def __init__(self, chunker: TextChunker):
+        self.chunker = chunker
+        self.buf = ""  # начало текущего абзаца либо недописанное предложение большого абзаца
+        self.large = False  # текущий абзац длиннее chunk_size — режется по предложениям
+        self.paras: Tuple[List[str], int] = ([], 0)  # чанк из абзацев
+        self.sents: Tuple[List[str], int] = ([], 0)  # чанк из предложений большого абзаца
+    
+    def feed(self, piece: str) -> List[str]:
+        c, sep = self.chunker, self.chunker.separator
+        out: List[str] = []
+        self.buf += piece
+        while True:
+            i = self.buf.find(sep)
+            if i < 0:
+                break
+            para, self.buf = self.buf[:i], self.buf[i + len(sep):]
+            self._end_paragraph(para, out)
+        # длина после strip у начала абзаца не больше, чем у всего абзаца: он уже точно большой
+        if not self.large and len(self.buf.strip()) > c.chunk_size:
+            self._start_large(out)
+        if self.large:
+            # целые предложения; хвост, который может оказаться началом разделителя, ждёт
+            cut = 0
+            for m in _SENTENCE_END.finditer(self.buf, 0, len(self.buf) - len(sep) + 1):
+                cut = m.end()
+            if cut:
+                self.sents = c._pack_sentences(_sentences(self.buf[:cut]), self.sents, out)
+                self.buf = self.buf[cut:]
+        return out
+    
+    def close(self) -> List[str]:
+        out: List[str] = []
+        self._end_paragraph(self.buf, out)
+        self.buf = ""
+        if self.paras[0]:
+            out.append(self.chunker.separator.join(self.paras[0]))
+            self.paras = ([], 0)
+        return out
+    
+    def _start_large(self, out: List[str]):
+        if self.paras[0]:
+            out.append(self.chunker.separator.join(self.paras[0]))
+            self.paras = ([], 0)
+        self.large = True
+    
+    def _end_paragraph(self, para: str, out: List[str]):
+        c = self.chunker
+        if not self.large:
+            para = para.strip()
+            if not para:
+                return
+            if len(para) <= c.chunk_size:
+                self.paras = c._pack_paragraph(para, self.paras, out)
+                return
+            self._start_large(out)
+        current, _ = c._pack_sentences(_sentences(para), self.sents, out)
+        if current:
+            out.append(' '.join(current))
+        self.sents = ([], 0)
+        self.large = False
+
+
 if __name__ == "__main__":
     # Тест чанкера
     chunker = TextChunker()
@@ -145,4 +242,20 @@ if __name__ == "__main__":
     for i, chunk in enumerate(chunks, 1):
         print(f"Чанк {i} ({len(chunk)} символов):")
         print(chunk[:100] + "..." if len(chunk) > 100 else chunk)
-        print("-" * 50)
\ No newline at end of file
+        print("-" * 50)
+
+# ---- пул процессов для перенарезки (app/studio/rechunk.py) ----
+_pool_chunker = None
+
+
+def init_pool_chunker(chunk_size: int, chunk_overlap: int, separator: str):
+    """initializer процесса пула: чанкер с параметрами собираемой версии"""
+    global _pool_chunker
+    from app.config import ChunkerConfig
+    _pool_chunker = TextChunker(ChunkerConfig(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                              separator=separator))
+
+
+def chunk_batch(items: List[Tuple[int, str]]) -> List[Tuple[int, List[str]]]:
+    """[(transcript_id, текст)] → [(transcript_id, чанки)]"""
+    return [(tid, _pool_chunker.chunk_text(text or "")) for tid, text in items]
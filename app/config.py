@@ -7,6 +7,37 @@ from pathlib import Path
 from dataclasses import dataclass, field
 from typing import Literal, Optional
 
+# Профили декодирования: скорость ↔ точность (beam search, запасные температуры, проверка сжатия).
+# accurate совпадает с умолчаниями faster-whisper/openai-whisper.
+# without_timestamps во всех профилях выключен: без таймкодов сегмент — целое окно 30 сек,
+# и с той же грубостью работают продолжение с контрольной точки, SRT/VTT и склейка на границе
+DECODING_PROFILES = {
+    "fast": {
+        "beam_size": 1,
+        "best_of": 1,
+        "temperature": [0.0],
+        "compression_ratio_threshold": 2.4,
+        "without_timestamps": False,
+        "word_timestamps": False,
+    },
+    "balanced": {
+        "beam_size": 3,
+        "best_of": 3,
+        "temperature": [0.0, 0.4, 0.8],
+        "compression_ratio_threshold": 2.4,
+        "without_timestamps": False,
+        "word_timestamps": False,
+    },
+    "accurate": {
+        "beam_size": 5,
+        "best_of": 5,
+        "temperature": [0.0, 0.2, 0.4, 0.6, 0.8, 1.0],
+        "compression_ratio_threshold": 2.4,
+        "without_timestamps": False,
+        "word_timestamps": False,
+    },
+}
+
 
 @dataclass
 class TranscriberConfig:
@@ -18,9 +49,29 @@ class TranscriberConfig:
     compute_type: str = "float16"  # float16 / int8 / float32
     language: str = "ru"
 
+    # CPU (faster-whisper): float16 на CPU не поддерживается, поэтому при device=cpu
+    # используется cpu_compute_type. Значения подбирает python -m app.autotune
+    cpu_compute_type: str = "int8"  # int8 / int8_float32 / float32
+    cpu_threads: int = 0  # потоков CTranslate2 на модель (0 — по умолчанию)
+    num_workers: int = 1  # параллельных транскрибаций на одну модель
+    pin_threads: bool = True  # воркеры сервера инференса на CPU закрепляются за своими ядрами/NUMA-узлом
+
+    # Два прохода: быстрый черновик малой моделью сразу, model_name — в фоне с атомарной заменой
+    two_pass: bool = False
+    draft_model_name: str = "base"
+
+    # Сегменты сохраняются в БД по ходу распознавания; после сбоя — продолжение с последнего
+    checkpoint_interval: float = 10.0  # сек между сохранениями (0 — без контрольных точек)
+
+    # Профиль декодирования по умолчанию (задача API и Settings могут выбрать другой)
+    profile: str = "accurate"  # fast / balanced / accurate
+    profiles: dict = field(default_factory=lambda: {k: dict(v) for k, v in DECODING_PROFILES.items()})
+
     # VAD настройки
     use_vad: bool = True
     vad_threshold: float = 0.5
+    vad_stage: bool = True  # VAD отдельным этапом: карта речи хранится по хэшу содержимого
+    vad_min_speech: float = 0.3  # сек речи, меньше — файл считается тихим (Whisper не запускается)
 
     # Фильтрация галлюцинаций
     filter_hallucinations: bool = True
@@ -39,22 +90,36 @@ class ChunkerConfig:
     chunk_size: int = 1000  # символов
     chunk_overlap: int = 200  # символов перекрытия
     separator: str = "\n\n"  # разделитель
+    # перенарезка существующих транскриптов при смене параметров (app/studio/rechunk.py)
+    rechunk_workers: int = 2  # процессов в пуле
+    rechunk_batch: int = 200  # транскриптов на транзакцию
+    # почти-дубликаты чанков (app/minhash.py): off | flag (пометить, скрыть из поиска) | skip (не сохранять)
+    dedupe: str = "flag"
+    dedupe_threshold: float = 0.85  # оценка сходства Жаккара по MinHash
 
 
 @dataclass
 class DatabaseConfig:
     """Настройки базы данных"""
     db_path: str = "./data/database.db"
-    transcripts_dir: str = "./data/transcripts"
+    transcripts_dir: str = "./data/transcripts"  # старые .txt (переносятся в transcripts_pack)
     chunks_dir: str = "./data/chunks"
+    # Упакованное хранилище транскриптов (app/transcript_store.py)
+    transcripts_pack: str = "./data/transcripts.pack"
+    pack_block_size: int = 65536  # байт текста в одном сжатом блоке
+    pack_codec: str = "auto"  # auto (zstd, если установлен zstandard) | zstd | zlib
+    migrate_txt_on_start: bool = True  # переносить старые .txt в pack при запуске UI
 
 
 @dataclass
 class APIConfig:
-    """Локальный REST API (если он у тебя есть в этом приложении)"""
+    """Локальный REST API (app/api.py), работает параллельно с UI"""
     host: str = "127.0.0.1"
     port: int = 8000
     enable_api: bool = True
+    upload_dir: str = "./data/uploads"  # куда сохраняются файлы из multipart-запросов
+    # Задачи по пути принимаются только для файлов внутри этих каталогов
+    allowed_roots: list = field(default_factory=lambda: ["./files", "./data/uploads"])
 
 
 @dataclass
@@ -66,6 +131,114 @@ class NooForgeConfig:
     ingest_file_path: str = "/api/ingest/file"
     rag_query_path: str = "/api/rag/query"
     default_collection: str = "chunks"
+    # delta — отправлять только новые/изменённые чанки и удалять исчезнувшие (учёт в БД, refiner_ingest);
+    # full — весь текст транскрипта одним документом, как раньше
+    ingest_mode: str = "delta"
+    ingest_batch_path: str = "/api/ingest/batch"  # нет (404/405) — чанки уходят по одному на ingest_text_path
+    delete_path: str = "/api/ingest/delete"
+    ingest_batch_size: int = 64  # чанков в одном запросе
+    request_timeout: float = 120.0  # сек на запрос (загрузка файла — не меньше 300)
+    pool_size: int = 8  # keep-alive соединений к Refiner (одновременных запросов без переподключения)
+
+
+@dataclass
+class WatcherConfig:
+    """Слежение за папками (автоматическая постановка файлов в транскрибацию)"""
+    enabled: bool = False
+    # Каждая папка — dict: path, model_name, collection, recursive
+    folders: list = field(default_factory=lambda: [
+        {"path": "./files", "model_name": None, "collection": None, "recursive": True},
+    ])
+    use_inotify: bool = True  # иначе (или если inotify недоступен) — опрос
+    poll_interval: float = 2.0  # сек между проходами опроса / проверками «дозаписи»
+    rescan_interval: float = 60.0  # полный пересканер при inotify (сетевые ФС событий не шлют)
+    settle_seconds: float = 5.0  # размер и mtime не менялись столько сек → файл дописан
+    max_concurrent: int = 1  # сколько файлов транскрибируется одновременно
+    extensions: list = field(default_factory=lambda: [
+        ".mp3", ".wav", ".m4a", ".flac", ".ogg",
+        ".mp4", ".mkv", ".avi", ".mov", ".wmv", ".flv", ".webm",
+    ])
+
+
+@dataclass
+class InferenceConfig:
+    """Отдельный процесс инференса (модель вне процесса UI)"""
+    mode: str = "local"  # local — модель в процессе UI; server — через сервер инференса
+    socket_path: str = "./data/inference.sock"
+    num_workers: int = 1  # процессов-воркеров с собственной копией модели
+    autostart: bool = True  # клиент сам запустит сервер, если сокет не отвечает
+    max_attempts: int = 3  # сколько раз переотправлять задачу после падения воркера
+    stall_timeout: float = 600.0  # сек без сегментов → воркер считается зависшим и перезапускается
+    cancel_grace: float = 10.0  # сек: клиент отключился, воркер не бросил задачу сам → перезапуск
+
+
+@dataclass
+class LanesConfig:
+    """Полосы исполнения: тяжёлые задачи (транскрибация) отдельно от быстрых (поиск, списки, RAG)"""
+    heavy_concurrency: int = 1  # одновременных транскрибаций на весь процесс (UI + API + папки)
+    heavy_max_queue: int = 8  # ждущих в очереди; сверху — «очередь заполнена»
+    heavy_per_session: int = 1  # тяжёлых задач на одну сессию UI (0 — без лимита)
+    # порядок очереди heavy: sjf — короткие вперёд со старением (HRRN), fifo — по времени постановки
+    heavy_policy: str = "sjf"
+    sjf_aging: float = 1.0  # вес ожидания: приоритет 1 + sjf_aging × ждёт / оценка (0 — чистый SJF)
+    sjf_default_rtf: float = 0.5  # RTF, пока нет истории распознавания для профиля
+    sjf_unknown_seconds: float = 600.0  # оценка задачи с неизвестной длительностью (нет ffprobe)
+    fast_concurrency: int = 8  # параллельных быстрых запросов в Gradio
+
+
+@dataclass
+class AudioCacheConfig:
+    """Кэш декодированного аудио (сырой PCM 16 кГц моно int16, <sha256>.pcm, читается через memmap)"""
+    enabled: bool = True
+    cache_dir: str = "./data/audio_cache"
+    max_size_mb: int = 4096  # при превышении удаляются давно не использованные записи
+
+
+@dataclass
+class TracingConfig:
+    """Трассы задач транскрибации (app/tracing.py): этапы, RSS и CPU — в БД"""
+    enabled: bool = True
+    sample_interval: float = 0.5  # сек между замерами RSS/CPU
+    keep: int = 500  # сколько последних трасс хранить
+
+
+@dataclass
+class PipelineConfig:
+    """Конвейер пакетной транскрибации (API, папки): декодирование → распознавание → запись"""
+    enabled: bool = True
+    decode_workers: int = 1  # потоков prefetch: хэш, PCM в кэш аудио, карта речи (VAD)
+    prefetch_depth: int = 2  # сколько файлов готовится заранее (дальше декодирование не убегает)
+    write_workers: int = 1  # одновременных записей: чанки, БД, ingest в Refiner
+    write_queue: int = 2  # распознанных файлов в ожидании записи; больше — распознавание ждёт
+
+
+@dataclass
+class MaintenanceConfig:
+    """Фоновое обслуживание БД (app/maintenance.py): слияние FTS, статистика планировщика, vacuum, проверки"""
+    enabled: bool = True
+    interval_minutes: float = 60.0  # плановый прогон не чаще
+    check_seconds: float = 30.0  # как часто проверять, пора ли
+    idle_seconds: float = 120.0  # транскрибация простаивает столько — полный optimize FTS
+    merge_pages: int = 500  # страниц за шаг FTS5 merge (между шагами БД доступна остальным)
+    optimize_segments: int = 16  # сегментов в индексе FTS больше — при простое optimize
+    vacuum_pages: int = 2000  # страниц за incremental_vacuum
+    integrity_check: bool = True  # сверка FTS с таблицами (расхождение — rebuild) и quick_check
+
+
+@dataclass
+class ClusterConfig:
+    """Удалённые воркеры транскрибации: координатор в студии (app/coordinator.py) и app/worker.py"""
+    enabled: bool = False  # задачи API распознают воркеры, а не локальная полоса heavy
+    token: Optional[str] = None  # общий секрет воркеров (заголовок X-Cluster-Token); обязателен при enabled
+    lease_seconds: float = 60.0  # аренда без heartbeat дольше — задача уходит другому воркеру
+    max_attempts: int = 3  # выдач одной задачи (истёкшие аренды, ошибки воркера)
+    max_queue: int = 100  # задач в ожидании воркера; больше — 429
+    # воркер
+    coordinator_url: str = "http://127.0.0.1:8000"
+    heartbeat_seconds: float = 10.0  # не реже lease_seconds / 3
+    poll_seconds: float = 20.0  # long-poll аренды
+    segment_batch: int = 20  # сегментов в одном POST
+    download_dir: str = "./data/worker"  # медиа арендованных задач (удаляется после задачи)
 
 
 @dataclass
@@ -76,27 +249,34 @@ class AppConfig:
     database: DatabaseConfig = field(default_factory=DatabaseConfig)
     api: APIConfig = field(default_factory=APIConfig)
     nooforge: NooForgeConfig = field(default_factory=NooForgeConfig)
+    watcher: WatcherConfig = field(default_factory=WatcherConfig)
+    inference: InferenceConfig = field(default_factory=InferenceConfig)
+    lanes: LanesConfig = field(default_factory=LanesConfig)
+    audio_cache: AudioCacheConfig = field(default_factory=AudioCacheConfig)
+    tracing: TracingConfig = field(default_factory=TracingConfig)
+    pipeline: PipelineConfig = field(default_factory=PipelineConfig)
+    maintenance: MaintenanceConfig = field(default_factory=MaintenanceConfig)
+    cluster: ClusterConfig = field(default_factory=ClusterConfig)
 
     config_file: str = "./data/config.json"  # Путь к файлу конфига
 
-    def __post_init__(self):
-        """Создаем необходимые директории"""
+    # Секции, которые пишутся/читаются из JSON
+    SECTIONS = ("transcriber", "chunker", "database", "api", "nooforge", "watcher", "inference", "lanes",
+                "audio_cache", "tracing", "pipeline", "maintenance", "cluster")
+
+    def ensure_dirs(self):
+        """Создаем необходимые директории (лениво — при первом открытии БД)"""
         os.makedirs(self.database.transcripts_dir, exist_ok=True)
         os.makedirs(self.database.chunks_dir, exist_ok=True)
         os.makedirs(Path(self.database.db_path).parent, exist_ok=True)
+        os.makedirs(Path(self.database.transcripts_pack).parent, exist_ok=True)
 
     def save_to_file(self):
         """Сохранить конфиг в JSON файл"""
         import json
         from dataclasses import asdict
 
-        config_dict = {
-            'transcriber': asdict(self.transcriber),
-            'chunker': asdict(self.chunker),
-            'database': asdict(self.database),
-            'api': asdict(self.api),
-            'nooforge': asdict(self.nooforge),
-        }
+        config_dict = {name: asdict(getattr(self, name)) for name in self.SECTIONS}
 
         os.makedirs(Path(self.config_file).parent, exist_ok=True)
 
@@ -114,30 +294,11 @@ class AppConfig:
             with open(self.config_file, 'r', encoding='utf-8') as f:
                 config_dict = json.load(f)
 
-            if 'transcriber' in config_dict:
-                for k, v in config_dict['transcriber'].items():
-                    if hasattr(self.transcriber, k):
-                        setattr(self.transcriber, k, v)
-
-            if 'chunker' in config_dict:
-                for k, v in config_dict['chunker'].items():
-                    if hasattr(self.chunker, k):
-                        setattr(self.chunker, k, v)
-
-            if 'database' in config_dict:
-                for k, v in config_dict['database'].items():
-                    if hasattr(self.database, k):
-                        setattr(self.database, k, v)
-
-            if 'api' in config_dict:
-                for k, v in config_dict['api'].items():
-                    if hasattr(self.api, k):
-                        setattr(self.api, k, v)
-
-            if 'nooforge' in config_dict:
-                for k, v in config_dict['nooforge'].items():
-                    if hasattr(self.nooforge, k):
-                        setattr(self.nooforge, k, v)
+            for name in self.SECTIONS:
+                section = getattr(self, name)
+                for k, v in config_dict.get(name, {}).items():
+                    if hasattr(section, k):
+                        setattr(section, k, v)
 
             return True
         except Exception as e:
@@ -188,3 +349,8 @@ if __name__ == "__main__":
     print("Database:", cfg.database)
     print("API:", cfg.api)
     print("NooForge:", cfg.nooforge)
+    print("Watcher:", cfg.watcher)
+    print("Inference:", cfg.inference)
+    print("Lanes:", cfg.lanes)
+    print("Audio cache:", cfg.audio_cache)
+    print("Tracing:", cfg.tracing)
@@ -0,0 +1,283 @@
+"""
+Координатор удалённых воркеров транскрибации (встроен в REST API студии).
+
+При cluster.enabled задачи API (app.jobs) распознаёт не локальная полоса heavy, а воркеры
+(python -m app.worker) на других машинах. Брокер не нужен — воркеры сами забирают задачи по HTTP:
+
+    POST /api/cluster/lease                    аренда задачи (long-poll) → 200 задача / 204 нет
+    GET  /api/cluster/leases/{id}/media        исходный файл потоком
+    POST /api/cluster/leases/{id}/heartbeat    продление аренды, прогресс
+    POST /api/cluster/leases/{id}/segments     порция сегментов
+    POST /api/cluster/leases/{id}/complete     meta распознавания → транскрипт в БД
+    POST /api/cluster/leases/{id}/fail         ошибка воркера (retry — отдать другому)
+    GET  /api/cluster                          очередь, аренды, воркеры
+
+Сегменты сразу пишутся в контрольную точку файла (segment_checkpoints) и видны в стриме
+задачи; транскрипт, чанки и ingest собираются из неё в студии по complete. Аренда без heartbeat
+дольше cluster.lease_seconds истекает: задача возвращается в начало очереди, и следующий воркер
+продолжает с последнего принятого сегмента (как после сбоя). Старому воркеру на любой запрос
+по истёкшей аренде отвечают 410 — он бросает задачу.
+"""
+from __future__ import annotations
+import hmac
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+from app import tracing
+from app.config import get_config
+from app.lanes import QueueFull
+from app.media import content_hash
+
+log = logging.getLogger("whisper_rag_studio")
+
+
+class LeaseLost(Exception):
+    """Аренды нет: истекла и передана другому воркеру, или задача уже завершена"""
+
+
+@dataclass
+class RemoteTask:
+    job: Any  # app.jobs.Job
+    path: Path
+    file_id: int
+    file_hash: str
+    model: str
+    attempts: int = 0
+    lease_id: Optional[str] = None
+    worker: Optional[str] = None
+    deadline: float = 0.0  # time.monotonic() истечения аренды
+    tail: Optional[Dict[str, Any]] = None  # последний принятый сегмент до текущей аренды
+    next_index: int = 0
+    meta: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    done: threading.Event = field(default_factory=threading.Event)
+
+
+class Coordinator:
+    """Очередь удалённых задач и аренды воркеров (см. модуль)"""
+
+    def __init__(self, studio, config=None):
+        self.studio = studio
+        self.cfg = config or get_config().cluster
+        if not self.cfg.token:
+            # API координатора открыт другим машинам: без секрета любой в сети арендует задачи,
+            # скачивает медиа и присылает свои сегменты
+            raise ValueError("cluster.enabled требует cluster.token (общий секрет воркеров)")
+        self._pending: Deque[RemoteTask] = deque()
+        self._leases: Dict[str, RemoteTask] = {}
+        self._workers: Dict[str, Dict[str, Any]] = {}  # имя → last_seen, address, leases, completed
+        self._cond = threading.Condition()
+        self._reaper: Optional[threading.Thread] = None
+
+    def authorized(self, token: Optional[str]) -> bool:
+        """Токен воркера совпадает с cluster.token (сравнение за постоянное время)"""
+        return hmac.compare_digest((token or "").encode(), self.cfg.token.encode())
+
+    def check_room(self):
+        """QueueFull, если воркеров ждут cluster.max_queue задач"""
+        with self._cond:
+            if len(self._pending) >= self.cfg.max_queue:
+                raise QueueFull(f"Очередь удалённых воркеров заполнена ({self.cfg.max_queue})")
+
+    # ---- сторона студии (поток задачи) ----
+    def run(self, job, progress=None) -> Dict[str, Any]:
+        """Распознать файл задачи на воркере → результат как у transcribe_path"""
+        transcribe = self.studio.transcribe
+        path = Path(job.path)
+        with tracing.span("hash", bytes=path.stat().st_size):
+            file_hash = content_hash(path)
+        claim = transcribe.claim_file(path, file_hash)
+        if "result" in claim:
+            return claim["result"]
+        model = job.model_name or self.studio.config.transcriber.model_name
+        task = RemoteTask(job=job, path=path, file_id=claim["file_id"], file_hash=file_hash, model=model)
+        try:
+            with tracing.span("remote", model=model) as sp:
+                with self._cond:
+                    self._pending.append(task)
+                    self._cond.notify_all()
+                self._ensure_reaper()
+                task.done.wait()
+                if sp is not None:
+                    sp.attrs.update(worker=task.worker, attempts=task.attempts)
+            if task.error is not None:
+                self.studio.db.update_file_status(task.file_id, "failed", task.error)
+                raise RuntimeError(task.error)
+        except BaseException:
+            transcribe.release_file(task.file_id)
+            raise
+        return transcribe.persist_checkpoint(task.file_id, model, task.meta, progress)
+
+    # ---- сторона воркера (обработчики HTTP) ----
+    def lease(self, worker: str, wait: float = 0.0, address: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Выдать задачу воркеру (ждёт до wait сек) → описание аренды или None"""
+        until = time.monotonic() + max(0.0, wait)
+        with self._cond:
+            self._seen(worker, address)
+            while not self._pending:
+                left = until - time.monotonic()
+                if left <= 0:
+                    return None
+                self._cond.wait(left)
+            task = self._pending.popleft()
+            task.attempts += 1
+            task.lease_id = uuid.uuid4().hex
+            task.worker = worker
+            task.deadline = time.monotonic() + self.cfg.lease_seconds
+            task.tail = self.studio.db.get_checkpoint_tail(task.file_id, task.model)
+            task.next_index = task.tail["index"] + 1 if task.tail else 0
+            self._leases[task.lease_id] = task
+            self._workers[worker]["leases"] += 1
+        resume_from = task.tail["end"] if task.tail else 0.0
+        job = task.job
+        job._update(status="running", started_at=job.started_at or time.time(),
+                    progress_desc=f"воркер {worker}")
+        log.info("CLUSTER %s → %s (попытка %d%s)", task.path.name, worker, task.attempts,
+                 f", с {resume_from:.1f} сек" if resume_from else "")
+        return {
+            "lease_id": task.lease_id,
+            "job_id": job.id,
+            "filename": task.path.name,
+            "size": task.path.stat().st_size,
+            "content_hash": task.file_hash,
+            "model_name": task.model,
+            "profile": job.profile,
+            "resume_from": resume_from,
+            "lease_seconds": self.cfg.lease_seconds,
+        }
+
+    def media_path(self, lease_id: str) -> Path:
+        with self._cond:
+            return self._task(lease_id).path
+
+    def heartbeat(self, lease_id: str, progress: Optional[float] = None, desc: str = "") -> Dict[str, Any]:
+        with self._cond:
+            task = self._task(lease_id)
+            self._seen(task.worker)
+        if progress is not None:
+            task.job._update(progress=float(progress), progress_desc=f"{task.worker}: {desc}".rstrip(": "))
+        return {"lease_seconds": self.cfg.lease_seconds}
+
+    def add_segments(self, lease_id: str, segments: List[Dict[str, Any]]) -> int:
+        """Порция сегментов воркера → в контрольную точку; число принятых"""
+        accepted = []
+        with self._cond:  # под замком: истечение аренды не разойдётся с записью
+            task = self._task(lease_id)
+            self._seen(task.worker)
+            tail = task.tail
+            for seg in segments:
+                start, end, text = float(seg["start"]), float(seg["end"]), str(seg["text"])
+                if tail:
+                    # граничный сегмент прошлой аренды мог быть уже принят (как в _run_pass)
+                    if end <= tail["end"] + 0.01:
+                        continue
+                    if start < tail["end"] + 1.0 and text.strip() == tail["text"].strip():
+                        continue
+                accepted.append({"index": task.next_index, "start": start, "end": end, "text": text,
+                                 "no_speech_prob": seg.get("no_speech_prob")})
+                task.next_index += 1
+            if accepted:
+                self.studio.db.add_checkpoint_segments(task.file_id, task.model, accepted)
+        for seg in accepted:
+            task.job._add_segment(seg)
+        return len(accepted)
+
+    def complete(self, lease_id: str, meta: Dict[str, Any]):
+        with self._cond:
+            task = self._pop(lease_id)
+            self._workers[task.worker]["completed"] += 1
+        task.meta = {**(meta or {}), "model": task.model, "worker": task.worker}
+        log.info("CLUSTER %s: готово на %s", task.path.name, task.worker)
+        task.done.set()
+
+    def fail(self, lease_id: str, error: str, retry: bool = True):
+        with self._cond:
+            task = self._pop(lease_id)
+            requeue = retry and task.attempts < self.cfg.max_attempts
+            if requeue:
+                self._pending.appendleft(task)
+                self._cond.notify_all()
+        log.warning("CLUSTER %s: ошибка на %s: %s", task.path.name, task.worker, error)
+        if requeue:
+            task.job._update(status="queued", progress_desc=f"повтор после ошибки: {error}")
+            return
+        task.error = f"{task.worker}: {error}"
+        task.done.set()
+
+    # ---- истечение аренд ----
+    def reap(self) -> int:
+        """Истёкшие аренды → задачи обратно в очередь (или ошибка после max_attempts)"""
+        now = time.monotonic()
+        failed = []
+        with self._cond:
+            expired = [t for t in self._leases.values() if t.deadline < now]
+            for task in expired:
+                del self._leases[task.lease_id]
+                if task.attempts >= self.cfg.max_attempts:
+                    failed.append(task)
+                else:
+                    self._pending.appendleft(task)
+            if expired:
+                self._cond.notify_all()
+        for task in expired:
+            log.warning("CLUSTER аренда %s (%s) истекла без heartbeat", task.worker, task.path.name)
+            if task in failed:
+                task.error = f"аренда истекла {task.attempts} раз(а), последний воркер {task.worker}"
+                task.done.set()
+            else:
+                task.job._update(status="queued", progress_desc=f"воркер {task.worker} пропал — повтор")
+        return len(expired)
+
+    def _ensure_reaper(self):
+        with self._cond:
+            if self._reaper is not None and self._reaper.is_alive():
+                return
+            self._reaper = threading.Thread(target=self._reap_loop, name="cluster-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(max(0.5, self.cfg.lease_seconds / 4))
+            try:
+                self.reap()
+            except Exception:
+                log.exception("CLUSTER reaper failed")
+
+    # ---- служебное ----
+    def _task(self, lease_id: str) -> RemoteTask:
+        task = self._leases.get(lease_id)
+        if task is None:
+            raise LeaseLost(lease_id)
+        task.deadline = time.monotonic() + self.cfg.lease_seconds
+        return task
+
+    def _pop(self, lease_id: str) -> RemoteTask:
+        task = self._leases.pop(lease_id, None)
+        if task is None:
+            raise LeaseLost(lease_id)
+        return task
+
+    def _seen(self, worker: str, address: Optional[str] = None):
+        w = self._workers.setdefault(worker, {"leases": 0, "completed": 0, "address": None})
+        w["last_seen"] = time.time()
+        if address:
+            w["address"] = address
+
+    def stats(self) -> Dict[str, Any]:
+        now, mono = time.time(), time.monotonic()
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "max_queue": self.cfg.max_queue,
+                "leases": [{"lease_id": t.lease_id, "job_id": t.job.id, "worker": t.worker,
+                            "filename": t.path.name, "attempts": t.attempts,
+                            "expires_in": round(t.deadline - mono, 1)} for t in self._leases.values()],
+                "workers": {name: {**w, "last_seen_ago": round(now - w["last_seen"], 1)}
+                            for name, w in self._workers.items()},
+            }
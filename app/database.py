@@ -1,11 +1,38 @@
 """
 База данных для хранения метаданных файлов и транскриптов
 """
+import json
 import sqlite3
+import threading
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, List, Dict
+from itertools import islice
+from typing import Iterable, Iterator, Optional, List, Dict, Tuple
 from app.config import get_config
+from app.transcript_store import PACK_SCHEME
+
+
+CHUNK_BATCH = 500  # чанков на пачку поиска дубликатов/вставки
+# внешние (content=) FTS5-индексы: таблица FTS → (таблица с текстом, колонка)
+FTS_TABLES = {"transcripts_fts": ("transcripts", "text_preview"), "chunks_fts": ("chunks", "chunk_text")}
+_FTS_STRUCTURE_ROWID = 10  # запись структуры индекса в <fts>_data (уровни и сегменты)
+DRAFT_RANK_FACTOR = 0.7  # bm25 отрицательный: множитель < 1 опускает черновики в выдаче
+
+
+def _ids_json(ids) -> str:
+    """Набор id одним параметром (json_each) — без лимита на число переменных SQLite"""
+    return json.dumps([int(i) for i in ids])
+
+
+def _varint(buf: bytes, i: int) -> Tuple[int, int]:
+    """Varint SQLite (big-endian, до 9 байт) → (значение, следующая позиция)"""
+    value = 0
+    for k in range(8):
+        b = buf[i + k]
+        value = (value << 7) | (b & 0x7F)
+        if b < 0x80:
+            return value, i + k + 1
+    return (value << 8) | buf[i + 8], i + 9
 
 
 class Database:
@@ -15,12 +42,18 @@ class Database:
         
         self.db_path = db_path
         self.conn = None
+        self._lock = threading.RLock()  # многошаговые транзакции (массовые операции)
         self._init_db()
     
     def _init_db(self):
         """Инициализация базы данных"""
         self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
+        # каскады ON DELETE работают только с включёнными внешними ключами (на каждое соединение)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        # новая база — с инкрементальным vacuum (app/maintenance.py); у существующей режим
+        # меняется только полным VACUUM (python -m app.maintenance --enable-incremental-vacuum)
+        self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
         
         # Создаем таблицы
         self.conn.execute("""
@@ -64,10 +97,166 @@ class Database:
             )
         """)
         
+        # Индекс блоков упакованного хранилища (app/transcript_store.py)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS transcript_blocks (
+                transcript_id INTEGER NOT NULL,
+                block_index INTEGER NOT NULL,
+                raw_offset INTEGER NOT NULL,
+                raw_size INTEGER NOT NULL,
+                pack_offset INTEGER NOT NULL,
+                pack_size INTEGER NOT NULL,
+                codec TEXT NOT NULL,
+                PRIMARY KEY (transcript_id, block_index),
+                FOREIGN KEY (transcript_id) REFERENCES transcripts(id) ON DELETE CASCADE
+            )
+        """)
+        
+        # Сегменты с таймкодами (субтитры, экспорт)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS segments (
+                transcript_id INTEGER NOT NULL,
+                segment_index INTEGER NOT NULL,
+                start_time REAL NOT NULL,
+                end_time REAL NOT NULL,
+                text TEXT NOT NULL,
+                no_speech_prob REAL,
+                PRIMARY KEY (transcript_id, segment_index),
+                FOREIGN KEY (transcript_id) REFERENCES transcripts(id) ON DELETE CASCADE
+            )
+        """)
+        
+        # Контрольные точки распознавания: сегменты незавершённого прохода (file_id + модель),
+        # после сбоя транскрибация продолжается с конца последнего сегмента
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS segment_checkpoints (
+                file_id INTEGER NOT NULL,
+                model TEXT NOT NULL,
+                segment_index INTEGER NOT NULL,
+                start_time REAL NOT NULL,
+                end_time REAL NOT NULL,
+                text TEXT NOT NULL,
+                no_speech_prob REAL,
+                PRIMARY KEY (file_id, model, segment_index),
+                FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE CASCADE
+            )
+        """)
+        
+        # Карты речи VAD по хэшу содержимого (app/vad.py): интервалы — float32 [start, end, ...]
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS speech_maps (
+                content_hash TEXT NOT NULL,
+                vad_key TEXT NOT NULL,
+                intervals BLOB NOT NULL,
+                duration REAL NOT NULL,
+                speech_seconds REAL NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (content_hash, vad_key)
+            )
+        """)
+        
+        # Что уже отправлено в Refiner: (файл, коллекция) → хэши чанков и id документов на стороне Refiner.
+        # Без внешнего ключа: после удаления файла строки нужны, чтобы удалить его чанки и в Refiner
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS refiner_ingest (
+                file_id INTEGER NOT NULL,
+                collection TEXT NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                source_id TEXT NOT NULL,
+                remote_id TEXT,
+                sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (file_id, collection, chunk_hash)
+            )
+        """)
+        
+        # Трассы задач (app/tracing.py): этапы с временем/RSS/CPU, ряд замеров — JSON
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS traces (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                file_id INTEGER,
+                status TEXT NOT NULL,
+                error TEXT,
+                started_at REAL NOT NULL,
+                duration REAL NOT NULL,
+                samples TEXT,
+                FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE CASCADE
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS trace_spans (
+                trace_id INTEGER NOT NULL,
+                span_index INTEGER NOT NULL,
+                parent_index INTEGER,
+                name TEXT NOT NULL,
+                start REAL NOT NULL,
+                duration REAL NOT NULL,
+                rss_start INTEGER,
+                rss_end INTEGER,
+                rss_peak INTEGER,
+                cpu REAL,
+                attrs TEXT,
+                PRIMARY KEY (trace_id, span_index),
+                FOREIGN KEY (trace_id) REFERENCES traces(id) ON DELETE CASCADE
+            )
+        """)
+        
+        # Версии нарезки на чанки (app/rechunk.py): чанки принадлежат набору с параметрами
+        # чанкера, поиск идёт только по активному набору
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunk_sets (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chunk_size INTEGER NOT NULL,
+                chunk_overlap INTEGER NOT NULL,
+                separator TEXT NOT NULL,
+                status TEXT DEFAULT 'building',
+                is_active INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                activated_at TIMESTAMP
+            )
+        """)
+        
+        # MinHash-сигнатуры чанков и LSH-индекс полос (app/minhash.py)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunk_minhash (
+                chunk_id INTEGER PRIMARY KEY,
+                signature BLOB NOT NULL,
+                FOREIGN KEY (chunk_id) REFERENCES chunks(id) ON DELETE CASCADE
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunk_lsh (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                FOREIGN KEY (chunk_id) REFERENCES chunks(id) ON DELETE CASCADE
+            )
+        """)
+        
+        # Миграции для баз, созданных старыми версиями
+        self._ensure_column("files", "content_hash", "TEXT")
+        self._ensure_column("files", "media_duration", "REAL")
+        self._ensure_column("files", "media_codec", "TEXT")
+        self._ensure_column("files", "media_channels", "INTEGER")
+        self._ensure_column("transcripts", "text_bytes", "INTEGER")
+        self._ensure_column("transcripts", "quality_tier", "TEXT DEFAULT 'final'")
+        self._ensure_column("transcripts", "decode_profile", "TEXT")
+        self._ensure_column("transcripts", "rtf", "REAL")
+        self._ensure_column("chunks", "chunk_set_id", "INTEGER")
+        self._ensure_column("chunks", "duplicate_of", "INTEGER REFERENCES chunks(id) ON DELETE SET NULL")
+        self._ensure_column("chunks", "dup_similarity", "REAL")
+
         # Создаем индексы
         self.conn.execute("CREATE INDEX IF NOT EXISTS idx_files_status ON files(status)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files(content_hash)")
         self.conn.execute("CREATE INDEX IF NOT EXISTS idx_transcripts_file_id ON transcripts(file_id)")
         self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_transcript_id ON chunks(transcript_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_set ON chunks(chunk_set_id, transcript_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_duplicate_of ON chunks(duplicate_of)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_traces_file ON traces(file_id, id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chunk_lsh_bucket ON chunk_lsh(band, bucket)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chunk_lsh_chunk ON chunk_lsh(chunk_id)")
         
         # Full-text search для транскриптов
         self.conn.execute("""
@@ -75,55 +264,717 @@ class Database:
             USING fts5(text_preview, content='transcripts', content_rowid='id')
         """)
         
+        # Full-text search по чанкам (для API/поиска с пагинацией)
+        has_chunks_fts = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'").fetchone()
+        self.conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts 
+            USING fts5(chunk_text, content='chunks', content_rowid='id')
+        """)
+        if not has_chunks_fts:
+            # первая миграция: индексируем уже существующие чанки
+            self.conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES('rebuild')")
+        self._ensure_fts_triggers()
+        
+        self._ensure_active_chunk_set()
         self.conn.commit()
+        self._purge_orphans()
+    
+    def _purge_orphans(self):
+        """Транскрипты/чанки, оставшиеся от удалений без каскада (старые версии)"""
+        orphans = self.conn.execute("""
+            SELECT id FROM transcripts WHERE file_id NOT IN (SELECT id FROM files)
+        """).fetchall()
+        if orphans:
+            with self.conn:
+                self._delete_transcripts_sql("SELECT id FROM transcripts WHERE file_id NOT IN (SELECT id FROM files)")
+    
+    def _ensure_fts_triggers(self):
+        """
+        FTS-индексы синхронизируются триггерами: вставка, удаление (в том числе каскадом
+        ON DELETE от files) и правка текста. Старые версии писали FTS вручную и при каскадных
+        удалениях оставляли в индексе строки удалённых записей — при первом создании
+        триггеров индексы пересобираются.
+        """
+        for fts, (table, column) in FTS_TABLES.items():
+            if self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                                 (f"{table}_fts_ad",)).fetchone():
+                continue
+            self.conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN
+                    INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column});
+                END
+            """)
+            self.conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN
+                    INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+                END
+            """)
+            self.conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE OF {column} ON {table} BEGIN
+                    INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+                    INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column});
+                END
+            """)
+            self.conn.execute(f"INSERT INTO {fts}({fts}) VALUES('rebuild')")
+    
+    def _ensure_active_chunk_set(self):
+        """Первый запуск / старая база: существующие чанки — активный набор с текущими параметрами"""
+        if self.conn.execute("SELECT 1 FROM chunk_sets WHERE is_active = 1").fetchone():
+            return
+        cfg = get_config().chunker
+        set_id = self.conn.execute("""
+            INSERT INTO chunk_sets (chunk_size, chunk_overlap, separator, status, is_active, activated_at)
+            VALUES (?, ?, ?, 'ready', 1, CURRENT_TIMESTAMP)
+        """, (cfg.chunk_size, cfg.chunk_overlap, cfg.separator)).lastrowid
+        self.conn.execute("UPDATE chunks SET chunk_set_id = ? WHERE chunk_set_id IS NULL", (set_id,))
+    
+    def _ensure_column(self, table: str, column: str, ddl: str):
+        """Добавить колонку в существующую таблицу, если её ещё нет"""
+        cols = {row["name"] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+        if column not in cols:
+            self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
     
     def add_file(self, filename: str, filepath: str, file_type: str, file_size: int) -> int:
         """Добавить файл в базу"""
-        cursor = self.conn.execute("""
-            INSERT INTO files (filename, filepath, file_type, file_size)
-            VALUES (?, ?, ?, ?)
-        """, (filename, filepath, file_type, file_size))
-        self.conn.commit()
+        with self._lock, self.conn:
+            cursor = self.conn.execute("""
+                INSERT INTO files (filename, filepath, file_type, file_size)
+                VALUES (?, ?, ?, ?)
+            """, (filename, filepath, file_type, file_size))
         return cursor.lastrowid
     
     def update_file_status(self, file_id: int, status: str, error_message: Optional[str] = None):
         """Обновить статус файла"""
-        self.conn.execute("""
-            UPDATE files 
-            SET status = ?, 
-                error_message = ?,
-                processed_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (status, error_message, file_id))
-        self.conn.commit()
+        self.update_files_status([file_id], status, error_message)
+    
+    def update_files_status(self, file_ids: List[int], status: str,
+                            error_message: Optional[str] = None) -> int:
+        """Обновить статус набора файлов одним запросом → сколько строк изменено"""
+        with self._lock, self.conn:
+            cursor = self.conn.execute("""
+                UPDATE files 
+                SET status = ?, 
+                    error_message = ?,
+                    processed_at = CURRENT_TIMESTAMP
+                WHERE id IN (SELECT value FROM json_each(?))
+            """, (status, error_message, _ids_json(file_ids)))
+        return cursor.rowcount
     
-    def add_transcript(self, file_id: int, transcript_path: str, text_preview: str,
-                      word_count: int, duration_seconds: float, language: str, model_used: str) -> int:
-        """Добавить транскрипт"""
+    def add_transcript(self, file_id: int, transcript_path: Optional[str], text_preview: str,
+                      word_count: int, duration_seconds: float, language: str, model_used: str,
+                      blocks: Optional[List[Dict]] = None, text_bytes: Optional[int] = None,
+                      quality_tier: str = "final", decode_profile: Optional[str] = None,
+                      rtf: Optional[float] = None) -> int:
+        """
+        Добавить транскрипт.
+        transcript_path=None — текст в упакованном хранилище (pack://<id>), blocks — его индекс
+        из TranscriptStore.pack(); строка и блоки пишутся одним коммитом.
+        quality_tier: draft — черновик быстрой моделью (будет заменён), final — окончательный.
+        decode_profile, rtf — профиль декодирования и real-time factor распознавания.
+        """
+        with self._lock, self.conn:
+            return self._insert_transcript(file_id, transcript_path, text_preview, word_count,
+                                           duration_seconds, language, model_used, blocks, text_bytes,
+                                           quality_tier, decode_profile, rtf)
+    
+    def _insert_transcript(self, file_id, transcript_path, text_preview, word_count, duration_seconds,
+                           language, model_used, blocks, text_bytes, quality_tier,
+                           decode_profile=None, rtf=None) -> int:
         cursor = self.conn.execute("""
             INSERT INTO transcripts 
-            (file_id, transcript_path, text_preview, word_count, duration_seconds, language, model_used)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (file_id, transcript_path, text_preview, word_count, duration_seconds, language, model_used))
+            (file_id, transcript_path, text_preview, word_count, duration_seconds, language, model_used,
+             text_bytes, quality_tier, decode_profile, rtf)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (file_id, transcript_path or PACK_SCHEME, text_preview, word_count, duration_seconds,
+              language, model_used, text_bytes, quality_tier, decode_profile, rtf))
         
-        # Добавляем в FTS индекс
         transcript_id = cursor.lastrowid
-        self.conn.execute("""
-            INSERT INTO transcripts_fts(rowid, text_preview)
-            VALUES (?, ?)
-        """, (transcript_id, text_preview))
-        
-        self.conn.commit()
+        if transcript_path is None:
+            self.conn.execute("UPDATE transcripts SET transcript_path = ? WHERE id = ?",
+                              (f"{PACK_SCHEME}{transcript_id}", transcript_id))
+            self._insert_blocks(transcript_id, blocks or [])
         return transcript_id
     
-    def add_chunks(self, transcript_id: int, chunks: List[str]):
-        """Добавить чанки текста"""
-        for i, chunk_text in enumerate(chunks):
+    def replace_transcript(self, old_transcript_id: int, chunks: Iterable[str], segments: List[Dict],
+                           from_checkpoint: Optional[Tuple[int, str]] = None, **transcript) -> Optional[int]:
+        """
+        Атомарно заменить транскрипт (черновик → уточнённый): новая строка, блоки, чанки,
+        сегменты и FTS пишутся, а старые удаляются одной транзакцией.
+        transcript — аргументы add_transcript. None — старого транскрипта уже нет (файл удалён).
+        chunks может быть генератором; from_checkpoint=(file_id, model) — сегменты берутся
+        из контрольной точки прохода (см. add_segments).
+        """
+        with self._lock, self.conn:
+            if not self.conn.execute("SELECT 1 FROM transcripts WHERE id = ?",
+                                     (old_transcript_id,)).fetchone():
+                return None
+            self._delete_transcripts_sql("SELECT ?", (old_transcript_id,))
+            new_id = self._insert_transcript(
+                transcript["file_id"], transcript.get("transcript_path"), transcript["text_preview"],
+                transcript["word_count"], transcript["duration_seconds"], transcript["language"],
+                transcript["model_used"], transcript.get("blocks"), transcript.get("text_bytes"),
+                transcript.get("quality_tier", "final"), transcript.get("decode_profile"),
+                transcript.get("rtf"))
+            self._insert_chunks(new_id, chunks)
+            self._insert_segments(new_id, segments)
+            if from_checkpoint is not None:
+                self._copy_checkpoint_segments(new_id, *from_checkpoint)
+        return new_id
+    
+    def get_draft_transcripts(self) -> List[Dict]:
+        """Черновики, ещё не заменённые окончательным транскриптом"""
+        cursor = self.conn.execute("""
+            SELECT t.id, t.file_id, f.filepath, f.content_hash
+            FROM transcripts t JOIN files f ON f.id = t.file_id
+            WHERE t.quality_tier = 'draft'
+            ORDER BY t.id
+        """)
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def _insert_blocks(self, transcript_id: int, blocks: List[Dict]):
+        self.conn.executemany("""
+            INSERT INTO transcript_blocks
+            (transcript_id, block_index, raw_offset, raw_size, pack_offset, pack_size, codec)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(transcript_id, i, b["raw_offset"], b["raw_size"], b["pack_offset"], b["pack_size"], b["codec"])
+              for i, b in enumerate(blocks)])
+    
+    def set_transcript_blocks(self, transcript_id: int, blocks: List[Dict], text_bytes: int):
+        """Перевести транскрипт в упакованное хранилище (миграция .txt)"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM transcript_blocks WHERE transcript_id = ?", (transcript_id,))
+            self._insert_blocks(transcript_id, blocks)
             self.conn.execute("""
-                INSERT INTO chunks (transcript_id, chunk_index, chunk_text, chunk_size)
-                VALUES (?, ?, ?, ?)
-            """, (transcript_id, i, chunk_text, len(chunk_text)))
-        self.conn.commit()
+                UPDATE transcripts SET transcript_path = ?, text_bytes = ? WHERE id = ?
+            """, (f"{PACK_SCHEME}{transcript_id}", text_bytes, transcript_id))
+    
+    def get_transcript_blocks(self, transcript_id: int, start: int = 0,
+                              end: Optional[int] = None) -> List[Dict]:
+        """Блоки транскрипта, пересекающие байтовый диапазон [start, end)"""
+        cursor = self.conn.execute("""
+            SELECT * FROM transcript_blocks
+            WHERE transcript_id = ? AND raw_offset + raw_size > ? AND raw_offset < ?
+            ORDER BY block_index
+        """, (transcript_id, start, end if end is not None else 2 ** 62))
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def get_all_transcript_blocks(self) -> List[Dict]:
+        """Все живые блоки в порядке расположения в pack (для compact)"""
+        cursor = self.conn.execute("""
+            SELECT transcript_id, block_index, pack_offset, pack_size
+            FROM transcript_blocks ORDER BY pack_offset
+        """)
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def update_transcript_block_offsets(self, moves: List[Tuple[int, int, int]], before_commit=None):
+        """
+        Новые смещения блоков [(pack_offset, transcript_id, block_index)] одной транзакцией;
+        before_commit вызывается перед COMMIT, его ошибка откатывает транзакцию
+        """
+        with self._lock, self.conn:
+            self.conn.executemany("""
+                UPDATE transcript_blocks SET pack_offset = ?
+                WHERE transcript_id = ? AND block_index = ?
+            """, moves)
+            if before_commit:
+                before_commit()
+    
+    def delete_transcript_blocks(self, transcript_id: int):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM transcript_blocks WHERE transcript_id = ?", (transcript_id,))
+    
+    def get_transcript_blocks_stats(self) -> Dict:
+        row = self.conn.execute("""
+            SELECT COUNT(*) AS blocks,
+                   COUNT(DISTINCT transcript_id) AS transcripts,
+                   COALESCE(SUM(raw_size), 0) AS raw_bytes,
+                   COALESCE(SUM(pack_size), 0) AS live_bytes
+            FROM transcript_blocks
+        """).fetchone()
+        return dict(row)
+    
+    def get_unpacked_transcripts(self) -> List[Dict]:
+        """Транскрипты, которые ещё лежат отдельными .txt"""
+        cursor = self.conn.execute("""
+            SELECT * FROM transcripts WHERE transcript_path NOT LIKE ? ORDER BY id
+        """, (PACK_SCHEME + "%",))
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def add_chunks(self, transcript_id: int, chunks: Iterable[str]) -> int:
+        """Добавить чанки текста (список или генератор) → сколько чанков нарезано"""
+        with self._lock, self.conn:
+            return self._insert_chunks(transcript_id, chunks)
+    
+    def _insert_chunks(self, transcript_id: int, chunks: Iterable[str], chunk_set_id: Optional[int] = None) -> int:
+        """Чанки пишутся пачками по CHUNK_BATCH: генератор (потоковая нарезка) не собирается в список"""
+        if chunk_set_id is None:
+            chunk_set_id = self._active_chunk_set_id()
+        mode = get_config().chunker.dedupe
+        it = iter(chunks)
+        start = 0
+        while True:
+            batch = list(islice(it, CHUNK_BATCH))
+            if not batch:
+                return start
+            # прошлые пачки уже в таблицах этой транзакции — дубликаты между пачками тоже найдутся
+            dedupe = self._find_duplicates(chunk_set_id, batch) if mode in ("flag", "skip") else None
+            roots: List[Optional[int]] = []
+            for i, chunk_text in enumerate(batch):
+                dup, sim = self._resolve_duplicate(dedupe, i, roots)
+                if dup is not None and mode == "skip":
+                    roots.append(dup)  # почти-дубликат не сохраняется (номер чанка остаётся пропуском)
+                    continue
+                cursor = self.conn.execute("""
+                    INSERT INTO chunks (transcript_id, chunk_index, chunk_text, chunk_size, chunk_set_id,
+                                        duplicate_of, dup_similarity)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (transcript_id, start + i, chunk_text, len(chunk_text), chunk_set_id, dup, sim))
+                if dedupe is not None:
+                    self._insert_minhash(cursor.lastrowid, dedupe["sigs"][i], dedupe["keys"][i])
+                roots.append(dup if dup is not None else cursor.lastrowid)
+            start += len(batch)
+    
+    # ---- почти-дубликаты (MinHash/LSH, app/minhash.py) ----
+    def _find_duplicates(self, chunk_set_id: Optional[int], texts: List[str]) -> Dict:
+        """Сигнатуры, ключи полос и совпадения для пачки текстов внутри набора чанков"""
+        from app import minhash
+        
+        sigs = minhash.signatures(texts)
+        keys = minhash.band_keys(sigs)
+        pairs = [[band, int(k)] for row in keys for band, k in enumerate(row)]
+        candidates, cand_sigs, cand_roots = {}, {}, {}
+        for row in self.conn.execute("""
+            SELECT l.band, l.bucket, l.chunk_id, m.signature, c.duplicate_of
+            FROM json_each(?) j
+            JOIN chunk_lsh l ON l.band = json_extract(j.value, '$[0]')
+                            AND l.bucket = json_extract(j.value, '$[1]')
+            JOIN chunks c ON c.id = l.chunk_id
+            JOIN chunk_minhash m ON m.chunk_id = l.chunk_id
+            WHERE c.chunk_set_id IS ?
+        """, (json.dumps(pairs), chunk_set_id)):
+            candidates.setdefault((row["band"], row["bucket"]), []).append(row["chunk_id"])
+            cand_sigs[row["chunk_id"]] = minhash.signature_from_bytes(row["signature"])
+            cand_roots[row["chunk_id"]] = row["duplicate_of"] or row["chunk_id"]
+        matches = minhash.find_duplicates(sigs, keys, candidates, cand_sigs,
+                                          get_config().chunker.dedupe_threshold)
+        return {"sigs": sigs, "keys": keys, "matches": matches, "roots": cand_roots}
+    
+    @staticmethod
+    def _resolve_duplicate(dedupe: Optional[Dict], i: int, roots: List[Optional[int]]):
+        """(id исходного чанка, сходство) для i-го текста пачки или (None, None)"""
+        if dedupe is None:
+            return None, None
+        dup, sim = dedupe["matches"][i]
+        if dup is None:
+            return None, None
+        # ссылка на чанк этой же пачки (-j-1) или на уже сохранённый; ведём к первоисточнику
+        root = roots[-dup - 1] if dup < 0 else dedupe["roots"][dup]
+        return root, round(sim, 4)
+    
+    def _insert_minhash(self, chunk_id: int, sig, keys):
+        self.conn.execute("INSERT OR REPLACE INTO chunk_minhash (chunk_id, signature) VALUES (?, ?)",
+                          (chunk_id, sig.tobytes()))
+        self.conn.executemany("INSERT INTO chunk_lsh (band, bucket, chunk_id) VALUES (?, ?, ?)",
+                              [(band, int(k), chunk_id) for band, k in enumerate(keys)])
+    
+    def backfill_minhash(self, batch_size: int = 500) -> int:
+        """Сигнатуры для чанков активного набора, сохранённых без них (только пометка, без удаления)"""
+        done = 0
+        while True:
+            with self._lock, self.conn:
+                rows = self.conn.execute("""
+                    SELECT c.id, c.chunk_text FROM chunks c
+                    WHERE c.chunk_set_id = (SELECT id FROM chunk_sets WHERE is_active = 1)
+                      AND c.id NOT IN (SELECT chunk_id FROM chunk_minhash)
+                    ORDER BY c.id LIMIT ?
+                """, (batch_size,)).fetchall()
+                if not rows:
+                    return done
+                dedupe = self._find_duplicates(self._active_chunk_set_id(), [r["chunk_text"] for r in rows])
+                roots: List[Optional[int]] = []
+                for i, r in enumerate(rows):
+                    dup, sim = self._resolve_duplicate(dedupe, i, roots)
+                    if dup is not None:
+                        self.conn.execute("UPDATE chunks SET duplicate_of = ?, dup_similarity = ? WHERE id = ?",
+                                          (dup, sim, r["id"]))
+                    self._insert_minhash(r["id"], dedupe["sigs"][i], dedupe["keys"][i])
+                    roots.append(dup if dup is not None else r["id"])
+                done += len(rows)
+    
+    def get_dedupe_report(self, top: int = 20) -> Dict:
+        """Почти-дубликаты по корпусу (активный набор): доли и пары файлов с общими фрагментами"""
+        active = "(SELECT id FROM chunk_sets WHERE is_active = 1)"
+        row = self.conn.execute(f"""
+            SELECT COUNT(*) AS chunks,
+                   SUM(duplicate_of IS NOT NULL) AS duplicates,
+                   SUM(id IN (SELECT chunk_id FROM chunk_minhash)) AS with_signature
+            FROM chunks WHERE chunk_set_id = {active}
+        """).fetchone()
+        pairs = [dict(r) for r in self.conn.execute(f"""
+            SELECT f.filename, fo.filename AS original_filename,
+                   COUNT(*) AS chunks, AVG(c.dup_similarity) AS avg_similarity
+            FROM chunks c
+            JOIN chunks o ON o.id = c.duplicate_of
+            JOIN transcripts t ON t.id = c.transcript_id JOIN files f ON f.id = t.file_id
+            JOIN transcripts tor ON tor.id = o.transcript_id JOIN files fo ON fo.id = tor.file_id
+            WHERE c.chunk_set_id = {active}
+            GROUP BY t.id, tor.id ORDER BY chunks DESC LIMIT ?
+        """, (top,))]
+        chunks, dups = row["chunks"] or 0, row["duplicates"] or 0
+        return {"chunks": chunks, "duplicates": dups, "with_signature": row["with_signature"] or 0,
+                "duplicate_share": dups / chunks if chunks else 0.0, "pairs": pairs}
+    
+    def get_transcript_duplicate_stats(self, transcript_id: int) -> Dict:
+        """Сколько чанков транскрипта (активный набор) — почти-дубликаты чужих чанков"""
+        row = self.conn.execute("""
+            SELECT COUNT(*) AS chunks,
+                   SUM(c.duplicate_of IS NOT NULL AND o.transcript_id != c.transcript_id) AS foreign_dups
+            FROM chunks c LEFT JOIN chunks o ON o.id = c.duplicate_of
+            WHERE c.transcript_id = ? AND c.chunk_set_id = (SELECT id FROM chunk_sets WHERE is_active = 1)
+        """, (transcript_id,)).fetchone()
+        return {"chunks": row["chunks"] or 0, "duplicates": row["foreign_dups"] or 0}
+    
+    # ---- версии нарезки (chunk_sets) ----
+    def _active_chunk_set_id(self) -> Optional[int]:
+        row = self.conn.execute("SELECT id FROM chunk_sets WHERE is_active = 1").fetchone()
+        return row["id"] if row else None
+    
+    def get_active_chunk_set(self) -> Optional[Dict]:
+        row = self.conn.execute("SELECT * FROM chunk_sets WHERE is_active = 1").fetchone()
+        return dict(row) if row else None
+    
+    def get_chunk_sets(self) -> List[Dict]:
+        """Все наборы с числом чанков"""
+        cursor = self.conn.execute("""
+            SELECT s.*, (SELECT COUNT(*) FROM chunks c WHERE c.chunk_set_id = s.id) AS chunks
+            FROM chunk_sets s ORDER BY s.id
+        """)
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def create_chunk_set(self, chunk_size: int, chunk_overlap: int, separator: str) -> int:
+        with self._lock, self.conn:
+            return self.conn.execute("""
+                INSERT INTO chunk_sets (chunk_size, chunk_overlap, separator) VALUES (?, ?, ?)
+            """, (chunk_size, chunk_overlap, separator)).lastrowid
+    
+    def set_chunk_set_status(self, set_id: int, status: str):
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE chunk_sets SET status = ? WHERE id = ?", (status, set_id))
+    
+    def add_chunk_set_batch(self, set_id: int, items: List[Tuple[int, List[str]]]):
+        """Чанки пачки транскриптов одной транзакцией (удалённые за это время пропускаются)"""
+        with self._lock, self.conn:
+            alive = {row["id"] for row in self.conn.execute(
+                "SELECT id FROM transcripts WHERE id IN (SELECT value FROM json_each(?))",
+                (_ids_json([tid for tid, _ in items]),))}
+            for tid, chunks in items:
+                if tid in alive:
+                    self._insert_chunks(tid, chunks, set_id)
+    
+    def get_transcript_ids(self, after_id: int = 0, limit: int = 1000) -> List[int]:
+        """id транскриптов по возрастанию (постранично по ключу)"""
+        cursor = self.conn.execute("SELECT id FROM transcripts WHERE id > ? ORDER BY id LIMIT ?",
+                                   (after_id, limit))
+        return [row["id"] for row in cursor.fetchall()]
+    
+    def activate_chunk_set(self, set_id: int, items: Optional[List[Tuple[int, List[str]]]] = None):
+        """
+        Переключить активный набор одной транзакцией; items — чанки транскриптов,
+        появившихся за время сборки (пишутся в ту же транзакцию)
+        """
+        with self._lock, self.conn:
+            alive = {row["id"] for row in self.conn.execute(
+                "SELECT id FROM transcripts WHERE id IN (SELECT value FROM json_each(?))",
+                (_ids_json([tid for tid, _ in items or []]),))}
+            for tid, chunks in items or []:
+                if tid in alive:
+                    self._insert_chunks(tid, chunks, set_id)
+            self.conn.execute("""
+                UPDATE chunk_sets SET
+                    is_active = (id = ?),
+                    status = CASE WHEN id = ? THEN 'ready' ELSE status END,
+                    activated_at = CASE WHEN id = ? THEN CURRENT_TIMESTAMP ELSE activated_at END
+            """, (set_id, set_id, set_id))
+    
+    def delete_chunk_set_chunks(self, set_id: int, batch_size: int = 5000) -> int:
+        """Удалить порцию чанков набора (FTS — триггером) → сколько удалено; 0 — набор пуст"""
+        with self._lock, self.conn:
+            ids = [row["id"] for row in self.conn.execute(
+                "SELECT id FROM chunks WHERE chunk_set_id = ? LIMIT ?", (set_id, batch_size))]
+            if not ids:
+                return 0
+            self.conn.execute("DELETE FROM chunks WHERE id IN (SELECT value FROM json_each(?))", (_ids_json(ids),))
+        return len(ids)
+    
+    def delete_chunk_set(self, set_id: int):
+        """Набор целиком (не активный): чанки порциями, затем сама запись"""
+        while self.delete_chunk_set_chunks(set_id):
+            pass
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM chunk_sets WHERE id = ? AND is_active = 0", (set_id,))
+    
+    def add_segments(self, transcript_id: int, segments: List[Dict],
+                     from_checkpoint: Optional[Tuple[int, str]] = None):
+        """
+        Сохранить сегменты (dict: index, start, end, text, no_speech_prob).
+        from_checkpoint=(file_id, model) — скопировать сегменты контрольной точки прохода
+        одним INSERT … SELECT, не поднимая их в память.
+        """
+        with self._lock, self.conn:
+            self._insert_segments(transcript_id, segments)
+            if from_checkpoint is not None:
+                self._copy_checkpoint_segments(transcript_id, *from_checkpoint)
+    
+    def _insert_segments(self, transcript_id: int, segments: List[Dict]):
+        self.conn.executemany("""
+            INSERT OR REPLACE INTO segments
+            (transcript_id, segment_index, start_time, end_time, text, no_speech_prob)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, ((transcript_id, seg.get("index", i), seg["start"], seg["end"], seg["text"],
+               seg.get("no_speech_prob")) for i, seg in enumerate(segments)))
+    
+    def _copy_checkpoint_segments(self, transcript_id: int, file_id: int, model: str):
+        self.conn.execute("""
+            INSERT OR REPLACE INTO segments
+            (transcript_id, segment_index, start_time, end_time, text, no_speech_prob)
+            SELECT ?, segment_index, start_time, end_time, text, no_speech_prob
+            FROM segment_checkpoints WHERE file_id = ? AND model = ?
+        """, (transcript_id, file_id, model))
+    
+    def add_checkpoint_segments(self, file_id: int, model: str, segments: List[Dict]):
+        """Сохранить очередную порцию сегментов незавершённого прохода"""
+        with self._lock, self.conn:
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO segment_checkpoints
+                (file_id, model, segment_index, start_time, end_time, text, no_speech_prob)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [(file_id, model, seg["index"], seg["start"], seg["end"], seg["text"],
+                   seg.get("no_speech_prob")) for seg in segments])
+    
+    def get_checkpoint_segments(self, file_id: int, model: str) -> List[Dict]:
+        """Сегменты контрольной точки (dict: index, start, end, text, no_speech_prob)"""
+        cursor = self.conn.execute("""
+            SELECT segment_index AS "index", start_time AS start, end_time AS "end",
+                   text, no_speech_prob
+            FROM segment_checkpoints WHERE file_id = ? AND model = ?
+            ORDER BY segment_index
+        """, (file_id, model))
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def iter_checkpoint_segments(self, file_id: int, model: str, batch_size: int = 1000) -> Iterator[Dict]:
+        """То же, что get_checkpoint_segments, но порциями по индексу — для длинных записей"""
+        after = -1
+        while True:
+            rows = self.conn.execute("""
+                SELECT segment_index AS "index", start_time AS start, end_time AS "end",
+                       text, no_speech_prob
+                FROM segment_checkpoints WHERE file_id = ? AND model = ? AND segment_index > ?
+                ORDER BY segment_index LIMIT ?
+            """, (file_id, model, after, batch_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+            after = rows[-1]["index"]
+    
+    def get_checkpoint_range(self, file_id: int, model: str, start: int, end: int,
+                             limit: int = 500) -> List[Dict]:
+        """Сегменты контрольной точки с индексом в [start, end), не больше limit (стрим задачи)"""
+        cursor = self.conn.execute("""
+            SELECT segment_index AS "index", start_time AS start, end_time AS "end",
+                   text, no_speech_prob
+            FROM segment_checkpoints
+            WHERE file_id = ? AND model = ? AND segment_index >= ? AND segment_index < ?
+            ORDER BY segment_index LIMIT ?
+        """, (file_id, model, start, end, limit))
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def get_checkpoint_tail(self, file_id: int, model: str) -> Optional[Dict]:
+        """Последний сохранённый сегмент прохода (с него продолжается распознавание) или None"""
+        row = self.conn.execute("""
+            SELECT segment_index AS "index", start_time AS start, end_time AS "end",
+                   text, no_speech_prob
+            FROM segment_checkpoints WHERE file_id = ? AND model = ?
+            ORDER BY segment_index DESC LIMIT 1
+        """, (file_id, model)).fetchone()
+        return dict(row) if row else None
+    
+    def get_checkpoint_models(self, file_id: int) -> List[str]:
+        """Модели, для которых у файла есть незавершённый проход"""
+        cursor = self.conn.execute(
+            "SELECT DISTINCT model FROM segment_checkpoints WHERE file_id = ?", (file_id,))
+        return [row["model"] for row in cursor.fetchall()]
+    
+    def clear_checkpoints(self, file_id: int, model: Optional[str] = None):
+        """Удалить контрольные точки файла (одной модели или все)"""
+        with self._lock, self.conn:
+            if model is None:
+                self.conn.execute("DELETE FROM segment_checkpoints WHERE file_id = ?", (file_id,))
+            else:
+                self.conn.execute("DELETE FROM segment_checkpoints WHERE file_id = ? AND model = ?",
+                                  (file_id, model))
+    
+    def get_speech_map(self, content_hash: str, vad_key: str) -> Optional[Dict]:
+        cursor = self.conn.execute("""
+            SELECT * FROM speech_maps WHERE content_hash = ? AND vad_key = ?
+        """, (content_hash, vad_key))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    
+    def save_speech_map(self, content_hash: str, vad_key: str, intervals: bytes,
+                        duration: float, speech_seconds: float):
+        with self._lock, self.conn:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO speech_maps
+                (content_hash, vad_key, intervals, duration, speech_seconds)
+                VALUES (?, ?, ?, ?, ?)
+            """, (content_hash, vad_key, intervals, duration, speech_seconds))
+    
+    # ---- состояние отправки в Refiner (дельта-ingest) ----
+    def get_ingest_state(self, file_id: int, collection: str) -> Dict[str, Dict]:
+        """chunk_hash → {source_id, remote_id} для файла в коллекции"""
+        cursor = self.conn.execute("""
+            SELECT chunk_hash, source_id, remote_id FROM refiner_ingest
+            WHERE file_id = ? AND collection = ?
+        """, (file_id, collection))
+        return {row["chunk_hash"]: dict(row) for row in cursor.fetchall()}
+    
+    def record_ingested(self, file_id: int, collection: str, rows: List[Tuple[str, str, Optional[str]]]):
+        """Отметить отправленные чанки: rows — (chunk_hash, source_id, remote_id)"""
+        with self._lock, self.conn:
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO refiner_ingest (file_id, collection, chunk_hash, source_id, remote_id)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(file_id, collection, h, s, r) for h, s, r in rows])
+    
+    def forget_ingested(self, file_id: int, collection: str, chunk_hashes: List[str]):
+        with self._lock, self.conn:
+            self.conn.execute("""
+                DELETE FROM refiner_ingest
+                WHERE file_id = ? AND collection = ? AND chunk_hash IN (SELECT value FROM json_each(?))
+            """, (file_id, collection, json.dumps(chunk_hashes)))
+    
+    def get_ingested_file_ids(self, collection: str) -> List[int]:
+        """Файлы (в том числе уже удалённые локально), чьи чанки лежат в коллекции Refiner"""
+        cursor = self.conn.execute("""
+            SELECT DISTINCT file_id FROM refiner_ingest WHERE collection = ? ORDER BY file_id
+        """, (collection,))
+        return [row["file_id"] for row in cursor.fetchall()]
+    
+    def get_completed_file_ids(self) -> List[int]:
+        cursor = self.conn.execute("""
+            SELECT DISTINCT f.id FROM files f JOIN transcripts t ON t.file_id = f.id
+            WHERE f.status = 'completed' ORDER BY f.id
+        """)
+        return [row["id"] for row in cursor.fetchall()]
+    
+    # ---- трассы задач ----
+    def save_trace(self, record: Dict, keep: int = 500) -> int:
+        """Трасса (Trace.to_record) одной транзакцией; старше keep последних — удаляются"""
+        with self._lock, self.conn:
+            file_id = record.get("file_id")
+            if file_id is not None and not self.conn.execute(
+                    "SELECT 1 FROM files WHERE id = ?", (file_id,)).fetchone():
+                file_id = None  # файл успели удалить
+            cursor = self.conn.execute("""
+                INSERT INTO traces (job_id, kind, file_id, status, error, started_at, duration, samples)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (record["job_id"], record["kind"], file_id, record["status"], record.get("error"),
+                  record["started_at"], record["duration"], json.dumps(record.get("samples") or [])))
+            trace_id = cursor.lastrowid
+            self.conn.executemany("""
+                INSERT INTO trace_spans (trace_id, span_index, parent_index, name, start, duration,
+                                         rss_start, rss_end, rss_peak, cpu, attrs)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(trace_id, s["index"], s["parent"], s["name"], s["start"], s["duration"], s["rss_start"],
+                   s["rss_end"], s["rss_peak"], s["cpu"], json.dumps(s["attrs"] or {}, ensure_ascii=False, default=str))
+                  for s in record["spans"]])
+            if keep > 0:
+                self.conn.execute("DELETE FROM traces WHERE id <= ?", (trace_id - keep,))
+        return trace_id
+    
+    def get_traces(self, file_id: Optional[int] = None, limit: int = 20) -> List[Dict]:
+        """Последние трассы (без этапов), для файла или все"""
+        cursor = self.conn.execute("""
+            SELECT id, job_id, kind, file_id, status, error, started_at, duration FROM traces
+            WHERE ? IS NULL OR file_id = ?
+            ORDER BY id DESC LIMIT ?
+        """, (file_id, file_id, limit))
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def get_trace(self, trace_id: int) -> Optional[Dict]:
+        row = self.conn.execute("SELECT * FROM traces WHERE id = ?", (trace_id,)).fetchone()
+        if not row:
+            return None
+        trace = dict(row)
+        trace["samples"] = json.loads(trace["samples"] or "[]")
+        trace["spans"] = [{
+            "index": r["span_index"], "parent": r["parent_index"], "name": r["name"], "start": r["start"],
+            "duration": r["duration"], "rss_start": r["rss_start"] or 0, "rss_end": r["rss_end"] or 0,
+            "rss_peak": r["rss_peak"] or 0, "cpu": r["cpu"] or 0.0, "attrs": json.loads(r["attrs"] or "{}"),
+        } for r in self.conn.execute(
+            "SELECT * FROM trace_spans WHERE trace_id = ? ORDER BY span_index", (trace_id,))]
+        return trace
+    
+    def get_segments(self, transcript_id: int) -> List[Dict]:
+        cursor = self.conn.execute("""
+            SELECT * FROM segments WHERE transcript_id = ? ORDER BY segment_index
+        """, (transcript_id,))
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def get_segment_range(self, transcript_id: int, start: int, end: int, limit: int = 500) -> List[Dict]:
+        """Сегменты транскрипта с индексом в [start, end), не больше limit — в формате стрима задачи"""
+        cursor = self.conn.execute("""
+            SELECT segment_index AS "index", start_time AS start, end_time AS "end",
+                   text, no_speech_prob
+            FROM segments WHERE transcript_id = ? AND segment_index >= ? AND segment_index < ?
+            ORDER BY segment_index LIMIT ?
+        """, (transcript_id, start, end, limit))
+        return [dict(row) for row in cursor.fetchall()]
+    
+    # ---- потоковое чтение (экспорт): курсор + fetchmany, без загрузки таблиц целиком ----
+    def iter_batches(self, query: str, params: tuple = (), batch_size: int = 1000) -> Iterator[List[Dict]]:
+        cursor = self.conn.execute(query, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [dict(row) for row in rows]
+        finally:
+            cursor.close()
+    
+    def iter_files(self, changed_since: Optional[str] = None, batch_size: int = 1000) -> Iterator[List[Dict]]:
+        """Файлы, созданные/обработанные начиная с changed_since (None — все)"""
+        # >= : метки с точностью до секунды, строки той же секунды лучше выгрузить повторно
+        return self.iter_batches("""
+            SELECT * FROM files
+            WHERE ? IS NULL OR COALESCE(processed_at, created_at) >= ?
+            ORDER BY id
+        """, (changed_since, changed_since), batch_size)
+    
+    def iter_transcripts(self, after_id: int = 0, batch_size: int = 1000) -> Iterator[List[Dict]]:
+        """Транскрипты с id > after_id вместе с полями файла"""
+        return self.iter_batches("""
+            SELECT t.*, f.filename, f.filepath, f.content_hash
+            FROM transcripts t
+            JOIN files f ON f.id = t.file_id
+            WHERE t.id > ?
+            ORDER BY t.id
+        """, (after_id,), batch_size)
+    
+    def iter_chunks(self, after_transcript_id: int = 0, batch_size: int = 1000) -> Iterator[List[Dict]]:
+        return self.iter_batches("""
+            SELECT * FROM chunks
+            WHERE transcript_id > ? AND chunk_set_id = (SELECT id FROM chunk_sets WHERE is_active = 1)
+            ORDER BY transcript_id, chunk_index
+        """, (after_transcript_id,), batch_size)
+    
+    def iter_segments(self, after_transcript_id: int = 0, batch_size: int = 1000) -> Iterator[List[Dict]]:
+        return self.iter_batches("""
+            SELECT * FROM segments WHERE transcript_id > ? ORDER BY transcript_id, segment_index
+        """, (after_transcript_id,), batch_size)
     
     def search_transcripts(self, query: str, limit: int = 10) -> List[Dict]:
         """Поиск по транскриптам (full-text search)"""
@@ -132,6 +983,7 @@ class Database:
                 t.id,
                 t.text_preview,
                 t.transcript_path,
+                t.quality_tier,
                 f.filename,
                 f.filepath,
                 t.created_at
@@ -139,12 +991,45 @@ class Database:
             JOIN transcripts t ON t.id = fts.rowid
             JOIN files f ON f.id = t.file_id
             WHERE transcripts_fts MATCH ?
-            ORDER BY rank
+            ORDER BY rank * (CASE t.quality_tier WHEN 'draft' THEN ? ELSE 1.0 END)
             LIMIT ?
-        """, (query, limit))
+        """, (query, DRAFT_RANK_FACTOR, limit))
         
         return [dict(row) for row in cursor.fetchall()]
     
+    def search_chunks(self, query: str, limit: int = 20, offset: int = 0) -> Tuple[List[Dict], int]:
+        """Поиск по чанкам (full-text) с пагинацией → (страница результатов, всего совпадений)"""
+        total = self.conn.execute("""
+            SELECT COUNT(*) AS count FROM chunks_fts
+            JOIN chunks c ON c.id = chunks_fts.rowid
+            WHERE chunks_fts MATCH ? AND c.chunk_set_id = (SELECT id FROM chunk_sets WHERE is_active = 1)
+              AND c.duplicate_of IS NULL
+        """, (query,)).fetchone()['count']
+        
+        cursor = self.conn.execute("""
+            SELECT 
+                c.id AS chunk_id,
+                c.transcript_id,
+                c.chunk_index,
+                snippet(chunks_fts, 0, '[', ']', '…', 24) AS snippet,
+                t.file_id,
+                t.quality_tier,
+                f.filename,
+                bm25(chunks_fts) AS score
+            FROM chunks_fts
+            JOIN chunks c ON c.id = chunks_fts.rowid
+            JOIN transcripts t ON t.id = c.transcript_id
+            JOIN files f ON f.id = t.file_id
+            WHERE chunks_fts MATCH ?
+              AND c.chunk_set_id = (SELECT id FROM chunk_sets WHERE is_active = 1)
+              AND c.duplicate_of IS NULL  -- почти-дубликаты не вытесняют другие результаты
+            -- bm25: чем меньше, тем лучше; черновики немного опускаем
+            ORDER BY rank * (CASE t.quality_tier WHEN 'draft' THEN ? ELSE 1.0 END)
+            LIMIT ? OFFSET ?
+        """, (query, DRAFT_RANK_FACTOR, limit, offset))
+        
+        return [dict(row) for row in cursor.fetchall()], total
+    
     def get_all_files(self, status: Optional[str] = None) -> List[Dict]:
         """Получить список всех файлов"""
         if status:
@@ -164,6 +1049,42 @@ class Database:
         row = cursor.fetchone()
         return dict(row) if row else None
     
+    def get_file_by_path(self, filepath: str) -> Optional[Dict]:
+        """Получить файл по пути"""
+        cursor = self.conn.execute("SELECT * FROM files WHERE filepath = ?", (filepath,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    
+    def get_file_by_hash(self, content_hash: str) -> Optional[Dict]:
+        """Получить файл по хэшу содержимого (приоритет — уже обработанные)"""
+        cursor = self.conn.execute("""
+            SELECT * FROM files WHERE content_hash = ?
+            ORDER BY CASE status WHEN 'completed' THEN 0 WHEN 'processing' THEN 1 ELSE 2 END, id
+            LIMIT 1
+        """, (content_hash,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    
+    def update_file_path(self, file_id: int, filepath: str, filename: str):
+        """Файл с тем же содержимым появился по другому пути (повторная загрузка)"""
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE files SET filepath = ?, filename = ? WHERE id = ?",
+                              (filepath, filename, file_id))
+    
+    def set_file_hash(self, file_id: int, content_hash: str, file_size: Optional[int] = None):
+        """Сохранить хэш содержимого файла (и размер, если файл перезаписан)"""
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE files SET content_hash = ?, file_size = COALESCE(?, file_size) WHERE id = ?",
+                              (content_hash, file_size, file_id))
+    
+    def set_media_info(self, file_id: int, duration: Optional[float], codec: Optional[str],
+                       channels: Optional[int]):
+        """Сохранить параметры медиа (app.media.probe_media)"""
+        with self._lock, self.conn:
+            self.conn.execute("""
+                UPDATE files SET media_duration = ?, media_codec = ?, media_channels = ? WHERE id = ?
+            """, (duration, codec, channels, file_id))
+    
     def get_transcript_by_file_id(self, file_id: int) -> Optional[Dict]:
         """Получить транскрипт по ID файла"""
         cursor = self.conn.execute("""
@@ -172,17 +1093,60 @@ class Database:
         row = cursor.fetchone()
         return dict(row) if row else None
     
+    def get_transcript_by_id(self, transcript_id: int) -> Optional[Dict]:
+        """Получить транскрипт по ID"""
+        cursor = self.conn.execute("SELECT * FROM transcripts WHERE id = ?", (transcript_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    
     def get_chunks_by_transcript_id(self, transcript_id: int) -> List[Dict]:
         """Получить все чанки транскрипта"""
         cursor = self.conn.execute("""
-            SELECT * FROM chunks WHERE transcript_id = ? ORDER BY chunk_index
+            SELECT * FROM chunks
+            WHERE transcript_id = ? AND chunk_set_id = (SELECT id FROM chunk_sets WHERE is_active = 1)
+            ORDER BY chunk_index
         """, (transcript_id,))
         return [dict(row) for row in cursor.fetchall()]
     
     def delete_file(self, file_id: int):
         """Удалить файл и связанные данные (каскадное удаление)"""
-        self.conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
-        self.conn.commit()
+        self.delete_files([file_id])
+    
+    def delete_files(self, file_ids: List[int]) -> Dict:
+        """
+        Удалить набор файлов одной транзакцией: транскрипты, чанки и блоки хранилища — каскадом,
+        строки FTS — триггерами удаления.
+        
+        Returns:
+            dict: deleted — [{id, filename}], missing — id, которых нет в базе,
+                  transcript_paths — пути транскриптов (старые .txt удаляет вызывающий)
+        """
+        ids = _ids_json(file_ids)
+        with self._lock, self.conn:
+            deleted = [dict(row) for row in self.conn.execute("""
+                SELECT id, filename FROM files WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id
+            """, (ids,))]
+            paths = [row["transcript_path"] for row in self.conn.execute("""
+                SELECT transcript_path FROM transcripts WHERE file_id IN (SELECT value FROM json_each(?))
+            """, (ids,))]
+            self._delete_transcripts_sql(
+                "SELECT id FROM transcripts WHERE file_id IN (SELECT value FROM json_each(?))", (ids,))
+            self.conn.execute("DELETE FROM files WHERE id IN (SELECT value FROM json_each(?))", (ids,))
+            # карты речи — по хэшу, общие для копий файла: удаляем, когда копий не осталось
+            self.conn.execute("""
+                DELETE FROM speech_maps WHERE content_hash NOT IN
+                    (SELECT content_hash FROM files WHERE content_hash IS NOT NULL)
+            """)
+        found = {d["id"] for d in deleted}
+        return {
+            "deleted": deleted,
+            "missing": sorted({int(i) for i in file_ids} - found),
+            "transcript_paths": paths,
+        }
+    
+    def _delete_transcripts_sql(self, id_query: str, params: tuple = ()):
+        """Удалить транскрипты из подзапроса id (внутри транзакции): чанки — каскадом, FTS — триггерами"""
+        self.conn.execute(f"DELETE FROM transcripts WHERE id IN ({id_query})", params)
     
     def get_stats(self) -> Dict:
         """Получить статистику"""
@@ -197,15 +1161,135 @@ class Database:
         cursor = self.conn.execute("SELECT COUNT(*) as count FROM transcripts")
         stats['total_transcripts'] = cursor.fetchone()['count']
         
-        cursor = self.conn.execute("SELECT COUNT(*) as count FROM chunks")
+        cursor = self.conn.execute("""
+            SELECT COUNT(*) as count FROM chunks
+            WHERE chunk_set_id = (SELECT id FROM chunk_sets WHERE is_active = 1)
+        """)
         stats['total_chunks'] = cursor.fetchone()['count']
         
+        cursor = self.conn.execute("""
+            SELECT COUNT(*) as count FROM chunks
+            WHERE chunk_set_id = (SELECT id FROM chunk_sets WHERE is_active = 1) AND duplicate_of IS NOT NULL
+        """)
+        stats['duplicate_chunks'] = cursor.fetchone()['count']
+        
         cursor = self.conn.execute("SELECT SUM(file_size) as total FROM files")
         total_size = cursor.fetchone()['total']
         stats['total_size_mb'] = round(total_size / 1024 / 1024, 2) if total_size else 0
         
         return stats
     
+    def get_profile_rtf_stats(self) -> List[Dict]:
+        """RTF распознавания по профилям декодирования и моделям (для сравнения профилей)"""
+        cursor = self.conn.execute("""
+            SELECT decode_profile AS profile, model_used AS model, COUNT(*) AS transcripts,
+                   SUM(duration_seconds) AS audio_seconds,
+                   AVG(rtf) AS avg_rtf, MIN(rtf) AS min_rtf, MAX(rtf) AS max_rtf
+            FROM transcripts
+            WHERE rtf IS NOT NULL
+            GROUP BY decode_profile, model_used
+            ORDER BY decode_profile, model_used
+        """)
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def get_expected_rtf(self, profile: Optional[str], model: Optional[str], recent: int = 50) -> Optional[float]:
+        """
+        RTF последних recent транскриптов (взвешенный по длительности) для профиля и модели,
+        без совпадения модели — по профилю; None — истории нет
+        """
+        for by_model in (True, False):
+            row = self.conn.execute(f"""
+                SELECT SUM(rtf * duration_seconds) / SUM(duration_seconds) AS rtf FROM (
+                    SELECT rtf, duration_seconds FROM transcripts
+                    WHERE rtf IS NOT NULL AND duration_seconds > 0 AND decode_profile IS ?
+                          {"AND model_used = ?" if by_model else ""}
+                    ORDER BY id DESC LIMIT ?
+                )
+            """, (profile, model, recent) if by_model else (profile, recent)).fetchone()
+            if row and row["rtf"] is not None:
+                return float(row["rtf"])
+        return None
+    
+    # ---- обслуживание (app/maintenance.py) ----
+    def fts_structure(self, fts: str) -> Tuple[int, int]:
+        """Фрагментация FTS-индекса → (уровней, сегментов); после optimize — один сегмент"""
+        row = self.conn.execute(f"SELECT block FROM {fts}_data WHERE id = ?", (_FTS_STRUCTURE_ROWID,)).fetchone()
+        if not row or not row["block"]:
+            return 0, 0
+        buf = bytes(row["block"])
+        i = 8 if buf[4:8] == b"\xff\x00\x00\x01" else 4  # cookie (+ метка формата v2)
+        levels, i = _varint(buf, i)
+        segments, _ = _varint(buf, i)
+        return levels, segments
+    
+    def fts_index_stats(self, fts: str) -> Dict:
+        """Размер и фрагментация FTS-индекса: блоки и байты в <fts>_data, уровни и сегменты"""
+        row = self.conn.execute(f"SELECT COUNT(*) AS blocks, COALESCE(SUM(LENGTH(block)), 0) AS bytes "
+                                f"FROM {fts}_data").fetchone()
+        levels, segments = self.fts_structure(fts)
+        return {"blocks": row["blocks"], "bytes": row["bytes"], "levels": levels, "segments": segments}
+    
+    def fts_merge(self, fts: str, pages: int) -> bool:
+        """Шаг слияния сегментов FTS5 (не больше pages страниц) → True, если было что сливать"""
+        with self._lock, self.conn:
+            before = self.conn.total_changes
+            self.conn.execute(f"INSERT INTO {fts}({fts}, rank) VALUES('merge', ?)", (int(pages),))
+            return self.conn.total_changes - before >= 2
+    
+    def fts_optimize(self, fts: str):
+        """Слить индекс в один сегмент (долго на больших индексах — только при простое)"""
+        with self._lock, self.conn:
+            self.conn.execute(f"INSERT INTO {fts}({fts}) VALUES('optimize')")
+    
+    def fts_integrity_check(self, fts: str) -> Optional[str]:
+        """Сверка FTS-индекса с таблицей текста → None или текст ошибки"""
+        with self._lock:
+            try:
+                self.conn.execute(f"INSERT INTO {fts}({fts}, rank) VALUES('integrity-check', 1)")
+            except sqlite3.DatabaseError as e:
+                return str(e)
+            finally:
+                self.conn.commit()
+        return None
+    
+    def fts_rebuild(self, fts: str):
+        """Пересобрать FTS-индекс из таблицы текста"""
+        with self._lock, self.conn:
+            self.conn.execute(f"INSERT INTO {fts}({fts}) VALUES('rebuild')")
+    
+    def storage_stats(self) -> Dict:
+        """Страницы файла БД: размер, свободные страницы, режим auto_vacuum"""
+        pragma = {name: self.conn.execute(f"PRAGMA {name}").fetchone()[0]
+                  for name in ("page_size", "page_count", "freelist_count", "auto_vacuum")}
+        pragma["bytes"] = pragma["page_size"] * pragma["page_count"]
+        return pragma
+    
+    def incremental_vacuum(self, pages: int) -> int:
+        """Вернуть ОС до pages свободных страниц (auto_vacuum = INCREMENTAL) → сколько вернули"""
+        with self._lock:
+            before = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # через execute модуль sqlite3 делает один шаг — одна страница; executescript доводит до конца
+            self.conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+            return before - self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+    
+    def enable_incremental_vacuum(self):
+        """Перевести существующую базу на auto_vacuum = INCREMENTAL (полный VACUUM — долго)"""
+        with self._lock:
+            self.conn.commit()
+            self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self.conn.execute("VACUUM")
+    
+    def pragma_optimize(self):
+        """PRAGMA optimize: ANALYZE таблиц, где статистика планировщика устарела"""
+        with self._lock:
+            self.conn.executescript("PRAGMA optimize;")
+    
+    def quick_check(self) -> List[str]:
+        """PRAGMA quick_check → [] или список проблем"""
+        with self._lock:
+            rows = [row[0] for row in self.conn.execute("PRAGMA quick_check")]
+        return [] if rows == ["ok"] else rows
+    
     def close(self):
         """Закрыть соединение с базой"""
         if self.conn:
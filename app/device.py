@@ -0,0 +1,86 @@
+"""
+Дешёвая проверка CUDA без torch и без создания CUDA-контекста.
+
+Порядок: CUDA_VISIBLE_DEVICES → наличие драйвера NVIDIA → кэш в ./data →
+ctranslate2.get_cuda_device_count() (бэкенд faster-whisper) → torch.cuda.is_available().
+Результат кэшируется в процессе и на диске (ключ — версия драйвера), так что
+повторные старты не импортируют ни ctranslate2, ни torch.
+"""
+import json
+import os
+import sys
+import time
+from functools import lru_cache
+from pathlib import Path
+
+PROBE_CACHE_FILE = "./data/device_probe.json"
+PROBE_CACHE_TTL = 24 * 3600  # сек; на Linux ключ — версия драйвера, TTL — страховка для Win/macOS
+
+
+def _driver_signature() -> str:
+    try:
+        return Path("/proc/driver/nvidia/version").read_text(encoding="utf-8").strip()
+    except OSError:
+        return ""
+
+
+def _cache_key() -> str:
+    return f"{sys.platform}|{os.environ.get('CUDA_VISIBLE_DEVICES', '*')}|{_driver_signature()}"
+
+
+def _read_cache(key: str):
+    try:
+        with open(PROBE_CACHE_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("key") == key and time.time() - data.get("ts", 0) < PROBE_CACHE_TTL:
+            return data.get("device")
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _write_cache(key: str, device: str):
+    try:
+        os.makedirs(Path(PROBE_CACHE_FILE).parent, exist_ok=True)
+        with open(PROBE_CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "device": device, "ts": time.time()}, f)
+    except OSError:
+        pass
+
+
+def _probe_uncached() -> str:
+    try:
+        import ctranslate2
+        return "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+    except Exception:
+        pass
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except Exception:
+        return "cpu"
+
+
+@lru_cache(maxsize=1)
+def probe_device(use_cache: bool = True) -> str:
+    """'cuda' или 'cpu'."""
+    if os.environ.get("CUDA_VISIBLE_DEVICES", None) in ("", "-1"):
+        return "cpu"
+    if sys.platform.startswith("linux") and not os.path.exists("/dev/nvidiactl"):
+        return "cpu"
+
+    key = _cache_key()
+    if use_cache:
+        cached = _read_cache(key)
+        if cached:
+            return cached
+
+    device = _probe_uncached()
+    _write_cache(key, device)
+    return device
+
+
+if __name__ == "__main__":
+    t0 = time.perf_counter()
+    print(probe_device(use_cache="--no-cache" not in sys.argv),
+          f"({(time.perf_counter() - t0) * 1000:.1f} мс)")
@@ -0,0 +1,69 @@
+"""
+Диагностика старта: отчёт о времени импорта модулей (аналог `python -X importtime`).
+
+    python -m app.diagnostics                 # что стоит импорт app.main
+    python -m app.diagnostics app.watcher 15  # другой модуль, топ-15
+    python -m app.main --import-report
+"""
+import subprocess
+import sys
+from typing import List, Tuple
+
+# (self_us, cumulative_us, module, depth)
+ImportRow = Tuple[int, int, str, int]
+
+
+def measure_imports(module: str = "app.main") -> List[ImportRow]:
+    """Импортировать модуль в отдельном процессе с -X importtime и разобрать stderr."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    rows: List[ImportRow] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cum_us, name = line.partition(":")[2].split("|")
+            depth = (len(name) - len(name.lstrip())) // 2
+            rows.append((int(self_us), int(cum_us), name.strip(), depth))
+        except ValueError:
+            continue
+    if proc.returncode != 0 and not rows:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    return rows
+
+
+def import_time_report(module: str = "app.main", top: int = 25) -> str:
+    """Текстовый отчёт: общий импорт, самые дорогие пакеты верхнего уровня и модули по self-time."""
+    rows = measure_imports(module)
+    if not rows:
+        return f"ℹ️ Нет данных importtime для {module}"
+
+    target = next((r for r in reversed(rows) if r[2] == module), None)
+    total_us = target[1] if target else max(r[1] for r in rows)
+
+    # Пакет = первый сегмент имени модуля
+    by_pkg = {}
+    for self_us, _, name, _ in rows:
+        pkg = name.split(".", 1)[0]
+        by_pkg[pkg] = by_pkg.get(pkg, 0) + self_us
+    heavy_pkgs = sorted(by_pkg.items(), key=lambda kv: kv[1], reverse=True)[:top]
+    heavy_mods = sorted(rows, key=lambda r: r[0], reverse=True)[:top]
+
+    lines = [
+        "=" * 60,
+        f"⏱️ import {module}: {total_us / 1000:.1f} мс, модулей: {len(rows)}",
+        "=" * 60,
+        "Пакеты (сумма self-time):",
+    ]
+    lines += [f"  {us / 1000:9.1f} мс  {pkg}" for pkg, us in heavy_pkgs]
+    lines.append("Модули (self / cumulative):")
+    lines += [f"  {s / 1000:9.1f} / {c / 1000:9.1f} мс  {name}" for s, c, name, _ in heavy_mods]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    mod = sys.argv[1] if len(sys.argv) > 1 else "app.main"
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+    print(import_time_report(mod, n))
@@ -0,0 +1,275 @@
+"""
+Потоковый экспорт корпуса: файлы, транскрипты (с полным текстом), чанки, сегменты.
+
+Таблицы читаются курсором пачками (Database.iter_*), в памяти — не больше одной пачки;
+строки транскриптов с полным текстом режутся на пачки по TEXT_BATCH_BYTES текста (бюджет
+превышает только одиночный транскрипт, который больше него). Форматы: JSONL, Parquet (если установлен pyarrow),
+субтитры SRT/VTT для транскриптов с таймкодами.
+
+Инкрементальный режим: водяная метка в <out>/export_state.json —
+последний выгруженный id транскрипта и время последнего изменения файлов.
+
+    python -m app.export --out ./data/export --formats jsonl,parquet,srt,vtt --incremental
+"""
+from __future__ import annotations
+import json
+import logging
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from app.config import get_config
+from app.transcript_store import TranscriptStore
+
+log = logging.getLogger("whisper_rag_studio")
+
+STATE_FILE = "export_state.json"
+FORMATS = ("jsonl", "parquet", "srt", "vtt")
+TEXT_BATCH_BYTES = 8 * 1024 * 1024  # текста транскриптов в одной пачке экспорта
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        return None
+
+
+# Типы колонок Parquet (схема задаётся явно: в первой пачке поле может быть целиком NULL)
+_SCHEMAS = {
+    "files": {
+        "id": "int64", "filename": "string", "filepath": "string", "file_type": "string",
+        "file_size": "int64", "created_at": "string", "processed_at": "string",
+        "status": "string", "error_message": "string", "content_hash": "string",
+    },
+    "transcripts": {
+        "id": "int64", "file_id": "int64", "filename": "string", "filepath": "string",
+        "content_hash": "string", "word_count": "int64", "duration_seconds": "float64",
+        "language": "string", "model_used": "string", "created_at": "string",
+        "text_bytes": "int64", "text": "string",
+    },
+    "chunks": {
+        "id": "int64", "transcript_id": "int64", "chunk_index": "int64",
+        "chunk_text": "string", "chunk_size": "int64", "created_at": "string",
+    },
+    "segments": {
+        "transcript_id": "int64", "segment_index": "int64", "start_time": "float64",
+        "end_time": "float64", "text": "string", "no_speech_prob": "float64",
+    },
+}
+
+
+class _JsonlSink:
+    def __init__(self, path: Path, columns: Iterable[str]):
+        self.columns = list(columns)
+        self.f = open(path, "w", encoding="utf-8")
+        self.rows = 0
+
+    def write(self, rows: List[Dict]):
+        for r in rows:
+            self.f.write(json.dumps({c: r.get(c) for c in self.columns}, ensure_ascii=False) + "\n")
+        self.rows += len(rows)
+
+    def close(self):
+        self.f.close()
+
+
+class _ParquetSink:
+    def __init__(self, path: Path, schema: Dict[str, str]):
+        pa = _pyarrow()
+        self.pa = pa
+        self.schema = pa.schema([(name, getattr(pa, typ)()) for name, typ in schema.items()])
+        self.writer = pa.parquet.ParquetWriter(str(path), self.schema, compression="zstd")
+        self.rows = 0
+
+    def write(self, rows: List[Dict]):
+        if rows:
+            cols = {name: [r.get(name) for r in rows] for name in self.schema.names}
+            self.writer.write_table(self.pa.Table.from_pydict(cols, schema=self.schema))
+            self.rows += len(rows)
+
+    def close(self):
+        self.writer.close()
+
+
+def _fmt_ts(seconds: float, sep: str) -> str:
+    ms = int(round(max(0.0, seconds) * 1000))
+    h, ms = divmod(ms, 3_600_000)
+    m, ms = divmod(ms, 60_000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}{sep}{ms:03d}"
+
+
+def write_srt(path: Path, segments: List[Dict]):
+    with open(path, "w", encoding="utf-8") as f:
+        for i, seg in enumerate(segments, 1):
+            f.write(f"{i}\n{_fmt_ts(seg['start_time'], ',')} --> {_fmt_ts(seg['end_time'], ',')}\n"
+                    f"{seg['text'].strip()}\n\n")
+
+
+def write_vtt(path: Path, segments: List[Dict]):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("WEBVTT\n\n")
+        for seg in segments:
+            f.write(f"{_fmt_ts(seg['start_time'], '.')} --> {_fmt_ts(seg['end_time'], '.')}\n"
+                    f"{seg['text'].strip()}\n\n")
+
+
+class CorpusExporter:
+    def __init__(self, db, out_dir: str, formats: Iterable[str] = ("jsonl",),
+                 batch_size: int = 1000, store: Optional[TranscriptStore] = None):
+        self.db = db
+        self.out_dir = Path(out_dir)
+        self.formats = [f for f in formats if f in FORMATS]
+        if "parquet" in self.formats and _pyarrow() is None:
+            log.warning("EXPORT: pyarrow не установлен — Parquet пропущен")
+            self.formats.remove("parquet")
+        self.batch_size = batch_size
+        self.store = store or TranscriptStore(db)
+
+    # ---- водяная метка ----
+    def load_state(self) -> Dict:
+        p = self.out_dir / STATE_FILE
+        if p.exists():
+            return json.loads(p.read_text(encoding="utf-8"))
+        return {"last_transcript_id": 0, "files_changed_at": None}
+
+    def _save_state(self, state: Dict):
+        p = self.out_dir / STATE_FILE
+        tmp = p.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp.replace(p)
+
+    # ---- экспорт ----
+    def run(self, incremental: bool = False, since_transcript_id: Optional[int] = None) -> Dict:
+        """Выгрузить корпус (или изменения после водяной метки) в новый каталог run_<время>"""
+        state = self.load_state() if incremental else {"last_transcript_id": 0, "files_changed_at": None}
+        if since_transcript_id is not None:
+            state["last_transcript_id"] = since_transcript_id
+        after_id = int(state["last_transcript_id"] or 0)
+
+        run_dir = self.out_dir / f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        run_dir.mkdir(parents=True, exist_ok=True)
+        report = {"dir": str(run_dir), "since_transcript_id": after_id}
+
+        files_wm = self._export_table(run_dir, "files",
+                                      self.db.iter_files(state.get("files_changed_at"), self.batch_size),
+                                      report, watermark=lambda r: r["processed_at"] or r["created_at"])
+        last_id = self._export_table(run_dir, "transcripts", self._with_text(
+            self.db.iter_transcripts(after_id, self.batch_size)), report, watermark=lambda r: r["id"])
+        self._export_table(run_dir, "chunks", self.db.iter_chunks(after_id, self.batch_size), report)
+        self._export_table(run_dir, "segments", self.db.iter_segments(after_id, self.batch_size), report)
+        report["subtitles"] = self._export_subtitles(run_dir, after_id)
+
+        state = {
+            "last_transcript_id": max(after_id, last_id or 0),
+            "files_changed_at": max(filter(None, [state.get("files_changed_at"), files_wm]), default=None),
+            "exported_at": datetime.now().isoformat(timespec="seconds"),
+            "last_run": str(run_dir),
+        }
+        self._save_state(state)
+        report["state"] = state
+        log.info("EXPORT → %s: %s", run_dir, {k: v for k, v in report.items() if k.endswith("_rows")})
+        return report
+
+    def _with_text(self, batches):
+        """Строки транскриптов с полным текстом пачками не больше TEXT_BATCH_BYTES текста"""
+        out, size = [], 0
+        for batch in batches:
+            for r in batch:
+                n = self.store.size(r["id"]) or 0
+                if out and size + n > TEXT_BATCH_BYTES:
+                    yield out
+                    out, size = [], 0
+                # копия: исходная пачка метаданных не должна удерживать тексты
+                row = {k: v for k, v in r.items() if k not in ("transcript_path", "text_preview")}
+                row["text"] = self.store.read_text(r["id"])
+                out.append(row)
+                size += n
+        if out:
+            yield out
+
+    def _export_table(self, run_dir: Path, name: str, batches, report: Dict, watermark=None):
+        sinks = []
+        if "jsonl" in self.formats:
+            sinks.append(_JsonlSink(run_dir / f"{name}.jsonl", _SCHEMAS[name]))
+        if "parquet" in self.formats:
+            sinks.append(_ParquetSink(run_dir / f"{name}.parquet", _SCHEMAS[name]))
+        rows, mark = 0, None
+        try:
+            for batch in batches:
+                for s in sinks:
+                    s.write(batch)
+                rows += len(batch)
+                if watermark and batch:
+                    mark = max(filter(None, [mark, *map(watermark, batch)]), default=mark)
+        finally:
+            for s in sinks:
+                s.close()
+        report[f"{name}_rows"] = rows
+        return mark
+
+    def _export_subtitles(self, run_dir: Path, after_id: int) -> int:
+        """SRT/VTT по транскриптам с таймкодами (сегменты идут по transcript_id подряд)"""
+        subs = [f for f in ("srt", "vtt") if f in self.formats]
+        if not subs:
+            return 0
+        sub_dir = run_dir / "subtitles"
+        sub_dir.mkdir(exist_ok=True)
+        written, current, segs = 0, None, []
+
+        def flush():
+            nonlocal written
+            if current is None or not segs:
+                return
+            tr = self.db.get_transcript_by_id(current)
+            fi = self.db.get_file_by_id(tr["file_id"]) if tr else None
+            stem = re.sub(r"[^\w.-]+", "_", Path(fi["filename"]).stem if fi else "transcript")
+            base = sub_dir / f"{current}_{stem}"
+            if "srt" in subs:
+                write_srt(base.with_suffix(".srt"), segs)
+            if "vtt" in subs:
+                write_vtt(base.with_suffix(".vtt"), segs)
+            written += 1
+
+        for batch in self.db.iter_segments(after_id, self.batch_size):
+            for seg in batch:
+                if seg["transcript_id"] != current:
+                    flush()
+                    current, segs = seg["transcript_id"], []
+                segs.append(seg)
+        flush()
+        return written
+
+
+def main():
+    import argparse
+    from app.database import Database
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Экспорт корпуса (JSONL / Parquet / SRT / VTT)")
+    parser.add_argument("--out", default="./data/export")
+    parser.add_argument("--formats", default="jsonl,parquet,srt,vtt",
+                        help=f"через запятую: {', '.join(FORMATS)}")
+    parser.add_argument("--incremental", action="store_true",
+                        help="только изменения после прошлой выгрузки (водяная метка)")
+    parser.add_argument("--since", type=int, default=None, help="транскрипты с id больше указанного")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    get_config().ensure_dirs()
+    db = Database()
+    exporter = CorpusExporter(db, args.out, [f.strip() for f in args.formats.split(",")], args.batch_size)
+    try:
+        report = exporter.run(incremental=args.incremental, since_transcript_id=args.since)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    finally:
+        exporter.store.close()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,515 @@
+"""
+Сервер инференса: пул процессов с моделью Whisper вне процесса UI.
+
+- запросы по локальному Unix-сокету (сообщение = 4 байта длины + JSON);
+- PCM (np.float32, 16 кГц моно) передаётся через multiprocessing.shared_memory, без копий в сокете;
+- сегменты стримятся клиенту по мере распознавания;
+- watchdog перезапускает упавшие/зависшие воркеры и переотправляет их задачи;
+- клиент отключился — задача отменяется: воркер бросает её на следующем сегменте, а не
+  успевший за inference.cancel_grace сек перезапускается (модель не занята ничьей записью).
+
+Запуск: python -m app.inference_server [--socket ./data/inference.sock] [--workers 2]
+Клиент: Transcriber при inference.mode = "server" (см. InferenceClient).
+"""
+from __future__ import annotations
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing as mp
+import os
+import queue
+import select
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.config import TranscriberConfig, get_config
+
+log = logging.getLogger("whisper_rag_studio")
+
+_LEN = struct.Struct(">I")
+
+
+# ---------------------------------------------------------------------------
+# Протокол
+# ---------------------------------------------------------------------------
+def send_msg(sock: socket.socket, msg: Dict[str, Any]):
+    data = json.dumps(msg, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_LEN.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("socket closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def recv_msg(sock: socket.socket) -> Dict[str, Any]:
+    (n,) = _LEN.unpack(_recv_exact(sock, _LEN.size))
+    return json.loads(_recv_exact(sock, n).decode("utf-8"))
+
+
+def _attach_shm(name: str) -> shared_memory.SharedMemory:
+    """Подключиться к чужому сегменту, не отдавая его resource_tracker'у этого процесса
+    (иначе при выходе воркера сегмент будет удалён/будут предупреждения об утечке)."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        pass
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+# ---------------------------------------------------------------------------
+# Воркер (отдельный процесс, владеет моделью)
+# ---------------------------------------------------------------------------
+def _model_key(cfg: TranscriberConfig) -> Tuple:
+    return (cfg.use_faster_whisper, cfg.model_name, cfg.model_path, cfg.device, cfg.compute_type,
+            cfg.cpu_compute_type, cfg.cpu_threads, cfg.num_workers)
+
+
+class _Cancelled(Exception):
+    """Задачу отменил сервер (клиент отключился)"""
+
+
+def _worker_main(slot: int, task_q, result_q, default_cfg: Dict[str, Any], n_slots: int = 1,
+                 cancel=None):
+    """cancel — общий mp.Value: id задачи, которую надо бросить"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import numpy as np
+    from transcriber import Transcriber
+
+    # несколько CPU-воркеров на хосте: у каждого свои ядра (в пределах NUMA-узла)
+    cpus = None
+    if default_cfg.get("device") == "cpu" and default_cfg.get("pin_threads") and n_slots > 1:
+        from app.autotune import pin_worker
+        cpus = pin_worker(slot, n_slots)
+
+    models: Dict[Tuple, Transcriber] = {}
+
+    def get_transcriber(cfg_dict: Dict[str, Any]) -> Transcriber:
+        cfg = TranscriberConfig(**{k: v for k, v in cfg_dict.items()
+                                   if k in TranscriberConfig.__dataclass_fields__})
+        if cpus and cfg.device == "cpu" and not cfg.cpu_threads:
+            cfg.cpu_threads = len(cpus)  # не больше потоков, чем закреплённых ядер
+        key = _model_key(cfg)
+        tr = models.get(key)
+        if tr is None:
+            tr = Transcriber(cfg, mode="local")
+            models[key] = tr
+        tr.config = cfg  # параметры декодирования — из запроса
+        return tr
+
+    get_transcriber(default_cfg)  # прогрев: модель загружается до первой задачи
+    result_q.put((None, {"type": "ready", "slot": slot, "pid": os.getpid()}))
+
+    while True:
+        task = task_q.get()
+        if task is None:
+            break
+        job_id, shm_name, samples, cfg_dict = task
+        shm = None
+        try:
+            shm = _attach_shm(shm_name)
+            audio = np.ndarray((samples,), dtype=np.float32, buffer=shm.buf)
+            tr = get_transcriber(cfg_dict)
+
+            def on_segment(seg):
+                if cancel is not None and cancel.value == job_id:
+                    raise _Cancelled()
+                result_q.put((job_id, {"type": "segment", **seg}))
+
+            # текст уходит сегментами — целиком в воркере не собирается
+            _, meta = tr.transcribe_audio(audio, segment_callback=on_segment,
+                                          clip_timestamps=cfg_dict.get("clip_timestamps"),
+                                          collect_text=False)
+            del audio
+            result_q.put((job_id, {"type": "done", "meta": meta}))
+        except _Cancelled:
+            result_q.put((job_id, {"type": "cancelled"}))
+        except Exception as e:
+            result_q.put((job_id, {"type": "error", "message": f"{type(e).__name__}: {e}"}))
+        finally:
+            if shm is not None:
+                try:
+                    shm.close()
+                except BufferError:
+                    pass
+
+
+# ---------------------------------------------------------------------------
+# Сервер
+# ---------------------------------------------------------------------------
+def _client_gone(conn: socket.socket) -> bool:
+    """Клиент закрыл соединение (читаемо, но данных нет — EOF)"""
+    readable, _, _ = select.select([conn], [], [], 0)
+    return bool(readable) and not conn.recv(1, socket.MSG_PEEK)
+
+
+@dataclass
+class _Job:
+    id: int
+    shm_name: str
+    samples: int
+    cfg: Dict[str, Any]
+    out: "queue.Queue[Dict[str, Any]]" = field(default_factory=queue.Queue)
+    attempts: int = 0
+    sent: int = 0  # сколько сегментов уже отдано клиенту (при повторе не дублируем)
+    slot: Optional["_WorkerSlot"] = None
+    last_activity: float = field(default_factory=time.monotonic)
+    cancelled: bool = False
+    cancelled_at: Optional[float] = None  # time.monotonic() отмены выполняющейся задачи
+
+
+@dataclass
+class _WorkerSlot:
+    slot: int
+    process: Any = None
+    task_q: Any = None
+    ready: bool = False
+    job: Optional[_Job] = None
+    cancel: Any = None  # mp.Value: id задачи воркера, которую клиент бросил
+    restarts: int = 0
+    restart_at: float = 0.0  # бэкофф при частых падениях
+
+
+class InferenceServer:
+    def __init__(self, socket_path: Optional[str] = None, num_workers: Optional[int] = None, config=None):
+        self.config = config or get_config().inference
+        self.socket_path = socket_path or self.config.socket_path
+        self.num_workers = max(1, int(num_workers or self.config.num_workers))
+        self.transcriber_cfg = asdict(get_config().transcriber)
+
+        self._mp = mp.get_context("spawn")  # CUDA не переживает fork
+        self._result_q = self._mp.Queue()
+        self._slots: List[_WorkerSlot] = [_WorkerSlot(i) for i in range(self.num_workers)]
+        self._pending: Deque[_Job] = deque()
+        self._jobs: Dict[int, _Job] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._sock: Optional[socket.socket] = None
+
+    # ---------- workers ----------
+    def _spawn(self, ws: _WorkerSlot):
+        ws.task_q = self._mp.Queue()
+        ws.cancel = self._mp.Value("q", 0, lock=False)
+        ws.ready = False
+        ws.process = self._mp.Process(
+            target=_worker_main, name=f"inference-worker-{ws.slot}",
+            args=(ws.slot, ws.task_q, self._result_q, self.transcriber_cfg, self.num_workers, ws.cancel),
+            daemon=True)
+        ws.process.start()
+        log.info("INFERENCE worker %d started (pid=%s)", ws.slot, ws.process.pid)
+
+    def _dispatch(self):
+        with self._lock:
+            for ws in self._slots:
+                if not self._pending:
+                    return
+                if ws.ready and ws.job is None and ws.process.is_alive():
+                    job = self._pending.popleft()
+                    job.slot, job.last_activity = ws, time.monotonic()
+                    ws.job = job
+                    ws.task_q.put((job.id, job.shm_name, job.samples, job.cfg))
+
+    def _finish(self, job: _Job):
+        with self._lock:
+            if job.slot is not None and job.slot.job is job:
+                job.slot.job = None
+            job.slot = None
+            self._jobs.pop(job.id, None)
+        self._dispatch()
+
+    def _route_results(self):
+        while not self._stop.is_set():
+            try:
+                job_id, msg = self._result_q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                continue
+            if job_id is None:
+                with self._lock:
+                    self._slots[msg["slot"]].ready = True
+                log.info("INFERENCE worker %d ready (pid=%s)", msg["slot"], msg["pid"])
+                self._dispatch()
+                continue
+            with self._lock:
+                job = self._jobs.get(job_id)
+            if job is None:
+                continue
+            job.last_activity = time.monotonic()
+            if msg["type"] == "segment":
+                if msg["index"] < job.sent:
+                    continue  # повтор после перезапуска воркера — уже отдано
+                job.sent += 1
+            if not job.cancelled:
+                job.out.put(msg)
+            if msg["type"] in ("done", "error", "cancelled"):
+                self._finish(job)
+
+    def _watchdog(self):
+        while not self._stop.wait(1.0):
+            now = time.monotonic()
+            for ws in self._slots:
+                with self._lock:
+                    job = ws.job
+                    if ws.process.is_alive():
+                        if job and now - job.last_activity > self.config.stall_timeout:
+                            log.error("INFERENCE worker %d stalled on job %d → kill", ws.slot, job.id)
+                            ws.process.kill()
+                        elif job and job.cancelled_at and now - job.cancelled_at > self.config.cancel_grace:
+                            # бэкенд не отдаёт сегменты по одному (openai-whisper) или долгая тишина
+                            log.warning("INFERENCE worker %d: job %d cancelled → restart", ws.slot, job.id)
+                            ws.process.kill()
+                        continue
+                    if now < ws.restart_at:
+                        continue
+                    log.error("INFERENCE worker %d died (exitcode=%s)", ws.slot, ws.process.exitcode)
+                    ws.job = None
+                    if job is not None:
+                        job.slot = None
+                        job.attempts += 1
+                        if job.attempts >= self.config.max_attempts or job.cancelled:
+                            job.out.put({"type": "error",
+                                         "message": f"worker crashed {job.attempts}× on this job"})
+                            self._jobs.pop(job.id, None)
+                        else:
+                            job.out.put({"type": "requeued", "attempt": job.attempts})
+                            self._pending.appendleft(job)
+                    if job is None or not job.cancelled:
+                        ws.restarts += 1  # перезапуск ради отмены — не сбой воркера
+                    # частые падения → экспоненциальная пауза перед следующим рестартом (до 60 сек)
+                    ws.restart_at = now + min(60.0, 2.0 ** min(ws.restarts, 6))
+                    self._spawn(ws)
+            self._dispatch()
+
+    # ---------- clients ----------
+    def _handle_client(self, conn: socket.socket):
+        job = None
+        try:
+            with conn:
+                req = recv_msg(conn)
+                op = req.get("op")
+                if op == "ping":
+                    with self._lock:
+                        send_msg(conn, {
+                            "type": "pong",
+                            "workers": [{"slot": w.slot, "ready": w.ready, "busy": w.job is not None,
+                                         "restarts": w.restarts} for w in self._slots],
+                            "pending": len(self._pending),
+                        })
+                    return
+                if op != "transcribe":
+                    send_msg(conn, {"type": "error", "message": f"unknown op: {op}"})
+                    return
+
+                job = _Job(next(self._ids), req["shm"], int(req["samples"]),
+                           dict(self.transcriber_cfg, **(req.get("config") or {})))
+                with self._lock:
+                    self._jobs[job.id] = job
+                    self._pending.append(job)
+                send_msg(conn, {"type": "accepted", "job_id": job.id, "position": len(self._pending)})
+                self._dispatch()
+
+                while True:
+                    try:
+                        msg = job.out.get(timeout=1.0)
+                    except queue.Empty:
+                        # в очереди или между сегментами клиент молчит — проверяем, не ушёл ли он
+                        if _client_gone(conn):
+                            raise ConnectionError("client disconnected")
+                        continue
+                    send_msg(conn, msg)
+                    if msg["type"] in ("done", "error"):
+                        break
+        except (ConnectionError, OSError):
+            if job is not None:
+                self._cancel(job)
+        except Exception:
+            log.exception("INFERENCE client handler error")
+
+    def _cancel(self, job: _Job):
+        """Клиент отключился: из очереди — убрать, у воркера — попросить бросить"""
+        with self._lock:
+            job.cancelled = True
+            if job in self._pending:
+                self._pending.remove(job)
+                self._jobs.pop(job.id, None)
+            elif job.slot is not None and job.slot.job is job:
+                job.cancelled_at = time.monotonic()
+                job.slot.cancel.value = job.id
+                log.info("INFERENCE job %d cancelled on worker %d", job.id, job.slot.slot)
+
+    def serve_forever(self):
+        Path(self.socket_path).parent.mkdir(parents=True, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        for ws in self._slots:
+            self._spawn(ws)
+        threading.Thread(target=self._route_results, name="inference-router", daemon=True).start()
+        threading.Thread(target=self._watchdog, name="inference-watchdog", daemon=True).start()
+
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.socket_path)
+        self._sock.listen(64)
+        print(f"🧠 Сервер инференса: {self.socket_path} | воркеров: {self.num_workers}")
+        try:
+            while not self._stop.is_set():
+                try:
+                    conn, _ = self._sock.accept()
+                except OSError:
+                    break
+                threading.Thread(target=self._handle_client, args=(conn,), daemon=True).start()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        for ws in self._slots:
+            try:
+                ws.task_q.put(None)
+            except Exception:
+                pass
+        for ws in self._slots:
+            if ws.process is not None:
+                ws.process.join(timeout=5)
+                if ws.process.is_alive():
+                    ws.process.kill()
+        if self._sock:
+            self._sock.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+# ---------------------------------------------------------------------------
+# Клиент
+# ---------------------------------------------------------------------------
+class InferenceClient:
+    """Тонкий клиент сервера инференса (используется Transcriber в режиме server)"""
+
+    def __init__(self, socket_path: Optional[str] = None, config=None):
+        self.config = config or get_config().inference
+        self.socket_path = socket_path or self.config.socket_path
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.socket_path)
+        return sock
+
+    def _connect_or_start(self, wait: float = 120.0) -> socket.socket:
+        try:
+            return self._connect()
+        except (FileNotFoundError, ConnectionRefusedError):
+            if not self.config.autostart:
+                raise
+        print("🔄 Запускаю сервер инференса…")
+        subprocess.Popen(
+            [sys.executable, "-m", "app.inference_server", "--socket", self.socket_path],
+            start_new_session=True)
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                return self._connect()
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"сервер инференса не поднялся за {wait:.0f} сек")
+                time.sleep(0.2)
+
+    def ping(self) -> Dict[str, Any]:
+        with self._connect() as sock:
+            send_msg(sock, {"op": "ping"})
+            return recv_msg(sock)
+
+    def transcribe(self, audio, config: Dict[str, Any],
+                   progress_callback: Optional[Callable] = None,
+                   segment_callback: Optional[Callable] = None,
+                   collect_text: bool = True) -> Tuple[str, dict]:
+        """
+        audio: np.float32 16 кГц моно → (full_text, metadata); сегменты стримятся в segment_callback
+        (collect_text=False — текст не склеивается, вернётся "")
+        """
+        import numpy as np
+
+        samples = int(audio.shape[0])
+        duration = samples / 16000.0
+        shm = shared_memory.SharedMemory(create=True, size=max(1, samples * 4))
+        texts: List[str] = []
+        received = 0
+        try:
+            buf = np.ndarray((samples,), dtype=np.float32, buffer=shm.buf)
+            buf[:] = audio
+            del buf
+            with self._connect_or_start() as sock:
+                send_msg(sock, {"op": "transcribe", "shm": shm.name, "samples": samples, "config": config})
+                while True:
+                    msg = recv_msg(sock)
+                    kind = msg["type"]
+                    if kind == "segment":
+                        received += 1
+                        if collect_text:
+                            texts.append(msg["text"])
+                        if segment_callback:
+                            segment_callback({k: v for k, v in msg.items() if k != "type"})
+                        if progress_callback and duration > 0:
+                            progress_callback(0.1 + 0.8 * min(1.0, msg["end"] / duration),
+                                              f"Обработано сегментов: {received}")
+                    elif kind == "accepted":
+                        if progress_callback:
+                            progress_callback(0.1, f"В очереди сервера инференса: {msg['position']}")
+                    elif kind == "requeued":
+                        log.warning("INFERENCE job requeued after worker crash (attempt %s)", msg["attempt"])
+                    elif kind == "done":
+                        if progress_callback:
+                            progress_callback(1.0, "Готово!")
+                        return "\n".join(texts), msg["meta"]
+                    elif kind == "error":
+                        raise RuntimeError(f"Сервер инференса: {msg['message']}")
+        finally:
+            shm.close()
+            shm.unlink()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Whisper inference server")
+    parser.add_argument("--socket", default=None, help="путь к Unix-сокету")
+    parser.add_argument("--workers", type=int, default=None, help="число процессов с моделью")
+    args = parser.parse_args()
+
+    server = InferenceServer(args.socket, args.workers)
+
+    def _term(_sig, _frm):
+        server.shutdown()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, _term)
+    signal.signal(signal.SIGINT, _term)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Фоновые задачи транскрибации (для REST API и других не-UI клиентов).
+
+Задача живёт в памяти процесса: статус, прогресс и сегменты по мере распознавания,
+которые можно дочитывать с любого индекса (стриминг в API). В памяти — только последние
+SEGMENT_RING сегментов выполняющейся задачи; более ранние и все сегменты завершённой
+читаются из БД (контрольная точка прохода, затем segments транскрипта).
+Исполнение — в полосе heavy (app.lanes): при переполнении submit бросает QueueFull.
+Длительность файла определяется при постановке (ffprobe / заголовок WAV): по ней и RTF из
+истории полоса ставит короткие задачи вперёд, а статус показывает ожидаемое время старта.
+Файлы идут через конвейер app.pipeline: декодирование следующей задачи начинается сразу
+при постановке, запись в БД и ingest — уже после освобождения полосы.
+При cluster.enabled распознают удалённые воркеры (app.coordinator), полоса heavy не занимается.
+"""
+from __future__ import annotations
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from app import tracing
+from app.config import get_config
+from app.lanes import Ticket, get_lanes
+
+log = logging.getLogger("whisper_rag_studio")
+
+FINAL_STATUSES = ("completed", "failed")
+# больше transcribe.SPOOL_SEGMENTS: всё, что старше кольца, уже сброшено в контрольную точку
+SEGMENT_RING = 1000
+SEGMENT_PAGE = 500  # сегментов из БД за одно чтение стрима
+
+
+@dataclass
+class Job:
+    id: str
+    path: str
+    model_name: Optional[str] = None
+    profile: Optional[str] = None  # профиль декодирования (None — transcriber.profile)
+    duration: Optional[float] = None  # длительность медиа, сек (probe при постановке)
+    collection: Optional[str] = None
+    status: str = "queued"  # queued → running → completed / failed
+    progress: float = 0.0
+    progress_desc: str = ""
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    file_id: Optional[int] = None
+    transcript_id: Optional[int] = None
+    word_count: Optional[int] = None
+    quality_tier: Optional[str] = None  # draft — окончательный транскрипт будет позже (two_pass)
+    rtf: Optional[float] = None  # время распознавания / длительность аудио
+    error: Optional[str] = None
+    trace_id: Optional[int] = None  # трасса этапов в БД (app.tracing)
+    upload: Optional[Tuple[float, float, int]] = field(default=None, repr=False)  # (начало, конец, байт)
+    segment_count: int = 0  # индекс следующего сегмента (сегменты нумеруются с 0)
+    _ring: Deque[Dict[str, Any]] = field(default_factory=lambda: deque(maxlen=SEGMENT_RING), repr=False)
+    # (start, end) → сохранённые сегменты с индексом в [start, end) (задаёт JobManager)
+    _history: Optional[Callable[[int, int], List[Dict[str, Any]]]] = field(default=None, repr=False)
+    ticket: Optional[Ticket] = field(default=None, repr=False)
+    _cond: threading.Condition = field(default_factory=threading.Condition, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINAL_STATUSES
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "path": self.path,
+            "model_name": self.model_name,
+            "profile": self.profile,
+            "collection": self.collection,
+            "status": self.status,
+            "queue_position": self.ticket.position() if self.ticket and self.status == "queued" else 0,
+            "expected_start_in": (round(self.ticket.expected_start(), 1)
+                                  if self.ticket and self.status == "queued" else None),
+            "duration": self.duration,
+            "progress": round(self.progress, 3),
+            "progress_desc": self.progress_desc,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "file_id": self.file_id,
+            "transcript_id": self.transcript_id,
+            "word_count": self.word_count,
+            "quality_tier": self.quality_tier,
+            "rtf": self.rtf,
+            "segments": self.segment_count,
+            "error": self.error,
+            "trace_id": self.trace_id,
+        }
+
+    # ---- обновления (из рабочего потока) ----
+    def _update(self, **kw):
+        with self._cond:
+            for k, v in kw.items():
+                setattr(self, k, v)
+            if self.done:
+                self._ring.clear()  # дальше сегменты читаются из БД
+            self._cond.notify_all()
+
+    def _add_segment(self, seg: Dict[str, Any]):
+        with self._cond:
+            self._ring.append(seg)
+            self.segment_count = max(self.segment_count, seg["index"] + 1)
+            self._cond.notify_all()
+
+    # ---- чтение ----
+    def wait_segments(self, start: int, timeout: float = 15.0) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Сегменты с индексом от start (ждёт новые до timeout) → (сегменты по возрастанию index,
+        задача завершена). Индексы могут идти с пропусками — продолжать с последнего index + 1.
+        """
+        with self._cond:
+            if self.segment_count <= start and not self.done:
+                self._cond.wait(timeout)
+            done, end = self.done, self.segment_count
+            recent = [s for s in self._ring if s["index"] >= start]
+            first = self._ring[0]["index"] if self._ring else end
+        if start >= first or self._history is None:
+            return recent, done
+        # читатель отстал от кольца (или задача завершена) — из БД, без замка задачи
+        stored = self._history(start, first)
+        return (stored or recent), done
+
+
+class JobManager:
+    """Очередь задач транскрибации поверх TranscribeModule.transcribe_path"""
+
+    def __init__(self, studio, keep_finished: int = 1000):
+        self.studio = studio
+        self.keep_finished = keep_finished
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.coordinator = None
+        if get_config().cluster.enabled:
+            from app.coordinator import Coordinator
+            self.coordinator = Coordinator(studio)
+
+    def submit(self, path: str, model_name: Optional[str] = None,
+               collection: Optional[str] = None, session: Optional[str] = None,
+               upload: Optional[Tuple[float, float, int]] = None, profile: Optional[str] = None) -> Job:
+        """
+        Поставить задачу; QueueFull/SessionLimit — если полоса heavy (или очередь воркеров) переполнена.
+        upload — (time.time() начала, конца, байт) приёма файла: попадёт в трассу этапом upload.
+        """
+        info = self.studio.transcribe.probe(path)
+        duration = info.duration if info else None
+        if self.coordinator is not None:
+            self.coordinator.check_room()
+            ticket = None
+        else:
+            cost = self.studio.transcribe.expected_seconds(duration, profile, model_name)
+            ticket = get_lanes().heavy.enter(session=session, cost=cost)
+        job = Job(id=uuid.uuid4().hex[:12], path=str(path), model_name=model_name, profile=profile,
+                  duration=duration, collection=collection, ticket=ticket, upload=upload)
+        job._history = lambda start, end: self._stored_segments(job, start, end)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._gc()
+        if ticket is not None:
+            # этап decode — пока задача ждёт очереди, в том же порядке, что полоса
+            self.studio.transcribe.pipeline.prefetch(path, cost=ticket.cost)
+        # потоков не больше, чем мест в полосе (concurrency + max_queue)
+        threading.Thread(target=self._run, args=(job,), name=f"job-{job.id}", daemon=True).start()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+
+    def _stored_segments(self, job: Job, start: int, end: int) -> List[Dict[str, Any]]:
+        """Сегменты задачи из БД: транскрипт завершённой, иначе контрольная точка её прохода"""
+        db = self.studio.db
+        if job.file_id is not None:
+            tr = db.get_transcript_by_file_id(job.file_id)
+            if tr:
+                return db.get_segment_range(tr["id"], start, end, SEGMENT_PAGE)
+        fi = db.get_file_by_path(job.path)
+        if not fi:
+            return []
+        segs = db.get_checkpoint_range(fi["id"], self._checkpoint_model(job), start, end, SEGMENT_PAGE)
+        if not segs and fi["status"] == "completed":
+            # этап write уже перенёс контрольную точку в транскрипт, статус задачи ещё не обновлён
+            tr = db.get_transcript_by_file_id(fi["id"])
+            if tr:
+                segs = db.get_segment_range(tr["id"], start, end, SEGMENT_PAGE)
+        return segs
+
+    def _checkpoint_model(self, job: Job) -> str:
+        """Модель прохода задачи (ключ контрольной точки) — как её выбирают recognize и координатор"""
+        tcfg = self.studio.config.transcriber
+        if job.model_name:
+            return job.model_name
+        if (self.coordinator is None and tcfg.two_pass and tcfg.draft_model_name
+                and tcfg.draft_model_name != tcfg.model_name):
+            return tcfg.draft_model_name
+        return tcfg.model_name
+
+    def _gc(self):
+        finished = [j for j in self._jobs.values() if j.done]
+        if len(finished) > self.keep_finished:
+            finished.sort(key=lambda j: j.finished_at or 0)
+            for j in finished[:len(finished) - self.keep_finished]:
+                del self._jobs[j.id]
+
+    def _run(self, job: Job):
+        try:
+            self._execute(job)
+        finally:
+            # задача упала до этапа asr — подготовленный prefetch файл больше никто не заберёт
+            self.studio.transcribe.pipeline.discard(job.path)
+            if job.ticket is not None:
+                job.ticket.release()
+
+    @contextmanager
+    def _asr_slot(self, job: Job):
+        """Место задачи в полосе heavy — этап asr конвейера"""
+        with tracing.span("queue"):
+            job.ticket.wait()
+        job._update(status="running", started_at=time.time())
+        try:
+            yield
+        finally:
+            job.ticket.release()
+
+    def _execute(self, job: Job):
+        def progress(v, desc=""):
+            job._update(progress=float(v), progress_desc=desc)
+
+        def ingest(res):
+            if job.collection and not res["existing"]:
+                with tracing.span("ingest", collection=job.collection):
+                    status, _ = self.studio.refiner.ingest_transcript_by_id(
+                        res["file_id"], f"file://{Path(job.path).name}", job.collection)
+                log.info("JOB %s ingest → %s: %s", job.id, job.collection, status)
+
+        trace = None
+        try:
+            with tracing.trace("job", self.studio.db, job_id=job.id) as trace:
+                if trace is not None and job.upload:
+                    t0, t1, size = job.upload
+                    trace.add_span("upload", t0 - trace.started_at, t1 - t0, bytes=size)
+                if self.coordinator is not None:
+                    res = self.coordinator.run(job, progress)
+                    ingest(res)
+                else:
+                    res = self.studio.transcribe.pipeline.run(
+                        Path(job.path), self._asr_slot(job), model_name=job.model_name, progress=progress,
+                        segment_callback=job._add_segment, post=ingest, profile=job.profile)
+            job._update(status="completed", progress=1.0, finished_at=time.time(),
+                        file_id=res["file_id"], transcript_id=res["transcript_id"],
+                        word_count=res["word_count"], quality_tier=res["quality_tier"],
+                        rtf=res["meta"].get("rtf"), trace_id=trace.trace_id if trace else None)
+        except Exception as e:
+            log.exception("JOB %s failed", job.id)
+            job._update(status="failed", error=str(e), finished_at=time.time(),
+                        trace_id=trace.trace_id if trace else None)
@@ -0,0 +1,240 @@
+"""
+Полосы исполнения (lanes) и контроль допуска.
+
+heavy — транскрибация: маленький лимит параллельности, ограниченная очередь (переполнение → QueueFull),
+        лимит задач на сессию; UI, REST API и наблюдатель папок делят одну полосу.
+        Порядок очереди (lanes.heavy_policy): sjf — по оценке времени задачи (cost — длительность
+        медиа × RTF из истории) со старением: приоритет 1 + aging × ожидание / оценка (HRRN),
+        т.е. голосовая заметка проходит вперёд часовой записи, но и запись, прождав сопоставимо
+        своей оценке, обгоняет новые короткие; fifo — по времени постановки.
+fast  — поиск, списки файлов, статистика, RAG: отдельный пул Gradio, не ждёт транскрибацию.
+
+    ticket = get_lanes().heavy.enter(session="abc", cost=42.0)   # QueueFull, если мест нет
+    try:
+        while not ticket.wait(1.0):
+            print("позиция в очереди:", ticket.position(), "старт через", ticket.expected_start())
+        ...
+    finally:
+        ticket.release()
+"""
+from __future__ import annotations
+import heapq
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional, Set
+
+from app.config import get_config
+
+POLICIES = ("sjf", "fifo")
+MIN_COST = 1.0  # сек: оценка снизу (деление в приоритете, накладные расходы задачи)
+
+
+class QueueFull(Exception):
+    """Очередь полосы переполнена — запрос отклонён сразу, а не повешен в ожидание"""
+
+
+class SessionLimit(QueueFull):
+    """Превышен лимит одновременных тяжёлых задач для сессии"""
+
+
+class Ticket:
+    def __init__(self, lane: "Lane", session: Optional[str], cost: Optional[float] = None):
+        self.lane = lane
+        self.session = session
+        self.cost = cost  # ожидаемое время выполнения, сек (None — неизвестно)
+        self.running = False
+        self.released = False
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+
+    def position(self) -> int:
+        """1..N — место в очереди, 0 — уже выполняется"""
+        return self.lane._position(self)
+
+    def expected_start(self) -> float:
+        """Через сколько секунд задача ожидаемо начнётся по оценкам очереди (0 — уже выполняется)"""
+        return self.lane._expected_start(self)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Ждать допуска; True — можно выполнять"""
+        return self.lane._wait(self, timeout)
+
+    def release(self):
+        self.lane._release(self)
+
+    def __enter__(self):
+        self.wait()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class Lane:
+    def __init__(self, name: str, concurrency: int, max_queue: int, per_session: int = 0,
+                 policy: str = "fifo", aging: float = 1.0, unknown_cost: float = 600.0):
+        self.name = name
+        self.concurrency = max(1, int(concurrency))
+        self.max_queue = max(0, int(max_queue))
+        self.per_session = max(0, int(per_session))  # 0 — без ограничения
+        self.policy = policy if policy in POLICIES else "fifo"
+        self.aging = max(0.0, float(aging))
+        self.unknown_cost = max(MIN_COST, float(unknown_cost))
+        self._cond = threading.Condition()
+        self._queue: Deque[Ticket] = deque()
+        self._executing: Set[Ticket] = set()
+        self._by_session: Dict[str, int] = {}
+
+    # ---- admission ----
+    def enter(self, session: Optional[str] = None, wait_for_room: Optional[float] = 0,
+              cost: Optional[float] = None) -> Ticket:
+        """
+        Встать в очередь полосы.
+
+        cost: ожидаемое время выполнения, сек (порядок sjf); None — lanes.sjf_unknown_seconds.
+        wait_for_room: 0 — при переполнении сразу QueueFull (интерактивные запросы);
+                       None — ждать места сколько угодно (фоновые источники: наблюдатель папок).
+        """
+        with self._cond:
+            if session and self.per_session and self._by_session.get(session, 0) >= self.per_session:
+                raise SessionLimit(
+                    f"У вас уже {self._by_session[session]} задач(и) транскрибации "
+                    f"(лимит {self.per_session}). Дождитесь завершения.")
+            deadline = None if wait_for_room is None else time.monotonic() + wait_for_room
+            while self._is_full():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise QueueFull(
+                        f"Очередь «{self.name}» заполнена ({len(self._queue)}/{self.max_queue}). "
+                        "Попробуйте позже.")
+                self._cond.wait(remaining)
+            t = Ticket(self, session, cost)
+            self._queue.append(t)
+            if session:
+                self._by_session[session] = self._by_session.get(session, 0) + 1
+            self._promote()
+            return t
+
+    @contextmanager
+    def slot(self, session: Optional[str] = None, wait_for_room: Optional[float] = 0,
+             cost: Optional[float] = None):
+        """Блокирующий вариант: дождаться очереди и выполнить блок"""
+        t = self.enter(session, wait_for_room, cost)
+        try:
+            t.wait()
+            yield t
+        finally:
+            t.release()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"running": len(self._executing), "queued": len(self._queue),
+                    "concurrency": self.concurrency, "max_queue": self.max_queue, "policy": self.policy}
+
+    # ---- internals ----
+    def _is_full(self) -> bool:
+        return len(self._queue) >= self.max_queue and len(self._executing) >= self.concurrency
+
+    def _cost(self, t: Ticket) -> float:
+        return max(MIN_COST, t.cost if t.cost is not None else self.unknown_cost)
+
+    def _key(self, now: float):
+        """Ключ порядка допуска: больший приоритет (HRRN), при равенстве — короче, затем раньше"""
+        def key(t: Ticket):
+            cost = self._cost(t)
+            return -(1.0 + self.aging * (now - t.enqueued_at) / cost), cost, t.enqueued_at
+        return key
+
+    def _order(self) -> List[Ticket]:
+        """Очередь в порядке допуска на текущий момент"""
+        if self.policy == "fifo":
+            return list(self._queue)
+        return sorted(self._queue, key=self._key(time.monotonic()))
+
+    def _promote(self):
+        while self._queue and len(self._executing) < self.concurrency:
+            if self.policy == "fifo":
+                t = self._queue.popleft()
+            else:
+                t = min(self._queue, key=self._key(time.monotonic()))
+                self._queue.remove(t)
+            t.running = True
+            t.started_at = time.monotonic()
+            self._executing.add(t)
+        self._cond.notify_all()
+
+    def _position(self, t: Ticket) -> int:
+        with self._cond:
+            if t.running or t.released:
+                return 0
+            try:
+                return self._order().index(t) + 1
+            except ValueError:
+                return 0
+
+    def _expected_start(self, t: Ticket) -> float:
+        # моделируем слоты полосы: выполняющиеся освобождаются по остатку своей оценки,
+        # очередь занимает их в текущем порядке допуска
+        with self._cond:
+            if t.running or t.released:
+                return 0.0
+            now = time.monotonic()
+            slots = [max(0.0, self._cost(r) - (now - r.started_at)) for r in self._executing]
+            slots += [0.0] * (self.concurrency - len(slots))
+            heapq.heapify(slots)
+            for q in self._order():
+                start = heapq.heappop(slots)
+                if q is t:
+                    return start
+                heapq.heappush(slots, start + self._cost(q))
+            return 0.0
+
+    def _wait(self, t: Ticket, timeout: Optional[float]) -> bool:
+        with self._cond:
+            if not t.running:
+                self._cond.wait_for(lambda: t.running or t.released, timeout)
+            return t.running
+
+    def _release(self, t: Ticket):
+        with self._cond:
+            if t.released:
+                return
+            t.released = True
+            if t.running:
+                self._executing.discard(t)
+            else:
+                try:
+                    self._queue.remove(t)
+                except ValueError:
+                    pass
+            if t.session:
+                n = self._by_session.get(t.session, 0) - 1
+                if n > 0:
+                    self._by_session[t.session] = n
+                else:
+                    self._by_session.pop(t.session, None)
+            self._promote()
+
+
+class Lanes:
+    def __init__(self, config=None):
+        cfg = config or get_config().lanes
+        self.heavy = Lane("транскрибация", cfg.heavy_concurrency, cfg.heavy_max_queue, cfg.heavy_per_session,
+                          cfg.heavy_policy, cfg.sjf_aging, cfg.sjf_unknown_seconds)
+        # fast — параллельность задаётся в Gradio (concurrency_id="fast"), здесь только для статистики
+        self.fast_concurrency = max(1, int(cfg.fast_concurrency))
+
+
+_lanes: Optional[Lanes] = None
+_lanes_lock = threading.Lock()
+
+
+def get_lanes() -> Lanes:
+    """Глобальные полосы (синглтон, как get_config)"""
+    global _lanes
+    with _lanes_lock:
+        if _lanes is None:
+            _lanes = Lanes()
+        return _lanes
@@ -0,0 +1,214 @@
+"""
+Нагрузочный тест вызовов Refiner из студии (RefinerModule) с заданным QPS.
+
+Запросы планируются по открытой модели: i-й уходит в момент start + i/qps независимо от того,
+успели ли ответить предыдущие; задержка считается от запланированного момента (очередь в пуле
+клиента тоже входит в неё). Отчёт — p50/p95/p99, фактическая пропускная способность и ошибки
+по видам.
+
+    python -m app.loadtest --stub --qps 50 --duration 20 --mix rag=0.8,ingest=0.2
+    python -m app.loadtest --base-url http://refiner:8877 --qps 10 --concurrency 16 --timeout 5
+
+--stub поднимает в процессе app.refiner_stub (параметры задержки/ошибок — как у него).
+"""
+from __future__ import annotations
+import argparse
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.config import get_config
+
+log = logging.getLogger("whisper_rag_studio")
+
+QUESTIONS = ["о чём была лекция", "бюджет проекта на следующий год", "как настроить модель",
+             "что сказали про сроки", "итоги встречи"]
+_STATUS = re.compile(r"Refiner вернул (\d{3})")
+
+
+class _Ctx:
+    """Минимальный контекст для RefinerModule: без БД — только конфиг и HTTP-заголовки"""
+
+    def __init__(self, config):
+        self.config = config
+
+    def headers_refiner(self) -> Dict[str, str]:
+        from app.studio.common import StudioContext
+        return StudioContext.headers_refiner(self)
+
+    @staticmethod
+    def join_url(base, path):
+        from app.studio.common import StudioContext
+        return StudioContext.join_url(base, path)
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = math.ceil(p / 100.0 * len(sorted_values)) - 1  # nearest-rank
+    return sorted_values[min(len(sorted_values) - 1, max(0, k))]
+
+
+def _classify(status: str) -> str:
+    """Строка статуса RefinerModule → ok / http_<код> / error"""
+    if status.startswith("✅"):
+        return "ok"
+    m = _STATUS.search(status)
+    return f"http_{m.group(1)}" if m else "error"
+
+
+def make_operations(refiner, collection: str, rng: random.Random) -> Dict[str, Callable[[], str]]:
+    """Операции нагрузки: каждая возвращает строку статуса, как в UI"""
+
+    def rag():
+        status, _ = refiner.rag_query(rng.choice(QUESTIONS), 8, 0, collection, "")
+        return status
+
+    def ingest():
+        n = rng.randint(1, 8)
+        items = [{"text": " ".join(rng.choice(QUESTIONS) for _ in range(20)),
+                  "source_id": f"loadtest://{rng.getrandbits(48):x}"} for _ in range(n)]
+        refiner._send_items(collection, items)  # тот же путь, что дельта-ingest (пачка или по одному)
+        return "✅"
+
+    return {"rag": rag, "ingest": ingest}
+
+
+def parse_mix(text: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in (text or "").split(","):
+        name, _, w = part.partition("=")
+        if name.strip():
+            mix.append((name.strip(), float(w or 1)))
+    return mix
+
+
+def run(refiner, qps: float, duration: float, concurrency: int, mix: List[Tuple[str, float]],
+        collection: str, seed: Optional[int] = None) -> Dict:
+    rng = random.Random(seed)
+    ops = make_operations(refiner, collection, rng)
+    unknown = [n for n, _ in mix if n not in ops]
+    if unknown:
+        raise SystemExit(f"❌ Неизвестные операции: {', '.join(unknown)} (есть: {', '.join(ops)})")
+    names, weights = [n for n, _ in mix], [w for _, w in mix]
+    lock = threading.Lock()
+    samples: List[Tuple[str, str, float, float]] = []  # (операция, исход, задержка, время обслуживания)
+
+    def call(name: str, scheduled: float):
+        started = time.perf_counter()
+        try:
+            outcome = _classify(ops[name]())
+        except Exception as e:  # таймауты и обрывы соединения requests поднимает исключениями
+            outcome = type(e).__name__
+            if outcome == "RefinerError":
+                outcome = f"http_{e.status}"
+        done = time.perf_counter()
+        with lock:
+            samples.append((name, outcome, done - scheduled, done - started))
+
+    total = int(qps * duration)
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="loadtest")
+    t0 = time.perf_counter()
+    for i in range(total):
+        scheduled = t0 + i / qps
+        wait = scheduled - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        pool.submit(call, rng.choices(names, weights)[0], scheduled)
+    pool.shutdown(wait=True)
+    wall = time.perf_counter() - t0
+    return summarize(samples, wall, qps)
+
+
+def summarize(samples, wall: float, target_qps: float) -> Dict:
+    def stats(rows):
+        lat = sorted(r[2] for r in rows)
+        svc = sorted(r[3] for r in rows)
+        ok = sum(1 for r in rows if r[1] == "ok")
+        return {
+            "requests": len(rows),
+            "ok": ok,
+            "throughput": round(ok / wall, 2) if wall else 0.0,
+            "p50_ms": round(_percentile(lat, 50) * 1000, 1),
+            "p95_ms": round(_percentile(lat, 95) * 1000, 1),
+            "p99_ms": round(_percentile(lat, 99) * 1000, 1),
+            "max_ms": round((lat[-1] if lat else 0.0) * 1000, 1),
+            "service_p50_ms": round(_percentile(svc, 50) * 1000, 1),
+            "errors": dict(Counter(r[1] for r in rows if r[1] != "ok")),
+        }
+
+    report = {"target_qps": target_qps, "wall_seconds": round(wall, 2), "total": stats(samples),
+              "by_operation": {}}
+    for name in sorted({r[0] for r in samples}):
+        report["by_operation"][name] = stats([r for r in samples if r[0] == name])
+    return report
+
+
+def report_text(report: Dict) -> str:
+    lines = [f"🎯 Цель {report['target_qps']} QPS, прошло {report['wall_seconds']} с"]
+    rows = [("всего", report["total"])] + list(report["by_operation"].items())
+    lines.append(f"{'':<8} {'запросов':>8} {'ok/с':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  ошибки")
+    for name, s in rows:
+        errors = ", ".join(f"{k}×{v}" for k, v in sorted(s["errors"].items())) or "-"
+        lines.append(f"{name:<8} {s['requests']:>8} {s['throughput']:>8} {s['p50_ms']:>8} {s['p95_ms']:>8} "
+                     f"{s['p99_ms']:>8} {s['max_ms']:>8}  {errors}")
+    return "\n".join(lines)
+
+
+def main():
+    from dataclasses import replace
+    from app import refiner_stub
+    from app.studio.refiner import RefinerModule
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Нагрузочный тест вызовов Refiner")
+    parser.add_argument("--qps", type=float, default=10.0)
+    parser.add_argument("--duration", type=float, default=10.0, help="сек")
+    parser.add_argument("--concurrency", type=int, default=16, help="потоков клиента")
+    parser.add_argument("--mix", default="rag=0.8,ingest=0.2")
+    parser.add_argument("--collection", default="loadtest")
+    parser.add_argument("--base-url", default=None, help="по умолчанию nooforge.base_url")
+    parser.add_argument("--timeout", type=float, default=None, help="nooforge.request_timeout")
+    parser.add_argument("--pool-size", type=int, default=None, help="nooforge.pool_size")
+    parser.add_argument("--stub", action="store_true", help="поднять app.refiner_stub в этом процессе")
+    parser.add_argument("--json", dest="json_out", default=None, help="сохранить отчёт в JSON")
+    parser.add_argument("--verbose", action="store_true", help="логи RefinerModule (каждая ошибка — строка)")
+    refiner_stub.add_options_args(parser)
+    args = parser.parse_args()
+    if not args.verbose:  # ошибки считаются в отчёте, построчный лог только мешает
+        log.setLevel(logging.CRITICAL)
+
+    cfg = get_config()
+    nf = cfg.nooforge
+    nf = replace(nf, base_url=args.base_url or nf.base_url,
+                 request_timeout=args.timeout or nf.request_timeout,
+                 pool_size=args.pool_size or nf.pool_size)
+    server = None
+    if args.stub:
+        server = refiner_stub.serve(refiner_stub.RefinerStub(refiner_stub.options_from_args(args)), port=0)
+        nf = replace(nf, base_url="http://%s:%d" % server.server_address[:2])
+    config = replace(cfg, nooforge=nf)
+    refiner = RefinerModule(_Ctx(config))
+    print(f"🚀 {nf.base_url}: {args.qps} QPS × {args.duration} с, потоков {args.concurrency}, "
+          f"пул {nf.pool_size}, таймаут {nf.request_timeout} с, смесь {args.mix}")
+    try:
+        report = run(refiner, args.qps, args.duration, args.concurrency, parse_mix(args.mix),
+                     args.collection, args.seed)
+    finally:
+        if server is not None:
+            server.shutdown()
+    print(report_text(report))
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,43 +3,43 @@
 Whisper RAG Studio — точка входа
 Запуск Gradio UI + проверка CUDA + аккуратное завершение.
 """
+import argparse
 import os
 import signal
 import sys
-import gradio as gr
+import threading
+import time
 
 from app.config import get_config, update_config
+from app.device import probe_device
 from app.studio import WhisperRAGStudio
-from app.ui.tabs import build_interface
+from app.watcher import FolderWatcher
 
 
 def check_cuda_availability():
-    """Лёгкая проверка CUDA/cuDNN. Возвращает 'cuda' или 'cpu'."""
-    try:
-        import torch
-    except Exception:
-        print("⚠️ torch не найден, работаем на CPU")
-        return "cpu"
+    """Лёгкая проверка CUDA (без torch и CUDA-контекста, с кэшем). Возвращает 'cuda' или 'cpu'."""
+    device = probe_device()
+    if device == "cuda":
+        print("✅ CUDA доступна")
+    else:
+        print("ℹ️ CUDA не доступна → CPU")
+    return device
 
-    print("\n" + "=" * 60)
-    print("🔍 Проверка системы...")
-    print("=" * 60)
 
-    if not torch.cuda.is_available():
-        print("ℹ️ CUDA не доступна → CPU")
-        return "cpu"
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Whisper RAG Studio")
+    parser.add_argument("--import-report", action="store_true",
+                        help="показать время импорта модулей (-X importtime) и выйти")
+    args = parser.parse_args(argv)
 
-    print("✅ CUDA доступна")
-    try:
-        _ = torch.zeros(1).cuda()
-        print(f"✅ GPU ок: {torch.cuda.get_device_name(0)}")
-    except Exception as e:
-        print(f"⚠️ Ошибка инициализации GPU: {e}")
-        return "cpu"
-    return "cuda"
+    if args.import_report:
+        from app.diagnostics import import_time_report
+        print(import_time_report("app.main"))
+        print(import_time_report("app.ui.tabs", top=10))
+        return
 
+    t0 = time.perf_counter()
 
-def main():
     # Отключаем прокси для localhost
     os.environ['NO_PROXY'] = 'localhost,127.0.0.1'
     os.environ['no_proxy'] = 'localhost,127.0.0.1'
@@ -48,17 +48,59 @@ def main():
     recommended = check_cuda_availability()
     cfg = get_config()
     if cfg.transcriber.device == "cuda" and recommended == "cpu":
-        print("⚙️ Переключаю устройство в конфиге: cuda → cpu")
+        print("⚙️ Переключаю устройство в конфиге: cuda → cpu "
+              f"({cfg.transcriber.cpu_compute_type}; подбор параметров — python -m app.autotune)")
         update_config(**{'transcriber.device': 'cpu'})
 
+    # gradio — только для UI (воркеры/CLI его не импортируют)
+    from app.ui.tabs import build_interface
+
     studio = WhisperRAGStudio()
-    demo: gr.Blocks = build_interface(studio)
+    demo = build_interface(studio)
+
+    # REST API (FastAPI/uvicorn в фоновом потоке)
+    if cfg.api.enable_api:
+        try:
+            from app.api import start_api_server
+            start_api_server(studio)
+        except ImportError as e:
+            print(f"⚠️ REST API не запущен (нет зависимостей: {e})")
+
+    # Перенос старых .txt-транскриптов в упакованное хранилище (в фоне, UI не ждёт)
+    if cfg.database.migrate_txt_on_start:
+        threading.Thread(target=lambda: studio.ctx.store.migrate_txt(),
+                         name="migrate-txt", daemon=True).start()
+
+    # Транскрибации, прерванные остановкой/сбоем, — с последней контрольной точки
+    threading.Thread(target=lambda: studio.transcribe.resume_interrupted(),
+                     name="resume-interrupted", daemon=True).start()
+
+    # Нарезка на чанки: недособранная версия или параметры сменились, пока UI был выключен
+    threading.Thread(target=lambda: studio.ctx.rechunk.resume(),
+                     name="rechunk-resume", daemon=True).start()
+
+    # Черновики (two_pass), не уточнённые до прошлой остановки
+    if cfg.transcriber.two_pass:
+        threading.Thread(target=lambda: studio.transcribe.resume_refines(),
+                         name="resume-refines", daemon=True).start()
+
+    # Обслуживание БД: слияние FTS, PRAGMA optimize, vacuum, проверки (по расписанию и при простое)
+    if cfg.maintenance.enabled:
+        studio.ctx.maintenance.start()
+
+    # Наблюдение за папками (./files и др. из config.watcher)
+    watcher = None
+    if cfg.watcher.enabled:
+        watcher = FolderWatcher(studio)
+        watcher.start()
 
     # Ctrl+C → корректное закрытие БД
     def _sigint(_sig, _frm):
         print("\n🛑 Остановка... Закрываю БД")
         try:
-            studio.db.close()
+            if watcher:
+                watcher.stop()
+            studio.ctx.close()
         finally:
             sys.exit(0)
 
@@ -70,6 +112,7 @@ def main():
     print(f"🖥️ Устройство: {studio.config.transcriber.device.upper()}")
     print(f"🎤 Модель: {studio.config.transcriber.model_name}")
     print(f"🔇 VAD: {'✓' if studio.config.transcriber.use_vad else '✗'}")
+    print(f"⏱️ Подготовка UI: {time.perf_counter() - t0:.2f} сек (модель загрузится при первом использовании)")
     print("=" * 60)
 
     demo.launch(
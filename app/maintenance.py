@@ -0,0 +1,195 @@
+"""
+Фоновое обслуживание БД.
+
+FTS-индексы (transcripts_fts, chunks_fts) синхронизируются триггерами, но каждая транзакция
+с новыми чанками добавляет в индекс свой маленький сегмент — со временем их много, и каждый
+MATCH обходит их все. Раз в maintenance.interval_minutes:
+
+    merge     шаги FTS5 'merge' по maintenance.merge_pages страниц — каждый отдельной короткой
+              транзакцией, поиск и запись между шагами не ждут
+    optimize  полный optimize индекса (один сегмент) — только когда транскрибация простаивает
+              maintenance.idle_seconds; при простое и сегментах больше maintenance.optimize_segments
+              запускается и раньше срока
+    check     при простое: FTS5 integrity-check со сверкой с таблицами (расхождение → rebuild)
+              и PRAGMA quick_check
+    analyze   PRAGMA optimize (статистика планировщика)
+    vacuum    PRAGMA incremental_vacuum(maintenance.vacuum_pages), если база в режиме INCREMENTAL
+
+Отчёт — размер индексов, сегменты до/после, свободные страницы файла БД.
+
+    python -m app.maintenance                              # прогон с проверками, отчёт
+    python -m app.maintenance --optimize                   # + полный optimize FTS
+    python -m app.maintenance --enable-incremental-vacuum  # перевести старую базу (полный VACUUM)
+"""
+from __future__ import annotations
+import argparse
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from app.config import get_config
+from app.database import FTS_TABLES
+
+log = logging.getLogger("whisper_rag_studio")
+
+MAX_MERGE_STEPS = 1000  # шагов merge за прогон (остаток — в следующий)
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+class DbMaintenance:
+    """Плановое и «при простое» обслуживание БД (см. модуль)"""
+
+    def __init__(self, db, is_idle: Optional[Callable[[], bool]] = None, config=None):
+        self.db = db
+        self.cfg = config or get_config().maintenance
+        self.is_idle = is_idle or (lambda: True)
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._last_run = time.monotonic()  # первый плановый прогон — через interval после старта
+        self._busy_at = time.monotonic()
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- фоновый поток ----
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="db-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(max(1.0, float(self.cfg.check_seconds))):
+            try:
+                self.tick()
+            except Exception:
+                log.exception("MAINTENANCE failed")
+
+    def idle_for(self) -> float:
+        """Сколько секунд подряд транскрибация простаивает (по наблюдениям tick)"""
+        now = time.monotonic()
+        if not self.is_idle():
+            self._busy_at = now
+        return now - self._busy_at
+
+    def tick(self) -> Optional[Dict[str, Any]]:
+        """Проверка условий → отчёт, если прогон был"""
+        idle = self.idle_for() >= self.cfg.idle_seconds
+        if time.monotonic() - self._last_run >= self.cfg.interval_minutes * 60:
+            return self.run(optimize=idle, check=idle and self.cfg.integrity_check)
+        if idle and self._fragmented():
+            return self.run(optimize=True, check=False)
+        return None
+
+    def _fragmented(self) -> bool:
+        return any(self.db.fts_structure(fts)[1] > self.cfg.optimize_segments for fts in FTS_TABLES)
+
+    # ---- прогон ----
+    def run(self, optimize: bool = False, check: bool = False) -> Dict[str, Any]:
+        """Один прогон обслуживания → отчёт (тот же — в last_report)"""
+        with self._run_lock:
+            t0 = time.perf_counter()
+            report: Dict[str, Any] = {"started_at": time.time(), "optimize": optimize, "check": check,
+                                      "fts": {}}
+            for fts in FTS_TABLES:
+                report["fts"][fts] = self._fts(fts, optimize, check)
+            self.db.pragma_optimize()
+            storage = self.db.storage_stats()
+            vacuumed = 0
+            if storage["auto_vacuum"] == AUTO_VACUUM_INCREMENTAL and storage["freelist_count"]:
+                vacuumed = self.db.incremental_vacuum(self.cfg.vacuum_pages)
+                storage = self.db.storage_stats()
+            report["db"] = {"bytes": storage["bytes"], "page_size": storage["page_size"],
+                            "pages": storage["page_count"], "free_pages": storage["freelist_count"],
+                            "incremental_vacuum": storage["auto_vacuum"] == AUTO_VACUUM_INCREMENTAL,
+                            "vacuumed_pages": vacuumed}
+            if check:
+                report["quick_check"] = self.db.quick_check() or "ok"
+            report["duration"] = round(time.perf_counter() - t0, 3)
+            self.last_report = report
+            self._last_run = time.monotonic()
+        log.info("MAINTENANCE за %.2f с: %s", report["duration"], ", ".join(
+            f"{fts} {e['segments_before']}→{e['segments']} сегм." for fts, e in report["fts"].items()))
+        return report
+
+    def _fts(self, fts: str, optimize: bool, check: bool) -> Dict[str, Any]:
+        before = self.db.fts_index_stats(fts)
+        entry: Dict[str, Any] = {"segments_before": before["segments"], "bytes_before": before["bytes"],
+                                 "merge_steps": 0, "optimized": False}
+        if check:
+            error = self.db.fts_integrity_check(fts)
+            entry["integrity"] = error or "ok"
+            if error:
+                log.warning("MAINTENANCE %s: индекс расходится с таблицей (%s) — rebuild", fts, error)
+                self.db.fts_rebuild(fts)
+                entry["rebuilt"] = True
+        if optimize and before["segments"] > 1:
+            self.db.fts_optimize(fts)
+            entry["optimized"] = True
+        else:
+            while entry["merge_steps"] < MAX_MERGE_STEPS and self.db.fts_merge(fts, self.cfg.merge_pages):
+                entry["merge_steps"] += 1
+        after = self.db.fts_index_stats(fts)
+        entry.update(segments=after["segments"], levels=after["levels"], bytes=after["bytes"],
+                     blocks=after["blocks"])
+        return entry
+
+    # ---- отчёт ----
+    def status_md(self) -> str:
+        r = self.last_report
+        if r is None:
+            return "🧹 Обслуживание БД ещё не запускалось"
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(r["started_at"]))
+        lines = [f"🧹 **Обслуживание БД** — {when}, {r['duration']} с", "",
+                 "| Индекс | Сегментов (было → стало) | Уровней | Размер, МБ | Проверка |",
+                 "|---|---|---|---|---|"]
+        for fts, e in r["fts"].items():
+            check = e.get("integrity", "—") + (" → rebuild" if e.get("rebuilt") else "")
+            lines.append(f"| {fts} | {e['segments_before']} → {e['segments']} | {e['levels']} | "
+                         f"{e['bytes'] / 1024 / 1024:.2f} | {check} |")
+        db = r["db"]
+        lines.append("")
+        lines.append(f"- Файл БД: {db['bytes'] / 1024 / 1024:.1f} МБ, свободных страниц {db['free_pages']} "
+                     f"(возвращено {db['vacuumed_pages']})"
+                     + ("" if db["incremental_vacuum"] else " — incremental vacuum выключен"))
+        if "quick_check" in r:
+            qc = r["quick_check"]
+            lines.append(f"- quick_check: {qc if isinstance(qc, str) else '; '.join(qc[:5])}")
+        return "\n".join(lines)
+
+
+def main():
+    from app.database import Database
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Обслуживание БД: FTS, статистика, vacuum, проверки")
+    parser.add_argument("--optimize", action="store_true", help="полный optimize FTS-индексов")
+    parser.add_argument("--no-check", action="store_true", help="без integrity-check и quick_check")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="перевести базу на auto_vacuum=INCREMENTAL (полный VACUUM)")
+    parser.add_argument("--json", dest="json_out", default=None, help="сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    get_config().ensure_dirs()
+    db = Database()
+    try:
+        if args.enable_incremental_vacuum:
+            print("🔄 VACUUM…")
+            db.enable_incremental_vacuum()
+        m = DbMaintenance(db)
+        report = m.run(optimize=args.optimize, check=not args.no_check)
+        print(m.status_md())
+        if args.json_out:
+            with open(args.json_out, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Утилиты для медиафайлов: хэш содержимого, определение формата по сигнатуре,
+декодирование в PCM и т.п.
+
+WAV с PCM/float/G.711 читается без ffmpeg: 16 кГц моно открывается через memmap,
+остальное сводится в моно и пересэмплируется средствами NumPy.
+"""
+import hashlib
+import json
+import struct
+import subprocess
+from pathlib import Path
+from typing import NamedTuple, Optional, Union
+
+HASH_BLOCK = 1024 * 1024  # читаем по 1 МБ
+SAMPLE_RATE = 16000  # Whisper работает с 16 кГц моно
+PROBE_TIMEOUT = 30  # сек на ffprobe
+
+
+def content_hash(path: Union[str, Path]) -> str:
+    """SHA-256 содержимого файла (потоково, без загрузки в память)"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def sniff_format(path: Union[str, Path]) -> Optional[str]:
+    """
+    Контейнер по сигнатуре (magic bytes), а не по расширению:
+    wav, avi, flac, ogg, mp3, m4a, mp4, matroska, asf, flv; None — не распознан
+    """
+    with open(path, "rb") as f:
+        head = f.read(16)
+    if head[:4] in (b"RIFF", b"RF64") and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return "avi"
+    if head[:4] == b"fLaC":
+        return "flac"
+    if head[:4] == b"OggS":
+        return "ogg"
+    if head[:3] == b"ID3" or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "mp3"
+    if head[4:8] == b"ftyp":
+        return "m4a" if head[8:12] in (b"M4A ", b"M4B ") else "mp4"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return "matroska"  # mkv / webm
+    if head[:4] == b"\x30\x26\xb2\x75":
+        return "asf"  # wmv / wma
+    if head[:3] == b"FLV":
+        return "flv"
+    return None
+
+
+VIDEO_CONTAINERS = ("avi", "mp4", "matroska", "asf", "flv")
+
+
+def may_contain_video(path: Union[str, Path]) -> bool:
+    """Контейнер, из которого аудио нужно извлекать (по сигнатуре; не распознан — по расширению)"""
+    fmt = sniff_format(path)
+    if fmt is not None:
+        return fmt in VIDEO_CONTAINERS
+    return Path(path).suffix.lower() in (".mp4", ".avi", ".mkv", ".mov", ".wmv", ".flv", ".webm")
+
+
+class WavInfo(NamedTuple):
+    format_tag: int  # 1 — PCM, 3 — float, 6 — A-law, 7 — μ-law
+    channels: int
+    sample_rate: int
+    bits: int
+    data_offset: int
+    frames: int
+
+    @property
+    def native(self) -> bool:
+        """Уже то, что ест модель: 16 кГц моно (int16 или float32)"""
+        return (self.channels == 1 and self.sample_rate == SAMPLE_RATE
+                and (self.format_tag, self.bits) in ((1, 16), (3, 32)))
+
+
+_WAV_FORMATS = {(1, 8), (1, 16), (1, 24), (1, 32), (3, 32), (3, 64), (6, 8), (7, 8)}
+_EXTENSIBLE = 0xFFFE
+
+
+def read_wav_info(path: Union[str, Path]) -> Optional[WavInfo]:
+    """Заголовок WAV (RIFF/RF64, в т.ч. WAVE_FORMAT_EXTENSIBLE); None — не WAV или формат не поддержан"""
+    file_size = Path(path).stat().st_size
+    with open(path, "rb") as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] not in (b"RIFF", b"RF64") or riff[8:12] != b"WAVE":
+            return None
+        fmt, ds64_data = None, None
+        while True:
+            hdr = f.read(8)
+            if len(hdr) < 8:
+                return None
+            cid, size = hdr[:4], struct.unpack("<I", hdr[4:])[0]
+            if cid == b"ds64":
+                body = f.read(size)
+                ds64_data = struct.unpack("<Q", body[8:16])[0]
+            elif cid == b"fmt ":
+                body = f.read(size)
+                tag, ch, rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+                if tag == _EXTENSIBLE and len(body) >= 26:
+                    tag = struct.unpack("<H", body[24:26])[0]  # первые байты GUID подформата
+                fmt = (tag, ch, rate, bits)
+            elif cid == b"data":
+                if fmt is None:
+                    return None
+                tag, ch, rate, bits = fmt
+                if (tag, bits) not in _WAV_FORMATS or ch < 1 or rate < 1:
+                    return None
+                offset = f.tell()
+                if ds64_data is not None and size == 0xFFFFFFFF:
+                    size = ds64_data
+                # писатели «на лету» оставляют размер 0 / 0xFFFFFFFF — берём до конца файла
+                size = min(size or file_size, file_size - offset)
+                return WavInfo(tag, ch, rate, bits, offset, size // (ch * bits // 8))
+            else:
+                f.seek(size, 1)
+            if size % 2:
+                f.seek(1, 1)  # чанки выровнены по 2 байта
+
+
+class MediaInfo(NamedTuple):
+    duration: Optional[float]  # сек; None — контейнер не сообщает
+    codec: Optional[str]  # аудиокодек в терминах ffmpeg (pcm_s16le, mp3, aac, opus…)
+    channels: Optional[int]
+
+
+_WAV_CODECS = {(1, 8): "pcm_u8", (1, 16): "pcm_s16le", (1, 24): "pcm_s24le", (1, 32): "pcm_s32le",
+               (3, 32): "pcm_f32le", (3, 64): "pcm_f64le", (6, 8): "pcm_alaw", (7, 8): "pcm_mulaw"}
+
+
+def _float(value) -> Optional[float]:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def probe_media(path: Union[str, Path]) -> Optional[MediaInfo]:
+    """
+    Длительность, кодек и каналы первой аудиодорожки: WAV — по заголовку, остальное — ffprobe
+    (без декодирования). None — не удалось (нет ffprobe, битый файл, нет аудио).
+    """
+    wav = read_wav_info(path)
+    if wav is not None:
+        return MediaInfo(wav.frames / wav.sample_rate, _WAV_CODECS.get((wav.format_tag, wav.bits)), wav.channels)
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries",
+           "format=duration:stream=codec_name,channels,duration", "-of", "json", str(path)]
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=PROBE_TIMEOUT)
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+    try:
+        data = json.loads(result.stdout or b"{}")
+    except ValueError:
+        return None
+    streams = data.get("streams") or []
+    if not streams:
+        return None
+    stream = streams[0]
+    duration = _float((data.get("format") or {}).get("duration")) or _float(stream.get("duration"))
+    return MediaInfo(duration, stream.get("codec_name"), stream.get("channels"))
+
+
+def _g711_table(format_tag: int):
+    """Таблица 256 значений G.711 (A-law / μ-law) → float32 [-1, 1]"""
+    import numpy as np
+
+    u = ~np.arange(256, dtype=np.uint8)
+    if format_tag == 7:  # μ-law
+        exp = (u >> 4) & 0x07
+        mag = (((u & 0x0F).astype(np.int32) << 3) + 0x84) << exp
+        val = mag - 0x84
+        return (np.where(u & 0x80, -val, val) / 32768.0).astype(np.float32)
+    a = np.arange(256, dtype=np.uint8) ^ 0x55  # A-law
+    exp = (a >> 4) & 0x07
+    mant = (a & 0x0F).astype(np.int32)
+    val = np.where(exp == 0, (mant << 4) + 8, ((mant << 4) + 0x108) << np.maximum(exp.astype(np.int32) - 1, 0))
+    return (np.where(a & 0x80, val, -val) / 32768.0).astype(np.float32)
+
+
+def resample(audio, src_rate: int, dst_rate: int = SAMPLE_RATE):
+    """Пересэмплирование float32 моно: при понижении — ФНЧ (windowed-sinc), затем линейная интерполяция"""
+    import numpy as np
+
+    if src_rate == dst_rate or len(audio) == 0:
+        return audio
+    if dst_rate < src_rate:
+        cutoff = 0.5 * dst_rate / src_rate  # доля частоты дискретизации исходника
+        n = np.arange(-32, 33)
+        taps = (2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(len(n))).astype(np.float32)
+        audio = np.convolve(audio, taps / taps.sum(), mode="same")
+    n_out = int(round(len(audio) * dst_rate / src_rate))
+    positions = np.arange(n_out, dtype=np.float64) * (src_rate / dst_rate)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+
+def load_wav(path: Union[str, Path], offset: float = 0.0, info: Optional[WavInfo] = None):
+    """
+    WAV → np.float32 [-1, 1], 16 кГц моно начиная с offset сек, без ffmpeg; None — не поддержан.
+    float32 16 кГц моно отдаётся как memmap без копирования, int16 — одна конвертация из memmap.
+    """
+    import numpy as np
+
+    info = info or read_wav_info(path)
+    if info is None:
+        return None
+    dtype = {(1, 8): np.uint8, (1, 16): np.int16, (1, 32): np.int32, (3, 32): np.float32,
+             (3, 64): np.float64, (6, 8): np.uint8, (7, 8): np.uint8}.get((info.format_tag, info.bits))
+    start = min(int(max(0.0, offset) * info.sample_rate), info.frames)
+    width = info.bits // 8 * info.channels
+    if info.frames - start == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    if dtype is None:  # 24-bit PCM: три байта → int32 со знаком
+        raw = np.memmap(path, dtype=np.uint8, mode="r", offset=info.data_offset + start * width,
+                        shape=((info.frames - start) * info.channels, 3))
+        x = (raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8)
+             | (raw[:, 2].astype(np.int32) << 16))
+        frames = ((x << 8) >> 8).astype(np.float32) * np.float32(1.0 / 8388608.0)
+    else:
+        frames = np.memmap(path, dtype=dtype, mode="r", offset=info.data_offset + start * width,
+                           shape=((info.frames - start) * info.channels,))
+        if info.format_tag == 3:
+            if info.native:
+                return frames  # уже float32 16 кГц моно — без копии
+            frames = frames.astype(np.float32, copy=False)
+        elif info.format_tag in (6, 7):
+            frames = _g711_table(info.format_tag)[frames]
+        elif info.bits == 8:
+            frames = np.subtract(frames, np.float32(128.0), dtype=np.float32) * np.float32(1.0 / 128.0)
+        else:
+            scale = np.float32(1.0 / (1 << (info.bits - 1)))
+            frames = np.multiply(frames, scale, dtype=np.float32)
+
+    if info.channels > 1:
+        frames = frames.reshape(-1, info.channels).mean(axis=1, dtype=np.float32)
+    return resample(frames, info.sample_rate)
+
+
+def decode_pcm16(path: Union[str, Path], sampling_rate: int = SAMPLE_RATE) -> bytes:
+    """Аудио/видео → сырой PCM s16le моно через ffmpeg (pipe, без временных файлов)"""
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", str(path), "-vn",
+        "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(sampling_rate), "-",
+    ]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg: {result.stderr.decode(errors='ignore')[-500:]}")
+    return result.stdout
+
+
+def decode_audio(path: Union[str, Path], sampling_rate: int = SAMPLE_RATE):
+    """Аудио/видео → np.float32 [-1, 1], 16 кГц моно (WAV — напрямую, прочее — ffmpeg, без ffmpeg — PyAV)"""
+    import numpy as np
+
+    if sampling_rate == SAMPLE_RATE:
+        audio = load_wav(path)
+        if audio is not None:
+            return audio
+    try:
+        raw = decode_pcm16(path, sampling_rate)
+    except FileNotFoundError:
+        from faster_whisper.audio import decode_audio as fw_decode_audio
+        return fw_decode_audio(str(path), sampling_rate=sampling_rate)
+    return np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+if __name__ == "__main__":
+    import sys
+
+    for p in sys.argv[1:]:
+        print(content_hash(p), p)
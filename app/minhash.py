@@ -0,0 +1,173 @@
+"""
+Поиск почти-дубликатов чанков: MinHash + LSH.
+
+Повторные эфиры и перезаливки одних и тех же лекций дают почти одинаковые чанки — они раздувают
+базу и коллекцию Refiner и забивают top-k поиска. На каждый чанк считается MinHash-сигнатура
+(128 × uint32 по словным 3-граммам, векторно в NumPy, в БД — BLOB 512 байт), она раскладывается
+на 16 полос по 8 значений — ключи полос лежат в индексе chunk_lsh. Кандидаты — чанки с хотя бы
+одной общей полосой, сходство (оценка Жаккара) — доля совпавших значений сигнатуры.
+
+Режим (chunker.dedupe): off — не искать; flag — чанк сохраняется с пометкой duplicate_of
+(в поиск не попадает); skip — не сохраняется вовсе.
+
+    python -m app.minhash report     # отчёт по корпусу
+    python -m app.minhash backfill   # сигнатуры для чанков, сохранённых до включения
+"""
+from __future__ import annotations
+import logging
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger("whisper_rag_studio")
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS  # порог срабатывания LSH ≈ (1/16)^(1/8) ≈ 0.71
+SHINGLE = 3
+_MERSENNE = (1 << 61) - 1
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+_perm = None
+
+
+def _permutations():
+    """Коэффициенты (a, b) универсального хэширования — фиксированные, сигнатуры сравнимы между запусками"""
+    global _perm
+    if _perm is None:
+        import numpy as np
+        rng = np.random.RandomState(1)
+        a = rng.randint(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+        b = rng.randint(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+        _perm = (a[:, None], b[:, None])
+    return _perm
+
+
+def _shingles(text: str):
+    """Хэши словных 3-грамм (uint64 < 2^32); короткий текст — хэши отдельных слов"""
+    import numpy as np
+
+    words = _WORD.findall(text.lower())
+    if not words:
+        return np.zeros(1, dtype=np.uint64)
+    t = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+    if len(t) < SHINGLE:
+        return t
+    with np.errstate(over="ignore"):
+        h = t[:-2] * np.uint64(0x9E3779B1) ^ t[1:-1] * np.uint64(0x85EBCA77) ^ t[2:]
+    return np.unique(h & np.uint64(0xFFFFFFFF))
+
+
+def signature(text: str):
+    """MinHash-сигнатура текста: np.uint32[NUM_PERM]"""
+    import numpy as np
+
+    a, b = _permutations()
+    x = _shingles(text)[None, :]
+    with np.errstate(over="ignore"):
+        h = (a * x + b) % np.uint64(_MERSENNE)
+    return (h & np.uint64(0xFFFFFFFF)).min(axis=1).astype(np.uint32)
+
+
+def signatures(texts: List[str]):
+    """Сигнатуры пачки текстов: np.uint32[n, NUM_PERM]"""
+    import numpy as np
+
+    if not texts:
+        return np.zeros((0, NUM_PERM), dtype=np.uint32)
+    return np.stack([signature(t) for t in texts])
+
+
+def signature_from_bytes(blob: bytes):
+    """Сигнатура из BLOB таблицы chunk_minhash"""
+    import numpy as np
+
+    return np.frombuffer(blob, dtype=np.uint32)
+
+
+def band_keys(sigs):
+    """Ключи полос: np.int64[n, BANDS] (знаковые — как INTEGER в SQLite)"""
+    import numpy as np
+
+    bands = sigs.reshape(len(sigs), BANDS, ROWS).astype(np.uint64)
+    key = np.zeros(bands.shape[:2], dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for r in range(ROWS):  # FNV-1a по значениям полосы
+            key = (key ^ bands[:, :, r]) * np.uint64(0x100000001B3)
+    return key.view(np.int64)
+
+
+def similarity(sig, others):
+    """Оценка Жаккара sig с каждой строкой others"""
+    return (others == sig).mean(axis=1)
+
+
+def find_duplicates(sigs, keys, candidates: Dict[Tuple[int, int], List[int]],
+                    candidate_sigs: Dict[int, "object"], threshold: float) -> List[Tuple[Optional[int], float]]:
+    """
+    Для каждой новой сигнатуры — (id ближайшего чанка со сходством ≥ threshold или None, сходство).
+    candidates: (полоса, ключ) → id уже сохранённых чанков; новые чанки пачки сравниваются
+    и между собой (отрицательный id -i-1 — i-й чанк пачки, его подставляет вызывающий).
+    """
+    import numpy as np
+
+    out: List[Tuple[Optional[int], float]] = []
+    local: Dict[Tuple[int, int], List[int]] = {}
+    for i in range(len(sigs)):
+        ids = set()
+        for band in range(BANDS):
+            k = (band, int(keys[i, band]))
+            ids.update(candidates.get(k, ()))
+            ids.update(local.get(k, ()))
+        best, best_sim = None, 0.0
+        if ids:
+            ids = sorted(ids)
+            others = np.stack([candidate_sigs[c] if c >= 0 else sigs[-c - 1] for c in ids])
+            sims = similarity(sigs[i], others)
+            j = int(sims.argmax())
+            if sims[j] >= threshold:
+                best, best_sim = ids[j], float(sims[j])
+        out.append((best, best_sim))
+        for band in range(BANDS):
+            local.setdefault((band, int(keys[i, band])), []).append(-i - 1)
+    return out
+
+
+def report_md(report: Dict) -> str:
+    """Отчёт Database.get_dedupe_report() → Markdown"""
+    lines = [
+        "### 🧬 Почти-дубликаты чанков",
+        f"- Чанков в активной нарезке: {report['chunks']}",
+        f"- С сигнатурой MinHash: {report['with_signature']}",
+        f"- Помечено дубликатами: {report['duplicates']} ({report['duplicate_share'] * 100:.1f}%)",
+    ]
+    if report["pairs"]:
+        lines.append("\n**Файлы с общими фрагментами:**")
+        for p in report["pairs"]:
+            lines.append(f"- {p['filename']} → {p['original_filename']}: {p['chunks']} чанков "
+                         f"(сходство ~{p['avg_similarity']:.2f})")
+    return "\n".join(lines)
+
+
+def main():
+    import argparse
+    from app.config import get_config
+    from app.database import Database
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Почти-дубликаты чанков (MinHash/LSH)")
+    parser.add_argument("command", choices=["report", "backfill"])
+    args = parser.parse_args()
+
+    get_config().ensure_dirs()
+    db = Database()
+    try:
+        if args.command == "backfill":
+            print(f"✅ Обработано чанков: {db.backfill_minhash()}")
+        print(report_md(db.get_dedupe_report()))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Конвейер пакетной транскрибации (задачи API, наблюдатель папок, продолжение после сбоя).
+
+Без конвейера каждый файл проходит этапы строго по очереди: декодирование (ffmpeg), распознавание,
+нарезка и запись в БД — модель простаивает, пока ffmpeg декодирует, а БД пишет. Здесь этапы
+разнесены и связаны ограниченными очередями:
+
+    decode  пул prefetch (pipeline.decode_workers): хэш содержимого, PCM в кэш аудио, карта
+            речи VAD; вперёд готовится не больше pipeline.prefetch_depth файлов — в порядке
+            допуска полосы heavy (при sjf — сначала те, что полоса пропустит раньше)
+    asr     полоса heavy (app.lanes) — TranscribeModule.recognize
+    write   не больше pipeline.write_workers одновременно — TranscribeModule.persist и ingest;
+            если записи ждут pipeline.write_queue файлов, распознавший файл держит место
+            в полосе heavy, и следующий не начинается (backpressure)
+
+Пока файл N распознаётся, N+1 уже декодирован, а N-1 пишется в БД.
+"""
+from __future__ import annotations
+import logging
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from app import tracing
+from app.config import get_config
+from app.lanes import get_lanes
+from app.media import content_hash, read_wav_info
+
+log = logging.getLogger("whisper_rag_studio")
+
+
+class _Prefetch:
+    def __init__(self, path: str, file_hash: Optional[str], cost: Optional[float] = None):
+        self.path = path
+        self.file_hash = file_hash
+        self.cost = cost  # оценка задачи в полосе heavy (как Ticket.cost)
+        self.enqueued_at = time.monotonic()
+        self.state = "pending"  # pending → running → done
+        self.done = threading.Event()
+
+
+class Prefetcher:
+    """
+    Пул этапа decode: готовит файлы не больше depth вперёд в порядке допуска lane
+    (app.lanes.Lane; None или fifo — в порядке постановки)
+    """
+
+    def __init__(self, db, workers: int = 1, depth: int = 2, lane=None):
+        self.db = db
+        self.lane = lane
+        self.workers = max(1, int(workers))
+        self.depth = max(1, int(depth))
+        self._items: Dict[str, _Prefetch] = {}
+        self._order: Deque[_Prefetch] = deque()
+        self._ahead = 0  # готовятся или готовы, но ещё не взяты распознаванием
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+
+    def submit(self, path, file_hash: Optional[str] = None, cost: Optional[float] = None):
+        key = str(path)
+        with self._cond:
+            if key in self._items:
+                return
+            item = _Prefetch(key, file_hash, cost)
+            self._items[key] = item
+            self._order.append(item)
+            while len(self._threads) < self.workers:
+                t = threading.Thread(target=self._worker, name=f"prefetch-{len(self._threads)}", daemon=True)
+                self._threads.append(t)
+                t.start()
+            self._cond.notify_all()
+
+    def take(self, path) -> Optional[str]:
+        """
+        Забрать подготовку файла → хэш содержимого (None — не ставился). Ещё не начатая
+        снимается с очереди (распознавание само всё сделает), начатая — дожидается.
+        """
+        with self._cond:
+            item = self._items.pop(str(path), None)
+            if item is None:
+                return None
+            if item.state == "pending":
+                self._order.remove(item)
+                return item.file_hash
+        with tracing.span("prefetch_wait", ready=item.done.is_set()):
+            item.done.wait()
+        with self._cond:
+            self._ahead -= 1
+            self._cond.notify_all()
+        return item.file_hash
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"queued": len(self._order), "ahead": self._ahead, "depth": self.depth}
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._order and self._ahead < self.depth)
+                item = self._next()
+                item.state = "running"
+                self._ahead += 1
+            try:
+                item.file_hash = self._warm(Path(item.path), item.file_hash)
+            except Exception as e:  # распознавание повторит шаг и покажет ошибку как обычно
+                log.warning("PREFETCH %s: %s: %s", Path(item.path).name, type(e).__name__, e)
+            finally:
+                item.state = "done"
+                item.done.set()
+
+    def _next(self) -> _Prefetch:
+        # тот же ключ, что у полосы: иначе глубина занята длинными файлами, которые ждут очереди,
+        # а короткие, пропущенные полосой вперёд, декодируются уже в слоте распознавания
+        if self.lane is None or self.lane.policy == "fifo":
+            return self._order.popleft()
+        item = min(self._order, key=self.lane._key(time.monotonic()))
+        self._order.remove(item)
+        return item
+
+    def _warm(self, path: Path, file_hash: Optional[str]) -> str:
+        from app.audio_cache import get_audio_cache
+        from app.vad import get_speech_map
+
+        file_hash = file_hash or content_hash(path)
+        # WAV читается memmap-ом напрямую, остальное — ffmpeg в кэш аудио
+        if get_config().audio_cache.enabled and not read_wav_info(path):
+            get_audio_cache().load(path, file_hash)
+        get_speech_map(self.db, path, file_hash)
+        log.debug("PREFETCH %s готов", path.name)
+        return file_hash
+
+
+class Pipeline:
+    """Этапы decode → asr → write для файлов пакета (см. модуль)"""
+
+    def __init__(self, transcribe, config=None):
+        cfg = config or get_config().pipeline
+        self.transcribe = transcribe  # TranscribeModule
+        self.enabled = bool(cfg.enabled)
+        self.prefetcher = Prefetcher(transcribe.ctx.db, cfg.decode_workers, cfg.prefetch_depth,
+                                     get_lanes().heavy)
+        self._admit = threading.BoundedSemaphore(max(1, cfg.write_workers) + max(0, cfg.write_queue))
+        self._writers = threading.BoundedSemaphore(max(1, cfg.write_workers))
+
+    def prefetch(self, path, file_hash: Optional[str] = None, cost: Optional[float] = None):
+        """
+        Поставить файл в этап decode (вызывается при постановке задачи, до очереди heavy);
+        cost — та же оценка, что у места задачи в полосе
+        """
+        if self.enabled:
+            self.prefetcher.submit(path, file_hash, cost)
+
+    def discard(self, path):
+        """
+        Файл не пойдёт в распознавание (дубликат, ошибка до этапа asr) — освободить место prefetch;
+        уже забранный run — ничего не делает. Вызывается в finally вокруг prefetch → run.
+        """
+        self.prefetcher.take(path)
+
+    def run(self, path, asr_slot, model_name: Optional[str] = None, file_hash: Optional[str] = None,
+            progress=None, segment_callback=None,
+            post: Optional[Callable[[Dict[str, Any]], None]] = None,
+            profile: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Провести файл через этапы → результат transcribe_path.
+        asr_slot — место в полосе heavy (Ticket или Lane.slot(...)): вход ждёт очереди,
+        выход — после того, как распознанный файл принят этапом write.
+        post(res) — дообработка в этапе write (ingest в Refiner); profile — профиль декодирования.
+        """
+        if not self.enabled:
+            with asr_slot:
+                res = self.transcribe.transcribe_path(path, progress, model_name, file_hash, segment_callback,
+                                                      profile)
+                if post:
+                    post(res)
+            return res
+        with tracing.trace("transcribe", self.transcribe.ctx.db):
+            with asr_slot:
+                file_hash = self.prefetcher.take(path) or file_hash
+                state = self.transcribe.recognize(path, progress, model_name, file_hash, segment_callback,
+                                                  profile)
+                if "result" in state:  # уже обработан — писать нечего
+                    res = state["result"]
+                    if post:
+                        post(res)
+                    return res
+                with tracing.span("write_wait"):
+                    self._admit.acquire()
+            try:
+                with self._writers:
+                    res = self.transcribe.persist(state)
+                    if post:
+                        post(res)
+            finally:
+                self._admit.release()
+        return res
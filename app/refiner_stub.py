@@ -0,0 +1,239 @@
+"""
+Локальная замена NooForge-Refiner для разработки и нагрузочных тестов (только stdlib).
+
+Реализует те же пути, что настроены в nooforge.* (ingest_text_path, ingest_file_path,
+rag_query_path, ingest_batch_path, delete_path), хранит документы в памяти и отвечает
+с настраиваемой задержкой, долей ошибок и потоковой (chunked) отдачей тела.
+RAG-запрос повторяет особенность Refiner: поле вопроса принимается только одно
+(по умолчанию `query`), на другое — 422 «missing field `query`».
+
+    python -m app.refiner_stub --port 8877 --latency-ms 80 --jitter-ms 40 --error-rate 0.02 --stream
+    GET /stats — счётчики запросов и документов
+"""
+from __future__ import annotations
+import argparse
+import email.parser
+import itertools
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from app.config import get_config
+
+log = logging.getLogger("whisper_rag_studio")
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+@dataclass
+class StubOptions:
+    latency_ms: float = 50.0  # базовая задержка ответа
+    jitter_ms: float = 0.0  # + экспоненциальный хвост со средним jitter_ms
+    error_rate: float = 0.0  # доля ответов 500/503 (до обработки запроса)
+    stream: bool = False  # отдавать тело частями (Transfer-Encoding: chunked)
+    stream_chunks: int = 8
+    stream_delay_ms: float = 5.0  # пауза между частями тела
+    query_field: str = "query"  # q | query — какое поле вопроса принимает rag_query_path
+    seed: Optional[int] = None
+
+
+class RefinerStub:
+    """Документы в памяти: коллекция → id → {text, source_id, words}"""
+
+    def __init__(self, options: Optional[StubOptions] = None):
+        self.options = options or StubOptions()
+        self.collections: Dict[str, Dict[str, Dict]] = {}
+        self.requests: Counter = Counter()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.options.seed)
+
+    # ---- операции ----
+    def add(self, collection: str, text: str, source_id: str) -> str:
+        with self._lock:
+            doc_id = str(next(self._ids))
+            self.collections.setdefault(collection, {})[doc_id] = {
+                "text": text, "source_id": source_id, "words": set(_WORD.findall(text.lower()))}
+        return doc_id
+
+    def delete(self, collection: str, ids: List[str], source_ids: List[str]) -> int:
+        with self._lock:
+            docs = self.collections.get(collection, {})
+            drop = set(ids) | {i for i, d in docs.items() if d["source_id"] in set(source_ids)}
+            for i in drop:
+                docs.pop(i, None)
+        return len(drop)
+
+    def query(self, collection: str, question: str, top_k: int) -> Dict:
+        q = set(_WORD.findall(question.lower()))
+        with self._lock:
+            docs = list(self.collections.get(collection, {}).values())
+        scored = sorted(((len(q & d["words"]) / (len(q) or 1), d) for d in docs),
+                        key=lambda x: -x[0])[:max(1, top_k)]
+        results = [{"source_id": d["source_id"], "score": s, "snippet": d["text"][:300]}
+                   for s, d in scored if s > 0]
+        answer = results[0]["snippet"] if results else "Ничего не найдено"
+        return {"answer": answer, "results": results}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"requests": dict(self.requests),
+                    "documents": {c: len(d) for c, d in self.collections.items()}}
+
+    # ---- ответы ----
+    def delay(self):
+        o = self.options
+        extra = self._rng.expovariate(1.0 / o.jitter_ms) if o.jitter_ms > 0 else 0.0
+        time.sleep(max(0.0, o.latency_ms + extra) / 1000.0)
+
+    def injected_error(self) -> Optional[int]:
+        if self.options.error_rate > 0 and self._rng.random() < self.options.error_rate:
+            return self._rng.choice((500, 503))
+        return None
+
+
+def _handler(stub: RefinerStub):
+    nf = get_config().nooforge
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive: клиентский пул соединений работает как с Refiner
+
+        def log_message(self, fmt, *args):
+            log.debug("STUB " + fmt, *args)
+
+        def _send(self, status: int, payload):
+            body = (payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json" if not isinstance(payload, str) else "text/plain")
+            o = stub.options
+            if not o.stream or o.stream_chunks <= 1:
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            step = max(1, -(-len(body) // o.stream_chunks))
+            for i in range(0, len(body), step):
+                part = body[i:i + step]
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(part), part))
+                self.wfile.flush()
+                time.sleep(o.stream_delay_ms / 1000.0)
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def do_GET(self):
+            if self.path == "/stats":
+                return self._send(200, stub.stats())
+            self._send(404, {"detail": "not found"})
+
+        def do_POST(self):
+            path = self.path.split("?", 1)[0]
+            raw = self._body()  # тело читаем всегда — иначе keep-alive соединение сломается
+            stub.requests[path] += 1
+            stub.delay()
+            status = stub.injected_error()
+            if status:
+                stub.requests[f"error_{status}"] += 1
+                return self._send(status, f"injected error {status}")
+            try:
+                if path == nf.ingest_file_path:
+                    return self._ingest_file(raw)
+                data = json.loads(raw or b"{}")
+            except ValueError as e:
+                return self._send(400, {"detail": f"bad request: {e}"})
+            collection = data.get("collection") or nf.default_collection or "chunks"
+            if path == nf.ingest_text_path:
+                if not isinstance(data.get("text"), str):
+                    return self._send(422, "Failed to deserialize the JSON body: missing field `text`")
+                doc_id = stub.add(collection, data["text"], data.get("source_id") or "")
+                return self._send(200, {"ok": True, "id": doc_id, "collection": collection})
+            if path == nf.ingest_batch_path:
+                ids = [stub.add(collection, it.get("text", ""), it.get("source_id") or "")
+                       for it in data.get("items") or []]
+                return self._send(200, {"ok": True, "ids": ids, "collection": collection})
+            if path == nf.delete_path:
+                n = stub.delete(collection, [str(i) for i in data.get("ids") or []], data.get("source_ids") or [])
+                return self._send(200, {"ok": True, "deleted": n})
+            if path == nf.rag_query_path:
+                field = stub.options.query_field
+                if not isinstance(data.get(field), str):
+                    return self._send(422, f"Failed to deserialize the JSON body: missing field `{field}`")
+                return self._send(200, stub.query(collection, data[field], int(data.get("top_k") or 8)))
+            self._send(404, {"detail": "not found"})
+
+        def _ingest_file(self, raw: bytes):
+            ctype = self.headers.get("Content-Type", "")
+            msg = email.parser.BytesParser().parsebytes(
+                b"Content-Type: " + ctype.encode("latin-1") + b"\r\n\r\n" + raw)
+            if not msg.is_multipart():
+                return self._send(422, "expected multipart/form-data")
+            fields, text = {}, ""
+            for part in msg.get_payload():
+                name = part.get_param("name", header="content-disposition")
+                payload = part.get_payload(decode=True) or b""
+                if part.get_filename():
+                    text = payload.decode("utf-8", errors="ignore")
+                elif name:
+                    fields[name] = payload.decode("utf-8", errors="ignore")
+            collection = fields.get("collection") or nf.default_collection or "chunks"
+            doc_id = stub.add(collection, text, fields.get("source_id") or "")
+            return self._send(200, {"ok": True, "id": doc_id, "bytes": len(text.encode("utf-8"))})
+
+    return Handler
+
+
+def serve(stub: RefinerStub, host: str = "127.0.0.1", port: int = 8877) -> ThreadingHTTPServer:
+    """Запустить сервер в фоновом потоке (port=0 — свободный порт: server.server_address)"""
+    server = ThreadingHTTPServer((host, port), _handler(stub))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="refiner-stub", daemon=True).start()
+    log.info("REFINER STUB on http://%s:%d %s", *server.server_address[:2], stub.options)
+    return server
+
+
+def add_options_args(parser: argparse.ArgumentParser):
+    d = StubOptions()
+    parser.add_argument("--latency-ms", type=float, default=d.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=d.jitter_ms)
+    parser.add_argument("--error-rate", type=float, default=d.error_rate)
+    parser.add_argument("--stream", action="store_true", help="отдавать тело ответа частями")
+    parser.add_argument("--stream-chunks", type=int, default=d.stream_chunks)
+    parser.add_argument("--stream-delay-ms", type=float, default=d.stream_delay_ms)
+    parser.add_argument("--query-field", choices=["q", "query"], default=d.query_field)
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def options_from_args(args) -> StubOptions:
+    return StubOptions(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                       stream=args.stream, stream_chunks=args.stream_chunks,
+                       stream_delay_ms=args.stream_delay_ms, query_field=args.query_field, seed=args.seed)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Локальная замена NooForge-Refiner")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8877)
+    add_options_args(parser)
+    args = parser.parse_args()
+    server = serve(RefinerStub(options_from_args(args)), args.host, args.port)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
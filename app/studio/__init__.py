@@ -87,6 +87,19 @@ class WhisperRAGStudio:
     def delete_files_by_ids_from_json(self, ids_json: str):
         return self.files.delete_files_by_ids_from_json(ids_json)
 
+    def dedupe_report_md(self) -> str:
+        return self.files.dedupe_report_md()
+
+    def trace_html(self, file_id: int) -> str:
+        return self.files.trace_html(file_id)
+
+    def trace_export(self, file_id: int):
+        return self.files.trace_export(file_id)
+
+    def delete_files_report(self, file_ids) -> str:
+        """Удалить файлы одной транзакцией → Markdown-отчёт"""
+        return self.ctx.delete_files_by_ids_list(file_ids)
+
     # settings
     def update_settings(self, *args, **kwargs):
         return self.settings.update_settings(*args, **kwargs)
@@ -97,10 +110,31 @@ class WhisperRAGStudio:
     def save_all_settings(self, *args, **kwargs):
         return self.settings.save_all_settings(*args, **kwargs)
 
+    # перенарезка чанков
+    def rechunk_start(self, force: bool = False) -> str:
+        return self.ctx.rechunk.start(force=force)
+
+    def rechunk_cancel(self) -> str:
+        return self.ctx.rechunk.cancel()
+
+    def rechunk_status_md(self) -> str:
+        return self.ctx.rechunk.status_md()
+
+    # обслуживание БД
+    def maintenance_run(self) -> str:
+        self.ctx.maintenance.run(optimize=True, check=True)
+        return self.ctx.maintenance.status_md()
+
+    def maintenance_status_md(self) -> str:
+        return self.ctx.maintenance.status_md()
+
     # refiner (ingest + rag)
     def ingest_transcript_by_id(self, file_id, source_id, collection):
         return self.refiner.ingest_transcript_by_id(file_id, source_id, collection)
 
+    def sync_collection(self, collection, all_files=False):
+        return self.refiner.sync_collection(collection, all_files)
+
     def ingest_file_direct(self, file, source_id, collection):
         return self.refiner.ingest_file_direct(file, source_id, collection)
 
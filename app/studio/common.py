@@ -1,34 +1,129 @@
 # app/studio/common.py
 from __future__ import annotations
 import logging
-from dataclasses import dataclass, field
+import threading
+from dataclasses import dataclass, field, replace
+from pathlib import Path
 from typing import Dict, List, Optional
 
 from app.config import get_config  # update_config может быть в других модулях
 from app.database import Database
 from app.chunker import TextChunker
-
-from transcriber import Transcriber
+from app.transcript_store import TranscriptStore, is_packed
 
 log = logging.getLogger("whisper_rag_studio")
 
 
+def _unlink_all(paths: List[str]):
+    for p in paths:
+        try:
+            Path(p).unlink(missing_ok=True)
+        except OSError as e:
+            log.warning("не удалось удалить %s: %s", p, e)
+
+
 @dataclass
 class StudioContext:
     """Общий контекст и утилиты для модулей."""
     config: any = field(default_factory=get_config)
-    db: Database = field(default_factory=Database)
+    _db: Optional[Database] = field(default=None, repr=False)
+    _store: Optional[TranscriptStore] = field(default=None, repr=False)
     transcriber: Optional[any] = None
     transcriber_loaded: bool = False
     chunker: TextChunker = field(default_factory=TextChunker)
+    # дополнительные модели (например, из настроек папок наблюдения): model_name → Transcriber
+    extra_transcribers: Dict[str, any] = field(default_factory=dict)
+    _lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+    # нарезка + запись чанков нового транскрипта не должна разойтись с переключением версии нарезки
+    chunk_lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+    _rechunk: Optional[any] = field(default=None, repr=False)
+    _maintenance: Optional[any] = field(default=None, repr=False)
+
+    # ---- lazy resources ----
+    @property
+    def db(self) -> Database:
+        """БД открывается (и создаются каталоги data/) при первом обращении."""
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    self.config.ensure_dirs()
+                    self._db = Database()
+        return self._db
+
+    @property
+    def store(self) -> TranscriptStore:
+        """Упакованное хранилище текстов транскриптов (индекс — в той же БД)."""
+        if self._store is None:
+            db = self.db
+            with self._lock:
+                if self._store is None:
+                    self._store = TranscriptStore(db)
+        return self._store
+
+    @property
+    def rechunk(self):
+        """Фоновая перенарезка транскриптов (один экземпляр на контекст)."""
+        if self._rechunk is None:
+            from .rechunk import RechunkModule
+            with self._lock:
+                if self._rechunk is None:
+                    self._rechunk = RechunkModule(self)
+        return self._rechunk
+
+    @property
+    def maintenance(self):
+        """Фоновое обслуживание БД (app/maintenance.py); простой — полоса heavy и перенарезка стоят."""
+        if self._maintenance is None:
+            from app.maintenance import DbMaintenance
+            db = self.db
+            with self._lock:
+                if self._maintenance is None:
+                    self._maintenance = DbMaintenance(db, is_idle=self._db_idle)
+        return self._maintenance
+
+    def _db_idle(self) -> bool:
+        from app.lanes import get_lanes
+
+        heavy = get_lanes().heavy.stats()
+        rechunk_busy = self._rechunk is not None and self._rechunk.running()
+        return heavy["running"] == 0 and heavy["queued"] == 0 and not rechunk_busy
+
+    def close(self):
+        if self._maintenance is not None:
+            self._maintenance.stop()
+        if self._store is not None:
+            self._store.close()
+        if self._db is not None:
+            self._db.close()
 
     # ---- helpers ----
     def ensure_transcriber(self):
-        if not self.transcriber_loaded:
-            if Transcriber is None:
-                raise RuntimeError("Transcriber class is not available")
-            self.transcriber = Transcriber()
-            self.transcriber_loaded = True
+        with self._lock:
+            if not self.transcriber_loaded:
+                from transcriber import Transcriber  # тянет модель/бэкенд — только по требованию
+                self.transcriber = Transcriber()
+                self.transcriber_loaded = True
+
+    def get_transcriber(self, model_name: Optional[str] = None):
+        """Транскрибатор для модели; None/модель из конфига → основной инстанс."""
+        if not model_name or model_name == self.config.transcriber.model_name:
+            self.ensure_transcriber()
+            return self.transcriber
+        with self._lock:
+            tr = self.extra_transcribers.get(model_name)
+            if tr is None:
+                from transcriber import Transcriber
+                cfg = replace(self.config.transcriber, model_name=model_name, model_path=None)
+                tr = Transcriber(cfg)
+                self.extra_transcribers[model_name] = tr
+            return tr
+
+    def reset_transcribers(self):
+        """Сбросить загруженные модели (перезагрузятся при следующем использовании)."""
+        with self._lock:
+            self.transcriber_loaded = False
+            self.transcriber = None
+            self.extra_transcribers.clear()
 
     def headers_refiner(self) -> Dict[str, str]:
         headers = {"Content-Type": "application/json"}
@@ -48,14 +143,19 @@ class StudioContext:
 
     # ---- stats ----
     def stats_md(self) -> str:
+        from app.lanes import get_lanes
+
         s = self.db.get_stats()
+        heavy = get_lanes().heavy.stats()
         return (
             "📊 **Статистика БД:**\n"
             f"- Всего файлов: {s['total_files']}\n"
             f"- Обработано: {s['processed_files']}\n"
             f"- Транскриптов: {s['total_transcripts']}\n"
-            f"- Чанков: {s['total_chunks']}\n"
-            f"- Размер: {s['total_size_mb']} МБ"
+            f"- Чанков: {s['total_chunks']} (почти-дубликатов: {s['duplicate_chunks']})\n"
+            f"- Размер: {s['total_size_mb']} МБ\n"
+            f"- Транскрибация: выполняется {heavy['running']}/{heavy['concurrency']}, "
+            f"в очереди {heavy['queued']}/{heavy['max_queue']}"
         )
 
     # ---- files (DESC) ----
@@ -80,19 +180,24 @@ class StudioContext:
         if not ids:
             return "ℹ️ Нечего удалять."
         try:
-            # у тебя, вероятно, уже есть метод удаления по JSON;
-            # дернем на прямую БД/хранилище, как реализовано у тебя:
-            ok, fail = 0, 0
-            for fid in ids:
-                try:
-                    self.db.delete_file_and_transcript(fid)
-                    ok += 1
-                except Exception:
-                    fail += 1
-            msg = f"✅ Удалено: **{ok}**, Ошибок: **{fail}**"
-            return msg
+            res = self.db.delete_files(ids)
         except Exception as e:
+            log.exception("delete files failed")
             return f"❌ Ошибка удаления: {e}"
+        # тексты в pack удалены вместе с индексом; старые .txt — в фоне, после коммита
+        legacy = [p for p in res["transcript_paths"] if not is_packed(p)]
+        if legacy:
+            threading.Thread(target=_unlink_all, args=(legacy,), name="unlink-transcripts",
+                             daemon=True).start()
+        msg = f"✅ Удалено файлов: {len(res['deleted'])}"
+        if res["deleted"]:
+            names = [f"• {d['filename']}" for d in res["deleted"][:50]]
+            if len(res["deleted"]) > 50:
+                names.append(f"… и ещё {len(res['deleted']) - 50}")
+            msg += "\n\n" + "\n".join(names)
+        if res["missing"]:
+            msg += f"\n\n⚠️ Не найдены (уже удалены?): {', '.join(map(str, res['missing']))}"
+        return msg
 
     def render_files_list_html(self, marked: list[int] | None = None) -> str:
         marked = set(marked or [])
@@ -2,9 +2,11 @@
 from __future__ import annotations
 import json
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional
 from .common import StudioContext
 
+VIEWER_MAX_BYTES = 256 * 1024  # больше в браузер не отдаём (полный текст — через API по диапазонам)
+
 
 class FilesModule:
     def __init__(self, ctx: StudioContext):
@@ -50,25 +52,65 @@ class FilesModule:
         tr = self.ctx.db.get_transcript_by_file_id(file_id)
         if not tr:
             return "❌ Транскрипт не найден"
-        p = Path(tr["transcript_path"])
-        return p.read_text(encoding="utf-8") if p.exists() else "❌ Файл транскрипта отсутствует"
+        text = self.ctx.store.read_text_range(tr["id"], 0, VIEWER_MAX_BYTES)
+        if text is None:
+            return "❌ Файл транскрипта отсутствует"
+        total = self.ctx.store.size(tr["id"]) or 0
+        if total > VIEWER_MAX_BYTES:
+            text += (f"\n\n… показаны первые {VIEWER_MAX_BYTES // 1024} КБ из {total // 1024} КБ. "
+                     f"Полный текст: GET /api/transcripts/{file_id}?offset={VIEWER_MAX_BYTES}")
+        return text
+
+    def read_transcript_range(self, file_id: int, offset: int = 0, length: int = 65536) -> Optional[Dict]:
+        """Фрагмент транскрипта [offset, offset+length) в байтах UTF-8 (распаковываются только нужные блоки)"""
+        tr = self.ctx.db.get_transcript_by_file_id(file_id)
+        if not tr:
+            return None
+        total = self.ctx.store.size(tr["id"])
+        data = self.ctx.store.read_range(tr["id"], offset, length)
+        if total is None or data is None:
+            return None
+        return {
+            "file_id": file_id,
+            "transcript_id": tr["id"],
+            "offset": offset,
+            "length": len(data),
+            "total": total,
+            # границы диапазона могут разрезать многобайтовый символ
+            "text": data.decode("utf-8", errors="ignore"),
+        }
+
+    # трассы обработки (app/tracing.py)
+    def trace_html(self, file_id: int) -> str:
+        """Водопад этапов последней трассы файла"""
+        from app.tracing import waterfall_html
+        if not file_id:
+            return ""
+        traces = self.ctx.db.get_traces(file_id=file_id, limit=1)
+        return waterfall_html(self.ctx.db.get_trace(traces[0]["id"]) if traces else None)
+
+    def trace_export(self, file_id: int) -> Optional[str]:
+        """Все трассы файла → Chrome trace JSON (путь к файлу для скачивания)"""
+        from app.tracing import chrome_trace
+        if not file_id:
+            return None
+        records = [self.ctx.db.get_trace(t["id"]) for t in self.ctx.db.get_traces(file_id=file_id, limit=100)]
+        if not records:
+            return None
+        out = Path(self.ctx.config.database.db_path).parent / "traces" / f"trace_file{file_id}.json"
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(chrome_trace(records), ensure_ascii=False), encoding="utf-8")
+        return str(out)
+
+    def dedupe_report_md(self) -> str:
+        """Отчёт о почти-дубликатах чанков (MinHash/LSH)"""
+        from app.minhash import report_md
+        return report_md(self.ctx.db.get_dedupe_report())
 
     def delete_files_by_ids(self, file_ids: List[int]):
         if not file_ids:
             return "⚠️ Выберите файлы для удаления", *self.refresh_files_display()
-        deleted = []
-        for fid in file_ids:
-            fi = self.ctx.db.get_file_by_id(fid)
-            if fi:
-                deleted.append(fi["filename"])
-                tr = self.ctx.db.get_transcript_by_file_id(fid)
-                if tr:
-                    Path(tr["transcript_path"]).unlink(missing_ok=True)
-                self.ctx.db.delete_file(fid)
-        msg = "✅ Удалено файлов: " + str(len(deleted))
-        if deleted:
-            msg += "\n\n" + "\n".join(f"• {n}" for n in deleted)
-        return msg, *self.refresh_files_display()
+        return self.ctx.delete_files_by_ids_list(file_ids), *self.refresh_files_display()
 
     def delete_files_by_ids_from_json(self, ids_json: str):
         try:
@@ -76,19 +118,7 @@ class FilesModule:
             if not isinstance(ids, list):
                 return "❌ Неверный формат выбранных ID", self.render_files_list_html(), ""
             ids_int = [int(x) for x in ids if str(x).isdigit()]
-            # реальное удаление
-            deleted = []
-            for fid in ids_int:
-                fi = self.ctx.db.get_file_by_id(fid)
-                if fi:
-                    deleted.append(fi["filename"])
-                    tr = self.ctx.db.get_transcript_by_file_id(fid)
-                    if tr:
-                        Path(tr["transcript_path"]).unlink(missing_ok=True)
-                    self.ctx.db.delete_file(fid)
-            msg = "✅ Удалено файлов: " + str(len(deleted))
-            if deleted:
-                msg += "\n\n" + "\n".join(f"• {n}" for n in deleted)
+            msg = self.ctx.delete_files_by_ids_list(ids_int)
             return msg, self.render_files_list_html(), ""
         except Exception as e:
             return f"❌ Ошибка: {e}", self.render_files_list_html(), ""
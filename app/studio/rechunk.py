@@ -0,0 +1,169 @@
+# app/studio/rechunk.py
+"""
+Перенарезка существующих транскриптов при смене параметров чанкера — без повторного ASR.
+
+Чанки версионируются наборами (chunk_sets) с параметрами chunk_size / chunk_overlap / separator.
+Новый набор собирается в фоне: тексты читаются из хранилища, TextChunker работает в пуле
+процессов, чанки пишутся пачками по rechunk_batch транскриптов на транзакцию. Поиск всё это
+время идёт по старому активному набору; в конце транскрипты, появившиеся за время сборки,
+досчитываются и активный набор переключается одной транзакцией, старый удаляется.
+"""
+from __future__ import annotations
+import logging
+import multiprocessing as mp
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.chunker import TextChunker, chunk_batch, init_pool_chunker
+from app.config import ChunkerConfig
+from .common import StudioContext
+
+log = logging.getLogger("whisper_rag_studio")
+
+
+def _params(cfg) -> Tuple[int, int, str]:
+    return int(cfg.chunk_size), int(cfg.chunk_overlap), cfg.separator
+
+
+class RechunkModule:
+    def __init__(self, ctx: StudioContext):
+        self.ctx = ctx
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._cancel = threading.Event()
+        self.state: Dict[str, Any] = {"status": "idle"}
+
+    # ---- управление ----
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, force: bool = False) -> str:
+        """Собрать набор под текущие параметры чанкера (force — даже если они не менялись)"""
+        params = _params(self.ctx.config.chunker)
+        active = self.ctx.db.get_active_chunk_set()
+        if not force and active and _params(ChunkerConfig(
+                active["chunk_size"], active["chunk_overlap"], active["separator"])) == params:
+            return "✅ Чанки уже нарезаны с текущими параметрами"
+        with self._lock:
+            if self.running():
+                if self.state.get("params") == params:
+                    return "⏳ Перенарезка с этими параметрами уже идёт"
+                self._cancel.set()
+                self._thread.join()
+            self._cancel = threading.Event()
+            set_id = self.ctx.db.create_chunk_set(*params)
+            self.state = {"status": "running", "set_id": set_id, "params": params,
+                          "done": 0, "total": self.ctx.db.get_stats()["total_transcripts"],
+                          "started_at": time.time()}
+            self._thread = threading.Thread(target=self._run, args=(set_id, params, self._cancel),
+                                            name="rechunk", daemon=True)
+            self._thread.start()
+        log.info("RECHUNK: набор %s (size=%s, overlap=%s)", set_id, params[0], params[1])
+        return f"🔄 Перенарезка запущена: {self.state['total']} транскриптов"
+
+    def cancel(self) -> str:
+        if not self.running():
+            return "ℹ️ Перенарезка не идёт"
+        self._cancel.set()
+        return "⏹ Перенарезка отменяется…"
+
+    def resume(self):
+        """При запуске: недособранные наборы удаляются, при смене параметров — новая сборка"""
+        if self.running():
+            return
+        for s in self.ctx.db.get_chunk_sets():
+            if not s["is_active"]:
+                self.ctx.db.delete_chunk_set(s["id"])
+        self.start()
+
+    def status(self) -> Dict[str, Any]:
+        st = dict(self.state)
+        if st.get("status") == "running":
+            elapsed = time.time() - st["started_at"]
+            rate = st["done"] / elapsed if elapsed > 0 else 0
+            st["eta_seconds"] = round((st["total"] - st["done"]) / rate) if rate else None
+        return st
+
+    def status_md(self) -> str:
+        st = self.status()
+        active = self.ctx.db.get_active_chunk_set()
+        lines = []
+        if active:
+            lines.append(f"📦 Активная нарезка: v{active['id']} — {active['chunk_size']} символов, "
+                         f"перекрытие {active['chunk_overlap']}")
+        s = st.get("status")
+        if s == "running":
+            pct = 100 * st["done"] / st["total"] if st["total"] else 100
+            eta = f", осталось ~{st['eta_seconds']} сек" if st.get("eta_seconds") is not None else ""
+            lines.append(f"🔄 Перенарезка v{st['set_id']}: {st['done']}/{st['total']} ({pct:.0f}%){eta}")
+        elif s == "done":
+            lines.append(f"✅ Перенарезка v{st['set_id']} завершена за {st['seconds']:.1f} сек")
+        elif s == "cancelled":
+            lines.append(f"⏹ Перенарезка v{st['set_id']} отменена")
+        elif s == "failed":
+            lines.append(f"❌ Перенарезка v{st['set_id']}: {st['error']}")
+        return "\n\n".join(lines) or "—"
+
+    # ---- сборка ----
+    def _run(self, set_id: int, params: Tuple[int, int, str], cancel: threading.Event):
+        db, cfg = self.ctx.db, self.ctx.config.chunker
+        batch = max(1, int(cfg.rechunk_batch))
+        workers = max(1, int(cfg.rechunk_workers))
+        last_id = 0
+        try:
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=mp.get_context("spawn"),
+                                     initializer=init_pool_chunker, initargs=params) as pool:
+                inflight = []
+                while not cancel.is_set():
+                    ids = db.get_transcript_ids(last_id, batch)
+                    if ids:
+                        last_id = ids[-1]
+                        inflight.append(pool.submit(chunk_batch, self._texts(ids)))
+                    # держим в работе не больше пачки на процесс сверх текущей
+                    while inflight and (not ids or len(inflight) > workers):
+                        items = inflight.pop(0).result()
+                        db.add_chunk_set_batch(set_id, items)
+                        self.state["done"] += len(items)
+                        if cancel.is_set():
+                            break
+                    if not ids and not inflight:
+                        break
+                if cancel.is_set():
+                    for f in inflight:
+                        f.cancel()
+                    raise InterruptedError
+
+            # досчитать новые транскрипты и переключиться; сохранение транскриптов ждёт
+            chunker = TextChunker(ChunkerConfig(*params))
+            with self.ctx.chunk_lock:
+                tail: List[Tuple[int, List[str]]] = []
+                while True:
+                    ids = db.get_transcript_ids(last_id, batch)
+                    if not ids:
+                        break
+                    last_id = ids[-1]
+                    tail += [(tid, chunker.chunk_text(text or "")) for tid, text in self._texts(ids)]
+                old = db.get_active_chunk_set()
+                db.activate_chunk_set(set_id, tail)
+                self.ctx.chunker = chunker
+            self.state["done"] += len(tail)
+            if old and old["id"] != set_id:
+                db.delete_chunk_set(old["id"])
+            self.state.update(status="done", seconds=time.time() - self.state["started_at"])
+            log.info("RECHUNK: набор %s активен (%d транскриптов, %.1f сек)",
+                     set_id, self.state["done"], self.state["seconds"])
+        except InterruptedError:
+            db.delete_chunk_set(set_id)
+            self.state["status"] = "cancelled"
+            log.info("RECHUNK: набор %s отменён", set_id)
+        except Exception as e:
+            log.exception("RECHUNK failed")
+            db.set_chunk_set_status(set_id, "failed")
+            db.delete_chunk_set(set_id)
+            self.state.update(status="failed", error=str(e))
+
+    def _texts(self, ids: List[int]) -> List[Tuple[int, str]]:
+        return [(tid, self.ctx.store.read_text(tid)) for tid in ids]
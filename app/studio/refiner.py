@@ -1,48 +1,114 @@
 # app/studio/refiner.py
 from __future__ import annotations
+import hashlib
 import json
 import logging
+import threading
+import time
 from pathlib import Path
-from typing import Tuple, List, Dict, Any
-import requests
+from typing import Tuple, List, Dict, Any, Optional
 from .common import StudioContext
 
 log = logging.getLogger("whisper_rag_studio")
 
 
+def _requests():
+    """Ленивый импорт requests: не платим за него при старте UI/воркеров."""
+    import requests
+    return requests
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+class RefinerError(Exception):
+    """Refiner ответил не 2xx"""
+
+    def __init__(self, status: int, body: str):
+        super().__init__(f"Refiner вернул {status}")
+        self.status = status
+        self.body = body
+
+
 class RefinerModule:
     def __init__(self, ctx: StudioContext):
         self.ctx = ctx
+        self._batch_supported: Optional[bool] = None  # есть ли ingest_batch_path (узнаём при первом запросе)
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    def _http(self):
+        """Общая requests.Session: keep-alive пул на nooforge.pool_size соединений"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    requests = _requests()
+                    session = requests.Session()
+                    size = max(1, int(self.ctx.config.nooforge.pool_size or 1))
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=size)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    @property
+    def _timeout(self) -> float:
+        return float(self.ctx.config.nooforge.request_timeout)
 
     # -------- Ingest --------
     def ingest_transcript_by_id(self, file_id, source_id, collection):
         if not file_id:
             return "⚠️ Выберите файл", ""
+        collection = collection or (self.ctx.config.nooforge.default_collection or "chunks")
+        if self.ctx.config.nooforge.ingest_mode != "delta":
+            return self._ingest_full(file_id, source_id, collection)
+        if not self.ctx.db.get_transcript_by_file_id(file_id):
+            return "❌ Транскрипт не найден", ""
+        try:
+            res = self.sync_file(file_id, collection, source_id or None)
+        except RefinerError as e:
+            return f"❌ Refiner вернул {e.status}", f"Тело ответа:\n\n{e.body}"
+        except Exception as e:
+            log.exception("INGEST DELTA exception")
+            return f"❌ Ошибка отправки: {e}", ""
+        return "✅ Синхронизировано с Refiner", self._sync_md([res])
+
+    def _ingest_full(self, file_id, source_id, collection):
+        """Весь текст транскрипта одним документом (nooforge.ingest_mode = full)"""
         tr = self.ctx.db.get_transcript_by_file_id(file_id)
         if not tr:
             return "❌ Транскрипт не найден", ""
-        p = Path(tr["transcript_path"])
-        if not p.exists():
+        text = self.ctx.store.read_text(tr["id"])
+        if text is None:
             return "❌ Файл транскрипта отсутствует", ""
-        text = p.read_text(encoding="utf-8")
+        dups = self.ctx.db.get_transcript_duplicate_stats(tr["id"])
+        # текст уходит целиком: пропустить можно только транскрипт, полностью повторяющий уже загруженные
+        # (при skip повторы не сохраняются — у такого транскрипта чанков не остаётся вовсе)
+        if (self.ctx.config.chunker.dedupe == "skip" and text.strip()
+                and dups["duplicates"] == dups["chunks"]):
+            log.info("INGEST TEXT skipped: file_id=%s, все чанки — почти-дубликаты", file_id)
+            return "ℹ️ Пропущено: транскрипт целиком повторяет уже загруженные", ""
         payload = {
             "text": text,
             "source_id": source_id or f"file://{file_id}",
-            "collection": collection or (self.ctx.config.nooforge.default_collection or "chunks"),
+            "collection": collection,
         }
         url = self.ctx.join_url(
             self.ctx.config.nooforge.base_url, self.ctx.config.nooforge.ingest_text_path)
         log.info("INGEST TEXT → %s | bytes=%d | source_id=%s | collection=%s",
                  url, len(text.encode('utf-8')), payload["source_id"], payload["collection"])
         try:
-            r = requests.post(url, data=json.dumps(payload),
-                              headers=self.ctx.headers_refiner(), timeout=120)
+            r = self._http().post(url, data=json.dumps(payload),
+                                  headers=self.ctx.headers_refiner(), timeout=self._timeout)
             if 200 <= r.status_code < 300:
                 try:
                     data = r.json()
                 except Exception:
                     data = {"ok": True, "raw": r.text}
-                return "✅ Отправлено в Refiner", "```json\n" + json.dumps(data, ensure_ascii=False, indent=2) + "\n```"
+                note = (f" (почти-дубликатов: {dups['duplicates']}/{dups['chunks']} чанков)"
+                        if dups["duplicates"] else "")
+                return "✅ Отправлено в Refiner" + note, "```json\n" + json.dumps(data, ensure_ascii=False, indent=2) + "\n```"
             log.error("INGEST TEXT ERROR POST → %s | status=%d | body=%s",
                       url, r.status_code, r.text)
             return f"❌ Refiner вернул {r.status_code}", f"Тело ответа:\n\n{r.text}"
@@ -50,6 +116,142 @@ class RefinerModule:
             log.exception("INGEST TEXT exception")
             return f"❌ Ошибка отправки: {e}", ""
 
+    # -------- Дельта-ingest: чанки по хэшам содержимого --------
+    def sync_file(self, file_id: int, collection: str, source_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Привести чанки файла в коллекции Refiner к текущим: отправить новые/изменённые,
+        удалить исчезнувшие (в том числе все — если файла или транскрипта больше нет).
+        Учёт отправленного — refiner_ingest; пачки фиксируются по мере успешной отправки.
+        """
+        db = self.ctx.db
+        state = db.get_ingest_state(file_id, collection)
+        if source_id is None:  # повторная синхронизация — тот же source_id, что в прошлый раз
+            prev = next(iter(state.values()), None)
+            source_id = prev["source_id"].rsplit("#", 1)[0] if prev else f"file://{file_id}"
+        desired: Dict[str, Dict] = {}
+        tr = db.get_transcript_by_file_id(file_id)
+        skip_dups = self.ctx.config.chunker.dedupe != "off"
+        for c in (db.get_chunks_by_transcript_id(tr["id"]) if tr else []):
+            if skip_dups and c.get("duplicate_of") is not None:
+                continue  # почти-дубликат уже лежит в коллекции (app/minhash.py)
+            desired.setdefault(chunk_hash(c["chunk_text"]), c)
+
+        added = [h for h in desired if h not in state]
+        removed = [h for h in state if h not in desired]
+        res = {"file_id": file_id, "collection": collection, "added": 0, "kept": len(desired) - len(added),
+               "removed": 0, "bytes": 0}
+        if removed:
+            self._delete_remote(collection, [state[h] for h in removed])
+            db.forget_ingested(file_id, collection, removed)
+            res["removed"] = len(removed)
+
+        batch_size = max(1, int(self.ctx.config.nooforge.ingest_batch_size or 1))
+        for i in range(0, len(added), batch_size):
+            hashes = added[i:i + batch_size]
+            items = [{
+                "text": desired[h]["chunk_text"],
+                "source_id": f"{source_id}#{h[:16]}",
+                "metadata": {"file_id": file_id, "chunk_index": desired[h]["chunk_index"], "chunk_hash": h},
+            } for h in hashes]
+            remote_ids = self._send_items(collection, items)
+            db.record_ingested(file_id, collection, [
+                (h, it["source_id"], rid) for h, it, rid in zip(hashes, items, remote_ids)])
+            res["added"] += len(items)
+            res["bytes"] += sum(len(it["text"].encode("utf-8")) for it in items)
+        log.info("INGEST DELTA file_id=%s → %s | +%d ~%d -%d | bytes=%d", file_id, collection,
+                 res["added"], res["kept"], res["removed"], res["bytes"])
+        return res
+
+    def sync_collection(self, collection: Optional[str] = None, all_files: bool = False) -> Tuple[str, str]:
+        """
+        Синхронизировать всю коллекцию: файлы, уже отправленные в неё (удалённые локально — удаляются
+        и в Refiner), а при all_files — и все обработанные, ещё не отправленные.
+        """
+        collection = collection or (self.ctx.config.nooforge.default_collection or "chunks")
+        ids = set(self.ctx.db.get_ingested_file_ids(collection))
+        if all_files:
+            ids.update(self.ctx.db.get_completed_file_ids())
+        results, t0 = [], time.perf_counter()
+        for fid in sorted(ids):
+            try:
+                results.append(self.sync_file(fid, collection))
+            except RefinerError as e:
+                log.error("SYNC %s file_id=%s | status=%d | body=%s", collection, fid, e.status, e.body)
+                return (f"❌ Refiner вернул {e.status} (файл {fid}); синхронизировано файлов: {len(results)}",
+                        self._sync_md(results) + f"\n\nТело ответа:\n\n{e.body}")
+            except Exception as e:
+                log.exception("SYNC %s exception", collection)
+                return f"❌ Ошибка синхронизации (файл {fid}): {e}", self._sync_md(results)
+        return (f"✅ Коллекция «{collection}» синхронизирована за {time.perf_counter() - t0:.1f} с",
+                self._sync_md(results))
+
+    def _post(self, path: str, payload: Dict):
+        url = self.ctx.join_url(self.ctx.config.nooforge.base_url, path)
+        return self._http().post(url, data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                                 headers=self.ctx.headers_refiner(), timeout=self._timeout)
+
+    @staticmethod
+    def _json(r) -> Dict:
+        try:
+            data = r.json()
+        except Exception:
+            return {}
+        return data if isinstance(data, dict) else {"items": data}
+
+    @staticmethod
+    def _remote_id(item: Any) -> Optional[str]:
+        if isinstance(item, dict):
+            item = item.get("id") or item.get("document_id") or item.get("doc_id")
+        return str(item) if item is not None else None
+
+    def _send_items(self, collection: str, items: List[Dict]) -> List[Optional[str]]:
+        """Отправить пачку чанков → id документов Refiner (None — если Refiner их не вернул)"""
+        cfg = self.ctx.config.nooforge
+        if self._batch_supported is not False:
+            r = self._post(cfg.ingest_batch_path, {"collection": collection, "items": items})
+            if r.status_code in (404, 405):
+                log.warning("INGEST BATCH %s не поддерживается (%d) — чанки по одному",
+                            cfg.ingest_batch_path, r.status_code)
+                self._batch_supported = False
+            elif r.status_code // 100 != 2:
+                raise RefinerError(r.status_code, r.text)
+            else:
+                self._batch_supported = True
+                data = self._json(r)
+                ids = data.get("ids") or data.get("items") or data.get("results") or []
+                ids = [self._remote_id(x) for x in ids]
+                return ids + [None] * (len(items) - len(ids)) if len(ids) < len(items) else ids[:len(items)]
+        out = []
+        for it in items:
+            r = self._post(cfg.ingest_text_path, {"text": it["text"], "source_id": it["source_id"],
+                                                  "collection": collection})
+            if r.status_code // 100 != 2:
+                raise RefinerError(r.status_code, r.text)
+            out.append(self._remote_id(self._json(r)))
+        return out
+
+    def _delete_remote(self, collection: str, rows: List[Dict]):
+        """Удалить документы из коллекции по id Refiner (и source_id — если id не было)"""
+        r = self._post(self.ctx.config.nooforge.delete_path, {
+            "collection": collection,
+            "ids": [row["remote_id"] for row in rows if row["remote_id"]],
+            "source_ids": [row["source_id"] for row in rows],
+        })
+        if r.status_code // 100 != 2:
+            raise RefinerError(r.status_code, r.text)
+
+    @staticmethod
+    def _sync_md(results: List[Dict]) -> str:
+        if not results:
+            return "ℹ️ Нечего синхронизировать"
+        lines = ["| file_id | отправлено | без изменений | удалено | байт |", "|---|---|---|---|---|"]
+        for r in results:
+            lines.append(f"| {r['file_id']} | {r['added']} | {r['kept']} | {r['removed']} | {r['bytes']} |")
+        if len(results) > 1:
+            lines.append(f"| **всего** | {sum(r['added'] for r in results)} | {sum(r['kept'] for r in results)} "
+                         f"| {sum(r['removed'] for r in results)} | {sum(r['bytes'] for r in results)} |")
+        return "\n".join(lines)
+
     def ingest_file_direct(self, file, source_id, collection):
         if file is None:
             return "⚠️ Файл не выбран", ""
@@ -66,8 +268,8 @@ class RefinerModule:
         log.info("INGEST FILE → %s | file=%s | source_id=%s | collection=%s",
                  url, filename, data["source_id"], data["collection"])
         try:
-            resp = requests.post(url, headers=headers,
-                                 files=files, data=data, timeout=300)
+            resp = self._http().post(url, headers=headers, files=files, data=data,
+                                     timeout=max(self._timeout, 300))
         finally:
             try:
                 files["file"][1].close()
@@ -106,8 +308,9 @@ class RefinerModule:
         payload_q["q"] = question.strip()
         log.info("RAG QUERY (try=q) → %s | payload=%s", url,
                  json.dumps(payload_q, ensure_ascii=False))
-        r = requests.post(url, data=json.dumps(payload_q),
-                          headers=headers, timeout=120)
+        http = self._http()
+        r = http.post(url, data=json.dumps(payload_q),
+                      headers=headers, timeout=self._timeout)
         if r.status_code // 100 != 2:
             body = r.text
             log.error("RAG QUERY ERROR (try=q) POST → %s | status=%d | body=%s",
@@ -120,8 +323,8 @@ class RefinerModule:
                 payload_query["query"] = question.strip()
                 log.info("RAG QUERY RETRY (try=query) → %s | payload=%s",
                          url, json.dumps(payload_query, ensure_ascii=False))
-                r2 = requests.post(url, data=json.dumps(
-                    payload_query), headers=headers, timeout=120)
+                r2 = http.post(url, data=json.dumps(
+                    payload_query), headers=headers, timeout=self._timeout)
                 if r2.status_code // 100 != 2:
                     log.error(
                         "RAG QUERY ERROR (try=query) POST → %s | status=%d | body=%s", url, r2.status_code, r2.text)
@@ -18,8 +18,9 @@ class SearchModule:
             for i, r in enumerate(res, 1):
                 date = str(r["created_at"])[:19]
                 preview = (r["text_preview"] or "")[:200]
+                tier = " 📝 черновик" if r.get("quality_tier") == "draft" else ""
                 out.append(
-                    f"**{i}. {r['filename']}**\n📅 {date}\n📄 {preview}…\n\n---")
+                    f"**{i}. {r['filename']}**{tier}\n📅 {date}\n📄 {preview}…\n\n---")
             return "\n\n".join(out)
         except Exception as e:
             return f"❌ Ошибка поиска: {e}"
@@ -41,7 +41,8 @@ class SettingsModule:
             return True, f"✅ Модель найдена: {path}\n💾 {total_mb:.1f} MB\n📁 {', '.join(p.name for p in pts)}"
 
     # ---- update sections ----
-    def update_settings(self, use_faster, model_name, model_path, device, use_vad, chunk_size, chunk_overlap) -> str:
+    def update_settings(self, use_faster, model_name, model_path, device, use_vad, chunk_size, chunk_overlap,
+                        profile=None) -> str:
         if model_path and model_path.strip():
             ok, vmsg = self.validate_model_path(model_path, use_faster)
             if not ok:
@@ -51,23 +52,29 @@ class SettingsModule:
             model_path_value = None
             vmsg = "ℹ️ Модель будет загружена автоматически при первом использовании"
 
+        old_chunking = (self.ctx.config.chunker.chunk_size, self.ctx.config.chunker.chunk_overlap)
         update_config(**{
             "transcriber.use_faster_whisper": use_faster,
             "transcriber.model_name": model_name,
             "transcriber.model_path": model_path_value,
             "transcriber.device": device,
             "transcriber.use_vad": use_vad,
+            "transcriber.profile": profile or self.ctx.config.transcriber.profile,
             "chunker.chunk_size": chunk_size,
             "chunker.chunk_overlap": chunk_overlap,
         })
 
         # Сбросить инстансы и перечитать конфиг корректно
-        self.ctx.transcriber_loaded = False
-        self.ctx.transcriber = None
+        self.ctx.reset_transcribers()
         self.ctx.chunker = self.ctx.chunker.__class__()  # перезагрузка chunker
         # <-- просто перечитываем конфиг без тернарных фокусов
         self.ctx.config = get_config()
 
+        # старые транскрипты перенарезаются в фоне (без повторной транскрибации)
+        rechunk_msg = ""
+        if (int(chunk_size), int(chunk_overlap)) != tuple(map(int, old_chunking)):
+            rechunk_msg = "\n\n" + self.ctx.rechunk.start()
+
         msg = (
             "✅ **Настройки сохранены**\n\n"
             "💾 ./data/config.json\n"
@@ -76,9 +83,10 @@ class SettingsModule:
             f"- Модель: {model_name}\n"
             f"- Устройство: {device.upper()}\n"
             f"- VAD: {'✓' if use_vad else '✗'}\n"
+            f"- Профиль декодирования: {profile or self.ctx.config.transcriber.profile}\n"
             f"- Чанк: {chunk_size} символов\n"
             f"- Перекрытие: {chunk_overlap} символов\n\n"
-            f"{vmsg}"
+            f"{vmsg}{rechunk_msg}"
         )
         return msg
 
@@ -95,13 +103,27 @@ class SettingsModule:
         self.ctx.config = get_config()
         return "✅ Настройки NooForge-Refiner сохранены"
 
+    def profile_rtf_md(self) -> str:
+        """Сравнение профилей декодирования: RTF (время распознавания / длительность аудио)"""
+        rows = self.ctx.db.get_profile_rtf_stats()
+        if not rows:
+            return "⚡ RTF по профилям: пока нет транскриптов с замером"
+        lines = ["⚡ **RTF по профилям** (меньше — быстрее)\n",
+                 "| Профиль | Модель | Файлов | Аудио, мин | RTF ср. | мин | макс |",
+                 "|---|---|---|---|---|---|---|"]
+        for r in rows:
+            lines.append(f"| {r['profile'] or '—'} | {r['model']} | {r['transcripts']} | "
+                         f"{(r['audio_seconds'] or 0) / 60:.1f} | {r['avg_rtf']:.3f} | "
+                         f"{r['min_rtf']:.3f} | {r['max_rtf']:.3f} |")
+        return "\n".join(lines)
+
     def save_all_settings(self, *args):
         (
-            use_faster, model_name, model_path, device, use_vad, chunk_size, chunk_overlap,
+            use_faster, model_name, model_path, device, use_vad, profile, chunk_size, chunk_overlap,
             base_url, api_key, ingest_text_path, ingest_file_path, rag_query_path, default_collection
         ) = args
         local_msg = self.update_settings(
-            use_faster, model_name, model_path, device, use_vad, chunk_size, chunk_overlap)
+            use_faster, model_name, model_path, device, use_vad, chunk_size, chunk_overlap, profile)
         ref_msg = self.update_refiner_settings(
             base_url, api_key, ingest_text_path, ingest_file_path, rag_query_path, default_collection)
         return f"{local_msg}\n\n{ref_msg}"
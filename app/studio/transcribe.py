@@ -2,128 +2,633 @@
 from __future__ import annotations
 import logging
 import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime
-import gradio as gr
+from typing import Any, Dict, List, Optional, Tuple
+from app import tracing
+from app.lanes import get_lanes
+from app.media import MediaInfo, content_hash, probe_media
+from app.pipeline import Pipeline
+from app.vad import get_speech_map
 from .common import StudioContext
 
 log = logging.getLogger("whisper_rag_studio")
 
+PREVIEW_CHARS = 500  # transcripts.text_preview
+UI_PREVIEW_CHARS = 20000  # столько текста уходит в Textbox; полный — файлом для скачивания
+SPOOL_SEGMENTS = 200  # сегментов в памяти до сброса в контрольную точку
+PROBE_CACHE = 1000  # результатов probe, ждущих claim_file
+
+
+def _noop_progress(*_args, **_kwargs):
+    pass
+
+
+class _TranscriptSink:
+    """
+    Приёмник сегментов прохода: текст сразу дописывается в pack (TranscriptWriter), слова
+    считаются на лету, в памяти остаётся только начало текста для превью.
+    checkpoint — (file_id, model) контрольной точки, где лежат сегменты прохода.
+    """
+
+    def __init__(self, store, checkpoint: Optional[Tuple[int, str]] = None):
+        self.checkpoint = checkpoint
+        self.segments = 0
+        self.word_count = 0
+        self.truncated = False
+        self._writer = store.writer()
+        self._preview: List[str] = []
+        self._preview_len = 0
+        self._write_time = 0.0
+        self._write_start: Optional[float] = None
+
+    def add(self, text: str):
+        piece = f"\n{text}" if self.segments else text  # как "\n".join(сегменты)
+        if self._write_start is None:
+            self._write_start = tracing.now()
+        t0 = time.perf_counter()
+        self._writer.write(piece)
+        self._write_time += time.perf_counter() - t0
+        self.segments += 1
+        self.word_count += len(text.split())
+        room = UI_PREVIEW_CHARS - self._preview_len
+        if room > 0:
+            self._preview.append(piece[:room])
+            self._preview_len += min(room, len(piece))
+        if len(piece) > room:
+            self.truncated = True
+
+    @property
+    def preview(self) -> str:
+        return "".join(self._preview)
+
+    def close(self) -> Tuple[List[Dict], int]:
+        t0 = time.perf_counter()
+        blocks, size = self._writer.close()
+        self._write_time += time.perf_counter() - t0
+        tracing.add_total("store_write", self._write_start or tracing.now(), self._write_time,
+                          bytes=size, blocks=len(blocks))
+        return blocks, size
+
+
+class _TimedChunks:
+    """Чанки из генератора нарезки: число и время нарезки (этап chunk в трассе)"""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.count = 0
+
+    def __iter__(self):
+        start, spent = tracing.now(), 0.0
+        it = iter(self._chunks)
+        while True:
+            t0 = time.perf_counter()
+            chunk = next(it, None)
+            spent += time.perf_counter() - t0
+            if chunk is None:
+                break
+            self.count += 1
+            yield chunk
+        tracing.add_total("chunk", start, spent, chunks=self.count)
+
 
 class TranscribeModule:
     def __init__(self, ctx: StudioContext):
         self.ctx = ctx
+        # фоновое уточнение черновиков (two_pass): file_id в очереди, один поток
+        self._refine_q: "queue.Queue[int]" = queue.Queue()
+        self._refine_pending: set = set()
+        self._refine_lock = threading.Lock()
+        self._refine_thread: Optional[threading.Thread] = None
+        # file_id, которые сейчас распознаются в этом процессе (строку с тем же
+        # содержимым можно переиспользовать, только если её никто не обрабатывает)
+        self._active: set = set()
+        self._active_lock = threading.Lock()
+        # параметры медиа с постановки в очередь (путь → MediaInfo), в files пишет claim_file
+        self._probes: "OrderedDict[str, Optional[MediaInfo]]" = OrderedDict()
+        # пакетная обработка (API, папки): decode → asr → write с ограниченными очередями
+        self.pipeline = Pipeline(self)
 
-    def process_file(self, file, progress=gr.Progress()):
+    def process_file(self, file, progress=None):
         if file is None:
-            return "❌ Файл не выбран", "", self.ctx.stats_md()
+            return "❌ Файл не выбран", "", self.ctx.stats_md(), None
 
         try:
-            progress(0, desc="Подготовка…")
-            self.ctx.ensure_transcriber()
+            with tracing.trace("ui", self.ctx.db):
+                res = self.transcribe_path(Path(file.name), progress=progress)
+            file_path, meta = Path(file.name), res["meta"]
+            # в браузер — только начало текста, полный транскрипт — файлом
+            preview = res["preview"]
+            if res["preview_truncated"]:
+                preview += "\n\n… показано начало транскрипта, полный текст — в файле для скачивания"
+            download = self._export_transcript(res["transcript_id"], file_path.stem)
+            if res["existing"]:
+                tr = res["transcript"]
+                msg = (
+                    "⚠️ **Файл уже обработан ранее**\n\n"
+                    f"📄 {file_path.name}\n"
+                    f"- Слов: {tr['word_count']}\n- Длительность: {tr['duration_seconds']:.1f} сек\n"
+                    f"- Язык: {tr['language']}\n"
+                    "💡 Показан существующий транскрипт."
+                )
+                return msg, preview, self.ctx.stats_md(), download
 
-            file_path = Path(file.name)
-            file_size = os.path.getsize(file_path)
+            msg = (
+                "✅ **Файл обработан**\n\n"
+                f"📄 {file_path.name}\n"
+                f"- Длительность: {meta.get('duration', 0):.1f} сек\n"
+                f"- Слов: {res['word_count']}\n"
+                f"- Сегментов: {meta.get('total_segments', 0)}\n"
+                f"- Отфильтровано: {meta.get('filtered_segments', 0)}\n"
+                f"- Чанков: {res['chunks']}\n"
+                f"🎯 Модель: {meta.get('model', 'unknown')}, 🌍 {meta.get('language', 'ru')}"
+            )
+            if meta.get("rtf") is not None:
+                msg += f"\n⚡ Профиль: {meta.get('profile')}, RTF {meta['rtf']:.3f}"
+            if meta.get("no_speech"):
+                msg += "\n\n🔇 Речь не найдена (VAD) — Whisper не запускался."
+            elif meta.get("speech_ratio") is not None:
+                msg += f"\n🗣 Речь: {meta['speech_ratio'] * 100:.0f}% записи"
+            if res["quality_tier"] == "draft":
+                msg += (f"\n\n📝 Это черновик. Уточнение моделью {self.ctx.config.transcriber.model_name} "
+                        "идёт в фоне и заменит его автоматически.")
+            return msg, preview, self.ctx.stats_md(), download
+        except sqlite3.IntegrityError:
+            return ("❌ Этот файл уже обрабатывается или был обработан. Обновите страницу.", "",
+                    self.ctx.stats_md(), None)
+        except Exception as e:
+            log.exception("process_file failed")
+            return f"❌ Ошибка обработки: {e}", "", self.ctx.stats_md(), None
+
+    def _export_transcript(self, transcript_id: Optional[int], stem: str) -> Optional[str]:
+        """Полный текст в <каталог БД>/exports/ порциями из pack → путь для gr.File"""
+        if transcript_id is None:
+            return None
+        out = Path(self.ctx.config.database.db_path).parent / "exports" / f"{stem}_transcript.txt"
+        out.parent.mkdir(parents=True, exist_ok=True)
+        return str(out) if self.ctx.store.export_text(transcript_id, out) is not None else None
+
+    def transcribe_path(self, file_path, progress=None, model_name: Optional[str] = None,
+                        file_hash: Optional[str] = None, segment_callback=None,
+                        profile: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Транскрибация файла по пути без привязки к UI (используется UI, наблюдателем папок и API).
+        segment_callback получает сегменты по мере распознавания.
+        profile — профиль декодирования (None — transcriber.profile).
+
+        Текст в память целиком не собирается: сегменты сразу пишутся в хранилище транскриптов.
+
+        Returns:
+            dict: file_id, transcript_id, word_count, meta, chunks (число чанков),
+                  preview (начало текста, до UI_PREVIEW_CHARS), preview_truncated,
+                  existing (True — файл уже был обработан, возвращён готовый транскрипт),
+                  transcript (строка transcripts для existing),
+                  quality_tier (draft — черновик, окончательный будет в фоне)
+        """
+        # трасса задачи — если вызывающий (API, наблюдатель папок, UI) не открыл свою
+        with tracing.trace("transcribe", self.ctx.db):
+            state = self.recognize(file_path, progress, model_name, file_hash, segment_callback, profile)
+            return self.persist(state)
 
-            # upsert file row
-            import sqlite3
+    def recognize(self, file_path, progress=None, model_name: Optional[str] = None,
+                  file_hash: Optional[str] = None, segment_callback=None,
+                  profile: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Первая половина transcribe_path — хэш, строка files, VAD и распознавание (этап asr
+        конвейера, app.pipeline) → состояние для persist. Уже обработанный файл — готовый
+        результат в state["result"].
+        """
+        progress = progress or _noop_progress
+        file_path = Path(file_path)
+        progress(0, desc="Подготовка…")
+
+        if not file_hash:
+            with tracing.span("hash", bytes=os.path.getsize(file_path)):
+                file_hash = content_hash(file_path)
+        claim = self.claim_file(file_path, file_hash)
+        if "result" in claim:
+            return claim
+        file_id = claim["file_id"]
+        try:
+            tcfg = self.ctx.config.transcriber
+            two_pass = (tcfg.two_pass and not model_name and tcfg.draft_model_name
+                        and tcfg.draft_model_name != tcfg.model_name)
+            tier = "draft" if two_pass else "final"
             try:
-                cur = self.ctx.db.conn.execute(
-                    "SELECT id, status FROM files WHERE filepath = ?", (str(file_path),))
-                row = cur.fetchone()
-                if row:
-                    file_id, status = row
-                    if status == "completed":
-                        tr = self.ctx.db.get_transcript_by_file_id(file_id)
-                        if tr and Path(tr["transcript_path"]).exists():
-                            full = Path(tr["transcript_path"]).read_text(
-                                encoding="utf-8")
-                            msg = (
-                                "⚠️ **Файл уже обработан ранее**\n\n"
-                                f"📄 {file_path.name}\n"
-                                f"- Слов: {tr['word_count']}\n- Длительность: {tr['duration_seconds']:.1f} сек\n"
-                                f"- Язык: {tr['language']}\n"
-                                "💡 Показан существующий транскрипт."
-                            )
-                            return msg, full, self.ctx.stats_md()
-                    self.ctx.db.update_file_status(file_id, "processing")
+                progress(0.02, desc="Поиск речи (VAD)…")
+                with tracing.span("vad") as sp:
+                    speech = get_speech_map(self.ctx.db, file_path, file_hash)
+                    if sp is not None and speech is not None:
+                        sp.attrs["speech_ratio"] = round(speech.speech_ratio, 3)
+                if speech is not None and speech.speech_seconds < tcfg.vad_min_speech:
+                    # музыка/тишина: Whisper не загружается, пустой транскрипт окончательный
+                    two_pass, tier = False, "final"
+                    sink = _TranscriptSink(self.ctx.store)
+                    meta = {"duration": speech.duration, "language": tcfg.language, "model": "vad",
+                            "total_segments": 0, "filtered_segments": 0,
+                            "speech_ratio": round(speech.speech_ratio, 4), "no_speech": True}
                 else:
-                    file_id = self.ctx.db.add_file(
-                        filename=file_path.name,
-                        filepath=str(file_path),
-                        file_type=file_path.suffix,
-                        file_size=file_size,
-                    )
-                    self.ctx.db.update_file_status(file_id, "processing")
-            except sqlite3.IntegrityError:
-                return "❌ Этот файл уже обрабатывается или был обработан. Обновите страницу.", "", self.ctx.stats_md()
-
-            # transcribe
-            def cb(v, d): progress(v, desc=d)
-            full_text, meta = self.ctx.transcriber.transcribe_file(
-                str(file_path), progress_callback=cb)
-
-            # save transcript
-            tr_path = Path(self.ctx.config.database.transcripts_dir) / \
-                f"{file_id}_{file_path.stem}.txt"
-            tr_path.write_text(full_text, encoding="utf-8")
-
-            tr_id = self.ctx.db.add_transcript(
+                    model = tcfg.draft_model_name if two_pass else model_name
+                    with tracing.span("model_load", model=model or tcfg.model_name):
+                        transcriber = self.ctx.get_transcriber(model)
+                    sink, meta = self._run_pass(
+                        transcriber, file_id, file_path, file_hash, progress, segment_callback, speech,
+                        profile)
+            except Exception as e:
+                self.ctx.db.update_file_status(file_id, "failed", str(e))
+                raise
+        except BaseException:
+            self.release_file(file_id)
+            raise
+        return {"file_id": file_id, "sink": sink, "meta": meta, "tier": tier, "two_pass": two_pass,
+                "progress": progress}
+
+    def claim_file(self, file_path: Path, file_hash: str) -> Dict[str, Any]:
+        """
+        Строка files под распознавание: тот же путь или то же содержимое → та же строка (после
+        сбоя — продолжение с контрольной точки), статус processing, файл занят в этом процессе
+        до persist/release_file → {"file_id": ...}. Уже обработанный — {"result": ...}.
+        """
+        file_size = os.path.getsize(file_path)
+        # upsert file row (тот же путь с тем же содержимым или то же содержимое → уже обработан).
+        # По тому же пути другое содержимое (файл перезаписан) — распознаём заново в ту же строку
+        # (filepath уникален), persist заменит прежний транскрипт
+        path_row = self.ctx.db.get_file_by_path(str(file_path))
+        rewritten = bool(path_row and path_row["content_hash"] and path_row["content_hash"] != file_hash)
+        row = path_row if path_row and not rewritten else self.ctx.db.get_file_by_hash(file_hash)
+        if row and row["status"] == "completed":
+            tracing.set_file(row["id"])
+            tr = self.ctx.db.get_transcript_by_file_id(row["id"])
+            total = self.ctx.store.size(tr["id"]) if tr else None
+            if total is not None:
+                if tr["quality_tier"] == "draft":
+                    self.schedule_refine(row["id"])  # например, после перезапуска
+                head = self.ctx.store.read_text_range(tr["id"], 0, UI_PREVIEW_CHARS * 4) or ""
+                return {"result": {
+                    "file_id": row["id"], "transcript_id": tr["id"], "preview": head[:UI_PREVIEW_CHARS],
+                    "preview_truncated": total > len(head[:UI_PREVIEW_CHARS].encode("utf-8")),
+                    "word_count": tr["word_count"], "meta": {}, "chunks": 0,
+                    "existing": True, "transcript": tr, "quality_tier": tr["quality_tier"],
+                }}
+        with self._active_lock:
+            if rewritten:
+                file_id = path_row["id"]
+            elif row and (row["filepath"] == str(file_path) or row["id"] not in self._active):
+                # тот же путь, либо то же содержимое после сбоя/ошибки (например, повторная
+                # загрузка через UI — путь временный): продолжаем с контрольной точки этой строки
+                file_id = row["id"]
+                if row["filepath"] != str(file_path):
+                    self.ctx.db.update_file_path(file_id, str(file_path), file_path.name)
+            else:
+                file_id = self.ctx.db.add_file(
+                    filename=file_path.name,
+                    filepath=str(file_path),
+                    file_type=file_path.suffix,
+                    file_size=file_size,
+                )
+            self._active.add(file_id)
+        tracing.set_file(file_id)
+        try:
+            if rewritten:
+                # сегменты прерванного прохода прежнего содержимого к новому не относятся
+                self.ctx.db.clear_checkpoints(file_id)
+                log.info("FILE file_id=%s: %s перезаписан — распознаётся заново", file_id, file_path.name)
+            self.ctx.db.set_file_hash(file_id, file_hash, file_size if rewritten else None)
+            self.ctx.db.update_file_status(file_id, "processing")
+            with self._active_lock:
+                probed = str(file_path) in self._probes
+                info = self._probes.pop(str(file_path), None)
+            if not probed:
+                info = probe_media(file_path)
+            if info is not None:
+                self.ctx.db.set_media_info(file_id, *info)
+        except BaseException:
+            self.release_file(file_id)
+            raise
+        return {"file_id": file_id}
+
+    # ---- оценка длительности задач (порядок полосы heavy) ----
+    def probe(self, file_path) -> Optional[MediaInfo]:
+        """Длительность, кодек и каналы файла при постановке в очередь (claim_file сохранит их в files)"""
+        key = str(file_path)
+        with self._active_lock:
+            if key in self._probes:
+                return self._probes[key]
+        try:
+            info = probe_media(file_path)
+        except OSError:
+            info = None
+        with self._active_lock:
+            self._probes[key] = info
+            while len(self._probes) > PROBE_CACHE:
+                self._probes.popitem(last=False)
+        return info
+
+    def expected_seconds(self, duration: Optional[float], profile: Optional[str] = None,
+                         model_name: Optional[str] = None) -> Optional[float]:
+        """Ожидаемое время распознавания: длительность × RTF из истории (профиль, модель); None — неизвестно"""
+        if not duration:
+            return None
+        tcfg = self.ctx.config.transcriber
+        rtf = self.ctx.db.get_expected_rtf(profile or tcfg.profile, model_name or tcfg.model_name)
+        return duration * (rtf if rtf is not None else self.ctx.config.lanes.sjf_default_rtf)
+
+    def queue_cost(self, file_path, profile: Optional[str] = None,
+                   model_name: Optional[str] = None) -> Optional[float]:
+        """Оценка задачи для Lane.enter(cost=...) по probe файла"""
+        info = self.probe(file_path)
+        return self.expected_seconds(info.duration if info else None, profile, model_name)
+
+    def release_file(self, file_id: int):
+        """Файл больше не распознаётся этим процессом (см. claim_file)"""
+        with self._active_lock:
+            self._active.discard(file_id)
+
+    def persist(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Вторая половина transcribe_path (этап write): чанки, строки БД, статус → результат"""
+        if "result" in state:
+            return state["result"]
+        file_id, sink, meta, tier = state["file_id"], state["sink"], state["meta"], state["tier"]
+        try:
+            try:
+                state["progress"](0.9, desc="Нарезка на чанки…")
+                # у строки уже есть транскрипт — файл перезаписан по тому же пути: заменяем
+                old = self.ctx.db.get_transcript_by_file_id(file_id)
+                tr_id, chunks = self._save_transcript(file_id, sink, meta, tier,
+                                                      replace_id=old["id"] if old else None)
+                if sink.checkpoint is not None:
+                    self.ctx.db.clear_checkpoints(*sink.checkpoint)
+                self.ctx.db.update_file_status(file_id, "completed")
+            except Exception as e:
+                self.ctx.db.update_file_status(file_id, "failed", str(e))
+                raise
+        finally:
+            self.release_file(file_id)
+
+        if state["two_pass"]:
+            self.schedule_refine(file_id)
+
+        return {
+            "file_id": file_id, "transcript_id": tr_id, "preview": sink.preview,
+            "preview_truncated": sink.truncated, "word_count": sink.word_count, "meta": meta, "chunks": chunks,
+            "existing": False, "transcript": None, "quality_tier": tier,
+        }
+
+    def persist_checkpoint(self, file_id: int, model: str, meta: Dict[str, Any], progress=None) -> Dict[str, Any]:
+        """
+        Транскрипт из сегментов контрольной точки (file_id, model) — их прислал удалённый
+        воркер (app.coordinator) → результат как у transcribe_path. Файл занят claim_file.
+        """
+        sink = _TranscriptSink(self.ctx.store, checkpoint=(file_id, model))
+        try:
+            for seg in self.ctx.db.iter_checkpoint_segments(file_id, model):
+                sink.add(seg["text"])
+        except BaseException:
+            self.release_file(file_id)
+            raise
+        meta["total_segments"] = max(meta.get("total_segments", 0), sink.segments)
+        return self.persist({"file_id": file_id, "sink": sink, "meta": meta, "tier": "final",
+                             "two_pass": False, "progress": progress or _noop_progress})
+
+    @staticmethod
+    def _checkpoint_model(transcriber) -> str:
+        return transcriber.config.model_name
+
+    def _run_pass(self, transcriber, file_id: int, file_path: Path, file_hash: Optional[str], progress,
+                  segment_callback=None, speech=None,
+                  profile: Optional[str] = None) -> Tuple[_TranscriptSink, Dict]:
+        """
+        Один проход распознавания → (приёмник с текстом в pack, meta); speech — карта речи (app.vad),
+        profile — профиль декодирования.
+
+        Сегменты копятся не в памяти, а в контрольной точке: сбрасываются раз в
+        transcriber.checkpoint_interval сек и не реже чем через SPOOL_SEGMENTS сегментов,
+        в segments их копирует _save_transcript. Если от прошлого (прерванного) прохода той же
+        модели они остались — распознаётся только хвост после последнего сохранённого сегмента
+        (checkpoint_interval = 0 — без продолжения, точка прошлого прохода сбрасывается).
+        """
+        interval = self.ctx.config.transcriber.checkpoint_interval
+        model = self._checkpoint_model(transcriber)
+        sink = _TranscriptSink(self.ctx.store, checkpoint=(file_id, model))
+        tail: Optional[Dict] = None  # последний сегмент прошлого прохода
+        if interval > 0:
+            for seg in self.ctx.db.iter_checkpoint_segments(file_id, model):
+                sink.add(seg["text"])
+                tail = seg
+                if segment_callback:
+                    segment_callback(seg)
+        else:
+            self.ctx.db.clear_checkpoints(file_id, model)
+        resume_at = tail["end"] if tail else 0.0
+        n_resumed = sink.segments
+        if tail:
+            log.info("CHECKPOINT file_id=%s: продолжение с %.1f сек (%d сегментов, %s)",
+                     file_id, resume_at, n_resumed, model)
+        pending: List[Dict] = []
+        last_flush = time.monotonic()
+
+        def flush():
+            nonlocal last_flush
+            if pending:
+                self.ctx.db.add_checkpoint_segments(file_id, model, pending)
+                pending.clear()
+            last_flush = time.monotonic()
+
+        def on_segment(seg):
+            if resume_at:
+                # граничный сегмент мог попасть в контрольную точку до сбоя
+                if seg["end"] <= resume_at + 0.01:
+                    return
+                if seg["start"] < resume_at + 1.0 and seg["text"].strip() == tail["text"].strip():
+                    return
+            seg = {**seg, "index": sink.segments}
+            sink.add(seg["text"])
+            pending.append(seg)
+            if len(pending) >= SPOOL_SEGMENTS or (interval > 0 and time.monotonic() - last_flush >= interval):
+                flush()
+            if segment_callback:
+                segment_callback(seg)
+
+        def cb(v, d): progress(v, desc=d)
+        try:
+            _, meta = transcriber.transcribe_file(
+                str(file_path), progress_callback=cb, segment_callback=on_segment,
+                file_hash=file_hash, start_offset=resume_at, speech=speech, collect_text=False,
+                profile=profile)
+        except Exception:
+            if interval > 0:
+                flush()  # повтор продолжит с места ошибки
+            raise
+        flush()
+        if resume_at:
+            meta["total_segments"] = meta.get("total_segments", 0) + n_resumed
+        return sink, meta
+
+    def _save_transcript(self, file_id: int, sink: _TranscriptSink, meta: Dict, tier: str,
+                         replace_id: Optional[int] = None) -> Tuple[Optional[int], int]:
+        """
+        Строка/чанки/сегменты — в БД (текст уже в pack) → (id транскрипта, число чанков);
+        replace_id — атомарная замена прежнего транскрипта (черновик, перезаписанный файл). Чанки нарезаются потоком из записанных
+        блоков и пишутся пачками — весь текст в память не поднимается.
+        """
+        blocks, text_bytes = sink.close()
+        # чанки — под chunk_lock: версия нарезки не переключится между нарезкой и записью
+        with self.ctx.chunk_lock:
+            chunks = _TimedChunks(self.ctx.chunker.iter_chunks(self.ctx.store.iter_text(blocks)))
+            transcript = dict(
                 file_id=file_id,
-                transcript_path=str(tr_path),
-                text_preview=full_text[:500],
-                word_count=len(full_text.split()),
+                transcript_path=None,
+                text_preview=sink.preview[:PREVIEW_CHARS],
+                word_count=sink.word_count,
                 duration_seconds=meta.get("duration", 0),
                 language=meta.get("language", "ru"),
                 model_used=meta.get("model", "unknown"),
+                blocks=blocks,
+                text_bytes=text_bytes,
+                quality_tier=tier,
+                decode_profile=meta.get("profile"),
+                rtf=meta.get("rtf"),
             )
+            with tracing.span("db_write", segments=sink.segments):
+                if replace_id is not None:
+                    new_id = self.ctx.db.replace_transcript(replace_id, chunks, [],
+                                                            from_checkpoint=sink.checkpoint, **transcript)
+                    return new_id, chunks.count
+                tr_id = self.ctx.db.add_transcript(**transcript)
+                self.ctx.db.add_segments(tr_id, [], from_checkpoint=sink.checkpoint)
+                n_chunks = self.ctx.db.add_chunks(tr_id, chunks)
+        return tr_id, n_chunks
 
-            progress(0.9, desc="Нарезка на чанки…")
-            chunks = self.ctx.chunker.chunk_text(full_text)
-            self.ctx.db.add_chunks(tr_id, chunks)
+    # ---- two-pass: уточнение черновиков в фоне ----
+    def schedule_refine(self, file_id: int):
+        """Поставить черновик файла на уточнение основной моделью (повторно не ставится)"""
+        with self._refine_lock:
+            if file_id in self._refine_pending:
+                return
+            self._refine_pending.add(file_id)
+            if self._refine_thread is None or not self._refine_thread.is_alive():
+                self._refine_thread = threading.Thread(
+                    target=self._refine_loop, name="refine-drafts", daemon=True)
+                self._refine_thread.start()
+        self._refine_q.put(file_id)
 
-            self.ctx.db.update_file_status(file_id, "completed")
+    def resume_refines(self):
+        """Черновики, не уточнённые до перезапуска"""
+        for d in self.ctx.db.get_draft_transcripts():
+            self.schedule_refine(d["file_id"])
 
-            msg = (
-                "✅ **Файл обработан**\n\n"
-                f"📄 {file_path.name}\n"
-                f"- Длительность: {meta.get('duration', 0):.1f} сек\n"
-                f"- Слов: {len(full_text.split())}\n"
-                f"- Сегментов: {meta.get('total_segments', 0)}\n"
-                f"- Отфильтровано: {meta.get('filtered_segments', 0)}\n"
-                f"- Чанков: {len(chunks)}\n"
-                f"🎯 Модель: {meta.get('model', 'unknown')}, 🌍 {meta.get('language', 'ru')}"
-            )
-            return msg, full_text, self.ctx.stats_md()
-        except Exception as e:
-            log.exception("process_file failed")
-            return f"❌ Ошибка обработки: {e}", "", self.ctx.stats_md()
+    def _refine_loop(self):
+        while True:
+            file_id = self._refine_q.get()
+            try:
+                # та же полоса, что и у пользовательских задач; ждём места сколько нужно
+                fi = self.ctx.db.get_file_by_id(file_id) or {}
+                cost = self.expected_seconds(fi.get("media_duration"))
+                with get_lanes().heavy.slot(session=None, wait_for_room=None, cost=cost), \
+                        tracing.trace("refine", self.ctx.db, file_id=file_id):
+                    self.refine_file(file_id)
+            except Exception:
+                log.exception("REFINE file_id=%s failed", file_id)
+            finally:
+                with self._refine_lock:
+                    self._refine_pending.discard(file_id)
+
+    def refine_file(self, file_id: int) -> Optional[int]:
+        """Распознать основной моделью и заменить черновик → id нового транскрипта"""
+        fi = self.ctx.db.get_file_by_id(file_id)
+        tr = self.ctx.db.get_transcript_by_file_id(file_id)
+        if not fi or not tr or tr["quality_tier"] != "draft":
+            return None
+        path = Path(fi["filepath"])
+        if not path.is_file():
+            log.warning("REFINE file_id=%s: исходный файл недоступен (%s)", file_id, path)
+            return None
+        with tracing.span("model_load", model=self.ctx.config.transcriber.model_name):
+            transcriber = self.ctx.get_transcriber(None)
+        with tracing.span("vad"):
+            speech = get_speech_map(self.ctx.db, path, fi["content_hash"])  # уже посчитана черновиком
+        sink, meta = self._run_pass(
+            transcriber, file_id, path, fi["content_hash"], _noop_progress, speech=speech)
+        new_id, _ = self._save_transcript(file_id, sink, meta, "final", replace_id=tr["id"])
+        self.ctx.db.clear_checkpoints(file_id, self._checkpoint_model(transcriber))
+        log.info("REFINE file_id=%s: транскрипт %s → %s (%s)", file_id, tr["id"], new_id,
+                 meta.get("model", "?"))
+        return new_id
+
+    # ---- продолжение после сбоя ----
+    def resume_interrupted(self):
+        """
+        Файлы, оставшиеся в статусе processing после остановки процесса: доступные
+        распознаются заново с контрольной точки (в полосе транскрибации), остальные — failed.
+        """
+        tcfg = self.ctx.config.transcriber
+        lost, todo = [], []
+        for fi in self.ctx.db.get_all_files(status="processing"):
+            path = Path(fi["filepath"])
+            with self._active_lock:
+                if fi["id"] in self._active:
+                    continue
+            if not path.is_file():
+                lost.append(fi["id"])
+                continue
+            # модель прерванного прохода (наблюдатель папок мог задать свою)
+            models = self.ctx.db.get_checkpoint_models(fi["id"])
+            model = models[0] if models and models[0] not in (tcfg.model_name, tcfg.draft_model_name) else None
+            try:
+                cost = self.expected_seconds(fi.get("media_duration"), model_name=model)
+            except Exception:
+                log.exception("RESUME file_id=%s: оценка длительности", fi["id"])
+                cost = None
+            todo.append((fi, path, model, cost))
+            self.pipeline.prefetch(path, fi["content_hash"], cost)
+        for fi, path, model, cost in todo:
+            try:
+                res = self.pipeline.run(path, get_lanes().heavy.slot(session=None, wait_for_room=None, cost=cost),
+                                        model_name=model, file_hash=fi["content_hash"])
+                log.info("RESUME file_id=%s (%s): готово, транскрипт %s",
+                         fi["id"], fi["filename"], res["transcript_id"])
+            except Exception:
+                log.exception("RESUME file_id=%s failed", fi["id"])
+            finally:
+                self.pipeline.discard(path)  # не дошёл до этапа asr — освободить место prefetch
+        if lost:
+            self.ctx.db.update_files_status(lost, "failed", "Прервано: исходный файл недоступен")
+            log.warning("RESUME: %d прерванных файлов без исходника помечены failed", len(lost))
 
-    def process_text(self, text, progress=gr.Progress()):
+    def process_text(self, text, progress=None):
         if not text or not text.strip():
             return "❌ Текст пустой", self.ctx.stats_md()
+        progress = progress or _noop_progress
         try:
             progress(0.5, desc="Обработка текста…")
             ts = datetime.now().strftime("%Y%m%d_%H%M%S")
             fname = f"text_{ts}.txt"
-            fpath = Path(self.ctx.config.database.transcripts_dir) / fname
-            fpath.write_text(text, encoding="utf-8")
+            blocks, text_bytes = self.ctx.store.pack(text)
 
+            # исходного файла нет — текст живёт только в хранилище
             file_id = self.ctx.db.add_file(
-                filename=fname, filepath=str(fpath), file_type=".txt", file_size=len(text.encode("utf-8"))
-            )
-            tr_id = self.ctx.db.add_transcript(
-                file_id=file_id,
-                transcript_path=str(fpath),
-                text_preview=text[:500],
-                word_count=len(text.split()),
-                duration_seconds=0,
-                language="ru",
-                model_used="manual_input",
+                filename=fname, filepath=f"text://{fname}", file_type=".txt", file_size=text_bytes
             )
-            progress(0.8, desc="Нарезка на чанки…")
-            chunks = self.ctx.chunker.chunk_text(text)
-            self.ctx.db.add_chunks(tr_id, chunks)
+            with self.ctx.chunk_lock:  # см. RechunkModule
+                tr_id = self.ctx.db.add_transcript(
+                    file_id=file_id,
+                    transcript_path=None,
+                    text_preview=text[:500],
+                    word_count=len(text.split()),
+                    duration_seconds=0,
+                    language="ru",
+                    model_used="manual_input",
+                    blocks=blocks,
+                    text_bytes=text_bytes,
+                )
+                progress(0.8, desc="Нарезка на чанки…")
+                chunks = self.ctx.chunker.chunk_text(text)
+                self.ctx.db.add_chunks(tr_id, chunks)
             self.ctx.db.update_file_status(file_id, "completed")
 
             msg = (
@@ -0,0 +1,315 @@
+"""
+Трассировка задач транскрибации: этапы (span) с временем, RSS и CPU.
+
+Трасса открывается на задачу (UI, API, наблюдатель папок, уточнение черновика) и живёт
+в contextvar — этапы отмечаются где угодно ниже по стеку вызовов через `span()`, без
+передачи объекта трассы. Вне трассы `span()` — nullcontext (ничего не стоит).
+Фоновый поток раз в tracing.sample_interval сек снимает RSS и CPU процесса: ряд
+сохраняется вместе с трассой, пик RSS приписывается открытым этапам.
+Трассы пишутся в БД (traces, trace_spans), в UI — водопад по файлу, экспорт — Chrome
+trace JSON (chrome://tracing, ui.perfetto.dev).
+
+    python -m app.tracing list
+    python -m app.tracing export --file-id 12 --out trace.json
+"""
+from __future__ import annotations
+import contextlib
+import html
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.config import get_config
+
+log = logging.getLogger("whisper_rag_studio")
+
+MAX_SAMPLES = 2000  # больше — прореживаем вдвое (длинные записи)
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _rss() -> int:
+    """Текущий RSS процесса, байт (Linux — /proc/self/statm; иначе пик из getrusage)"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE
+    except (OSError, ValueError, IndexError):
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except Exception:
+            return 0
+
+
+def _cpu() -> float:
+    """CPU-время процесса (user + sys), сек"""
+    t = os.times()
+    return t.user + t.system
+
+
+@dataclass
+class Span:
+    name: str
+    start: float  # сек от начала трассы
+    parent: Optional[int] = None
+    duration: float = 0.0
+    rss_start: int = 0
+    rss_end: int = 0
+    rss_peak: int = 0
+    cpu: float = 0.0  # сек CPU процесса за этап
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+
+class Trace:
+    def __init__(self, kind: str, job_id: Optional[str] = None, file_id: Optional[int] = None):
+        self.kind = kind
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self.file_id = file_id
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.t0 = time.perf_counter()
+        self.cpu0 = _cpu()
+        self.duration = 0.0
+        self.spans: List[Span] = []
+        self.samples: List[List[float]] = []  # [t, rss, cpu]
+        self.trace_id: Optional[int] = None
+        self._stack: List[int] = []
+        self._lock = threading.Lock()
+        self._interval = max(0.05, float(get_config().tracing.sample_interval))
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name=f"trace-{self.job_id}", daemon=True)
+        self._sampler.start()
+
+    def _now(self) -> float:
+        return time.perf_counter() - self.t0
+
+    def _sample_loop(self):
+        interval = self._interval
+        while not self._stop.wait(interval):
+            rss, cpu = _rss(), _cpu() - self.cpu0
+            with self._lock:
+                self.samples.append([round(self._now(), 3), rss, round(cpu, 3)])
+                for i in self._stack:
+                    if rss > self.spans[i].rss_peak:
+                        self.spans[i].rss_peak = rss
+                if len(self.samples) > MAX_SAMPLES:
+                    self.samples = self.samples[::2]
+                    interval *= 2
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Span]:
+        rss, cpu = _rss(), _cpu()
+        with self._lock:
+            sp = Span(name, self._now(), self._stack[-1] if self._stack else None,
+                      rss_start=rss, rss_peak=rss, attrs=attrs)
+            self.spans.append(sp)
+            idx = len(self.spans) - 1
+            self._stack.append(idx)
+        try:
+            yield sp
+        except BaseException as e:
+            sp.attrs["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            rss_end = _rss()
+            with self._lock:
+                sp.duration = self._now() - sp.start
+                sp.rss_end = rss_end
+                sp.rss_peak = max(sp.rss_peak, rss_end)
+                sp.cpu = _cpu() - cpu
+                if idx in self._stack:
+                    self._stack.remove(idx)
+
+    def add_span(self, name: str, start: float, duration: float, **attrs):
+        """Этап, измеренный снаружи: start — сек от начала трассы (может быть < 0, например загрузка
+        файла до постановки задачи), либо суммарное время повторяющегося действия"""
+        with self._lock:
+            parent = self._stack[-1] if self._stack else None
+            self.spans.append(Span(name, start, parent, duration, attrs=attrs))
+
+    def finish(self, status: str, error: Optional[str] = None):
+        self._stop.set()
+        self.status, self.error = status, error
+        self.duration = self._now()
+
+    def to_record(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+            order = {id(s): i for i, s in enumerate(spans)}
+            by_old = {i: s for i, s in enumerate(self.spans)}
+            return {
+                "job_id": self.job_id, "kind": self.kind, "file_id": self.file_id,
+                "status": self.status, "error": self.error, "started_at": self.started_at,
+                "duration": self.duration, "samples": list(self.samples),
+                "spans": [{
+                    "index": order[id(s)],
+                    "parent": order[id(by_old[s.parent])] if s.parent is not None else None,
+                    "name": s.name, "start": s.start, "duration": s.duration,
+                    "rss_start": s.rss_start, "rss_end": s.rss_end, "rss_peak": s.rss_peak,
+                    "cpu": s.cpu, "attrs": s.attrs,
+                } for s in spans],
+            }
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+def span(name: str, **attrs):
+    """Этап текущей трассы (вне трассы — пустой контекст)"""
+    tr = _current.get()
+    return tr.span(name, **attrs) if tr is not None else contextlib.nullcontext()
+
+
+def now() -> float:
+    """Сек от начала текущей трассы (вне трассы — 0)"""
+    tr = _current.get()
+    return tr._now() if tr is not None else 0.0
+
+
+def add_total(name: str, start: float, duration: float, **attrs):
+    """Суммарное время действия, повторявшегося внутри этапа (например, фильтр на каждый сегмент)"""
+    tr = _current.get()
+    if tr is not None:
+        tr.add_span(name, start, duration, total=True, **attrs)
+
+
+def set_file(file_id: int):
+    tr = _current.get()
+    if tr is not None:
+        tr.file_id = file_id
+
+
+@contextlib.contextmanager
+def trace(kind: str, db=None, job_id: Optional[str] = None, file_id: Optional[int] = None):
+    """
+    Открыть трассу задачи (если она уже открыта выше по стеку — вложенный вызов
+    пишет в неё же). По выходе трасса сохраняется в db (Database), ошибка записи не мешает задаче.
+    """
+    if _current.get() is not None or not get_config().tracing.enabled:
+        yield _current.get()
+        return
+    tr = Trace(kind, job_id, file_id)
+    token = _current.set(tr)
+    try:
+        yield tr
+    except BaseException as e:
+        tr.finish("failed", f"{type(e).__name__}: {e}")
+        raise
+    else:
+        tr.finish("completed")
+    finally:
+        _current.reset(token)
+        if db is not None:
+            try:
+                tr.trace_id = db.save_trace(tr.to_record(), keep=get_config().tracing.keep)
+            except Exception:
+                log.exception("TRACE %s: не удалось сохранить", tr.job_id)
+
+
+# ---------------------------------------------------------------------------
+# Представление
+# ---------------------------------------------------------------------------
+def _mb(b: int) -> str:
+    return f"{b / 1048576:.0f}"
+
+
+def waterfall_html(record: Optional[Dict[str, Any]]) -> str:
+    """Водопад этапов трассы (Database.get_trace) → HTML для gr.HTML"""
+    if not record:
+        return "<p>ℹ️ Трасс для этого файла нет</p>"
+    spans = record["spans"]
+    lo = min([0.0] + [s["start"] for s in spans])
+    total = max([record["duration"] - lo] + [s["start"] + s["duration"] - lo for s in spans]) or 1e-9
+    depth: Dict[int, int] = {}
+    rows = []
+    for s in spans:
+        d = depth[s["index"]] = depth.get(s["parent"], -1) + 1 if s["parent"] is not None else 0
+        left = (s["start"] - lo) / total * 100
+        width = max(0.3, s["duration"] / total * 100)
+        attrs = ", ".join(f"{k}={v}" for k, v in (s["attrs"] or {}).items())
+        mem = (f"{_mb(s['rss_start'])}→{_mb(s['rss_end'])} (пик {_mb(s['rss_peak'])})"
+               if s["rss_peak"] else "")
+        color = "#e57373" if "error" in (s["attrs"] or {}) else "#64b5f6"
+        rows.append(
+            "<tr>"
+            f"<td style='padding-left:{8 + 14 * d}px;white-space:nowrap'>{html.escape(s['name'])}</td>"
+            f"<td style='text-align:right'>{s['duration'] * 1000:.0f}</td>"
+            f"<td style='width:45%'><div style='position:relative;height:12px'>"
+            f"<div style='position:absolute;left:{left:.2f}%;width:{width:.2f}%;height:12px;"
+            f"background:{color};border-radius:2px'></div></div></td>"
+            f"<td style='white-space:nowrap'>{mem}</td>"
+            f"<td style='text-align:right'>{s['cpu']:.2f}</td>"
+            f"<td style='font-size:85%'>{html.escape(attrs)}</td>"
+            "</tr>")
+    started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record["started_at"]))
+    head = (f"<p><b>{html.escape(record['kind'])}</b> {html.escape(record['job_id'])} · {started} · "
+            f"{record['duration']:.2f} с · {html.escape(record['status'])}"
+            + (f" · {html.escape(record['error'] or '')}" if record.get("error") else "") + "</p>")
+    return (head + "<table style='width:100%;font-size:90%'><tr><th>этап</th><th>мс</th><th></th>"
+            "<th>RSS, МБ</th><th>CPU, с</th><th></th></tr>" + "".join(rows) + "</table>")
+
+
+def chrome_trace(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Трассы → Chrome trace event format (процесс на трассу, этапы — X, RSS/CPU — счётчики)"""
+    events: List[Dict[str, Any]] = []
+    for pid, rec in enumerate(records, 1):
+        base = rec["started_at"] * 1e6
+        events.append({"name": "process_name", "ph": "M", "pid": pid,
+                       "args": {"name": f"{rec['kind']} {rec['job_id']} (file {rec['file_id']})"}})
+        for s in rec["spans"]:
+            events.append({
+                "name": s["name"], "ph": "X", "pid": pid, "tid": 1,
+                "ts": base + s["start"] * 1e6, "dur": s["duration"] * 1e6,
+                "args": dict(s["attrs"] or {}, rss_start_mb=_mb(s["rss_start"]),
+                             rss_peak_mb=_mb(s["rss_peak"]), cpu_s=round(s["cpu"], 3)),
+            })
+        for t, rss, cpu in rec["samples"]:
+            events.append({"name": "rss_mb", "ph": "C", "pid": pid, "ts": base + t * 1e6,
+                           "args": {"rss_mb": round(rss / 1048576, 1)}})
+            events.append({"name": "cpu_s", "ph": "C", "pid": pid, "ts": base + t * 1e6,
+                           "args": {"cpu_s": cpu}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def main():
+    import argparse
+    from app.database import Database
+
+    parser = argparse.ArgumentParser(description="Трассы задач транскрибации")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_list = sub.add_parser("list")
+    p_list.add_argument("--limit", type=int, default=20)
+    p_exp = sub.add_parser("export", help="Chrome trace JSON")
+    p_exp.add_argument("--file-id", type=int, default=None, help="по умолчанию — последние трассы")
+    p_exp.add_argument("--limit", type=int, default=20)
+    p_exp.add_argument("--out", default="trace.json")
+    args = parser.parse_args()
+
+    get_config().ensure_dirs()
+    db = Database()
+    try:
+        traces = db.get_traces(file_id=getattr(args, "file_id", None), limit=args.limit)
+        if args.command == "list":
+            for t in traces:
+                print(f"#{t['id']:<6} {t['kind']:<10} {t['job_id']:<14} file={t['file_id']} "
+                      f"{t['duration']:.2f}s {t['status']}")
+            return
+        records = [db.get_trace(t["id"]) for t in traces]
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(chrome_trace(records), f, ensure_ascii=False)
+        print(f"✅ {len(records)} трасс → {args.out}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
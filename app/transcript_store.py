@@ -0,0 +1,424 @@
+"""
+Упакованное хранилище транскриптов.
+
+Вместо отдельного .txt на каждый файл — один append-only файл (transcripts.pack)
+со сжатыми блоками по ~64 КБ текста (zstd, если установлен zstandard, иначе zlib).
+Индекс блоков лежит в БД (таблица transcript_blocks), транскрипт адресуется по id:
+transcripts.transcript_path = "pack://<id>".
+
+    store = TranscriptStore(db)
+    blocks, size = store.pack(text)                       # записать кадры в pack
+    tr_id = db.add_transcript(file_id, None, ..., blocks=blocks, text_bytes=size)
+    store.read_range(tr_id, 0, 4096)                      # распаковываются только нужные блоки
+
+Блоки удаляются каскадом вместе с транскриптом (Database.delete_files), а их кадры
+остаются в pack «мусором» до compact(). Кадры открытого TranscriptWriter попадают в индекс
+только при close(), поэтому compact() отказывает, пока есть открытые записи — в этом
+процессе и в других (общая блокировка flock на <pack>.lock); процесс, у которого pack
+подменили, переоткрывает файл по смене inode.
+Старые .txt переносятся migrate_txt() (автоматически при старте UI, либо вручную):
+
+    python -m app.transcript_store migrate | compact | stats
+"""
+from __future__ import annotations
+import codecs
+import logging
+import os
+import threading
+import time
+import weakref
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.config import get_config
+
+try:
+    import fcntl
+except ImportError:  # Windows: без межпроцессной блокировки
+    fcntl = None
+
+log = logging.getLogger("whisper_rag_studio")
+
+PACK_SCHEME = "pack://"
+COMPACT_LOCK_WAIT = 30.0  # сек: сколько compact ждёт окончания записи в других процессах
+
+
+def is_packed(transcript_path: Optional[str]) -> bool:
+    return bool(transcript_path) and transcript_path.startswith(PACK_SCHEME)
+
+
+def _zstd():
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+class TranscriptWriter:
+    """Потоковая запись текста в pack: блоки сжимаются по мере заполнения"""
+
+    def __init__(self, store: "TranscriptStore"):
+        self.store = store
+        self.blocks: List[Dict] = []
+        self.size = 0
+        self._buf = bytearray()
+        self._done = None  # weakref.finalize: снимает запись с учёта (close или сборка мусора)
+
+    def write(self, text: str):
+        self._buf += text.encode("utf-8")
+        bs = self.store.block_size
+        while len(self._buf) >= bs:
+            self._flush_block(bytes(self._buf[:bs]))
+            del self._buf[:bs]
+
+    def close(self) -> Tuple[List[Dict], int]:
+        """Дописать хвост и сбросить на диск → (блоки для индекса, размер текста в байтах)"""
+        if self._buf:
+            self._flush_block(bytes(self._buf))
+            self._buf.clear()
+        self.store._sync()
+        if self._done is not None:
+            self._done()
+        return self.blocks, self.size
+
+    def _flush_block(self, raw: bytes):
+        codec, data = self.store._compress(raw)
+        offset = self.store._append(data)
+        self.blocks.append({
+            "raw_offset": self.size, "raw_size": len(raw),
+            "pack_offset": offset, "pack_size": len(data), "codec": codec,
+        })
+        self.size += len(raw)
+
+
+class TranscriptStore:
+    def __init__(self, db, pack_path: Optional[str] = None,
+                 block_size: Optional[int] = None, codec: Optional[str] = None):
+        cfg = get_config().database
+        self.db = db
+        self.pack_path = Path(pack_path or cfg.transcripts_pack)
+        self.block_size = max(4096, int(block_size or cfg.pack_block_size))
+        codec = (codec or cfg.pack_codec or "auto").lower()
+        if codec in ("auto", "zstd"):
+            codec = "zstd" if _zstd() else "zlib"
+        self.codec = codec
+        self._lock = threading.RLock()
+        self._wf = None   # файл для дозаписи
+        self._rfd = None  # дескриптор для чтения (pread)
+        self._lock_fd = None  # <pack>.lock: shared — запись/чтение, exclusive — compact
+        self._holders = 0  # открытые записи и чтения, держащие shared-блокировку
+        self._open_writers = 0
+
+    # ---------------- запись ----------------
+    def writer(self) -> TranscriptWriter:
+        """
+        Потоковая запись; пока она не закрыта, compact() отказывает. Брошенная запись
+        (ошибка прохода) снимается с учёта сборщиком мусора
+        """
+        w = TranscriptWriter(self)
+        with self._lock:
+            self._hold()
+            self._open_writers += 1
+        w._done = weakref.finalize(w, self._writer_closed)
+        w._done.atexit = False
+        return w
+
+    def _writer_closed(self):
+        with self._lock:
+            self._open_writers -= 1
+            self._unhold()
+
+    def pack(self, text: str) -> Tuple[List[Dict], int]:
+        """Записать текст целиком → (блоки, размер в байтах); индекс сохраняет вызывающий"""
+        w = self.writer()
+        w.write(text)
+        return w.close()
+
+    def _compress(self, raw: bytes) -> Tuple[str, bytes]:
+        if self.codec == "zstd":
+            data = _zstd().ZstdCompressor(level=6).compress(raw)
+        else:
+            data = zlib.compress(raw, 6)
+        # несжимаемое (или слишком короткое) храним как есть
+        return (self.codec, data) if len(data) < len(raw) else ("raw", raw)
+
+    def _append(self, data: bytes) -> int:
+        with self._lock:
+            if self._wf is not None and self._replaced(self._wf.fileno()):
+                self._wf.close()  # pack переписал compact другого процесса
+                self._wf = None
+            if self._wf is None:
+                self.pack_path.parent.mkdir(parents=True, exist_ok=True)
+                self._wf = open(self.pack_path, "ab")
+            offset = self._wf.seek(0, os.SEEK_END)
+            self._wf.write(data)
+            self._wf.flush()  # чтобы pread сразу видел кадр
+            return offset
+
+    def _sync(self):
+        """Кадры должны лечь на диск до коммита индекса"""
+        with self._lock:
+            if self._wf is not None:
+                os.fsync(self._wf.fileno())
+
+    # ---------------- блокировки ----------------
+    def _lockfile(self) -> int:
+        if self._lock_fd is None:
+            self.pack_path.parent.mkdir(parents=True, exist_ok=True)
+            lock_path = self.pack_path.with_suffix(self.pack_path.suffix + ".lock")
+            self._lock_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        return self._lock_fd
+
+    def _hold(self):
+        """Shared-блокировка pack (под self._lock); ждёт, пока другой процесс делает compact"""
+        if self._holders == 0 and fcntl is not None:
+            fcntl.flock(self._lockfile(), fcntl.LOCK_SH)
+        self._holders += 1
+
+    def _unhold(self):
+        self._holders -= 1
+        if self._holders == 0 and fcntl is not None:
+            fcntl.flock(self._lockfile(), fcntl.LOCK_UN)
+
+    @contextmanager
+    def _shared(self):
+        with self._lock:
+            self._hold()
+            try:
+                yield
+            finally:
+                self._unhold()
+
+    def _exclusive(self):
+        """Exclusive-блокировка для compact; RuntimeError, если запись в других процессах не кончилась"""
+        if fcntl is None:
+            return
+        deadline = time.monotonic() + COMPACT_LOCK_WAIT
+        while True:
+            try:
+                fcntl.flock(self._lockfile(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise RuntimeError("compact: в pack пишет другой процесс — повторите позже")
+                time.sleep(0.1)
+
+    def _replaced(self, fd: int) -> bool:
+        """Открытый дескриптор указывает не на текущий pack (его подменил compact)"""
+        try:
+            return os.fstat(fd).st_ino != os.stat(self.pack_path).st_ino
+        except FileNotFoundError:
+            return True
+
+    # ---------------- чтение ----------------
+    @staticmethod
+    def _decompress(codec: str, data: bytes, raw_size: int) -> bytes:
+        if codec == "raw":
+            return data
+        if codec == "zlib":
+            return zlib.decompress(data)
+        if codec == "zstd":
+            zstd = _zstd()
+            if zstd is None:
+                raise RuntimeError("Транскрипт сжат zstd — установите пакет zstandard")
+            return zstd.ZstdDecompressor().decompress(data, max_output_size=raw_size)
+        raise ValueError(f"Неизвестный кодек блока: {codec}")
+
+    def _pread(self, offset: int, size: int) -> bytes:
+        with self._lock:
+            if self._rfd is not None and self._replaced(self._rfd):
+                os.close(self._rfd)
+                self._rfd = None
+            if self._rfd is None:
+                self._rfd = os.open(self.pack_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+            if hasattr(os, "pread"):
+                return os.pread(self._rfd, size, offset)
+            os.lseek(self._rfd, offset, os.SEEK_SET)
+            return os.read(self._rfd, size)
+
+    def size(self, transcript_id: int) -> Optional[int]:
+        """Размер текста в байтах UTF-8 (None — транскрипта нет)"""
+        tr = self.db.get_transcript_by_id(transcript_id)
+        if not tr:
+            return None
+        if is_packed(tr["transcript_path"]):
+            return tr["text_bytes"] or 0
+        p = Path(tr["transcript_path"])
+        return p.stat().st_size if p.exists() else None
+
+    def read_range(self, transcript_id: int, offset: int = 0, length: int = 65536) -> Optional[bytes]:
+        """Байты [offset, offset+length) текста; распаковываются только пересекающиеся блоки"""
+        offset, length = max(0, int(offset)), max(0, int(length))
+        with self._shared():  # compact() не должен поменять смещения посреди чтения
+            tr = self.db.get_transcript_by_id(transcript_id)
+            if not tr:
+                return None
+            if not is_packed(tr["transcript_path"]):
+                return self._read_legacy(tr["transcript_path"], offset, length)
+            end = offset + length
+            out = bytearray()
+            for b in self.db.get_transcript_blocks(transcript_id, offset, end):
+                raw = self._decompress(b["codec"], self._pread(b["pack_offset"], b["pack_size"]),
+                                       b["raw_size"])
+                lo = max(offset - b["raw_offset"], 0)
+                hi = min(end - b["raw_offset"], b["raw_size"])
+                out += raw[lo:hi]
+            return bytes(out)
+
+    def read_text_range(self, transcript_id: int, offset: int = 0, length: int = 65536) -> Optional[str]:
+        data = self.read_range(transcript_id, offset, length)
+        # границы диапазона могут разрезать многобайтовый символ
+        return None if data is None else data.decode("utf-8", errors="ignore")
+
+    def read_text(self, transcript_id: int) -> Optional[str]:
+        """Текст транскрипта целиком"""
+        total = self.size(transcript_id)
+        if total is None:
+            return None
+        data = self.read_range(transcript_id, 0, total)
+        return None if data is None else data.decode("utf-8", errors="replace")
+
+    def iter_text(self, blocks: List[Dict]) -> Iterator[str]:
+        """
+        Текст по блокам (список из TranscriptWriter.close()/get_transcript_blocks) — по одному
+        распакованному блоку за раз, без загрузки всего транскрипта
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        for b in blocks:
+            with self._shared():
+                data = self._pread(b["pack_offset"], b["pack_size"])
+            yield decoder.decode(self._decompress(b["codec"], data, b["raw_size"]))
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+    def export_text(self, transcript_id: int, path, step: int = 1 << 20) -> Optional[int]:
+        """Записать текст транскрипта в файл порциями по step байт → размер (None — нет транскрипта)"""
+        total = self.size(transcript_id)
+        if total is None:
+            return None
+        with open(path, "wb") as f:
+            for offset in range(0, total, step):
+                f.write(self.read_range(transcript_id, offset, step) or b"")
+        return total
+
+    @staticmethod
+    def _read_legacy(path: str, offset: int, length: int) -> Optional[bytes]:
+        p = Path(path)
+        if not p.exists():
+            return None
+        with open(p, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    # ---------------- обслуживание ----------------
+    def migrate_txt(self, remove: bool = True) -> Dict[str, int]:
+        """Перенести транскрипты из отдельных .txt в pack"""
+        stats = {"migrated": 0, "missing": 0, "bytes": 0}
+        tdir = Path(get_config().database.transcripts_dir).resolve()
+        for tr in self.db.get_unpacked_transcripts():
+            p = Path(tr["transcript_path"])
+            if not p.exists():
+                stats["missing"] += 1
+                continue
+            blocks, size = self.pack(p.read_text(encoding="utf-8", errors="replace"))
+            self.db.set_transcript_blocks(tr["id"], blocks, size)
+            stats["migrated"] += 1
+            stats["bytes"] += size
+            # удаляем только то, что лежит в нашем каталоге транскриптов
+            if remove and tdir in p.resolve().parents:
+                p.unlink(missing_ok=True)
+        if stats["migrated"] or stats["missing"]:
+            log.info("TRANSCRIPT STORE migrate: %s", stats)
+        return stats
+
+    def stats(self) -> Dict[str, int]:
+        s = self.db.get_transcript_blocks_stats()
+        s["pack_bytes"] = self.pack_path.stat().st_size if self.pack_path.exists() else 0
+        return s
+
+    def compact(self) -> Dict[str, int]:
+        """
+        Переписать pack только с живыми кадрами (блокирует запись/чтение на время работы).
+        RuntimeError, если есть открытые записи (их кадры ещё не в индексе и были бы потеряны)
+        """
+        with self._lock:
+            if self._open_writers:
+                raise RuntimeError(f"compact: открыто записей в pack: {self._open_writers} — повторите позже")
+            self._exclusive()
+            try:
+                return self._compact()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._lockfile(), fcntl.LOCK_UN)
+
+    def _compact(self) -> Dict[str, int]:
+        with self._lock:
+            before = self.pack_path.stat().st_size if self.pack_path.exists() else 0
+            tmp = self.pack_path.with_suffix(self.pack_path.suffix + ".compact")
+            moves = []
+            with open(tmp, "wb") as out:
+                for b in self.db.get_all_transcript_blocks():
+                    data = self._pread(b["pack_offset"], b["pack_size"])
+                    moves.append((out.tell(), b["transcript_id"], b["block_index"]))
+                    out.write(data)
+                out.flush()
+                os.fsync(out.fileno())
+            self._close_files()
+            # новые смещения и подмена файла — в одной транзакции: замена делается
+            # перед COMMIT, при ошибке индекс откатывается к старому pack
+            self.db.update_transcript_block_offsets(
+                moves, before_commit=lambda: os.replace(tmp, self.pack_path))
+            after = self.pack_path.stat().st_size
+        log.info("TRANSCRIPT STORE compact: %d → %d байт", before, after)
+        return {"before": before, "after": after, "blocks": len(moves)}
+
+    def close(self):
+        with self._lock:
+            self._close_files()
+            if self._lock_fd is not None and self._holders == 0:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+    def _close_files(self):
+        with self._lock:
+            if self._wf is not None:
+                self._wf.close()
+                self._wf = None
+            if self._rfd is not None:
+                os.close(self._rfd)
+                self._rfd = None
+
+
+def main():
+    import argparse
+    import json
+    from app.database import Database
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    parser = argparse.ArgumentParser(description="Хранилище транскриптов (transcripts.pack)")
+    parser.add_argument("command", choices=["migrate", "compact", "stats"])
+    parser.add_argument("--keep-txt", action="store_true", help="migrate: не удалять исходные .txt")
+    args = parser.parse_args()
+
+    get_config().ensure_dirs()
+    db = Database()
+    store = TranscriptStore(db)
+    try:
+        if args.command == "migrate":
+            res = store.migrate_txt(remove=not args.keep_txt)
+        elif args.command == "compact":
+            res = store.compact()
+        else:
+            res = store.stats()
+        print(json.dumps(res, ensure_ascii=False, indent=2))
+    finally:
+        store.close()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
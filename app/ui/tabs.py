@@ -2,6 +2,8 @@
 from __future__ import annotations
 import gradio as gr
 from app.ui.js import RESTORE_ACTIVE_TAB_JS, SAVE_ACTIVE_TAB_JS
+from app.config import DECODING_PROFILES
+from app.lanes import QueueFull, get_lanes
 from app.studio import WhisperRAGStudio
 from app.studio.settings import SettingsModule
 
@@ -108,7 +110,26 @@ def _decode(s: str) -> int:
     return int(s.split(" ::: ", 1)[0])
 
 
+def _eta(seconds: float) -> str:
+    """Оценка времени до старта задачи для сообщения очереди"""
+    if seconds < 60:
+        return f"{max(1, round(seconds))} с"
+    if seconds < 3600:
+        return f"{round(seconds / 60)} мин"
+    return f"{seconds / 3600:.1f} ч"
+
+
 def build_interface(studio: WhisperRAGStudio) -> gr.Blocks:
+    # Группы параллельности Gradio. heavy: ждущие в полосе генераторы держат воркер,
+    # поэтому лимит = параллельность + очередь; fast — отдельный пул, транскрибация его не занимает.
+    lanes_cfg = studio.config.lanes
+    HEAVY = dict(concurrency_id="heavy",
+                 concurrency_limit=lanes_cfg.heavy_concurrency + lanes_cfg.heavy_max_queue)
+    FAST = dict(concurrency_id="fast", concurrency_limit=lanes_cfg.fast_concurrency)
+    # bulk — долгие операции над всей базой (синхронизация, перенарезка, обслуживание БД):
+    # по одной за раз, не занимая ни слоты транскрибации, ни быстрый пул
+    BULK = dict(concurrency_id="bulk", concurrency_limit=1)
+
     with gr.Blocks(title="Whisper RAG Studio", theme=gr.themes.Soft(), css=CUSTOM_CSS) as demo:
         _init = gr.State("")
         _hotkey = gr.State("")
@@ -152,21 +173,38 @@ def build_interface(studio: WhisperRAGStudio) -> gr.Blocks:
 
                 result_md = gr.Markdown()
                 transcript_tb = gr.Textbox(
-                    label="Транскрипт", lines=15, max_lines=20, show_copy_button=True)
+                    label="Транскрипт (начало)", lines=15, max_lines=20, show_copy_button=True)
+                transcript_file = gr.File(label="⬇️ Полный транскрипт (.txt)")
 
-                # Пробрасываем progress, чтобы внутри не был None
-                def _process_file_guard(f, progress=gr.Progress(track_tqdm=True)):
+                # Транскрибация — через полосу heavy: лимит параллельности, очередь с позицией,
+                # «очередь заполнена» и лимит на сессию. Пробрасываем progress, чтобы внутри не был None.
+                def _process_file_guard(f, request: gr.Request, progress=gr.Progress(track_tqdm=True)):
                     if f is None:
-                        return ("ℹ️ Файл не выбран.", "", studio._stats_md())
-                    return studio.process_file(f, progress=progress)
+                        yield ("ℹ️ Файл не выбран.", "", studio._stats_md(), None)
+                        return
+                    try:
+                        cost = studio.transcribe.queue_cost(getattr(f, "name", f))
+                        ticket = get_lanes().heavy.enter(session=getattr(request, "session_hash", None),
+                                                         cost=cost)
+                    except QueueFull as e:
+                        yield (f"⛔ {e}", "", studio._stats_md(), None)
+                        return
+                    try:
+                        while not ticket.wait(1.0):
+                            yield (f"⏳ В очереди на транскрибацию: позиция **{ticket.position()}**, "
+                                   f"старт примерно через {_eta(ticket.expected_start())}",
+                                   "", gr.update(), None)
+                        yield studio.process_file(f, progress=progress)
+                    finally:
+                        ticket.release()
 
                 def _process_text_guard(txt, progress=gr.Progress(track_tqdm=True)):
                     return studio.process_text(txt, progress=progress)
 
                 btn_proc_file.click(_process_file_guard, [file_input], [
-                                    result_md, transcript_tb, stats_md])
+                                    result_md, transcript_tb, stats_md, transcript_file], **HEAVY)
                 btn_proc_text.click(_process_text_guard, [
-                                    text_input], [result_md, stats_md])
+                                    text_input], [result_md, stats_md], **FAST)
 
             # ------------------------ ПОИСК ------------------------
             with gr.Tab("🔍 Поиск") as tab_search:
@@ -178,8 +216,8 @@ def build_interface(studio: WhisperRAGStudio) -> gr.Blocks:
                 btn_search = gr.Button("🔍 Искать", variant="primary")
                 out_search = gr.Markdown()
 
-                btn_search.click(studio.search_documents, [q], [out_search])
-                q.submit(studio.search_documents, [q], [out_search])
+                btn_search.click(studio.search_documents, [q], [out_search], **FAST)
+                q.submit(studio.search_documents, [q], [out_search], **FAST)
 
             # ------------------------ ФАЙЛЫ (две вертикальные колонки) ------------------------
             with gr.Tab("📁 Файлы") as tab_files:
@@ -207,11 +245,17 @@ def build_interface(studio: WhisperRAGStudio) -> gr.Blocks:
 
                 with gr.Row():
                     btn_refresh = gr.Button("🔄 Обновить списки")
+                    btn_dedupe = gr.Button("🧬 Отчёт о дубликатах")
                     btn_delete = gr.Button(
                         "🗑️ Удалить выбранные", variant="stop")
 
                 tr_view = gr.Textbox(label="Транскрипт",
                                      lines=28, show_copy_button=True)
+                with gr.Accordion("⏱ Трасса обработки", open=False):
+                    trace_view = gr.HTML()
+                    with gr.Row():
+                        btn_trace_export = gr.Button("⬇️ Chrome trace JSON")
+                        trace_file = gr.File(label="chrome://tracing / ui.perfetto.dev")
                 action_md = gr.Markdown()
 
                 def _show(sel):
@@ -219,7 +263,11 @@ def build_interface(studio: WhisperRAGStudio) -> gr.Blocks:
                         return ""
                     return studio.view_transcript_by_id(_decode(sel))
 
-                files_radio.change(_show, [files_radio], [tr_view])
+                files_radio.change(_show, [files_radio], [tr_view], **FAST)
+                files_radio.change(lambda sel: studio.trace_html(_decode(sel)) if sel else "",
+                                   [files_radio], [trace_view], **FAST)
+                btn_trace_export.click(lambda sel: studio.trace_export(_decode(sel)) if sel else None,
+                                       [files_radio], [trace_file], **FAST)
 
                 def _refresh():
                     ch = _choices()
@@ -231,11 +279,11 @@ def build_interface(studio: WhisperRAGStudio) -> gr.Blocks:
 
                 # автообновление при входе во вкладку «Файлы»
                 gr.on(triggers=[tab_files.select], fn=_refresh, inputs=None, outputs=[
-                      files_radio, files_checks, tr_view])
+                      files_radio, files_checks, tr_view], **FAST)
 
                 # ручной refresh
                 btn_refresh.click(
-                    _refresh, None, [files_radio, files_checks, tr_view])
+                    _refresh, None, [files_radio, files_checks, tr_view], **FAST)
 
                 def _delete(selected_list):
                     if not selected_list:
@@ -243,22 +291,12 @@ def build_interface(studio: WhisperRAGStudio) -> gr.Blocks:
                         return "ℹ️ Нечего удалять.", *_refresh()
 
                     ids = [_decode(s) for s in selected_list]
-                    raw_msg = studio.delete_files_by_ids(ids)
-
-                    # Гарантированно превращаем в строку для Markdown:
-                    if isinstance(raw_msg, str):
-                        msg = raw_msg
-                    elif raw_msg is None:
-                        msg = "✅ Удаление выполнено."
-                    elif isinstance(raw_msg, (list, tuple, set)):
-                        msg = "\n".join(map(str, raw_msg))
-                    else:
-                        msg = str(raw_msg)
-
+                    msg = studio.delete_files_report(ids)
                     return msg, *_refresh()
 
                 btn_delete.click(_delete, [files_checks], [
-                                 action_md, files_radio, files_checks, tr_view])
+                                 action_md, files_radio, files_checks, tr_view], **FAST)
+                btn_dedupe.click(studio.dedupe_report_md, None, [action_md], **FAST)
 
             # ------------------------ INGEST (Radio вертикально, один файл) ------------------------
             with gr.Tab("📤 Ingest → NooForge") as tab_ingest:
@@ -279,7 +317,10 @@ def build_interface(studio: WhisperRAGStudio) -> gr.Blocks:
                                         placeholder="file://notes или свой ID")
                     coll = gr.Textbox(
                         label="Коллекция", value=studio.config.nooforge.default_collection or "chunks")
-                btn_ing = gr.Button("📤 Отправить", variant="primary")
+                with gr.Row():
+                    btn_ing = gr.Button("📤 Отправить", variant="primary")
+                    btn_sync = gr.Button("🔁 Синхронизировать коллекцию")
+                    sync_all = gr.Checkbox(label="включая ещё не отправленные файлы", value=False)
 
                 ingest_status = gr.Markdown()
                 ingest_payload = gr.Markdown()
@@ -290,6 +331,7 @@ def build_interface(studio: WhisperRAGStudio) -> gr.Blocks:
                     fn=lambda: gr.update(choices=_choices_ing(), value=None),
                     inputs=None,
                     outputs=[ingest_radio],
+                    **FAST,
                 )
 
                 def _ingest(sel, src, c):
@@ -298,7 +340,9 @@ def build_interface(studio: WhisperRAGStudio) -> gr.Blocks:
                     return studio.ingest_transcript_by_id(_decode(sel), src, c)
 
                 btn_ing.click(_ingest, [ingest_radio, src_id, coll], [
-                              ingest_status, ingest_payload])
+                              ingest_status, ingest_payload], **FAST)
+                btn_sync.click(studio.sync_collection, [coll, sync_all], [
+                               ingest_status, ingest_payload], **BULK)
 
             # ------------------------ RAG (Enter → отправка, Shift+Enter → перенос) ------------------------
             with gr.Tab("🧠 RAG") as tab_rag:
@@ -330,6 +374,7 @@ def build_interface(studio: WhisperRAGStudio) -> gr.Blocks:
                     studio.rag_query,
                     inputs=[question, top_k, rerank_k, coll_rag, filters_json],
                     outputs=[rag_status, rag_output],
+                    **FAST,
                 )
 
                 # при входе во вкладку — повторно навешиваем хоткей
@@ -370,6 +415,16 @@ def build_interface(studio: WhisperRAGStudio) -> gr.Blocks:
                         label="VAD-фильтр",
                         value=bool(cfg.transcriber.use_vad),
                     )
+                    decode_profile = gr.Dropdown(
+                        label="Профиль декодирования",
+                        choices=list({**DECODING_PROFILES, **(cfg.transcriber.profiles or {})}),
+                        value=cfg.transcriber.profile or "accurate",
+                    )
+
+                with gr.Row():
+                    profile_rtf = gr.Markdown(value=settings.profile_rtf_md)
+                    btn_profile_rtf = gr.Button("🔄 RTF по профилям")
+                btn_profile_rtf.click(fn=settings.profile_rtf_md, inputs=None, outputs=[profile_rtf], **FAST)
 
                 with gr.Row():
                     chunk_size = gr.Number(
@@ -383,6 +438,27 @@ def build_interface(studio: WhisperRAGStudio) -> gr.Blocks:
                         precision=0,
                     )
 
+                with gr.Row():
+                    rechunk_status = gr.Markdown(value=studio.rechunk_status_md)
+                with gr.Row():
+                    btn_rechunk_refresh = gr.Button("🔄 Статус нарезки")
+                    btn_rechunk = gr.Button("♻️ Перенарезать все транскрипты")
+                    btn_rechunk_cancel = gr.Button("⏹ Отменить перенарезку", variant="stop")
+                btn_rechunk_refresh.click(fn=studio.rechunk_status_md, inputs=None, outputs=[rechunk_status], **FAST)
+                btn_rechunk.click(fn=lambda: f"{studio.rechunk_start(force=True)}\n\n{studio.rechunk_status_md()}",
+                                  inputs=None, outputs=[rechunk_status], **BULK)
+                btn_rechunk_cancel.click(fn=lambda: f"{studio.rechunk_cancel()}\n\n{studio.rechunk_status_md()}",
+                                         inputs=None, outputs=[rechunk_status], **FAST)
+
+                with gr.Row():
+                    maintenance_status = gr.Markdown(value=studio.maintenance_status_md)
+                with gr.Row():
+                    btn_maintenance_refresh = gr.Button("🔄 Статус обслуживания БД")
+                    btn_maintenance = gr.Button("🧹 Обслужить БД сейчас (optimize + проверка)")
+                btn_maintenance_refresh.click(fn=studio.maintenance_status_md, inputs=None,
+                                              outputs=[maintenance_status], **FAST)
+                btn_maintenance.click(fn=studio.maintenance_run, inputs=None, outputs=[maintenance_status], **BULK)
+
                 gr.Markdown("### NooForge-Refiner")
 
                 with gr.Row():
@@ -423,11 +499,12 @@ def build_interface(studio: WhisperRAGStudio) -> gr.Blocks:
                 save_btn.click(
                     fn=settings.save_all_settings,
                     inputs=[
-                        use_faster, model_name, model_path, device, use_vad,
+                        use_faster, model_name, model_path, device, use_vad, decode_profile,
                         chunk_size, chunk_overlap,
                         base_url, api_key, ingest_text_path, ingest_file_path, rag_query_path, default_collection
                     ],
                     outputs=[save_status],
+                    **FAST,
                 )
 
     return demo
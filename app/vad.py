@@ -0,0 +1,97 @@
+"""
+VAD отдельным этапом: карта речи по хэшу содержимого.
+
+Silero VAD (из faster-whisper) прогоняется один раз на файл; интервалы речи хранятся в БД
+(таблица speech_maps, массив float32 [start, end, ...] в секундах) вместе с долей речи.
+Дальше:
+- файл без речи (музыка, тишина) завершается без загрузки Whisper;
+- остальные распознаются только по интервалам — они уходят в модель как clip_timestamps,
+  так что повторные прогоны (другая модель, уточнение черновика) VAD не считают.
+
+    sm = get_speech_map(db, "call.wav", file_hash)
+    sm.speech_ratio, sm.clip_timestamps()
+"""
+from __future__ import annotations
+import logging
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Union
+
+from app.config import get_config
+from app.media import SAMPLE_RATE
+
+log = logging.getLogger("whisper_rag_studio")
+
+
+class SpeechMap(NamedTuple):
+    intervals: "object"  # np.ndarray float32 (n, 2), секунды
+    duration: float
+
+    @property
+    def speech_seconds(self) -> float:
+        return float((self.intervals[:, 1] - self.intervals[:, 0]).sum()) if len(self.intervals) else 0.0
+
+    @property
+    def speech_ratio(self) -> float:
+        return self.speech_seconds / self.duration if self.duration > 0 else 0.0
+
+    def clip_timestamps(self, offset: float = 0.0) -> List[float]:
+        """[start, end, ...] для модели; offset — аудио начинается не с нуля (продолжение)"""
+        out: List[float] = []
+        for start, end in self.intervals.tolist():
+            if end <= offset:
+                continue
+            out += [round(max(start - offset, 0.0), 3), round(end - offset, 3)]
+        return out
+
+
+def vad_key(threshold: float) -> str:
+    """Параметры, при которых посчитана карта (другой порог — другая карта)"""
+    return f"silero:{threshold:g}"
+
+
+def detect_speech(audio, threshold: float = 0.5):
+    """np.float32 16 кГц → интервалы речи (n, 2) в секундах"""
+    import numpy as np
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    chunks = get_speech_timestamps(audio, VadOptions(threshold=threshold))
+    if not chunks:
+        return np.zeros((0, 2), dtype=np.float32)
+    samples = np.array([(c["start"], c["end"]) for c in chunks], dtype=np.float64)
+    return (samples / SAMPLE_RATE).astype(np.float32)
+
+
+def get_speech_map(db, path: Union[str, Path], file_hash: str,
+                   threshold: Optional[float] = None) -> Optional[SpeechMap]:
+    """Карта речи файла: из БД или расчётом (с сохранением); None — этап выключен/нет VAD"""
+    import numpy as np
+
+    tcfg = get_config().transcriber
+    if not (tcfg.use_vad and tcfg.vad_stage):
+        return None
+    threshold = tcfg.vad_threshold if threshold is None else threshold
+    key = vad_key(threshold)
+    row = db.get_speech_map(file_hash, key)
+    if row is not None:
+        intervals = np.frombuffer(row["intervals"], dtype=np.float32).reshape(-1, 2)
+        return SpeechMap(intervals, row["duration"])
+
+    # проверка наличия Silero VAD до декодирования аудио: без faster-whisper этап пропускается
+    try:
+        from faster_whisper.vad import get_speech_timestamps
+    except ImportError:
+        return None
+    del get_speech_timestamps  # нужен только как проба; сам VAD — в detect_speech
+    from app.audio_cache import load_audio
+
+    audio = load_audio(path, file_hash)
+    try:
+        intervals = detect_speech(audio, threshold)
+    except Exception as e:  # нет onnxruntime и т.п. — остаётся VAD внутри модели
+        log.warning("VAD %s: этап пропущен (%s: %s)", Path(path).name, type(e).__name__, e)
+        return None
+    sm = SpeechMap(intervals, len(audio) / SAMPLE_RATE)
+    db.save_speech_map(file_hash, key, intervals.tobytes(), sm.duration, sm.speech_seconds)
+    log.info("VAD %s: речь %.1f из %.1f сек (%.0f%%), интервалов: %d", Path(path).name,
+             sm.speech_seconds, sm.duration, sm.speech_ratio * 100, len(intervals))
+    return sm
@@ -0,0 +1,380 @@
+"""
+Наблюдение за папками: новые медиафайлы автоматически уходят в транскрибацию.
+
+- inotify (Linux, через ctypes) с откатом на периодический опрос;
+- файл считается дописанным, когда размер и mtime не меняются settle_seconds;
+- дубликаты отсекаются по SHA-256 содержимого;
+- параллельно распознаётся не больше max_concurrent файлов; через конвейер app.pipeline
+  следующие файлы тем временем декодируются, а готовые пишутся в БД;
+- у каждой папки свои настройки: модель и коллекция Refiner для ingest.
+
+Запуск без UI: python -m app.watcher
+"""
+from __future__ import annotations
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from app import tracing
+from app.config import get_config
+from app.lanes import get_lanes
+from app.media import content_hash
+
+log = logging.getLogger("whisper_rag_studio")
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+_EVENT_HEADER = struct.Struct("iIII")
+
+# Недописанные загрузки, временные файлы браузеров/rsync и т.п.
+_TEMP_SUFFIXES = (".part", ".tmp", ".crdownload", ".partial", ".download")
+
+
+def _db_timestamp(value: Optional[str]) -> Optional[float]:
+    """CURRENT_TIMESTAMP SQLite (UTC, 'YYYY-MM-DD HH:MM:SS') → unix time; None — не разобрать"""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class WatchFolder:
+    """Папка наблюдения с собственными настройками"""
+    path: Path
+    model_name: Optional[str] = None
+    collection: Optional[str] = None
+    recursive: bool = True
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "WatchFolder":
+        return cls(
+            path=Path(d["path"]).resolve(),
+            model_name=d.get("model_name") or None,
+            collection=d.get("collection") or None,
+            recursive=bool(d.get("recursive", True)),
+        )
+
+
+@dataclass
+class _Pending:
+    folder: WatchFolder
+    size: int
+    mtime: float
+    stable_since: float
+
+
+class _Inotify:
+    """Минимальная обёртка над inotify через libc"""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.wd_to_dir: Dict[int, Tuple[Path, WatchFolder]] = {}
+
+    def add_watch(self, directory: Path, folder: WatchFolder):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), _WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed: {directory}")
+        self.wd_to_dir[wd] = (directory, folder)
+
+    def read_events(self, timeout: float) -> List[Tuple[int, int, str]]:
+        """[(wd, mask, name)] или [] по таймауту"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events, off = [], 0
+        while off + _EVENT_HEADER.size <= len(buf):
+            wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(buf, off)
+            off += _EVENT_HEADER.size
+            name = buf[off:off + name_len].rstrip(b"\0")
+            off += name_len
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class FolderWatcher:
+    """Следит за папками из config.watcher и ставит новые файлы в транскрибацию"""
+
+    def __init__(self, studio, config=None):
+        self.studio = studio
+        self.config = config or get_config().watcher
+        self.folders = [WatchFolder.from_dict(d) for d in self.config.folders]
+        self.extensions = {e.lower() for e in self.config.extensions}
+
+        self._pending: Dict[Path, _Pending] = {}
+        self._inflight: Set[Path] = set()
+        # уже разобранные файлы (в т.ч. дубликаты): path → (size, mtime)
+        self._handled: Dict[Path, Tuple[int, float]] = {}
+        self._inflight_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._inotify: Optional[_Inotify] = None
+        # потоки — на распознаваемые файлы и на те, что в этапах decode и write конвейера
+        max_concurrent = max(1, int(self.config.max_concurrent))
+        pcfg = get_config().pipeline
+        extra = pcfg.prefetch_depth + pcfg.write_workers + pcfg.write_queue if pcfg.enabled else 0
+        self._asr_slots = threading.BoundedSemaphore(max_concurrent)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrent + extra, thread_name_prefix="watch-job")
+        self.stats = {"queued": 0, "processed": 0, "duplicates": 0, "failed": 0}
+
+    # ---------- lifecycle ----------
+    def start(self):
+        for folder in self.folders:
+            folder.path.mkdir(parents=True, exist_ok=True)
+
+        if self.config.use_inotify:
+            try:
+                self._inotify = _Inotify()
+                for folder in self.folders:
+                    self._watch_tree(folder.path, folder)
+            except (OSError, AttributeError) as e:
+                log.warning("inotify недоступен (%s) → опрос каждые %.1f сек", e, self.config.poll_interval)
+                if self._inotify:
+                    self._inotify.close()
+                self._inotify = None
+
+        self._thread = threading.Thread(target=self._run, name="folder-watcher", daemon=True)
+        self._thread.start()
+        mode = "inotify" if self._inotify else "polling"
+        print(f"👀 Наблюдение за папками ({mode}): " + ", ".join(str(f.path) for f in self.folders))
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self._inotify:
+            self._inotify.close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # ---------- main loop ----------
+    def _run(self):
+        interval = max(0.2, float(self.config.poll_interval))
+        self._scan_all()
+        last_scan = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                if self._inotify:
+                    self._handle_events(self._inotify.read_events(interval))
+                    # страховочный пересканер: сетевые ФС (SMB/NFS) не шлют inotify-события
+                    if time.monotonic() - last_scan >= self.config.rescan_interval:
+                        self._scan_all()
+                        last_scan = time.monotonic()
+                else:
+                    self._stop.wait(interval)
+                    self._scan_all()
+                self._check_pending()
+            except Exception:
+                log.exception("folder watcher loop error")
+                self._stop.wait(interval)
+
+    def _watch_tree(self, root: Path, folder: WatchFolder):
+        self._inotify.add_watch(root, folder)
+        if folder.recursive:
+            for dirpath, dirnames, _ in os.walk(root):
+                dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+                for d in dirnames:
+                    self._inotify.add_watch(Path(dirpath) / d, folder)
+
+    def _handle_events(self, events):
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                log.warning("inotify: переполнение очереди событий → полный пересканер")
+                self._scan_all()
+                continue
+            if mask & IN_IGNORED:
+                self._inotify.wd_to_dir.pop(wd, None)
+                continue
+            entry = self._inotify.wd_to_dir.get(wd)
+            if not entry or not name:
+                continue
+            directory, folder = entry
+            path = directory / name
+            if mask & IN_ISDIR:
+                if folder.recursive and not name.startswith("."):
+                    self._watch_tree(path, folder)
+                    self._scan_dir(path, folder)
+                continue
+            self._touch(path, folder)
+
+    # ---------- scanning ----------
+    def _scan_all(self):
+        for folder in self.folders:
+            self._scan_dir(folder.path, folder)
+        # удалённые файлы (события удаления inotify могли не прийти — сетевые ФС)
+        for path in [p for p in self._handled if not p.exists()]:
+            del self._handled[path]
+
+    def _scan_dir(self, root: Path, folder: WatchFolder):
+        if not root.is_dir():
+            return
+        walker = os.walk(root) if folder.recursive else [(str(root), [], os.listdir(root))]
+        for dirpath, dirnames, filenames in walker:
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for fn in filenames:
+                self._touch(Path(dirpath) / fn, folder)
+
+    def _accepts(self, path: Path) -> bool:
+        name = path.name.lower()
+        if name.startswith(".") or name.endswith(_TEMP_SUFFIXES):
+            return False
+        return path.suffix.lower() in self.extensions
+
+    def _touch(self, path: Path, folder: WatchFolder):
+        """Файл появился/изменился → (пере)запускаем ожидание «дозаписи»"""
+        if not self._accepts(path):
+            return
+        with self._inflight_lock:
+            if path in self._inflight:
+                return
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            self._pending.pop(path, None)
+            self._handled.pop(path, None)
+            return
+        if self._handled.get(path) == (st.st_size, st.st_mtime):
+            return
+        p = self._pending.get(path)
+        if p and p.size == st.st_size and p.mtime == st.st_mtime:
+            return
+        if p is None and self._already_known(path, st.st_size, st.st_mtime):
+            return
+        self._pending[path] = _Pending(folder, st.st_size, st.st_mtime, time.monotonic())
+
+    def _already_known(self, path: Path, size: int, mtime: float) -> bool:
+        """
+        Тот же путь и размер уже в БД и файл не менялся после обработки → не хэшируем повторно
+        при каждом пересканере (перезаписанный файл распознаётся заново)
+        """
+        row = self.studio.db.get_file_by_path(str(path))
+        if not (row and row["file_size"] == size and row["status"] in ("completed", "processing")):
+            return False
+        seen = _db_timestamp(row["processed_at"] or row["created_at"])
+        return seen is not None and mtime <= seen
+
+    def _check_pending(self):
+        now = time.monotonic()
+        for path, p in list(self._pending.items()):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                del self._pending[path]
+                continue
+            if st.st_size != p.size or st.st_mtime != p.mtime:
+                p.size, p.mtime, p.stable_since = st.st_size, st.st_mtime, now
+                continue
+            if st.st_size > 0 and now - p.stable_since >= self.config.settle_seconds:
+                del self._pending[path]
+                self._handled[path] = (st.st_size, st.st_mtime)
+                self._enqueue(path, p.folder)
+
+    # ---------- jobs ----------
+    @contextmanager
+    def _asr_slot(self, cost: Optional[float] = None):
+        """Место в полосе heavy и в лимите max_concurrent — этап asr конвейера; cost — оценка задачи"""
+        with self._asr_slots:
+            with tracing.span("queue"):
+                ticket = get_lanes().heavy.enter(session=None, wait_for_room=None, cost=cost)
+                ticket.wait()
+            try:
+                yield
+            finally:
+                ticket.release()
+
+    def _enqueue(self, path: Path, folder: WatchFolder):
+        with self._inflight_lock:
+            if path in self._inflight:
+                return
+            self._inflight.add(path)
+        self.stats["queued"] += 1
+        self._pool.submit(self._process, path, folder)
+
+    def _process(self, path: Path, folder: WatchFolder):
+        pipeline = self.studio.transcribe.pipeline
+        try:
+            file_hash = content_hash(path)
+            dup = self.studio.db.get_file_by_hash(file_hash)
+            if dup and dup["status"] in ("completed", "processing"):
+                self.stats["duplicates"] += 1
+                log.info("WATCH skip duplicate %s (= file #%s %s)", path, dup["id"], dup["filename"])
+                return
+            cost = self.studio.transcribe.queue_cost(path, model_name=folder.model_name)
+            pipeline.prefetch(path, file_hash, cost)
+
+            def ingest(res):
+                if folder.collection and not res["existing"]:
+                    rel = path.relative_to(folder.path).as_posix()
+                    with tracing.span("ingest", collection=folder.collection):
+                        status, _ = self.studio.refiner.ingest_transcript_by_id(
+                            res["file_id"], f"file://{rel}", folder.collection)
+                    log.info("WATCH ingest %s → %s: %s", rel, folder.collection, status)
+
+            log.info("WATCH transcribe %s | model=%s | collection=%s",
+                     path, folder.model_name or "default", folder.collection or "-")
+            # общая с UI/API полоса транскрибации; ждём места, а не отбрасываем файл
+            with tracing.trace("watch", self.studio.db):
+                pipeline.run(path, self._asr_slot(cost), model_name=folder.model_name,
+                             file_hash=file_hash, post=ingest)
+            self.stats["processed"] += 1
+        except Exception:
+            self.stats["failed"] += 1
+            log.exception("WATCH failed: %s", path)
+        finally:
+            pipeline.discard(path)  # ошибка до этапа asr — иначе место в prefetch занято навсегда
+            with self._inflight_lock:
+                self._inflight.discard(path)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    from app.studio import WhisperRAGStudio
+
+    studio = WhisperRAGStudio()
+    watcher = FolderWatcher(studio)
+    watcher.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("\n🛑 Остановка наблюдения…")
+    finally:
+        watcher.stop()
+        studio.ctx.close()
+
+
+if __name__ == "__main__":
+    main()
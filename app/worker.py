@@ -0,0 +1,259 @@
+"""
+Удалённый воркер транскрибации: берёт задачи у координатора студии (cluster.enabled,
+см. app.coordinator) и распознаёт их на этой машине.
+
+    python -m app.worker --coordinator http://studio:8000 --token secret --name gpu-1
+    python -m app.worker --processes 3     # три воркера на этой машине (у каждого своя модель)
+    python -m app.worker --once            # одна задача и выход
+
+Цикл: аренда (long-poll cluster.poll_seconds) → медиа потоком в cluster.download_dir со сверкой
+SHA-256 → распознавание (transcriber.* этой машины, модель и профиль — из задачи) с heartbeat
+в фоне и сегментами порциями по cluster.segment_batch → complete. Задача, которую уже начал
+другой воркер, продолжается с его последнего принятого сегмента. 410 от координатора —
+аренда истекла и передана другому: задача бросается без отчёта.
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.config import get_config
+
+log = logging.getLogger("whisper_rag_studio")
+
+DOWNLOAD_BLOCK = 1024 * 1024
+SEGMENT_FLUSH_SECONDS = 2.0  # сегменты уходят не реже (стрим задачи в API не замирает)
+RETRY_SECONDS = 5.0  # пауза, если координатор недоступен
+
+
+def _requests():
+    """Ленивый импорт requests: не нужен, пока воркер не запущен."""
+    import requests
+    return requests
+
+
+class LeaseLost(Exception):
+    """Координатор ответил 410: аренда истекла и передана другому воркеру"""
+
+
+class _Heartbeat:
+    """Фоновое продление аренды; последний прогресс распознавания уходит вместе с ним"""
+
+    def __init__(self, worker: "Worker", lease_id: str, interval: float):
+        self.worker = worker
+        self.lease_id = lease_id
+        self.interval = interval
+        self.progress: Optional[float] = None
+        self.desc = ""
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=f"heartbeat-{lease_id[:8]}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.worker._post(f"/api/cluster/leases/{self.lease_id}/heartbeat",
+                                  {"progress": self.progress, "desc": self.desc})
+            except LeaseLost:
+                self.lost.set()
+                return
+            except Exception as e:  # сеть мигнула — следующий heartbeat успеет до истечения
+                log.warning("WORKER heartbeat: %s", e)
+
+
+class Worker:
+    """Цикл аренды и распознавания (см. модуль)"""
+
+    def __init__(self, coordinator_url: Optional[str] = None, token: Optional[str] = None,
+                 name: Optional[str] = None, config=None):
+        self.cfg = config or get_config().cluster
+        self.base_url = (coordinator_url or self.cfg.coordinator_url).rstrip("/")
+        token = token or self.cfg.token
+        self.headers = {"X-Cluster-Token": token} if token else {}
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self._session = None
+        self._transcribers: Dict[str, Any] = {}
+        self._stop = threading.Event()
+
+    # ---- HTTP ----
+    def _http(self):
+        if self._session is None:
+            self._session = _requests().Session()
+        return self._session
+
+    def _post(self, path: str, payload: Dict[str, Any], timeout: float = 30.0):
+        r = self._http().post(f"{self.base_url}{path}", json=payload, headers=self.headers, timeout=timeout)
+        if r.status_code == 410:
+            raise LeaseLost(path)
+        if r.status_code >= 400:
+            raise RuntimeError(f"{path}: {r.status_code} {r.text[:200]}")
+        return r
+
+    # ---- цикл ----
+    def run(self, once: bool = False):
+        log.info("WORKER %s → %s", self.name, self.base_url)
+        while not self._stop.is_set():
+            try:
+                r = self._post("/api/cluster/lease", {"worker": self.name, "wait": self.cfg.poll_seconds},
+                               timeout=self.cfg.poll_seconds + 30)
+            except Exception as e:
+                log.warning("WORKER %s: координатор недоступен: %s", self.name, e)
+                self._stop.wait(RETRY_SECONDS)
+                continue
+            if r.status_code == 204:
+                continue
+            self.process(r.json())
+            if once:
+                return
+
+    def stop(self):
+        self._stop.set()
+
+    def process(self, task: Dict[str, Any]) -> bool:
+        """Одна арендованная задача → True, если координатор принял результат"""
+        lease_id = task["lease_id"]
+        interval = max(1.0, min(self.cfg.heartbeat_seconds, float(task["lease_seconds"]) / 3))
+        hb = _Heartbeat(self, lease_id, interval)
+        path = None
+        t0 = time.perf_counter()
+        try:
+            hb.start()
+            path = self._download(task)
+            meta = self._transcribe(task, path, hb)
+            self._post(f"/api/cluster/leases/{lease_id}/complete", {"meta": meta})
+            log.info("WORKER %s: %s готов за %.1f с", self.name, task["filename"], time.perf_counter() - t0)
+            return True
+        except LeaseLost:
+            log.warning("WORKER %s: аренда %s потеряна — %s передан другому воркеру",
+                        self.name, lease_id[:8], task["filename"])
+        except Exception as e:
+            log.exception("WORKER %s: %s failed", self.name, task["filename"])
+            try:
+                self._post(f"/api/cluster/leases/{lease_id}/fail", {"error": f"{type(e).__name__}: {e}"})
+            except Exception:
+                pass  # аренда истечёт сама
+        finally:
+            hb.stop()
+            if path is not None:
+                path.unlink(missing_ok=True)
+        return False
+
+    def _download(self, task: Dict[str, Any]) -> Path:
+        """Медиа аренды потоком во временный файл (сверка размера и SHA-256)"""
+        folder = Path(self.cfg.download_dir)
+        folder.mkdir(parents=True, exist_ok=True)
+        dest = folder / f"{task['lease_id']}{Path(task['filename']).suffix}"
+        h = hashlib.sha256()
+        url = f"{self.base_url}/api/cluster/leases/{task['lease_id']}/media"
+        try:
+            with self._http().get(url, headers=self.headers, stream=True, timeout=60) as r:
+                if r.status_code == 410:
+                    raise LeaseLost(url)
+                r.raise_for_status()
+                with open(dest, "wb") as out:
+                    for block in r.iter_content(DOWNLOAD_BLOCK):
+                        out.write(block)
+                        h.update(block)
+            size = dest.stat().st_size
+            if size != task["size"] or h.hexdigest() != task["content_hash"]:
+                raise RuntimeError(f"медиа повреждено при загрузке ({size} из {task['size']} байт)")
+        except BaseException:
+            dest.unlink(missing_ok=True)
+            raise
+        return dest
+
+    def _transcriber(self, model_name: str):
+        tr = self._transcribers.get(model_name)
+        if tr is None:
+            from transcriber import Transcriber  # тянет модель/бэкенд — только по требованию
+            cfg = get_config().transcriber
+            if model_name != cfg.model_name:
+                cfg = replace(cfg, model_name=model_name, model_path=None)
+            tr = self._transcribers[model_name] = Transcriber(cfg)
+        return tr
+
+    def _transcribe(self, task: Dict[str, Any], path: Path, hb: _Heartbeat) -> Dict[str, Any]:
+        lease_id = task["lease_id"]
+        pending: List[Dict[str, Any]] = []
+        last_flush = time.monotonic()
+
+        def flush():
+            nonlocal last_flush
+            if pending:
+                self._post(f"/api/cluster/leases/{lease_id}/segments", {"segments": pending})
+                pending.clear()
+            last_flush = time.monotonic()
+
+        def on_segment(seg):
+            if hb.lost.is_set():
+                raise LeaseLost(lease_id)
+            pending.append({"start": seg["start"], "end": seg["end"], "text": seg["text"],
+                            "no_speech_prob": seg.get("no_speech_prob")})
+            if len(pending) >= self.cfg.segment_batch or time.monotonic() - last_flush >= SEGMENT_FLUSH_SECONDS:
+                flush()
+
+        def on_progress(v, desc=""):
+            hb.progress, hb.desc = float(v), desc
+
+        transcriber = self._transcriber(task["model_name"])
+        _, meta = transcriber.transcribe_file(
+            str(path), progress_callback=on_progress, segment_callback=on_segment,
+            file_hash=task["content_hash"], start_offset=float(task.get("resume_from") or 0.0),
+            collect_text=False, profile=task.get("profile"))
+        flush()
+        if hb.lost.is_set():
+            raise LeaseLost(lease_id)
+        return meta
+
+
+def _serve(url: Optional[str], token: Optional[str], name: Optional[str], once: bool):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    worker = Worker(url, token, name)
+    try:
+        worker.run(once=once)
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Удалённый воркер транскрибации")
+    parser.add_argument("--coordinator", default=None, help="URL студии (по умолчанию cluster.coordinator_url)")
+    parser.add_argument("--token", default=None, help="общий секрет (по умолчанию cluster.token)")
+    parser.add_argument("--name", default=None, help="имя воркера (по умолчанию хост-pid)")
+    parser.add_argument("--processes", type=int, default=1, help="воркеров-процессов на этой машине")
+    parser.add_argument("--once", action="store_true", help="одна задача и выход")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        _serve(args.coordinator, args.token, args.name, args.once)
+        return
+    base = args.name or socket.gethostname()
+    procs = [multiprocessing.Process(target=_serve, name=f"{base}-{i}",
+                                     args=(args.coordinator, args.token, f"{base}-{i}", args.once))
+             for i in range(args.processes)]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.join()
+
+
+if __name__ == "__main__":
+    main()
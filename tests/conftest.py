@@ -0,0 +1,11 @@
+import pytest
+
+from app.database import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Пустая БД во временном каталоге (схема, триггеры FTS — как при старте)"""
+    database = Database(str(tmp_path / "test.db"))
+    yield database
+    database.close()
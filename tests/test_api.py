@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api import create_app
+from app.config import get_config
+from app.lanes import QueueFull
+
+
+class _Jobs:
+    coordinator = None
+
+    def __init__(self, error=None):
+        self.error = error
+        self.submitted = []
+
+    def submit(self, path, **kwargs):
+        if self.error:
+            raise self.error
+        self.submitted.append(path)
+        return SimpleNamespace(to_dict=lambda: {"id": "j", "path": path})
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(get_config().api, "upload_dir", str(tmp_path / "uploads"))
+    return tmp_path / "uploads"
+
+
+def _post(jobs, **data):
+    client = TestClient(create_app(SimpleNamespace(), jobs))
+    return client.post("/api/jobs", files={"file": ("a.wav", b"RIFF0000")}, data=data)
+
+
+def _files(upload_dir):
+    return sorted(p.name for p in upload_dir.rglob("*")) if upload_dir.exists() else []
+
+
+def test_accepted_upload_is_kept(upload_dir):
+    jobs = _Jobs()
+    assert _post(jobs).status_code == 202
+    assert len(jobs.submitted) == 1 and "a.wav" in _files(upload_dir)
+
+
+def test_queue_full_removes_upload(upload_dir):
+    r = _post(_Jobs(QueueFull("full")))
+    assert r.status_code == 429
+    assert _files(upload_dir) == []
+
+
+def test_unknown_profile_removes_upload(upload_dir):
+    r = _post(_Jobs(), profile="no-such-profile")
+    assert r.status_code == 400
+    assert _files(upload_dir) == []
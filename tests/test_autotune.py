@@ -0,0 +1,45 @@
+import pytest
+
+from app.autotune import _run_parallel, _similarity, best_of
+
+
+class _Model:
+    def __init__(self, texts):
+        self.texts = list(texts)
+
+    def transcribe_audio(self, audio):
+        text = self.texts.pop(0)
+        if isinstance(text, Exception):
+            raise text
+        return text, {}
+
+
+def test_parallel_run_returns_all_texts():
+    texts, wall = _run_parallel(_Model(["раз два", "раз два"]), None, 2)
+    assert texts == ["раз два", "раз два"]
+    assert wall >= 0
+
+
+def test_thread_error_is_raised_not_swallowed():
+    with pytest.raises(MemoryError):
+        _run_parallel(_Model(["раз два", MemoryError("ct2")]), None, 2)
+
+
+def test_empty_text_is_an_error():
+    with pytest.raises(RuntimeError):
+        _run_parallel(_Model([""]), None, 1)
+
+
+def test_empty_texts_are_not_similar():
+    assert _similarity("", "") == 0.0
+    assert _similarity("Раз два", "раз два") == 1.0
+
+
+def test_best_of_ignores_failed_combinations():
+    results = [
+        {"compute_type": "int8", "ok": False, "error": "MemoryError"},
+        {"compute_type": "float32", "ok": True, "throughput": 1.5},
+        {"compute_type": "int8_float32", "ok": True, "throughput": 2.5},
+    ]
+    assert best_of(results)["compute_type"] == "int8_float32"
+    assert best_of(results[:1]) is None
@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.config import AppConfig
+from app.studio.common import StudioContext
+from app.studio.transcribe import TranscribeModule
+from app.transcript_store import TranscriptStore
+
+MODEL = "test-model"
+
+
+class _Transcriber:
+    """Вместо модели: отдаёт заданные сегменты (абсолютное время, как после start_offset)"""
+
+    def __init__(self, segments, fail_after=None):
+        self.config = SimpleNamespace(model_name=MODEL)
+        self.segments = segments
+        self.fail_after = fail_after
+        self.start_offset = None
+
+    def transcribe_file(self, path, progress_callback=None, segment_callback=None, start_offset=0.0,
+                        **_kwargs):
+        self.start_offset = start_offset
+        for i, (start, end, text) in enumerate(self.segments):
+            if i == self.fail_after:
+                raise RuntimeError("сбой посреди файла")
+            segment_callback({"start": start, "end": end, "text": text, "no_speech_prob": 0.0})
+        return None, {"total_segments": len(self.segments), "duration": self.segments[-1][1]}
+
+
+@pytest.fixture
+def module(db, tmp_path):
+    store = TranscriptStore(db, pack_path=str(tmp_path / "t.pack"), codec="zlib")
+    ctx = StudioContext(config=AppConfig(), _db=db, _store=store)
+    yield TranscribeModule(ctx)
+    store.close()
+
+
+def _file(db):
+    return db.add_file("a.wav", "/x/a.wav", "audio", 1)
+
+
+def _checkpoint(db, file_id):
+    return [(s["index"], s["text"]) for s in db.get_checkpoint_segments(file_id, MODEL)]
+
+
+def _run(module, file_id, transcriber):
+    sink, meta = module._run_pass(transcriber, file_id, "/x/a.wav", None, lambda *a, **k: None)
+    blocks, _ = sink.close()
+    return "".join(module.ctx.store.iter_text(blocks)), meta
+
+
+def test_resume_skips_boundary_segment_and_continues_indices(db, module):
+    file_id = _file(db)
+    db.add_checkpoint_segments(file_id, MODEL, [
+        {"index": 0, "start": 0.0, "end": 1.0, "text": "один"},
+        {"index": 1, "start": 1.0, "end": 2.0, "text": "два"},
+        {"index": 2, "start": 2.0, "end": 3.0, "text": "три"},
+    ])
+    tr = _Transcriber([
+        (2.0, 3.0, "три"),     # уже принят: кончается не позже хвоста
+        (2.9, 3.5, " три "),   # тот же текст у границы — повтор хвоста
+        (3.0, 4.0, "четыре"),
+        (4.0, 5.0, "пять"),
+    ])
+    text, meta = _run(module, file_id, tr)
+    assert tr.start_offset == 3.0
+    assert text == "один\nдва\nтри\nчетыре\nпять"
+    assert _checkpoint(db, file_id) == [(0, "один"), (1, "два"), (2, "три"), (3, "четыре"), (4, "пять")]
+    assert meta["total_segments"] == 4 + 3
+
+
+def test_same_text_far_from_boundary_is_kept(db, module):
+    file_id = _file(db)
+    db.add_checkpoint_segments(file_id, MODEL, [{"index": 0, "start": 0.0, "end": 1.0, "text": "да"}])
+    text, _ = _run(module, file_id, _Transcriber([(5.0, 6.0, "да")]))
+    assert text == "да\nда"
+
+
+def test_failed_pass_leaves_checkpoint_for_next_run(db, module):
+    file_id = _file(db)
+    segs = [(0.0, 1.0, "один"), (1.0, 2.0, "два"), (2.0, 3.0, "три")]
+    with pytest.raises(RuntimeError):
+        _run(module, file_id, _Transcriber(segs, fail_after=2))
+    assert db.get_checkpoint_tail(file_id, MODEL)["end"] == 2.0
+    tr = _Transcriber(segs)  # модель снова распознаёт с начала окна — повтор отбрасывается
+    text, _ = _run(module, file_id, tr)
+    assert tr.start_offset == 2.0
+    assert text == "один\nдва\nтри"
+    assert [i for i, _ in _checkpoint(db, file_id)] == [0, 1, 2]
+
+
+def test_zero_interval_discards_old_checkpoint(db, module):
+    module.ctx.config.transcriber.checkpoint_interval = 0
+    file_id = _file(db)
+    db.add_checkpoint_segments(file_id, MODEL, [{"index": 0, "start": 0.0, "end": 1.0, "text": "старое"}])
+    tr = _Transcriber([(0.0, 1.0, "новое")])
+    text, _ = _run(module, file_id, tr)
+    assert tr.start_offset == 0.0
+    assert text == "новое"
+    assert _checkpoint(db, file_id) == [(0, "новое")]
@@ -0,0 +1,134 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.config import ClusterConfig
+from app.coordinator import Coordinator, LeaseLost, RemoteTask
+
+MODEL = "test-model"
+
+
+class _Job:
+    """Задача app.jobs без менеджера: запоминает обновления и сегменты стрима"""
+
+    def __init__(self):
+        self.id = "job-1"
+        self.profile = None
+        self.started_at = None
+        self.status = "queued"
+        self.segments = []
+
+    def _update(self, **fields):
+        for k, v in fields.items():
+            setattr(self, k, v)
+
+    def _add_segment(self, seg):
+        self.segments.append(seg)
+
+
+@pytest.fixture
+def coord(db):
+    cfg = ClusterConfig(enabled=True, token="secret", lease_seconds=30, max_attempts=2)
+    return Coordinator(SimpleNamespace(db=db), cfg)
+
+
+@pytest.fixture
+def task(db, coord, tmp_path):
+    path = tmp_path / "a.wav"
+    path.write_bytes(b"RIFF")
+    file_id = db.add_file("a.wav", str(path), "audio", 4)
+    t = RemoteTask(job=_Job(), path=path, file_id=file_id, file_hash="h", model=MODEL)
+    coord._pending.append(t)
+    return t
+
+
+def _expire(coord, lease_id):
+    coord._leases[lease_id].deadline = 0.0
+    return coord.reap()
+
+
+def test_token_is_required():
+    with pytest.raises(ValueError):
+        Coordinator(SimpleNamespace(db=None), ClusterConfig(enabled=True))
+
+
+def test_authorized_compares_token(coord):
+    assert coord.authorized("secret")
+    assert not coord.authorized("secreT")
+    assert not coord.authorized(None)
+
+
+def test_expired_lease_is_requeued_and_resumes_from_tail(coord, task):
+    first = coord.lease("w1")
+    assert first["resume_from"] == 0.0
+    assert coord.add_segments(first["lease_id"], [
+        {"start": 0.0, "end": 1.0, "text": "один"},
+        {"start": 1.0, "end": 2.0, "text": "два"},
+    ]) == 2
+
+    assert _expire(coord, first["lease_id"]) == 1
+    assert task.job.status == "queued"
+    assert coord.stats()["pending"] == 1
+    with pytest.raises(LeaseLost):  # старый воркер больше ничего не может прислать
+        coord.heartbeat(first["lease_id"], 0.5)
+
+    second = coord.lease("w2")
+    assert second["lease_id"] != first["lease_id"]
+    assert second["resume_from"] == 2.0
+    assert task.attempts == 2 and task.worker == "w2"
+
+
+def test_requeued_task_goes_ahead_of_new_ones(coord, task, db, tmp_path):
+    first = coord.lease("w1")
+    other = tmp_path / "b.wav"
+    other.write_bytes(b"RIFF")
+    coord._pending.append(RemoteTask(job=_Job(), path=other, file_id=db.add_file("b.wav", str(other), "audio", 4),
+                                     file_hash="h2", model=MODEL))
+    _expire(coord, first["lease_id"])
+    assert coord.lease("w2")["filename"] == "a.wav"
+
+
+def test_lease_expiring_max_attempts_times_fails_task(coord, task):
+    for worker in ("w1", "w2"):
+        lease = coord.lease(worker)
+        _expire(coord, lease["lease_id"])
+    assert task.done.is_set()
+    assert "w2" in task.error
+    assert coord.stats()["pending"] == 0
+    assert coord.lease("w3") is None
+
+
+def test_heartbeat_extends_lease(coord, task):
+    lease = coord.lease("w1")
+    coord._leases[lease["lease_id"]].deadline = 0.0
+    coord.heartbeat(lease["lease_id"], 0.3, "asr")
+    assert coord.reap() == 0
+    assert task.job.progress == 0.3
+
+
+def test_boundary_segments_of_previous_lease_are_dropped(coord, task, db):
+    first = coord.lease("w1")
+    coord.add_segments(first["lease_id"], [{"start": 0.0, "end": 1.0, "text": "один"},
+                                           {"start": 1.0, "end": 2.0, "text": "два"}])
+    _expire(coord, first["lease_id"])
+    second = coord.lease("w2")
+    accepted = coord.add_segments(second["lease_id"], [
+        {"start": 1.0, "end": 2.0, "text": "два"},    # уже принят от w1
+        {"start": 1.9, "end": 2.5, "text": " два"},   # повтор хвоста у границы
+        {"start": 2.0, "end": 3.0, "text": "три"},
+    ])
+    assert accepted == 1
+    assert [(s["index"], s["text"]) for s in db.get_checkpoint_segments(task.file_id, MODEL)] == [
+        (0, "один"), (1, "два"), (2, "три")]
+
+
+def test_complete_and_fail_retry(coord, task):
+    lease = coord.lease("w1")
+    coord.fail(lease["lease_id"], "CUDA OOM")
+    assert not task.done.is_set() and coord.stats()["pending"] == 1
+    lease = coord.lease("w2")
+    coord.complete(lease["lease_id"], {"duration": 3.0})
+    assert task.done.is_set() and task.error is None
+    assert task.meta == {"duration": 3.0, "model": MODEL, "worker": "w2"}
+    with pytest.raises(LeaseLost):
+        coord.complete(lease["lease_id"], {})
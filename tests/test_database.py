@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+
+
+def _blocks(n):
+    return [{"raw_offset": i * 10, "raw_size": 10, "pack_offset": i * 5, "pack_size": 5, "codec": "zlib"}
+            for i in range(n)]
+
+
+def _transcript(db, name="a.wav"):
+    file_id = db.add_file(name, f"/x/{name}", "audio", 1)
+    return db.add_transcript(file_id, None, "", 0, 1.0, "ru", "m", blocks=_blocks(3), text_bytes=30)
+
+
+def test_block_offsets_roll_back_when_before_commit_fails(db):
+    tr_id = _transcript(db)
+
+    def fail():
+        raise OSError("replace failed")
+
+    with pytest.raises(OSError):
+        db.update_transcript_block_offsets([(100, tr_id, 0)], before_commit=fail)
+    assert [b["pack_offset"] for b in db.get_transcript_blocks(tr_id)] == [0, 5, 10]
+    db.update_transcript_block_offsets([(100, tr_id, 0)])
+    assert db.get_transcript_blocks(tr_id)[0]["pack_offset"] == 100
+
+
+def test_writer_does_not_commit_another_threads_transaction(db):
+    tr_id = _transcript(db)
+    inside, release = threading.Event(), threading.Event()
+
+    def before_commit():
+        inside.set()
+        release.wait(5)
+        raise OSError("replace failed")
+
+    def compact():
+        with pytest.raises(OSError):
+            db.update_transcript_block_offsets([(100, tr_id, 0)], before_commit=before_commit)
+
+    t = threading.Thread(target=compact)
+    t.start()
+    assert inside.wait(5)
+    # другой поток пишет посреди транзакции: ждёт замка, а не коммитит чужой UPDATE
+    other = threading.Thread(target=db.add_file, args=("b.wav", "/x/b.wav", "audio", 1))
+    other.start()
+    other.join(0.2)
+    assert other.is_alive()
+    release.set()
+    t.join(5)
+    other.join(5)
+    assert db.get_transcript_blocks(tr_id)[0]["pack_offset"] == 0
+    assert db.get_file_by_path("/x/b.wav") is not None
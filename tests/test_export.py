@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+import app.export as export
+from app.export import CorpusExporter
+from app.transcript_store import TranscriptStore
+
+
+@pytest.fixture
+def store(db, tmp_path):
+    s = TranscriptStore(db, pack_path=str(tmp_path / "t.pack"), codec="zlib")
+    yield s
+    s.close()
+
+
+def _transcript(db, store, n, text):
+    file_id = db.add_file(f"{n}.wav", f"/x/{n}.wav", "audio", 1)
+    blocks, size = store.pack(text)
+    return db.add_transcript(file_id, None, text[:50], len(text.split()), 1.0, "ru", "m",
+                             blocks=blocks, text_bytes=size)
+
+
+def test_transcript_batches_are_bounded_by_text_bytes(db, store, tmp_path, monkeypatch):
+    monkeypatch.setattr(export, "TEXT_BATCH_BYTES", 5000)
+    texts = [f"{i} " + "слово " * 300 for i in range(5)]  # ~3.3 КБ каждый
+    for i, text in enumerate(texts):
+        _transcript(db, store, i, text)
+    exporter = CorpusExporter(db, str(tmp_path / "out"), ["jsonl"], batch_size=1000, store=store)
+    batches = list(exporter._with_text(db.iter_transcripts(0, 1000)))
+    assert [len(b) for b in batches] == [1, 1, 1, 1, 1]
+    monkeypatch.setattr(export, "TEXT_BATCH_BYTES", 7000)
+    batches = list(exporter._with_text(db.iter_transcripts(0, 1000)))
+    assert [len(b) for b in batches] == [2, 2, 1]
+    assert [r["text"] for b in batches for r in b] == texts
+    assert "transcript_path" not in batches[0][0]
+
+
+def test_oversized_transcript_goes_alone(db, store, tmp_path, monkeypatch):
+    monkeypatch.setattr(export, "TEXT_BATCH_BYTES", 100)
+    _transcript(db, store, 0, "а" * 1000)
+    _transcript(db, store, 1, "б")
+    exporter = CorpusExporter(db, str(tmp_path / "out"), ["jsonl"], store=store)
+    assert [len(b) for b in exporter._with_text(db.iter_transcripts(0, 1000))] == [1, 1]
+
+
+def test_jsonl_run_writes_full_texts(db, store, tmp_path, monkeypatch):
+    monkeypatch.setattr(export, "TEXT_BATCH_BYTES", 10)
+    texts = ["первый транскрипт", "второй транскрипт"]
+    for i, text in enumerate(texts):
+        _transcript(db, store, i, text)
+    report = CorpusExporter(db, str(tmp_path / "out"), ["jsonl"], store=store).run()
+    assert report["transcripts_rows"] == 2
+    lines = (tmp_path / "out").glob("run_*/transcripts.jsonl")
+    rows = [json.loads(line) for line in next(lines).read_text(encoding="utf-8").splitlines()]
+    assert [r["text"] for r in rows] == texts
+    assert report["state"]["last_transcript_id"] == 2
@@ -0,0 +1,94 @@
+import queue
+import socket
+import threading
+import time
+from dataclasses import replace
+
+import pytest
+
+from app.config import get_config
+from app.inference_server import InferenceServer, recv_msg, send_msg
+
+
+class _Process:
+    def __init__(self):
+        self.killed = threading.Event()
+
+    def is_alive(self):
+        return True
+
+    def kill(self):
+        self.killed.set()
+
+
+@pytest.fixture
+def server(tmp_path):
+    cfg = replace(get_config().inference, cancel_grace=0.2, stall_timeout=600)
+    srv = InferenceServer(str(tmp_path / "s.sock"), num_workers=1, config=cfg)
+    ws = srv._slots[0]
+    ws.process, ws.task_q, ws.ready = _Process(), queue.Queue(), True
+    ws.cancel = srv._mp.Value("q", 0, lock=False)
+    yield srv
+    srv._stop.set()
+
+
+def _start_job(server):
+    client, conn = socket.socketpair()
+    handler = threading.Thread(target=server._handle_client, args=(conn,), daemon=True)
+    handler.start()
+    send_msg(client, {"op": "transcribe", "shm": "x", "samples": 16000})
+    accepted = recv_msg(client)
+    return client, handler, accepted["job_id"]
+
+
+def _wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_disconnect_of_running_job_asks_worker_to_stop(server):
+    client, handler, job_id = _start_job(server)
+    ws = server._slots[0]
+    assert ws.task_q.get(timeout=1)[0] == job_id  # задача у воркера
+    client.close()  # клиент ушёл, сегментов пока нет
+    handler.join(5)
+    assert not handler.is_alive()
+    assert ws.cancel.value == job_id
+    job = server._jobs[job_id]
+    assert job.cancelled and job.cancelled_at is not None
+
+    threading.Thread(target=server._route_results, daemon=True).start()
+    server._result_q.put((job_id, {"type": "cancelled"}))
+    assert _wait_for(lambda: ws.job is None)
+    assert job_id not in server._jobs
+
+
+def test_disconnect_of_queued_job_removes_it(server):
+    server._slots[0].ready = False  # воркер занят загрузкой — задача ждёт в очереди
+    client, handler, job_id = _start_job(server)
+    client.close()
+    handler.join(5)
+    assert not server._pending and job_id not in server._jobs
+    assert server._slots[0].cancel.value == 0
+
+
+def test_worker_ignoring_cancel_is_killed_after_grace(server):
+    client, handler, job_id = _start_job(server)
+    client.close()
+    handler.join(5)
+    threading.Thread(target=server._watchdog, daemon=True).start()
+    assert server._slots[0].process.killed.wait(5)
+
+
+def test_connected_client_is_not_cancelled(server):
+    client, handler, job_id = _start_job(server)
+    time.sleep(1.3)  # дольше интервала проверки соединения
+    assert not server._jobs[job_id].cancelled
+    server._jobs[job_id].out.put({"type": "done", "meta": {}})
+    assert recv_msg(client)["type"] == "done"
+    handler.join(5)
+    client.close()
@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+import app.jobs as jobs
+from app.config import AppConfig
+from app.jobs import Job, JobManager
+
+
+def _seg(i):
+    return {"index": i, "start": float(i), "end": i + 1.0, "text": f"сегмент {i}", "no_speech_prob": 0.0}
+
+
+def _job(monkeypatch, ring=3):
+    monkeypatch.setattr(jobs, "SEGMENT_RING", ring)
+    job = Job(id="j", path="/x/a.wav")
+    calls = []
+
+    def history(start, end):
+        calls.append((start, end))
+        return [_seg(i) for i in range(start, end)]
+
+    job._history = history
+    return job, calls
+
+
+def test_running_job_keeps_only_recent_segments(monkeypatch):
+    job, calls = _job(monkeypatch)
+    for i in range(10):
+        job._add_segment(_seg(i))
+    assert len(job._ring) == 3 and job.segment_count == 10
+    segs, done = job.wait_segments(8, timeout=0)
+    assert [s["index"] for s in segs] == [8, 9] and not done
+    assert calls == []
+
+
+def test_lagging_reader_catches_up_from_history(monkeypatch):
+    job, calls = _job(monkeypatch)
+    for i in range(10):
+        job._add_segment(_seg(i))
+    segs, _ = job.wait_segments(2, timeout=0)
+    assert [s["index"] for s in segs] == [2, 3, 4, 5, 6]
+    assert calls == [(2, 7)]  # до первого сегмента кольца
+
+
+def test_finished_job_frees_segments_and_reads_db(monkeypatch):
+    job, calls = _job(monkeypatch)
+    for i in range(5):
+        job._add_segment(_seg(i))
+    job._update(status="completed", file_id=1)
+    assert len(job._ring) == 0 and job.to_dict()["segments"] == 5
+    segs, done = job.wait_segments(0, timeout=0)
+    assert [s["index"] for s in segs] == [0, 1, 2, 3, 4] and done
+    assert job.wait_segments(5, timeout=0) == ([], True)
+
+
+def test_missing_history_falls_back_to_ring(monkeypatch):
+    job, _ = _job(monkeypatch)
+    job._history = lambda start, end: []
+    for i in range(10):
+        job._add_segment(_seg(i))
+    segs, _ = job.wait_segments(0, timeout=0)
+    assert [s["index"] for s in segs] == [7, 8, 9]  # пропуск вместо зависания стрима
+
+
+def test_stored_segments_from_checkpoint_then_transcript(db):
+    manager = JobManager(SimpleNamespace(db=db, config=AppConfig()))
+    job = Job(id="j", path="/x/a.wav")
+    file_id = db.add_file("a.wav", "/x/a.wav", "audio", 1)
+    model = AppConfig().transcriber.model_name
+    db.add_checkpoint_segments(file_id, model, [_seg(i) for i in range(4)])
+    assert [s["index"] for s in manager._stored_segments(job, 1, 3)] == [1, 2]
+
+    tr_id = db.add_transcript(file_id, None, "", 0, 4.0, "ru", model, blocks=[], text_bytes=0)
+    db.add_segments(tr_id, [], from_checkpoint=(file_id, model))
+    db.clear_checkpoints(file_id)
+    job.file_id = file_id
+    segs = manager._stored_segments(job, 0, 10)
+    assert [(s["index"], s["text"]) for s in segs] == [(i, f"сегмент {i}") for i in range(4)]
@@ -0,0 +1,98 @@
+import pytest
+
+from app.lanes import MIN_COST, Lane, QueueFull, SessionLimit
+
+
+def _lane(policy="sjf", aging=1.0, max_queue=10, **kw):
+    return Lane("t", 1, max_queue, policy=policy, aging=aging, **kw)
+
+
+def _running(lane):
+    """Первый билет занимает единственный слот — следующие остаются в очереди"""
+    t = lane.enter(cost=100)
+    assert t.wait(0)
+    return t
+
+
+def test_sjf_admits_shortest_first():
+    lane = _lane(aging=0.0)
+    head = _running(lane)
+    long_, mid, short = lane.enter(cost=3600), lane.enter(cost=60), lane.enter(cost=5)
+    assert [short.position(), mid.position(), long_.position()] == [1, 2, 3]
+    head.release()
+    assert short.running and not mid.running and not long_.running
+    short.release()
+    assert mid.running
+
+
+def test_fifo_admits_in_submission_order():
+    lane = _lane(policy="fifo")
+    head = _running(lane)
+    long_, short = lane.enter(cost=3600), lane.enter(cost=5)
+    assert [long_.position(), short.position()] == [1, 2]
+    head.release()
+    assert long_.running and not short.running
+
+
+def test_aging_lets_long_wait_overtake_new_short():
+    lane = _lane(aging=1.0)
+    head = _running(lane)
+    long_ = lane.enter(cost=600)
+    short = lane.enter(cost=60)
+    assert short.position() == 1
+    # длинная ждёт дольше своей оценки: 1 + 700/600 > 1 + ~0/60
+    long_.enqueued_at -= 700
+    assert long_.position() == 1
+    head.release()
+    assert long_.running and not short.running
+
+
+def test_equal_priority_breaks_ties_by_cost_then_age():
+    lane = _lane(aging=0.0)
+    head = _running(lane)
+    a, b, c = lane.enter(cost=30), lane.enter(cost=10), lane.enter(cost=10)
+    b.enqueued_at = c.enqueued_at + 1  # c поставлена раньше b
+    assert [c.position(), b.position(), a.position()] == [1, 2, 3]
+    head.release()
+    assert c.running
+
+
+def test_unknown_and_tiny_costs_are_clamped():
+    lane = _lane(aging=0.0, unknown_cost=120)
+    head = _running(lane)
+    unknown, tiny, known = lane.enter(), lane.enter(cost=0), lane.enter(cost=60)
+    assert lane._cost(unknown) == 120
+    assert lane._cost(tiny) == MIN_COST
+    assert [tiny.position(), known.position(), unknown.position()] == [1, 2, 3]
+    head.release()
+
+
+def test_expected_start_sums_estimates_ahead():
+    lane = _lane(aging=0.0)
+    head = _running(lane)
+    head.started_at -= 40  # выполняется 40 из оценённых 100 сек
+    short, long_ = lane.enter(cost=20), lane.enter(cost=300)
+    assert short.expected_start() == pytest.approx(60, abs=1)
+    assert long_.expected_start() == pytest.approx(80, abs=1)
+    assert head.expected_start() == 0.0
+
+
+def test_queue_full_and_session_limit():
+    lane = Lane("t", 1, 1, per_session=1)
+    lane.enter(session="a")
+    with pytest.raises(SessionLimit):
+        lane.enter(session="a")
+    lane.enter(session="b")
+    with pytest.raises(QueueFull):
+        lane.enter(session="c")
+
+
+def test_release_of_queued_ticket_frees_its_place():
+    lane = _lane(max_queue=1)
+    head = _running(lane)
+    queued = lane.enter(cost=10)
+    queued.release()
+    assert lane.stats()["queued"] == 0
+    nxt = lane.enter(cost=10)
+    head.release()
+    assert nxt.running and not queued.running
@@ -0,0 +1,94 @@
+import threading
+import time
+
+from app.lanes import Lane
+from app.pipeline import Prefetcher
+
+
+class _Prefetcher(Prefetcher):
+    """Prefetcher без декодирования: _warm ждёт разрешения теста"""
+
+    def __init__(self, depth, lane=None):
+        super().__init__(db=None, workers=1, depth=depth, lane=lane)
+        self.release = threading.Event()
+        self.started = []
+
+    def _warm(self, path, file_hash):
+        self.started.append(path.name)
+        self.release.wait(5)
+        return file_hash or f"hash-{path.name}"
+
+
+def _wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_take_returns_hash_and_frees_depth():
+    p = _Prefetcher(depth=1)
+    p.submit("/x/a.wav")
+    p.submit("/x/b.wav")
+    assert _wait_for(lambda: p.started == ["a.wav"])
+    assert p.stats() == {"queued": 1, "ahead": 1, "depth": 1}
+    p.release.set()
+    assert p.take("/x/a.wav") == "hash-a.wav"
+    assert _wait_for(lambda: p.started == ["a.wav", "b.wav"])
+    assert p.take("/x/b.wav") == "hash-b.wav"
+    assert p.stats()["ahead"] == 0
+
+
+def test_discard_of_started_item_releases_ahead():
+    p = _Prefetcher(depth=1)
+    p.release.set()
+    p.submit("/x/a.wav")
+    assert _wait_for(lambda: p.stats()["ahead"] == 1 and p.started == ["a.wav"])
+    p.take("/x/a.wav")  # то, что делает Pipeline.discard
+    assert p.stats()["ahead"] == 0
+    p.submit("/x/b.wav")
+    assert _wait_for(lambda: p.started == ["a.wav", "b.wav"])
+
+
+def test_discard_of_pending_item_removes_it_from_order():
+    p = _Prefetcher(depth=1)
+    p.submit("/x/a.wav")
+    p.submit("/x/b.wav")
+    assert _wait_for(lambda: p.started == ["a.wav"])
+    assert p.take("/x/b.wav") is None  # ещё не начат — снимается без ожидания
+    assert p.stats()["queued"] == 0
+    p.release.set()
+    p.take("/x/a.wav")
+    assert p.stats() == {"queued": 0, "ahead": 0, "depth": 1}
+
+
+def test_take_of_unknown_path_is_noop():
+    p = _Prefetcher(depth=2)
+    assert p.take("/x/never.wav") is None
+    assert p.stats()["ahead"] == 0
+
+
+def test_sjf_lane_prefetches_short_files_first():
+    p = _Prefetcher(depth=1, lane=Lane("t", 1, 10, policy="sjf"))
+    p.submit("/x/first.wav", cost=10)
+    assert _wait_for(lambda: p.started == ["first.wav"])
+    p.submit("/x/long.wav", cost=3600)
+    p.submit("/x/short.wav", cost=5)
+    p.release.set()
+    p.take("/x/first.wav")
+    assert _wait_for(lambda: len(p.started) == 2)
+    assert p.started[1] == "short.wav"
+
+
+def test_fifo_lane_prefetches_in_submission_order():
+    p = _Prefetcher(depth=1, lane=Lane("t", 1, 10, policy="fifo"))
+    p.submit("/x/first.wav", cost=10)
+    assert _wait_for(lambda: p.started == ["first.wav"])
+    p.submit("/x/long.wav", cost=3600)
+    p.submit("/x/short.wav", cost=5)
+    p.release.set()
+    p.take("/x/first.wav")
+    assert _wait_for(lambda: len(p.started) == 2)
+    assert p.started[1] == "long.wav"
@@ -0,0 +1,129 @@
+import itertools
+
+import pytest
+
+from app.transcript_store import TranscriptStore, _zstd, fcntl
+
+# кириллица — 2 байта UTF-8: границы блоков и диапазонов режут символы
+TEXT = "\n".join(f"Сегмент {i}: привет, мир — segment {i}" for i in range(2000))
+DATA = TEXT.encode("utf-8")
+_FILES = itertools.count()
+
+
+@pytest.fixture(params=["zlib", pytest.param("zstd", marks=pytest.mark.skipif(
+    _zstd() is None, reason="zstandard не установлен"))])
+def store(request, db, tmp_path):
+    s = TranscriptStore(db, pack_path=str(tmp_path / "t.pack"), block_size=4096, codec=request.param)
+    yield s
+    s.close()
+
+
+def _save(db, store, text):
+    n = next(_FILES)
+    file_id = db.add_file(f"{n}.wav", f"/x/{n}.wav", "audio", 1)
+    blocks, size = store.pack(text)
+    return db.add_transcript(file_id, None, text[:100], len(text.split()), 1.0, "ru", "m",
+                             blocks=blocks, text_bytes=size)
+
+
+def test_pack_splits_into_blocks_and_reads_back(db, store):
+    tr_id = _save(db, store, TEXT)
+    assert store.size(tr_id) == len(DATA)
+    assert len(db.get_transcript_blocks(tr_id)) == -(-len(DATA) // 4096)
+    assert store.read_text(tr_id) == TEXT
+
+
+@pytest.mark.parametrize("offset,length", [
+    (0, 10), (4090, 20), (4096, 4096), (5000, 10000), (len(DATA) - 7, 100), (len(DATA) + 5, 10), (123, 0),
+])
+def test_read_range_matches_slice(db, store, offset, length):
+    tr_id = _save(db, store, TEXT)
+    assert store.read_range(tr_id, offset, length) == DATA[offset:offset + length]
+
+
+def test_streaming_writer_equals_pack(db, store):
+    w = store.writer()
+    for line in TEXT.splitlines(keepends=True):
+        w.write(line)
+    blocks, size = w.close()
+    assert size == len(DATA)
+    assert "".join(store.iter_text(blocks)) == TEXT
+
+
+def test_transcripts_share_pack_and_survive_compact(db, store):
+    first = _save(db, store, TEXT)
+    second = _save(db, store, "второй транскрипт")
+    db.delete_file(db.get_transcript_by_id(first)["file_id"])
+    res = store.compact()
+    assert res["after"] < res["before"]
+    assert store.read_text(second) == "второй транскрипт"
+    assert store.read_range(first, 0, 10) is None
+
+
+def test_short_text_is_stored_uncompressed(db, store):
+    tr_id = _save(db, store, "да")
+    assert [b["codec"] for b in db.get_transcript_blocks(tr_id)] == ["raw"]
+    assert store.read_text(tr_id) == "да"
+
+
+def test_read_of_missing_transcript_is_none(store):
+    assert store.read_range(999, 0, 10) is None
+    assert store.read_text(999) is None
+
+
+def _index(db, blocks, size):
+    n = next(_FILES)
+    file_id = db.add_file(f"{n}.wav", f"/x/{n}.wav", "audio", 1)
+    return db.add_transcript(file_id, None, "", 0, 1.0, "ru", "m", blocks=blocks, text_bytes=size)
+
+
+def test_compact_refuses_while_writer_is_open(db, store):
+    _save(db, store, TEXT)
+    w = store.writer()
+    w.write(TEXT[:6000])  # один блок уже в pack, но ещё не в индексе
+    with pytest.raises(RuntimeError):
+        store.compact()
+    w.write(TEXT[6000:])
+    tr_id = _index(db, *w.close())
+    store.compact()
+    assert store.read_text(tr_id) == TEXT
+
+
+def test_abandoned_writer_does_not_block_compact(db, store):
+    w = store.writer()
+    w.write(TEXT)
+    del w  # проход упал, запись брошена
+    store.compact()
+
+
+def test_other_store_reopens_pack_replaced_by_compact(db, store, tmp_path):
+    other = TranscriptStore(db, pack_path=str(store.pack_path), block_size=4096, codec=store.codec)
+    try:
+        dead = _save(db, store, TEXT)
+        alive = _save(db, store, "живой")
+        assert other.read_text(alive) == "живой"  # у other открыт дескриптор старого pack
+        db.delete_file(db.get_transcript_by_id(dead)["file_id"])
+        store.compact()
+        assert other.read_text(alive) == "живой"
+        fresh = _save(db, other, TEXT)  # дописывает в новый pack, а не в удалённый
+        assert store.read_text(fresh) == TEXT
+    finally:
+        other.close()
+
+
+@pytest.mark.skipif(fcntl is None, reason="нет fcntl.flock")
+def test_compact_waits_for_writer_of_other_process(db, store, monkeypatch):
+    # flock — на открытое описание файла: второй экземпляр ведёт себя как другой процесс
+    import app.transcript_store as ts
+    monkeypatch.setattr(ts, "COMPACT_LOCK_WAIT", 0.2)
+    other = TranscriptStore(db, pack_path=str(store.pack_path), block_size=4096, codec=store.codec)
+    try:
+        w = other.writer()
+        w.write(TEXT)
+        with pytest.raises(RuntimeError):
+            store.compact()
+        tr_id = _index(db, *w.close())
+        store.compact()
+        assert other.read_text(tr_id) == TEXT
+    finally:
+        other.close()
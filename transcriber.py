@@ -4,19 +4,35 @@
 import os
 import tempfile
 import subprocess
+import time
+from dataclasses import asdict
 from pathlib import Path
 from typing import Optional, Tuple, List
-from app.config import get_config
+from app import tracing
+from app.config import DECODING_PROFILES, get_config
+from app.media import may_contain_video, read_wav_info
 
 
 class Transcriber:
-    def __init__(self, config=None):
+    def __init__(self, config=None, mode: Optional[str] = None):
+        """
+        Args:
+            config: TranscriberConfig (по умолчанию — из глобального конфига)
+            mode: "local" — модель в этом процессе, "server" — тонкий клиент сервера инференса
+                  (по умолчанию — inference.mode из конфига)
+        """
         if config is None:
             config = get_config().transcriber
         
         self.config = config
         self.model = None
-        self._load_model()
+        self.client = None
+        
+        if (mode or get_config().inference.mode) == "server":
+            from app.inference_server import InferenceClient
+            self.client = InferenceClient()
+        else:
+            self._load_model()
     
     def _load_model(self):
         """Загрузка модели"""
@@ -31,18 +47,29 @@ class Transcriber:
         
         print(f"🔄 Загружаю Faster-Whisper '{self.config.model_name}'...")
         
+        compute_type = self.config.compute_type
+        kwargs = {"num_workers": max(1, int(self.config.num_workers or 1))}
+        if self.config.device == "cpu":
+            compute_type = self.config.cpu_compute_type or "int8"
+            if self.config.cpu_threads:
+                kwargs["cpu_threads"] = int(self.config.cpu_threads)
+        print(f"   {self.config.device}/{compute_type}, потоков: {kwargs.get('cpu_threads', 'auto')}, "
+              f"воркеров: {kwargs['num_workers']}")
+        
         if self.config.model_path:
             self.model = WhisperModel(
                 self.config.model_path,
                 device=self.config.device,
-                compute_type=self.config.compute_type,
-                local_files_only=True
+                compute_type=compute_type,
+                local_files_only=True,
+                **kwargs
             )
         else:
             self.model = WhisperModel(
                 self.config.model_name,
                 device=self.config.device,
-                compute_type=self.config.compute_type
+                compute_type=compute_type,
+                **kwargs
             )
         
         print("✅ Faster-Whisper загружен")
@@ -67,7 +94,7 @@ class Transcriber:
         """Извлечение аудио из видео через ffmpeg"""
         output = tempfile.mktemp(suffix='.wav')
         
-        print(f"🎬 Извлекаю аудио из видео...")
+        print("🎬 Извлекаю аудио из видео...")
         
         try:
             cmd = [
@@ -87,7 +114,7 @@ class Transcriber:
                 print(f"❌ Ошибка ffmpeg: {result.stderr}")
                 return None
             
-            print(f"✅ Аудио извлечено")
+            print("✅ Аудио извлечено")
             return output
             
         except FileNotFoundError:
@@ -113,26 +140,99 @@ class Transcriber:
         
         return False
     
-    def transcribe_file(self, file_path: str, progress_callback=None) -> Tuple[str, dict]:
+    def decoding_options(self, profile: Optional[str] = None) -> Tuple[str, dict]:
+        """
+        Профиль декодирования → (имя, параметры). Не заданные в конфиге ключи берутся
+        из встроенного профиля (или accurate); неизвестное имя — ValueError
+        """
+        name = profile or self.config.profile or "accurate"
+        profiles = {**DECODING_PROFILES, **(self.config.profiles or {})}
+        if name not in profiles:
+            raise ValueError(f"Неизвестный профиль декодирования: {name} (есть: {', '.join(profiles)})")
+        base = DECODING_PROFILES.get(name, DECODING_PROFILES["accurate"])
+        return name, {**base, **profiles[name]}
+
+    def transcribe_file(self, file_path: str, progress_callback=None,
+                        segment_callback=None, file_hash: Optional[str] = None,
+                        start_offset: float = 0.0, speech=None, collect_text: bool = True,
+                        profile: Optional[str] = None) -> Tuple[str, dict]:
         """
         Транскрибация файла
         
+        Args:
+            progress_callback: (доля 0..1, описание)
+            segment_callback: вызывается для каждого принятого сегмента
+                              dict(index, start, end, text, no_speech_prob)
+            file_hash: SHA-256 содержимого (ключ кэша аудио; если не задан — посчитается)
+            start_offset: начать с этой секунды (продолжение после сбоя); таймкоды сегментов
+                          и длительность в metadata — от начала файла
+            speech: app.vad.SpeechMap — распознаются только интервалы речи (clip_timestamps),
+                    VAD внутри модели не запускается
+            collect_text: False — текст не склеивается (вернётся ""), сегменты забирает
+                          segment_callback; память не растёт с длительностью записи
+            profile: профиль декодирования (fast / balanced / accurate; None — transcriber.profile)
+        
         Returns:
             (full_text, metadata)
         """
         file_path = Path(file_path)
+        profile, _ = self.decoding_options(profile)  # неизвестный профиль — до декодирования
         
         if not file_path.exists():
             raise FileNotFoundError(f"Файл не найден: {file_path}")
         
-        # Определяем тип файла
-        video_extensions = ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm']
-        is_video = file_path.suffix.lower() in video_extensions
+        wav = read_wav_info(file_path)
+        clips = speech.clip_timestamps(start_offset) if speech is not None else None
+        if (self.client is not None or get_config().audio_cache.enabled or start_offset or wav
+                or speech is not None):
+            # WAV — напрямую через memmap, прочее — PCM из кэша аудио (или декодирование
+            # в него); в режиме сервера уходит в сервер через shared memory
+            from app.audio_cache import load_audio
+            if progress_callback:
+                progress_callback(0.05, "Декодирование аудио...")
+            with tracing.span("decode", offset=start_offset) as sp:
+                audio = load_audio(file_path, file_hash, offset=start_offset)
+                if sp is not None:
+                    sp.attrs["seconds"] = round(len(audio) / 16000, 1)
+            if (start_offset and len(audio) < 1600) or clips == []:
+                # сбой пришёлся на самый конец (или после него речи нет) — распознавать нечего
+                return "", {'duration': start_offset, 'language': self.config.language,
+                            'model': self.config.model_name, 'profile': profile, 'total_segments': 0,
+                            'filtered_segments': 0, 'resumed_from': start_offset}
+            def shifted(seg):
+                segment_callback({**seg, 'start': seg['start'] + start_offset,
+                                  'end': seg['end'] + start_offset})
+
+            on_segment = shifted if start_offset and segment_callback else segment_callback
+            with tracing.span("decode_loop", model=self.config.model_name, profile=profile,
+                              mode="server" if self.client is not None else "local") as sp:
+                if self.client is not None:
+                    text, meta = self.client.transcribe(
+                        audio, dict(asdict(self.config), clip_timestamps=clips, profile=profile),
+                        progress_callback=progress_callback, segment_callback=on_segment,
+                        collect_text=collect_text)
+                else:
+                    if progress_callback:
+                        progress_callback(0.1, "Транскрибация...")
+                    text, meta = self.transcribe_audio(audio, progress_callback, on_segment, clips,
+                                                       collect_text=collect_text, profile=profile)
+                if sp is not None:
+                    sp.attrs["segments"] = meta.get("total_segments", 0)
+            if speech is not None:
+                meta['speech_ratio'] = round(speech.speech_ratio, 4)
+            if start_offset:
+                meta['duration'] = meta.get('duration', 0) + start_offset
+                meta['resumed_from'] = start_offset
+            return text, meta
+        
+        # Определяем тип файла (по сигнатуре, а не по расширению)
+        is_video = may_contain_video(file_path)
         
         # Извлекаем аудио если видео
         temp_audio = None
         if is_video:
-            temp_audio = self.extract_audio_from_video(str(file_path))
+            with tracing.span("decode", ffmpeg=True):
+                temp_audio = self.extract_audio_from_video(str(file_path))
             if temp_audio is None:
                 raise Exception("Не удалось извлечь аудио из видео")
             audio_path = temp_audio
@@ -143,35 +243,77 @@ class Transcriber:
             if progress_callback:
                 progress_callback(0.1, "Транскрибация...")
             
-            # Транскрибация
-            if self.config.use_faster_whisper:
-                full_text, metadata = self._transcribe_faster_whisper(audio_path, progress_callback)
-            else:
-                full_text, metadata = self._transcribe_whisper(audio_path, progress_callback)
-            
-            if progress_callback:
-                progress_callback(1.0, "Готово!")
-            
-            return full_text, metadata
+            with tracing.span("decode_loop", model=self.config.model_name, profile=profile, mode="local"):
+                return self.transcribe_audio(audio_path, progress_callback, segment_callback,
+                                             collect_text=collect_text, profile=profile)
             
         finally:
             # Удаляем временный аудиофайл
             if temp_audio and os.path.exists(temp_audio):
                 os.remove(temp_audio)
     
-    def _transcribe_faster_whisper(self, audio_path: str, progress_callback=None) -> Tuple[str, dict]:
+    def transcribe_audio(self, audio, progress_callback=None, segment_callback=None,
+                         clip_timestamps: Optional[List[float]] = None,
+                         collect_text: bool = True, profile: Optional[str] = None) -> Tuple[str, dict]:
+        """
+        Транскрибация уже подготовленного аудио: путь к файлу или np.float32 (16 кГц моно)
+        
+        Args:
+            clip_timestamps: [start, end, ...] сек — распознавать только эти интервалы
+                             (готовая карта речи; встроенный VAD тогда не нужен)
+            collect_text: False — не копить текст (см. transcribe_file)
+            profile: профиль декодирования (None — transcriber.profile)
+        
+        Returns:
+            (full_text, metadata); metadata['rtf'] — время распознавания / длительность аудио
+        """
+        profile, options = self.decoding_options(profile)
+        started = time.perf_counter()
+        # Транскрибация
+        if self.config.use_faster_whisper:
+            full_text, metadata = self._transcribe_faster_whisper(
+                audio, progress_callback, segment_callback, clip_timestamps, collect_text, options)
+        else:
+            full_text, metadata = self._transcribe_whisper(
+                audio, progress_callback, segment_callback, clip_timestamps, collect_text, options)
+        elapsed = time.perf_counter() - started
+        metadata['profile'] = profile
+        if metadata.get('duration'):
+            metadata['rtf'] = round(elapsed / metadata['duration'], 4)
+        
+        if progress_callback:
+            progress_callback(1.0, "Готово!")
+        
+        return full_text, metadata
+    
+    def _transcribe_faster_whisper(self, audio, progress_callback=None, segment_callback=None,
+                                   clip_timestamps: Optional[List[float]] = None,
+                                   collect_text: bool = True,
+                                   options: Optional[dict] = None) -> Tuple[str, dict]:
         """Транскрибация через Faster-Whisper"""
+        options = options if options is not None else self.decoding_options()[1]
+        use_vad = self.config.use_vad and not clip_timestamps
         segments, info = self.model.transcribe(
-            audio_path,
+            audio,
             language=self.config.language,
-            vad_filter=self.config.use_vad,
+            vad_filter=use_vad,
             condition_on_previous_text=False,
-            vad_parameters=dict(threshold=self.config.vad_threshold) if self.config.use_vad else None
+            vad_parameters=dict(threshold=self.config.vad_threshold) if use_vad else None,
+            beam_size=int(options["beam_size"]),
+            best_of=int(options["best_of"]),
+            temperature=list(options["temperature"]),
+            compression_ratio_threshold=options["compression_ratio_threshold"],
+            without_timestamps=bool(options["without_timestamps"]),
+            word_timestamps=bool(options["word_timestamps"]),
+            **({'clip_timestamps': clip_timestamps} if clip_timestamps else {})
         )
         
         full_text = []
+        accepted = 0
         filtered_count = 0
         total_segments = 0
+        filter_time = 0.0
+        loop_start = tracing.now()
         
         for segment in segments:
             total_segments += 1
@@ -179,16 +321,30 @@ class Transcriber:
             no_speech_prob = getattr(segment, 'no_speech_prob', None)
             
             # Фильтрация галлюцинаций
-            if self.is_likely_hallucination(text, no_speech_prob):
+            t0 = time.perf_counter()
+            hallucination = self.is_likely_hallucination(text, no_speech_prob)
+            filter_time += time.perf_counter() - t0
+            if hallucination:
                 filtered_count += 1
                 continue
             
-            full_text.append(text)
+            if collect_text:
+                full_text.append(text)
+            accepted += 1
+            if segment_callback:
+                segment_callback({
+                    'index': accepted - 1,
+                    'start': segment.start,
+                    'end': segment.end,
+                    'text': text,
+                    'no_speech_prob': no_speech_prob,
+                })
             
             if progress_callback and total_segments % 10 == 0:
                 progress_callback(0.1 + 0.8 * (total_segments / max(total_segments, 100)), 
                                 f"Обработано сегментов: {total_segments}")
         
+        tracing.add_total("filter", loop_start, filter_time, segments=total_segments, filtered=filtered_count)
         metadata = {
             'duration': info.duration,
             'language': info.language,
@@ -199,36 +355,74 @@ class Transcriber:
         
         return "\n".join(full_text), metadata
     
-    def _transcribe_whisper(self, audio_path: str, progress_callback=None) -> Tuple[str, dict]:
+    def _transcribe_whisper(self, audio, progress_callback=None, segment_callback=None,
+                            clip_timestamps: Optional[List[float]] = None,
+                            collect_text: bool = True,
+                            options: Optional[dict] = None) -> Tuple[str, dict]:
         """Транскрибация через оригинальный Whisper"""
+        options = options if options is not None else self.decoding_options()[1]
+        beam_size = int(options["beam_size"])
         result = self.model.transcribe(
-            audio_path,
+            audio,
             language=self.config.language,
             condition_on_previous_text=False,
             no_speech_threshold=0.6,
-            verbose=False
+            verbose=False,
+            # у openai-whisper жадный поиск — beam_size=None, температуры — кортеж
+            beam_size=beam_size if beam_size > 1 else None,
+            best_of=int(options["best_of"]),
+            temperature=tuple(options["temperature"]),
+            compression_ratio_threshold=options["compression_ratio_threshold"],
+            without_timestamps=bool(options["without_timestamps"]),
+            word_timestamps=bool(options["word_timestamps"]),
+            **({'clip_timestamps': clip_timestamps} if clip_timestamps else {})
         )
         
         full_text = []
+        accepted = 0
         filtered_count = 0
+        filter_time = 0.0
+        loop_start = tracing.now()
         
         for i, segment in enumerate(result.get('segments', [])):
             text = segment['text'].strip()
             no_speech_prob = segment.get('no_speech_prob', 0)
             
             # Фильтрация галлюцинаций
-            if self.is_likely_hallucination(text, no_speech_prob):
+            t0 = time.perf_counter()
+            hallucination = self.is_likely_hallucination(text, no_speech_prob)
+            filter_time += time.perf_counter() - t0
+            if hallucination:
                 filtered_count += 1
                 continue
             
-            full_text.append(text)
+            if collect_text:
+                full_text.append(text)
+            accepted += 1
+            if segment_callback:
+                segment_callback({
+                    'index': accepted - 1,
+                    'start': segment['start'],
+                    'end': segment['end'],
+                    'text': text,
+                    'no_speech_prob': no_speech_prob,
+                })
             
             if progress_callback and i % 10 == 0:
                 progress = 0.1 + 0.8 * (i / len(result['segments']))
                 progress_callback(progress, f"Обработано сегментов: {i}")
         
+        tracing.add_total("filter", loop_start, filter_time,
+                          segments=len(result.get('segments', [])), filtered=filtered_count)
+        # в результате openai-whisper длительности нет: по числу сэмплов (16 кГц),
+        # для пути к файлу — по концу последнего сегмента
+        segments = result.get('segments', [])
+        if isinstance(audio, str):
+            duration = segments[-1]['end'] if segments else 0
+        else:
+            duration = len(audio) / 16000
         metadata = {
-            'duration': result.get('duration', 0),
+            'duration': duration,
             'language': result.get('language', self.config.language),
             'total_segments': len(result.get('segments', [])),
             'filtered_segments': filtered_count,